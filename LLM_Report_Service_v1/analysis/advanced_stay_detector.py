@@ -4,19 +4,9 @@ import pandas as pd
 import numpy as np
 
 # ==========================================
-# 1. 核心距離公式
+# 1. 核心距離公式 (統一由 geo_kernels 提供)
 # ==========================================
-def haversine_distance(lon1, lat1, lon2, lat2):
-    """計算地球上兩點的距離 (單位: 公尺)"""
-    R = 6371000  # 地球半徑
-    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
-    
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    
-    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
-    c = 2 * np.arcsin(np.sqrt(a))
-    return R * c
+from analysis.geo_kernels import haversine_distance
 
 # ==========================================
 # 2. 進階停留點偵測邏輯 (Hybrid)
@@ -51,7 +41,8 @@ def find_advanced_stay_points(vehicle_df: pd.DataFrame,
     # 確保是副本以免影響原始資料
     df = vehicle_df.copy()
     df['datetime'] = pd.to_datetime(df['datetime'])
-    df = df.sort_values('datetime').reset_index(drop=True)
+    # 穩定排序：時間相同的偵測維持原本順序 (與 trajectory_kernel 相同，停留中心不受排序演算法影響)
+    df = df.sort_values('datetime', kind='stable').reset_index(drop=True)
     
     # 強制轉型經緯度，避免字串運算錯誤
     df['經度'] = pd.to_numeric(df['經度'], errors='coerce')
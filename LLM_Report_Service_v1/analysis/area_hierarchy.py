@@ -0,0 +1,123 @@
+# analysis/area_hierarchy.py (多層級地點區域索引：攝影機 → 50m → 200m → 轄區，各半徑層級直接對攝影機分群)
+
+import pandas as pd
+
+from analysis.camera_clusterer import cluster_cameras_by_distance
+
+DEFAULT_RADII = (50, 200)
+CAMERA_LEVEL = 'camera'
+DISTRICT_LEVEL = 'district'
+
+def level_name(radius_meters: int) -> str:
+    """半徑層級的名稱，例如 200 -> '200m'。"""
+    return f"{int(radius_meters)}m"
+
+def level_column(level: str) -> str:
+    """各層級在攝影機對照表中的欄位名稱。"""
+    if level == CAMERA_LEVEL:
+        return '攝影機'
+    if level == DISTRICT_LEVEL:
+        return 'DistrictID'
+    return f"AreaID_{level}"
+
+def _majority_parent(camera_table: pd.DataFrame, fine_col: str, coarse_col: str) -> dict:
+    """{細層級區域 ID: 其攝影機最多落在的粗層級區域 ID} (次數相同時取 ID 較小者)。"""
+    counts = camera_table.groupby([fine_col, coarse_col], dropna=False).size().reset_index(name='count')
+    counts = counts.sort_values([fine_col, 'count', coarse_col], ascending=[True, False, True], kind='stable')
+    first = counts.drop_duplicates(subset=[fine_col])
+    return dict(zip(first[fine_col], first[coarse_col]))
+
+def build_area_hierarchy(unique_cameras: pd.DataFrame,
+                         radii: tuple = DEFAULT_RADII,
+                         district_col: str = '單位') -> dict:
+    """
+    預先計算多層級的地點區域索引。
+
+    每個半徑層級都直接對攝影機座標分群 (與 cluster_cameras_by_distance(unique_cameras, 半徑) 的結果相同)，
+    因此各層級的區域與單獨以該半徑分群時一致。不同半徑的分群彼此獨立，細層級區域不一定完整落在
+    同一個粗層級區域內：parent 取該區域多數攝影機所屬的粗層級區域，children 則列出所有與粗層級區域
+    共用攝影機的細層級區域。需要精確對應時以 camera_table 的各層級欄位 (或 roll_up / drill_down) 為準。
+    最上層為轄區 (預設使用 '單位' 欄位，取區域內最多攝影機所屬的單位)，由最粗的半徑層級彙總而來。
+
+    Args:
+        unique_cameras: 不重複的攝影機表 (需包含 '攝影機', '攝影機名稱', '經度', '緯度')
+        radii: 由細到粗的分群半徑 (公尺)
+        district_col: 作為轄區的欄位名稱；資料中沒有此欄位時略過轄區層級
+
+    Returns:
+        dict: {
+            'levels': 由細到粗的層級名稱 (含 'camera' 與 'district'),
+            'camera_table': 每支攝影機在各層級的區域 ID,
+            'parent': {層級: {區域 ID: 上一層區域 ID (多數攝影機所屬)}},
+            'children': {層級: {區域 ID: [與其共用攝影機的下一層區域 ID, ...]}}
+        }
+    """
+    radii = sorted(radii)
+    camera_table = unique_cameras.drop_duplicates(subset=['攝影機']).reset_index(drop=True).copy()
+    camera_table['經度'] = pd.to_numeric(camera_table['經度'], errors='coerce')
+    camera_table['緯度'] = pd.to_numeric(camera_table['緯度'], errors='coerce')
+
+    levels = [CAMERA_LEVEL]
+    for radius in radii:
+        level = level_name(radius)
+        clustered = cluster_cameras_by_distance(camera_table[['攝影機', '經度', '緯度']], radius_meters=radius)
+        camera_table[level_column(level)] = clustered['LocationAreaID'].to_numpy()
+        levels.append(level)
+
+    if district_col in camera_table.columns:
+        top_col = level_column(levels[-1])
+        district_of_area = (camera_table.groupby(top_col)[district_col]
+                            .agg(lambda s: s.mode().iloc[0] if not s.mode().empty else None))
+        camera_table[level_column(DISTRICT_LEVEL)] = camera_table[top_col].map(district_of_area)
+        levels.append(DISTRICT_LEVEL)
+
+    parent, children = {}, {}
+    for fine, coarse in zip(levels[:-1], levels[1:]):
+        parent[fine] = _majority_parent(camera_table, level_column(fine), level_column(coarse))
+        pairs = camera_table[[level_column(fine), level_column(coarse)]].drop_duplicates()
+        children[coarse] = pairs.groupby(level_column(coarse))[level_column(fine)].apply(list).to_dict()
+
+    return {
+        'levels': levels,
+        'camera_table': camera_table,
+        'parent': parent,
+        'children': children,
+    }
+
+def area_table_for_level(hierarchy: dict, level: str) -> pd.DataFrame:
+    """
+    回傳與 cluster_cameras_by_distance 相同格式的攝影機表 ('LocationAreaID' 為指定層級的區域 ID)，
+    可直接替換既有流程中的單層分群結果。
+    """
+    table = hierarchy['camera_table'].copy()
+    table['LocationAreaID'] = table[level_column(level)]
+    return table
+
+def roll_up(detections_df: pd.DataFrame, hierarchy: dict, level: str, out_col: str = None) -> pd.DataFrame:
+    """
+    將偵測紀錄 (需包含 '攝影機') 彙總到指定層級，新增一欄該層級的區域 ID。
+    """
+    out_col = out_col or level_column(level)
+    camera_to_area = dict(zip(hierarchy['camera_table']['攝影機'],
+                              hierarchy['camera_table'][level_column(level)]))
+    result = detections_df.copy()
+    result[out_col] = result['攝影機'].map(camera_to_area)
+    return result
+
+def coarse_area_map(hierarchy: dict, fine_level: str, coarse_level: str) -> dict:
+    """回傳 {細層級區域 ID: 粗層級區域 ID} 的對照表 (細層級區域跨越多個粗層級區域時取多數攝影機所屬者)。"""
+    camera_table = hierarchy['camera_table']
+    return _majority_parent(camera_table, level_column(fine_level), level_column(coarse_level))
+
+def drill_down(hierarchy: dict, level: str, area_id, to_level: str = CAMERA_LEVEL) -> list:
+    """
+    將某個層級的區域展開成更細層級的區域 (或攝影機) 列表：該區域內的攝影機在目標層級所屬的區域
+    (依 camera_table 的出現順序，不重複)。
+    """
+    levels = hierarchy['levels']
+    if levels.index(to_level) >= levels.index(level):
+        raise ValueError(f"無法從 {level} 展開到 {to_level}：目標層級必須比較細。")
+
+    camera_table = hierarchy['camera_table']
+    members = camera_table.loc[camera_table[level_column(level)] == area_id, level_column(to_level)]
+    return members.drop_duplicates().tolist()
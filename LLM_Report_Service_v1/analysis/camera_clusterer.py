@@ -3,22 +3,8 @@
 import pandas as pd
 import numpy as np
 
-def haversine_distance(lon1, lat1, lon2, lat2):
-    """
-    計算兩個經緯度座標點之間的距離（單位：公尺）。
-    """
-    R = 6371000  # 地球半徑，單位為公尺
-    
-    phi1 = np.radians(lat1)
-    phi2 = np.radians(lat2)
-    delta_phi = np.radians(lat2 - lat1)
-    delta_lambda = np.radians(lon2 - lon1)
-    
-    a = np.sin(delta_phi / 2.0) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2.0) ** 2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-    
-    meters = R * c
-    return meters
+# 距離公式與網格索引統一由 geo_kernels 提供
+from analysis.geo_kernels import build_grid_index, query_radius
 
 def cluster_cameras_by_distance(all_cameras_df: pd.DataFrame, radius_meters: int = 50) -> pd.DataFrame:
     """
@@ -29,28 +15,31 @@ def cluster_cameras_by_distance(all_cameras_df: pd.DataFrame, radius_meters: int
     # 初始化時，直接將欄位類型設定為 object (可以存放文字)，並使用 None 作為未分群的標記
     cameras_with_clusters['LocationAreaID'] = pd.Series(dtype='object')
     # =========================  修正結束  =========================
-    
+
+    lon = pd.to_numeric(cameras_with_clusters['經度'], errors='coerce').to_numpy(dtype=float)
+    lat = pd.to_numeric(cameras_with_clusters['緯度'], errors='coerce').to_numpy(dtype=float)
+
+    # 以網格索引做半徑查詢，取代「每支攝影機都和全部未分群攝影機計算距離」的 O(n^2) 掃描
+    grid = build_grid_index(lon, lat, cell_meters=max(radius_meters, 1))
+    labels = np.full(len(cameras_with_clusters), None, dtype=object)
+
     cluster_id_counter = 0
-    
-    for index, camera in cameras_with_clusters.iterrows():
+
+    for i in range(len(labels)):
         # 如果這支攝影機已經被分過群，就跳過
-        if pd.notna(camera['LocationAreaID']):
+        if labels[i] is not None:
             continue
-            
+
         current_cluster_id = f"Area-{cluster_id_counter:03d}"
-        cameras_with_clusters.loc[index, 'LocationAreaID'] = current_cluster_id
-        
-        # 找出所有其他尚未分群的攝影機
-        unclustered_cameras = cameras_with_clusters[pd.isna(cameras_with_clusters['LocationAreaID'])]
-        
-        if not unclustered_cameras.empty:
-            distances = haversine_distance(
-                camera['經度'], camera['緯度'],
-                unclustered_cameras['經度'], unclustered_cameras['緯度']
-            )
-            nearby_indices = unclustered_cameras.index[distances <= radius_meters]
-            cameras_with_clusters.loc[nearby_indices, 'LocationAreaID'] = current_cluster_id
-        
+        labels[i] = current_cluster_id
+
+        # 找出半徑內所有其他尚未分群的攝影機
+        nearby_indices = query_radius(grid, lon[i], lat[i], radius_meters)
+        for j in nearby_indices:
+            if labels[j] is None:
+                labels[j] = current_cluster_id
+
         cluster_id_counter += 1
-        
-    return cameras_with_clusters
\ No newline at end of file
+
+    cameras_with_clusters['LocationAreaID'] = labels
+    return cameras_with_clusters
@@ -0,0 +1,167 @@
+# analysis/camera_graph.py (攝影機轉移圖與學習式旅行時間模型)
+
+import hashlib
+import json
+
+import pandas as pd
+import numpy as np
+
+# ==========================================
+# 1. 建圖：從歷史偵測紀錄挖掘「攝影機 → 攝影機」轉移
+# ==========================================
+def _group_quantile(sorted_values: np.ndarray, starts: np.ndarray, lengths: np.ndarray, q: float) -> np.ndarray:
+    """對已依群組排序好的數值，一次計算每個群組的分位數 (線性內插，與 pandas 預設相同)。"""
+    pos = starts + (lengths - 1) * q
+    lower = np.floor(pos).astype(np.int64)
+    upper = np.minimum(lower + 1, starts + lengths - 1)
+    frac = pos - lower
+    return sorted_values[lower] * (1 - frac) + sorted_values[upper] * frac
+
+def build_camera_transition_graph(full_data: pd.DataFrame,
+                                  node_col: str = 'LocationID',
+                                  max_gap_minutes: int = 20) -> dict:
+    """
+    將每台車相鄰兩筆偵測紀錄 (同一行程內，即時間差不超過 max_gap_minutes，與 segment_trips_v3 的切分相同)
+    彙整成攝影機轉移圖，並以 CSR (compressed sparse row) 格式儲存每條邊的旅行時間分佈。
+
+    Args:
+        full_data: 全部車輛的軌跡資料 (需包含 '車牌', 'datetime' 與 node_col)
+        node_col: 作為圖節點的欄位 (預設 'LocationID'；舊資料集可用 '攝影機')
+        max_gap_minutes: 超過此時間差的相鄰紀錄視為不同行程，不計入轉移
+
+    Returns:
+        dict: {
+            'nodes': 節點 ID 陣列, 'node_index': {節點 ID: 編號},
+            'indptr', 'indices': CSR 鄰接結構 (indices 為終點節點編號，每列內已排序),
+            'count', 'mean_seconds', 'median_seconds', 'p10_seconds', 'p90_seconds': 與 indices 對齊的邊統計
+        }
+    """
+    df = full_data[['車牌', node_col, 'datetime']].dropna(subset=[node_col])
+    df = df.sort_values(['車牌', 'datetime'], kind='mergesort')
+
+    plate_codes, _ = pd.factorize(df['車牌'])
+    node_codes, nodes = pd.factorize(df[node_col].astype(str))
+    times = pd.to_datetime(df['datetime']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    n_nodes = len(nodes)
+
+    gap_seconds = np.diff(times) / 1e9
+    src, dst = node_codes[:-1], node_codes[1:]
+    valid = (
+        (plate_codes[1:] == plate_codes[:-1]) &
+        (gap_seconds <= max_gap_minutes * 60) &
+        (src != dst)
+    )
+    src, dst, gap_seconds = src[valid], dst[valid], gap_seconds[valid]
+
+    # 依 (起點, 終點, 時間差) 排序後，每條邊的樣本會連續排列，可直接計算分位數
+    order = np.lexsort((gap_seconds, dst, src))
+    src, dst, gap_seconds = src[order], dst[order], gap_seconds[order]
+    edge_keys = src.astype(np.int64) * max(n_nodes, 1) + dst
+    _, starts, counts = np.unique(edge_keys, return_index=True, return_counts=True)
+
+    edge_src = src[starts]
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.add.at(indptr, edge_src + 1, 1)
+    indptr = np.cumsum(indptr)
+
+    sums = np.add.reduceat(gap_seconds, starts) if len(starts) else np.empty(0)
+    return {
+        'node_col': node_col,
+        'max_gap_minutes': max_gap_minutes,
+        'nodes': np.asarray(nodes, dtype=object),
+        'node_index': {node: i for i, node in enumerate(nodes)},
+        'indptr': indptr,
+        'indices': dst[starts].astype(np.int32),
+        'count': counts.astype(np.int32),
+        'mean_seconds': sums / np.maximum(counts, 1),
+        'median_seconds': _group_quantile(gap_seconds, starts, counts, 0.5),
+        'p10_seconds': _group_quantile(gap_seconds, starts, counts, 0.1),
+        'p90_seconds': _group_quantile(gap_seconds, starts, counts, 0.9),
+    }
+
+# ==========================================
+# 2. 查詢
+# ==========================================
+def edge_position(graph: dict, from_node, to_node) -> int:
+    """回傳 (from_node -> to_node) 在 CSR 陣列中的位置；邊不存在時回傳 -1。"""
+    a = graph['node_index'].get(str(from_node))
+    b = graph['node_index'].get(str(to_node))
+    if a is None or b is None:
+        return -1
+    lo, hi = graph['indptr'][a], graph['indptr'][a + 1]
+    pos = lo + np.searchsorted(graph['indices'][lo:hi], b)
+    return int(pos) if pos < hi and graph['indices'][pos] == b else -1
+
+def expected_transition_seconds(graph: dict, from_node, to_node, stat: str = 'median_seconds', default=None):
+    """查詢兩支攝影機之間的學習旅行時間 (秒)；沒有歷史轉移時回傳 default。"""
+    pos = edge_position(graph, from_node, to_node)
+    return float(graph[stat][pos]) if pos >= 0 else default
+
+def neighbors(graph: dict, node) -> list:
+    """列出某支攝影機的所有下游攝影機與旅行時間統計。"""
+    a = graph['node_index'].get(str(node))
+    if a is None:
+        return []
+    lo, hi = graph['indptr'][a], graph['indptr'][a + 1]
+    return [{
+        'to': graph['nodes'][graph['indices'][pos]],
+        'count': int(graph['count'][pos]),
+        'median_seconds': float(graph['median_seconds'][pos]),
+        'p90_seconds': float(graph['p90_seconds'][pos]),
+    } for pos in range(lo, hi)]
+
+def transition_gap_thresholds(graph: dict, from_nodes, to_nodes,
+                              default_minutes: float = 20,
+                              factor: float = 3.0,
+                              min_minutes: float = 1.0,
+                              min_count: int = 3) -> np.ndarray:
+    """
+    以學習到的旅行時間取代固定的時間門檻。
+
+    對每一組相鄰的 (from, to)，若歷史轉移樣本數至少 min_count，門檻為 max(p90 * factor, min_minutes)；
+    否則退回 default_minutes。
+
+    Returns:
+        與輸入等長的門檻陣列 (分鐘)。
+    """
+    thresholds = np.full(len(from_nodes), float(default_minutes))
+    for i, (a, b) in enumerate(zip(from_nodes, to_nodes)):
+        if a == b:
+            continue
+        pos = edge_position(graph, a, b)
+        if pos >= 0 and graph['count'][pos] >= min_count:
+            thresholds[i] = max(graph['p90_seconds'][pos] * factor / 60.0, min_minutes)
+    return thresholds
+
+# ==========================================
+# 3. 儲存 / 載入 (建圖只需執行一次)
+# ==========================================
+_ARRAY_KEYS = ('indptr', 'indices', 'count', 'mean_seconds', 'median_seconds', 'p10_seconds', 'p90_seconds')
+
+def save_transition_graph(graph: dict, path) -> None:
+    """將轉移圖存成 .npz (節點 ID 以 JSON 字串儲存，避免 pickle)。"""
+    np.savez_compressed(
+        path,
+        nodes_json=np.array(json.dumps([str(n) for n in graph['nodes']], ensure_ascii=False)),
+        meta_json=np.array(json.dumps({'node_col': graph['node_col'], 'max_gap_minutes': graph['max_gap_minutes']})),
+        **{key: graph[key] for key in _ARRAY_KEYS}
+    )
+
+def transition_graph_fingerprint(graph: dict) -> str:
+    """轉移圖內容的指紋 (節點、邊與旅行時間統計)，作為分析結果快取鍵的一部分。"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([str(n) for n in graph['nodes']], ensure_ascii=False).encode('utf-8'))
+    for key in _ARRAY_KEYS:
+        digest.update(np.ascontiguousarray(graph[key]).tobytes())
+    return digest.hexdigest()
+
+def load_transition_graph(path) -> dict:
+    """載入 save_transition_graph 儲存的轉移圖。"""
+    with np.load(path) as data:
+        nodes = json.loads(str(data['nodes_json']))
+        meta = json.loads(str(data['meta_json']))
+        graph = {key: data[key] for key in _ARRAY_KEYS}
+    graph.update(meta)
+    graph['nodes'] = np.asarray(nodes, dtype=object)
+    graph['node_index'] = {node: i for i, node in enumerate(nodes)}
+    return graph
@@ -0,0 +1,232 @@
+# analysis/colocation_query.py (反向查詢「誰來過這裡」：指定區域或座標半徑 + 時間區間，列出出現過的車輛並依停留時間排序)
+#
+# 用法:
+#     index = build_colocation_index(full_data, area_hierarchy)          # 建立一次 (API 於啟動時載入)
+#     table = who_was_here(index, start='2025-08-01', end='2025-08-07', area_id='Area-012', level='200m')
+#     table = who_was_here(index, start=..., end=..., lon=121.11, lat=24.90, radius_meters=150)
+#     records = table_records(table)                                      # analysis/result_types.py
+#
+# 索引為每支攝影機一段依時間排序的偵測列 (postings)；區域 (任一層級) 經由 area_hierarchy 展開成攝影機，
+# 座標半徑經由攝影機的網格索引找出攝影機，因此同一份索引可回答所有層級的區域與任意半徑的查詢。
+# 停留時間以 advanced_stay_table (與 find_advanced_stay_points 相同的顯性 / 隱性停留規則) 計算，
+# 只針對時間區間內出現過的車輛，取其查詢區間前後 context_hours 的軌跡。
+
+import numpy as np
+import pandas as pd
+
+from analysis.area_hierarchy import build_area_hierarchy, level_column, CAMERA_LEVEL, DEFAULT_RADII
+from analysis.geo_kernels import build_grid_index, query_radius
+from analysis.result_types import create_table, empty_table, take_rows
+from analysis.shared_dataset import create_shared_dataset
+from analysis.trajectory_kernel import trajectory_arrays_from_columns, advanced_stay_table
+
+DEFAULT_LEVEL = '200m'
+DEFAULT_CONTEXT_HOURS = 12
+
+COLOCATION_FIELDS = [
+    ('plate', 'category'), ('dwell_minutes', 'float'), ('stay_count', 'int'), ('detections', 'int'),
+    ('camera_count', 'int'), ('first_seen', 'time'), ('last_seen', 'time'),
+]
+
+# ==========================================
+# 1. 建立索引
+# ==========================================
+def build_colocation_index(full_data: pd.DataFrame, area_hierarchy: dict = None, dataset: dict = None,
+                           stay_level: str = DEFAULT_LEVEL, cell_meters: float = 200.0) -> dict:
+    """
+    建立反向查詢索引。
+
+    Args:
+        area_hierarchy: build_area_hierarchy 的結果 (未提供時以預設半徑建立)
+        dataset: 依 (車牌, 時間) 排序的資料集 (analysis/shared_dataset.py；未提供時以 'local' 後端建立)
+        stay_level: 停留點說明中使用的區域層級
+        cell_meters: 攝影機網格索引的網格邊長 (公尺)
+
+    Returns:
+        dict: {'dataset', 'post_rows', 'post_times', 'camera_offsets', 'grid', 'camera_index',
+               'area_cameras', 'camera_names', 'camera_areas', 'levels'}
+    """
+    if dataset is None:
+        dataset = create_shared_dataset(full_data, backend='local')
+    if area_hierarchy is None:
+        columns = [c for c in ('攝影機', '攝影機名稱', '經度', '緯度', '單位') if c in full_data.columns]
+        unique_cameras = full_data[columns].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+        area_hierarchy = build_area_hierarchy(unique_cameras, radii=DEFAULT_RADII)
+
+    arrays = dataset['arrays']
+    meta = dataset['spec']['meta']
+    n_cameras = len(meta['camera_values'])
+
+    # 每支攝影機一段依時間排序的偵測列
+    camera_codes = np.asarray(arrays['camera_codes'])
+    post_rows = np.lexsort((arrays['times'], camera_codes))
+    camera_offsets = np.searchsorted(camera_codes[post_rows], np.arange(n_cameras + 1)).astype(np.int64)
+    first_rows = post_rows[camera_offsets[:-1]]
+
+    # 區域 / 攝影機 ID 一律以字串比對 (命令列與 API 的參數皆為字串)
+    camera_index = {str(camera): code for code, camera in enumerate(meta['camera_values'])}
+    table = area_hierarchy['camera_table']
+    table_codes = table['攝影機'].astype(str).map(camera_index)
+    in_data = table_codes.notna().to_numpy()
+    area_cameras, camera_areas = {}, {}
+    for level in area_hierarchy['levels']:
+        if level == CAMERA_LEVEL:
+            continue
+        area_ids = table[level_column(level)].to_numpy(dtype=object)[in_data]
+        codes = table_codes[in_data].astype(np.int64).to_numpy()
+        area_keys = pd.Series(area_ids).astype(str)
+        area_cameras[level] = {key: codes[positions] for key, positions in area_keys.groupby(area_keys).indices.items()}
+        camera_areas[level] = np.full(n_cameras, None, dtype=object)
+        camera_areas[level][codes] = area_ids
+
+    return {
+        'dataset': dataset,
+        'post_rows': post_rows,
+        'post_times': np.asarray(arrays['times'])[post_rows],
+        'camera_offsets': camera_offsets,
+        'grid': build_grid_index(arrays['lon'][first_rows], arrays['lat'][first_rows], cell_meters=cell_meters),
+        'camera_index': camera_index,
+        'area_cameras': area_cameras,
+        'camera_names': np.array(meta['camera_names'], dtype=object),
+        'camera_areas': camera_areas,
+        'stay_level': stay_level if stay_level in camera_areas else None,
+        'levels': area_hierarchy['levels'],
+    }
+
+# ==========================================
+# 2. 查詢
+# ==========================================
+def _target_cameras(index: dict, area_id=None, level: str = DEFAULT_LEVEL, lon: float = None, lat: float = None,
+                    radius_meters: float = None) -> np.ndarray:
+    """查詢範圍內的攝影機編號：區域 (任一層級，'camera' 層級為單一攝影機) 或座標半徑擇一。"""
+    by_point = lon is not None or lat is not None
+    if by_point == (area_id is not None):
+        raise ValueError("請指定 area_id (區域查詢) 或 lon / lat / radius_meters (座標半徑查詢) 其中一種。")
+
+    if by_point:
+        if lon is None or lat is None or radius_meters is None or radius_meters <= 0:
+            raise ValueError("座標半徑查詢需要 lon、lat 與大於 0 的 radius_meters。")
+        return query_radius(index['grid'], float(lon), float(lat), float(radius_meters))
+
+    if level == CAMERA_LEVEL:
+        if str(area_id) not in index['camera_index']:
+            raise ValueError(f"找不到攝影機 {area_id}")
+        return np.array([index['camera_index'][str(area_id)]], dtype=np.int64)
+    if level not in index['area_cameras']:
+        raise ValueError(f"不支援的區域層級 '{level}'，可用: {', '.join(index['levels'])}")
+    if str(area_id) not in index['area_cameras'][level]:
+        raise ValueError(f"在 {level} 層級找不到區域 {area_id}")
+    return index['area_cameras'][level][str(area_id)]
+
+def _time_bounds(start, end) -> tuple:
+    """[start, end) 的 ns 邊界；未指定的一端為 int64 的極值。"""
+    from data_loader import parse_date_range
+
+    start_ts, end_ts = parse_date_range(start, end)
+    info = np.iinfo(np.int64)
+    return (start_ts.value if start_ts is not None else info.min,
+            end_ts.value if end_ts is not None else info.max)
+
+def _plate_dwell(index: dict, plate_code: int, lo_ns: int, hi_ns: int, in_target: np.ndarray,
+                 context_ns: int, stay_threshold_minutes: float, gap_speed_threshold_kph: float) -> tuple:
+    """
+    車輛在查詢範圍內的停留時間 (分鐘) 與停留次數。
+    停留 (advanced_stay_table) 與 find_advanced_stay_points 的 area_id_hint 相同，只歸屬於起點偵測的位置：
+    起點攝影機位於查詢範圍內時計入，只計算與 [lo, hi) 重疊的部分。
+    """
+    arrays = index['dataset']['arrays']
+    start, end = arrays['plate_offsets'][plate_code], arrays['plate_offsets'][plate_code + 1]
+    plate_times = arrays['times'][start:end]
+    # 查詢區間前後各取 context_ns，讓跨越邊界的停留也能完整判斷
+    window_lo = np.searchsorted(plate_times, max(lo_ns, np.iinfo(np.int64).min + context_ns) - context_ns, side='left')
+    window_hi = np.searchsorted(plate_times, min(hi_ns, np.iinfo(np.int64).max - context_ns) + context_ns, side='left')
+    rows = slice(start + window_lo, start + window_hi)
+
+    cameras = np.asarray(arrays['camera_codes'][rows])
+    times = np.asarray(arrays['times'][rows])
+    areas = index['camera_areas'][index['stay_level']][cameras] if index['stay_level'] else None
+    trajectory = trajectory_arrays_from_columns(times, np.asarray(arrays['lon'][rows]), np.asarray(arrays['lat'][rows]),
+                                                index['camera_names'][cameras], areas=areas)
+    stays = advanced_stay_table(trajectory, stay_threshold_minutes, gap_speed_threshold_kph)
+    if not stays['length']:
+        return 0.0, 0
+
+    # 起點偵測列：顯性停留從斷層後第一筆開始 (同時間的第一筆)，隱性停留從斷層前最後一筆開始 (同時間的最後一筆)
+    stay_start, stay_end = stays['columns']['start_time'], stays['columns']['end_time']
+    is_gap_stay = stays['columns']['type'] == 1
+    first = np.where(is_gap_stay, np.searchsorted(times, stay_start, side='right') - 1,
+                     np.searchsorted(times, stay_start, side='left'))
+    overlap = np.minimum(stay_end, hi_ns) - np.maximum(stay_start, lo_ns)
+    here = in_target[cameras[first]] & (overlap > 0)
+    return float(overlap[here].sum() / 6e10), int(here.sum())
+
+def who_was_here(index: dict, start=None, end=None, area_id=None, level: str = DEFAULT_LEVEL,
+                 lon: float = None, lat: float = None, radius_meters: float = None,
+                 min_dwell_minutes: float = 0.0, top_n: int = None,
+                 stay_threshold_minutes: float = 20, gap_speed_threshold_kph: float = 10.0,
+                 context_hours: float = DEFAULT_CONTEXT_HOURS) -> dict:
+    """
+    列出在 [start, end) 期間被查詢範圍內的攝影機拍到的所有車輛，依停留時間排序。
+
+    Args:
+        start / end: 日期範圍 ('YYYY-MM-DD' 或完整時間；end 只有日期時包含當天整天)，未指定為不限
+        area_id / level: 區域查詢 (level 為 area_hierarchy 的層級名稱，'camera' 時 area_id 為攝影機 ID)
+        lon / lat / radius_meters: 座標半徑查詢 (與區域查詢擇一)
+        min_dwell_minutes: 只保留停留時間至少這麼久的車輛 (0 表示只要出現過就列出)
+        top_n: 只回傳前 top_n 台 (None 為全部)
+
+    Returns:
+        dict: 結果表 (欄位見 COLOCATION_FIELDS)，依停留時間、偵測次數 (皆由多到少)、首次出現時間排序
+
+    Raises:
+        ValueError: 查詢方式、層級、區域或日期範圍不正確
+    """
+    cameras = _target_cameras(index, area_id, level, lon, lat, radius_meters)
+    lo_ns, hi_ns = _time_bounds(start, end)
+
+    # 1. 範圍內各攝影機的偵測列 (每支攝影機兩次二分搜尋)
+    offsets, post_times = index['camera_offsets'], index['post_times']
+    rows = []
+    for camera in cameras:
+        camera_times = post_times[offsets[camera]:offsets[camera + 1]]
+        first = offsets[camera] + np.searchsorted(camera_times, lo_ns, side='left')
+        last = offsets[camera] + np.searchsorted(camera_times, hi_ns, side='left')
+        rows.append(index['post_rows'][first:last])
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    if len(rows) == 0:
+        return empty_table('colocation', COLOCATION_FIELDS)
+
+    # 2. 依車牌彙總偵測次數、攝影機數與首末次出現時間
+    arrays = index['dataset']['arrays']
+    plates = np.asarray(arrays['plate_codes'])[rows].astype(np.int64)
+    times = np.asarray(arrays['times'])[rows]
+    camera_codes = np.asarray(arrays['camera_codes'])[rows].astype(np.int64)
+    order = np.lexsort((times, plates))
+    plates, times, camera_codes = plates[order], times[order], camera_codes[order]
+    plate_codes, starts, detections = np.unique(plates, return_index=True, return_counts=True)
+    n_cameras = len(offsets) - 1
+    plate_camera_pairs = np.unique(plates * n_cameras + camera_codes) // n_cameras
+    camera_count = np.searchsorted(plate_camera_pairs, plate_codes, side='right') - \
+        np.searchsorted(plate_camera_pairs, plate_codes, side='left')
+
+    # 3. 停留時間 (只針對出現過的車輛計算)
+    in_target = np.zeros(n_cameras, dtype=bool)
+    in_target[cameras] = True
+    context_ns = int(context_hours * 3600 * 1e9)
+    dwell = [_plate_dwell(index, code, lo_ns, hi_ns, in_target, context_ns, stay_threshold_minutes,
+                          gap_speed_threshold_kph) for code in plate_codes]
+
+    table = create_table('colocation', COLOCATION_FIELDS, {
+        'plate': plate_codes.astype(np.int32),
+        'dwell_minutes': np.round(np.array([d[0] for d in dwell], dtype=np.float64), 2),
+        'stay_count': np.array([d[1] for d in dwell], dtype=np.int64),
+        'detections': detections.astype(np.int64),
+        'camera_count': camera_count.astype(np.int64),
+        'first_seen': times[starts],
+        'last_seen': times[starts + detections - 1],
+    }, categories={'plate': np.array(index['dataset']['spec']['meta']['plate_names'], dtype=object)})
+
+    columns = table['columns']
+    ranked = np.lexsort((columns['first_seen'], -columns['detections'], -columns['dwell_minutes']))
+    ranked = ranked[columns['dwell_minutes'][ranked] >= min_dwell_minutes]
+    return take_rows(table, ranked[:top_n] if top_n is not None else ranked)
@@ -1,34 +1,65 @@
 # analysis/convoy_analyzer.py (V9 - 新增摘要總表)
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 from itertools import groupby
 
-# 從現有的模組中，匯入我們需要的行程切分工具
-from .trip_segmenter import segment_trips_v3
+# 從現有的模組中，匯入我們需要的行程切分工具 (單次掃描核心)
+from .trajectory_kernel import build_trajectory_arrays, trip_table, graph_node_col
+from .result_types import create_table, encode_categories, table_records, take_rows, column_values
+from .camera_graph import transition_gap_thresholds
+from .route_matcher import fill_path_gaps
+from .trip_lsh_index import rank_candidate_plates
+from .copresence_index import nearest_matches_in_window
+from .shared_dataset import shared_dataset, attach_worker_dataset, get_worker_dataset, plate_arrays, plate_frame
+from monitoring.stage_metrics import stage_span
 
 # --- 核心演算法函式 ---
 
-def _find_continuous_segments(events_df: pd.DataFrame, max_gap_minutes: int = 10) -> list:
-    """從一系列共現事件中，找出所有連續的同行片段。"""
-    if events_df.empty:
+SEGMENT_FIELDS = [('datetime_x', 'time'), ('datetime_y', 'time'), ('LocationID', 'category')]
+
+def _find_continuous_segments(events: list, max_gap_minutes: int = 10,
+                              transition_graph: dict = None) -> list:
+    """
+    從一系列共現事件 ({'datetime_x', 'datetime_y', 'LocationID'}) 中，找出所有連續的同行片段，
+    每個片段為一個結果表 (欄位見 SEGMENT_FIELDS，analysis/result_types.py)。
+    提供 transition_graph 時，相鄰兩個共現地點之間的容許間隔改用學習旅行時間。
+    """
+    if not events:
         return []
-    
-    segments = []
+
+    location_codes, locations = encode_categories([e['LocationID'] for e in events])
+    events_table = create_table('convoy_segment', SEGMENT_FIELDS, {
+        'datetime_x': pd.DatetimeIndex([e['datetime_x'] for e in events]).as_unit('ns').asi8,
+        'datetime_y': pd.DatetimeIndex([e['datetime_y'] for e in events]).as_unit('ns').asi8,
+        'LocationID': location_codes,
+    }, categories={'LocationID': locations})
+
     # 僅根據目標車的時間差來切分路段
-    events_df['time_gap'] = events_df['datetime_x'].diff() > pd.Timedelta(minutes=max_gap_minutes)
-    group_ids = events_df['time_gap'].cumsum()
-    
-    for _, group in events_df.groupby(group_ids):
-        segments.append(group.drop(columns=['time_gap']))
-    return segments
+    times_x = events_table['columns']['datetime_x']
+    if transition_graph is not None:
+        locs = locations[location_codes].astype(str)
+        thresholds = transition_gap_thresholds(transition_graph, locs[:-1].tolist(), locs[1:].tolist(),
+                                               default_minutes=max_gap_minutes)
+        threshold_ns = pd.to_timedelta(thresholds, unit='min').as_unit('ns').asi8
+    else:
+        threshold_ns = pd.Timedelta(minutes=max_gap_minutes).value
+    starts = np.ones(len(events), dtype=bool)
+    starts[1:] = np.diff(times_x) > threshold_ns
+
+    bounds = np.append(np.flatnonzero(starts), len(events))
+    return [take_rows(events_table, np.arange(s, e)) for s, e in zip(bounds[:-1], bounds[1:])]
 
-def _get_following_pattern_v2(target_trip_df: pd.DataFrame, convoy_segment_df: pd.DataFrame) -> str:
+def _get_following_pattern_v2(target_trip_df: pd.DataFrame, convoy_segment: dict) -> str:
     """
-    【V2版】根據同行路段在完整行程中的位置和比例，產生更詳細的跟隨模式標籤。
+    【V2版】根據同行路段 (_find_continuous_segments 的片段結果表) 在完整行程中的位置和比例，
+    產生更詳細的跟隨模式標籤。
     """
     target_len = len(target_trip_df)
     if target_len == 0: return "模式未知"
-    convoy_len = len(convoy_segment_df)
+    convoy_len = convoy_segment['length']
     
     ratio = convoy_len / target_len
     if ratio > 0.9: length_tag = "全程"
@@ -38,8 +69,8 @@ def _get_following_pattern_v2(target_trip_df: pd.DataFrame, convoy_segment_df: p
 
     if length_tag == "全程": return "全程跟隨"
 
-    first_convoy_point_time = convoy_segment_df.iloc[0]['datetime_x']
-    last_convoy_point_time = convoy_segment_df.iloc[-1]['datetime_x']
+    first_convoy_point_time = pd.Timestamp(convoy_segment['columns']['datetime_x'][0])
+    last_convoy_point_time = pd.Timestamp(convoy_segment['columns']['datetime_x'][-1])
 
     start_indices = target_trip_df.index[target_trip_df['datetime'] == first_convoy_point_time]
     if len(start_indices) == 0: return f"{length_tag}跟隨 (位置未知)"
@@ -67,118 +98,299 @@ def _get_following_pattern_v2(target_trip_df: pd.DataFrame, convoy_segment_df: p
 
     return f"{length_tag}跟隨 ({position_tag})"
 
-# --- 主流程函式 ---
+def _partner_arrays(full_data: pd.DataFrame, partners: list) -> dict:
+    """
+    一次將同行車的資料依車牌分組，回傳 {車牌: (時間 ns 陣列, LocationID 陣列)}，各車依時間排序。
+    取代每個 (行程, 同行車) 組合都對整份資料做一次車牌篩選。
+    """
+    partner_df = full_data[full_data['車牌'].isin(set(partners))]
+    partner_df = partner_df.sort_values(['車牌', 'datetime'], kind='mergesort')
+    return {
+        plate: (group['datetime'].to_numpy(dtype='datetime64[ns]').astype(np.int64),
+                group['LocationID'].to_numpy(dtype=object))
+        for plate, group in partner_df.groupby('車牌', sort=False)
+    }
+
+def _dataset_partner_arrays(dataset: dict, partners: list) -> dict:
+    """與 _partner_arrays 相同的結果，但直接由共用資料集切出各車的陣列視圖，不必篩選與排序整份 DataFrame。"""
+    location_names = np.array(dataset['spec']['meta']['location_names'] + [np.nan], dtype=object)
+    partner_arrays = {}
+    for plate in partners:
+        view = plate_arrays(dataset, plate)
+        if len(view['times']):
+            partner_arrays[plate] = (np.asarray(view['times']), location_names[np.asarray(view['location_codes'])])
+    return partner_arrays
+
+def _scan_partner_co_occurrence(partner_arrays: tuple, target_trip_df: pd.DataFrame,
+                                time_tolerance: pd.Timedelta = pd.Timedelta(minutes=1)) -> list:
+    """
+    找出同行車與目標行程每個地點 ±time_tolerance 內 (含邊界) 時間最接近的偵測；
+    以二分搜尋取出時間窗，距離相同時取時間較早的一筆。partner_arrays 來自 _partner_arrays。
+    """
+    p_times, p_locs = partner_arrays
+    t_times = target_trip_df['datetime'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    t_locs = target_trip_df['LocationID'].to_numpy(dtype=object)
+    tolerance_ns = int(time_tolerance.value)
+    lo = np.searchsorted(p_times, t_times - tolerance_ns, side='left')
+    hi = np.searchsorted(p_times, t_times + tolerance_ns, side='right')
+
+    co_occurrence_events_list = []
+    for i in np.flatnonzero(hi > lo):
+        same_loc = np.flatnonzero(p_locs[lo[i]:hi[i]] == t_locs[i])
+        if len(same_loc) == 0:
+            continue
+        window = p_times[lo[i]:hi[i]][same_loc]
+        best = window[np.argmin(np.abs(window - t_times[i]))]
+        co_occurrence_events_list.append({'datetime_x': target_trip_df['datetime'].iloc[i],
+                                          'datetime_y': pd.Timestamp(best), 'LocationID': t_locs[i]})
+    return co_occurrence_events_list
+
+def _co_occurrence_events_from_index(copresence_index: dict, target_trip_df: pd.DataFrame,
+                                     tolerance_seconds: float = 60) -> dict:
+    """
+    以共現索引一次找出所有車輛的共現事件 (結果與 _scan_partner_co_occurrence 相同)，
+    每個目標地點只需一次索引查詢，而不是每台同行車各掃描一次 DataFrame。
+
+    Returns:
+        dict: {同行車車牌: [共現事件, ...]}
+    """
+    events_by_partner = {}
+    for target_time, target_loc in zip(target_trip_df['datetime'], target_trip_df['LocationID']):
+        for plate, matched_time in nearest_matches_in_window(copresence_index, target_loc, target_time, tolerance_seconds).items():
+            events_by_partner.setdefault(plate, []).append(
+                {'datetime_x': target_time, 'datetime_y': matched_time, 'LocationID': target_loc}
+            )
+    return events_by_partner
+
+# --- 平行掃描 (資料以共用資料集提供，不需逐工作 pickle；見 analysis/shared_dataset.py) ---
+
+def _scan_partner_chunk(task: tuple) -> list:
+    """
+    子行程工作：對一批同行車，找出與每個目標行程地點 ±tolerance 內時間最接近的偵測
+    (規則與 _scan_partner_co_occurrence 相同)。
+
+    Returns:
+        list of (partner_code, trip_idx, target_positions, partner_times_ns)
+    """
+    partner_codes, target_trips, tolerance_ns = task
+    arrays = get_worker_dataset()['arrays']
+    offsets = arrays['plate_offsets']
+    results = []
+    for code in partner_codes:
+        start, end = offsets[code], offsets[code + 1]
+        p_times = arrays['times'][start:end]
+        p_locs = arrays['location_codes'][start:end]
+        for trip_idx, (t_times, t_locs) in enumerate(target_trips):
+            lo = np.searchsorted(p_times, t_times - tolerance_ns, side='left')
+            hi = np.searchsorted(p_times, t_times + tolerance_ns, side='right')
+            positions, matched = [], []
+            for i in np.flatnonzero(hi > lo):
+                same_loc = np.flatnonzero(p_locs[lo[i]:hi[i]] == t_locs[i])
+                if len(same_loc) == 0:
+                    continue
+                window = p_times[lo[i]:hi[i]][same_loc]
+                positions.append(i)
+                matched.append(window[np.argmin(np.abs(window - t_times[i]))])
+            if positions:
+                results.append((code, trip_idx, positions, matched))
+    return results
+
+def _parallel_co_occurrence_events(full_data: pd.DataFrame, partners: list, target_trip_dfs: list,
+                                   n_workers: int, time_tolerance: pd.Timedelta = pd.Timedelta(minutes=1),
+                                   dataset: dict = None) -> list:
+    """
+    以行程池平行掃描所有 (同行車, 目標行程) 組合。子行程附加到共用資料集 (dataset 未提供時臨時建立)，
+    每個工作只傳遞車牌編號與目標行程的小陣列。
+
+    Returns:
+        list (與 target_trip_dfs 對齊) of dict：{同行車車牌: [共現事件, ...]}；
+        結果依輸入順序組合，與工作數量、完成順序無關。
+    """
+    events_per_trip = [dict() for _ in target_trip_dfs]
+    with contextlib.ExitStack() as stack:
+        if dataset is None:
+            dataset = stack.enter_context(shared_dataset(full_data, location_col='LocationID'))
+        partner_codes = [dataset['plate_index'][p] for p in partners if p in dataset['plate_index']]
+        plate_names = dataset['spec']['meta']['plate_names']
+        target_trips = [(
+            trip_df['datetime'].to_numpy(dtype='datetime64[ns]').astype(np.int64),
+            np.array([dataset['location_index'].get(str(loc), -1) for loc in trip_df['LocationID']], dtype=np.int32),
+        ) for trip_df in target_trip_dfs]
+
+        chunk_count = max(1, min(len(partner_codes), n_workers * 4))
+        chunks = [partner_codes[i::chunk_count] for i in range(chunk_count)]
+        tasks = [(chunk, target_trips, int(time_tolerance.value)) for chunk in chunks if chunk]
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=attach_worker_dataset,
+                                 initargs=(dataset['spec'],)) as pool:
+            chunk_results = list(pool.map(_scan_partner_chunk, tasks))
+
+    for result in chunk_results:
+        for code, trip_idx, positions, matched in result:
+            trip_df = target_trip_dfs[trip_idx]
+            events_per_trip[trip_idx][plate_names[code]] = [
+                {'datetime_x': trip_df['datetime'].iloc[i], 'datetime_y': pd.Timestamp(t), 'LocationID': trip_df['LocationID'].iloc[i]}
+                for i, t in zip(positions, matched)
+            ]
+    return events_per_trip
+
+# --- 分析 (計算) ---
+
+def analyze_convoy_partners(full_data: pd.DataFrame, target_plate: str, transition_graph: dict = None,
+                            trip_lsh_index: dict = None, lsh_min_similarity: float = None,
+                            copresence_index: dict = None, n_workers: int = None,
+                            min_segment_length: int = 20, dataset: dict = None) -> dict:
+    """
+    找出目標車每個行程的同行車 (只計算，不列印)。
+
+    指定 n_workers 時以 n_workers 個子行程平行掃描同行車 (資料以共用資料集提供，
+    多台目標車連續分析時可傳入同一個 analysis.shared_dataset 的 dataset，省去每次重建)；
+    提供 dataset 時目標車與同行車的資料都直接由共用陣列切出 (plate_frame / plate_arrays)，不再篩選整份 DataFrame；
+    提供 copresence_index 時直接查詢索引，不需平行掃描。
+    trip_lsh_index (選用) 依路線相似度排列候選同行車 (相似的先比對)；只有明確指定 lsh_min_similarity
+    時才排除相似度較低的車輛。
+
+    Returns:
+        dict: {'target_plate', 'target_trip_count', 'candidate_count', 'analyzed_trips', 'summary_events'}
+    """
+    if copresence_index is not None and copresence_index['meta']['key_col'] != 'LocationID':
+        raise ValueError("隨行分析需要以 'LocationID' 建立的共現索引。")
 
-def run_trip_oriented_convoy_analysis(full_data: pd.DataFrame):
-    """執行「目標行程導向的隨行分析」的主函式。"""
-    
     available_plates = sorted(full_data['車牌'].unique())
-    print("\n" + "="*50); print("== 目標行程導向隨行分析 =="); print("="*50)
-    for i, plate in enumerate(available_plates): print(f"  [{i+1}] {plate}")
-    
-    try:
-        choice_input = input(f"\n請選擇要作為基準的目標車牌 [1-{len(available_plates)}]: ")
-        target_plate = available_plates[int(choice_input) - 1]
-    except (ValueError, IndexError):
-        print("錯誤：無效的選擇，返回主菜單。")
-        return
+    target_df = (plate_frame(dataset, target_plate) if dataset is not None
+                 else full_data[full_data['車牌'] == target_plate].copy())
 
-    print("\n--- 正在分析目標車輛的所有行程並尋找同行者... ---")
-    
-    target_df = full_data[full_data['車牌'] == target_plate].copy()
-    
     if 'LocationAreaID' not in target_df.columns:
          target_df['LocationAreaID'] = target_df['LocationID']
-    
-    all_target_trips = segment_trips_v3(target_df, gap_threshold_minutes=20)
-    
-    if not all_target_trips:
-        print(f"錯誤：無法為車輛 {target_plate} 切分出任何有效行程。")
-        return
+
+    with stage_span('convoy.trip_split', rows_in=len(target_df), plate=target_plate) as span:
+        target_arrays = build_trajectory_arrays(target_df, node_col=graph_node_col(transition_graph))
+        trips = trip_table(target_arrays, gap_threshold_minutes=20, transition_graph=transition_graph)
+        all_target_trips = table_records(trips)
+        # 排序一次後以二分搜尋切出各行程 [start_time, end_time]，不必每個行程都對整台車的資料做一次篩選
+        sorted_target = target_df.sort_values('datetime', kind='mergesort')
+        target_times = sorted_target['datetime'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        lo = np.searchsorted(target_times, trips['columns']['start_time'], side='left')
+        hi = np.searchsorted(target_times, trips['columns']['end_time'], side='right')
+        target_trip_dfs = [sorted_target.iloc[s:e].reset_index(drop=True) for s, e in zip(lo, hi)]
+        span['rows_out'] = len(all_target_trips)
+
+    # 候選同行車：有 LSH 索引時依路線相似度排列 (指定 lsh_min_similarity 時才篩選)
+    with stage_span('convoy.candidates', rows_in=len(available_plates), plate=target_plate) as span:
+        candidate_partners = [p for p in available_plates if p != target_plate]
+        if trip_lsh_index is not None:
+            candidate_partners = rank_candidate_plates(trip_lsh_index, target_plate, candidate_partners,
+                                                       min_similarity=lsh_min_similarity)
+        span['rows_out'] = len(candidate_partners)
 
     analyzed_trips = []
     # 【【【 新增1: 建立一個list來儲存所有同行事件，用於最終的摘要 】】】
     all_convoy_events_for_summary = []
     cam_name_map = full_data.drop_duplicates(subset=['LocationID']).set_index('LocationID')['攝影機名稱'].to_dict()
 
-    for trip_index, trip_info in enumerate(all_target_trips):
-        trip_start_time = trip_info['start_time']
-        trip_end_time = trip_info['end_time']
-        
-        target_trip_df = target_df[
-            (target_df['datetime'] >= trip_start_time) & (target_df['datetime'] <= trip_end_time)
-        ].sort_values('datetime').reset_index(drop=True)
+    events_per_trip = None
+    partner_arrays = None
+    if copresence_index is None and n_workers and target_trip_dfs and candidate_partners:
+        with stage_span('convoy.parallel_scan', rows_in=len(full_data), plate=target_plate, workers=n_workers) as span:
+            events_per_trip = _parallel_co_occurrence_events(full_data, candidate_partners, target_trip_dfs, n_workers,
+                                                             dataset=dataset)
+            span['rows_out'] = sum(len(events) for trip_events in events_per_trip for events in trip_events.values())
+    elif copresence_index is None and target_trip_dfs:
+        partner_arrays = (_dataset_partner_arrays(dataset, candidate_partners) if dataset is not None
+                          else _partner_arrays(full_data, candidate_partners))
 
-        convoy_partners_found = []
-        max_convoy_length_in_trip = 0
+    # 逐行程比對同行片段 (未使用索引或平行掃描時，掃描同行車的時間也計入此階段)
+    with stage_span('convoy.matching', rows_in=len(target_trip_dfs) * len(candidate_partners), plate=target_plate) as span:
+        for trip_index, (trip_info, target_trip_df) in enumerate(zip(all_target_trips, target_trip_dfs)):
+            convoy_partners_found = []
+            max_convoy_length_in_trip = 0
 
-        for partner_plate in available_plates:
-            if partner_plate == target_plate: continue
-            
-            partner_df = full_data[full_data['車牌'] == partner_plate].copy()
-            partner_df_sorted = partner_df.sort_values('datetime')
-            
-            co_occurrence_events_list = []
-            time_tolerance = pd.Timedelta(minutes=1)
-
-            for _, target_row in target_trip_df.iterrows():
-                target_time = target_row['datetime']
-                target_loc = target_row['LocationID']
-                
-                time_min = target_time - time_tolerance
-                time_max = target_time + time_tolerance
-                
-                possible_matches = partner_df_sorted[
-                    (partner_df_sorted['LocationID'] == target_loc) &
-                    (partner_df_sorted['datetime'].between(time_min, time_max))
-                ]
-                
-                if not possible_matches.empty:
-                    best_match = possible_matches.loc[(possible_matches['datetime'] - target_time).abs().idxmin()]
-                    event = {'datetime_x': target_time, 'datetime_y': best_match['datetime'], 'LocationID': target_loc}
-                    co_occurrence_events_list.append(event)
-
-            if not co_occurrence_events_list: continue
-
-            co_occurrence_events_df = pd.DataFrame(co_occurrence_events_list)
-            continuous_segments = _find_continuous_segments(co_occurrence_events_df)
-            
-            for segment_df in continuous_segments:
-                if len(segment_df) >= 20:
-                    partner_info = {
-                        'plate': partner_plate,
-                        'segment_length': len(segment_df),
-                        'start_time': segment_df.iloc[0]['datetime_y'],
-                        'end_time': segment_df.iloc[-1]['datetime_y'],
-                        'start_loc_id': segment_df.iloc[0]['LocationID'],
-                        'end_loc_id': segment_df.iloc[-1]['LocationID'],
-                        'time_lags': (segment_df['datetime_y'] - segment_df['datetime_x']).dt.total_seconds().tolist(),
-                        'convoy_segment_df': segment_df
-                    }
-                    convoy_partners_found.append(partner_info)
-
-                    # 【【【 新增2: 將這個事件的摘要資訊加入總表list中 】】】
-                    summary_event = {
-                        'date': partner_info['start_time'].date(),
-                        'partner_plate': partner_plate,
-                        'start_loc_name': cam_name_map.get(partner_info['start_loc_id'], partner_info['start_loc_id']),
-                        'end_loc_name': cam_name_map.get(partner_info['end_loc_id'], partner_info['end_loc_id']),
-                    }
-                    all_convoy_events_for_summary.append(summary_event)
-                    
-                    if len(segment_df) > max_convoy_length_in_trip:
-                        max_convoy_length_in_trip = len(segment_df)
-        
-        if convoy_partners_found:
-            analyzed_trips.append({
-                'trip_info': trip_info,
-                'target_trip_df': target_trip_df,
-                'convoy_partners': convoy_partners_found,
-                'max_convoy_length': max_convoy_length_in_trip
-            })
+            if copresence_index is not None:
+                events_by_partner = _co_occurrence_events_from_index(copresence_index, target_trip_df)
+            elif events_per_trip is not None:
+                events_by_partner = events_per_trip[trip_index]
+
+            for partner_plate in candidate_partners:
+                if copresence_index is not None or events_per_trip is not None:
+                    co_occurrence_events_list = events_by_partner.get(partner_plate, [])
+                else:
+                    if partner_plate not in partner_arrays:
+                        continue
+                    co_occurrence_events_list = _scan_partner_co_occurrence(partner_arrays[partner_plate], target_trip_df)
+
+                if not co_occurrence_events_list: continue
+
+                continuous_segments = _find_continuous_segments(co_occurrence_events_list, transition_graph=transition_graph)
+
+                for segment in continuous_segments:
+                    if segment['length'] >= min_segment_length:
+                        times_x, times_y = segment['columns']['datetime_x'], segment['columns']['datetime_y']
+                        segment_locs = column_values(segment, 'LocationID')
+                        partner_info = {
+                            'plate': partner_plate,
+                            'segment_length': segment['length'],
+                            'start_time': pd.Timestamp(times_y[0]),
+                            'end_time': pd.Timestamp(times_y[-1]),
+                            'start_loc_id': segment_locs[0],
+                            'end_loc_id': segment_locs[-1],
+                            'time_lags': pd.to_timedelta(times_y - times_x, unit='ns').total_seconds().tolist(),
+                            'convoy_segment': segment
+                        }
+                        convoy_partners_found.append(partner_info)
+
+                        # 【【【 新增2: 將這個事件的摘要資訊加入總表list中 】】】
+                        summary_event = {
+                            'date': partner_info['start_time'].date(),
+                            'partner_plate': partner_plate,
+                            'start_loc_name': cam_name_map.get(partner_info['start_loc_id'], partner_info['start_loc_id']),
+                            'end_loc_name': cam_name_map.get(partner_info['end_loc_id'], partner_info['end_loc_id']),
+                        }
+                        all_convoy_events_for_summary.append(summary_event)
+
+                        if segment['length'] > max_convoy_length_in_trip:
+                            max_convoy_length_in_trip = segment['length']
+
+            if convoy_partners_found:
+                analyzed_trips.append({
+                    'trip_info': trip_info,
+                    'target_trip_df': target_trip_df,
+                    'convoy_partners': convoy_partners_found,
+                    'max_convoy_length': max_convoy_length_in_trip
+                })
+        span['rows_out'] = len(all_convoy_events_for_summary)
+
+    return {
+        'target_plate': target_plate,
+        'target_trip_count': len(all_target_trips),
+        'candidate_count': len(candidate_partners),
+        'analyzed_trips': analyzed_trips,
+        'summary_events': all_convoy_events_for_summary,
+    }
+
+# --- 報告 (列印) ---
+
+def matched_trip_path(route_matcher: dict, target_trip_df: pd.DataFrame) -> list:
+    """目標車行程補上未拍到攝影機後的推估完整路徑 (LocationID 列表)。"""
+    gaps = target_trip_df['datetime'].diff().dt.total_seconds().iloc[1:].tolist()
+    return fill_path_gaps(route_matcher, target_trip_df['LocationID'].tolist(), observed_gaps_seconds=gaps)
+
+def print_convoy_report(full_data: pd.DataFrame, result: dict, route_matcher: dict = None,
+                        min_segment_length: int = 20):
+    """
+    列印 analyze_convoy_partners 的結果。
+    route_matcher (選用) 用於在詳細報告中列出補全後的推估完整路徑。
+    """
+    target_plate = result['target_plate']
+    analyzed_trips = result['analyzed_trips']
+    all_convoy_events_for_summary = result['summary_events']
+    cam_name_map = full_data.drop_duplicates(subset=['LocationID']).set_index('LocationID')['攝影機名稱'].to_dict()
+
+    if result['target_trip_count'] == 0:
+        print(f"錯誤：無法為車輛 {target_plate} 切分出任何有效行程。")
+        return
 
     if not analyzed_trips:
-        print(f"\n分析完成：未找到車輛 {target_plate} 有任何被跟隨超過 20 個地點的行程。")
+        print(f"\n分析完成：未找到車輛 {target_plate} 有任何被跟隨超過 {min_segment_length} 個地點的行程。")
         return
 
     # 【【【 新增3: 在詳細報告前，先列印摘要總表 】】】
@@ -227,6 +439,8 @@ def run_trip_oriented_convoy_analysis(full_data: pd.DataFrame):
         print(f"  - 起點: {start_loc_name} ({target_info['start_area_id']})")
         print(f"  - 終點: {end_loc_name} ({target_info['end_area_id']})")
         print(f"  - 行程路徑: {' -> '.join(target_df['LocationID'].tolist())}")
+        if route_matcher is not None:
+            print(f"  - 推估完整路徑 (含未拍到地點): {' -> '.join(matched_trip_path(route_matcher, target_df))}")
 
         print("\n  --- 同行車資訊 ---")
         
@@ -242,7 +456,7 @@ def run_trip_oriented_convoy_analysis(full_data: pd.DataFrame):
             avg_lag = np.mean(partner_info['time_lags'])
             lag_str = f"晚 {avg_lag:.1f} 秒" if avg_lag > 0 else f"早 {abs(avg_lag):.1f} 秒"
             
-            pattern_tag = _get_following_pattern_v2(target_df, partner_info['convoy_segment_df'])
+            pattern_tag = _get_following_pattern_v2(target_df, partner_info['convoy_segment'])
 
             print(f"\n    [同行車 #{j+1}]")
             print(f"    - 車牌: {partner_info['plate']}")
@@ -254,7 +468,47 @@ def run_trip_oriented_convoy_analysis(full_data: pd.DataFrame):
             
             print(f"    - 平均時間差: {lag_str}")
             print(f"    - 跟隨模式標籤: {pattern_tag}")
-            print(f"    - 同行路段: {' -> '.join(partner_info['convoy_segment_df']['LocationID'].tolist())}")
+            print(f"    - 同行路段: {' -> '.join(column_values(partner_info['convoy_segment'], 'LocationID').tolist())}")
             print(f"    - 同行時間: {partner_info['start_time'].strftime('%H:%M:%S')} -> {partner_info['end_time'].strftime('%H:%M:%S')} (耗時 {(partner_info['end_time'] - partner_info['start_time']).total_seconds() / 60:.1f} 分鐘)")
             print(f"    - 同行起點: {p_start_loc_name} ({partner_info['start_loc_id']})")
-            print(f"    - 同行終點: {p_end_loc_name} ({partner_info['end_loc_id']})")
\ No newline at end of file
+            print(f"    - 同行終點: {p_end_loc_name} ({partner_info['end_loc_id']})")
+
+# --- 主流程函式 ---
+
+def run_trip_oriented_convoy_analysis(full_data: pd.DataFrame, transition_graph: dict = None,
+                                      route_matcher: dict = None, trip_lsh_index: dict = None,
+                                      lsh_min_similarity: float = None, copresence_index: dict = None,
+                                      n_workers: int = None):
+    """
+    執行「目標行程導向的隨行分析」的主函式。
+    transition_graph (選用) 用於行程切分與同行片段的間隔容許值，取代固定的 20 / 10 分鐘。
+    route_matcher (選用) 用於在詳細報告中列出補全後的推估完整路徑。
+    trip_lsh_index (選用) 依路線相似度排列候選同行車；指定 lsh_min_similarity 時只比對相似度
+    >= lsh_min_similarity 的車輛 (較快，但可能漏掉只同行一小段的車輛)。
+    copresence_index (選用，以 'LocationID' 建立的共現索引) 以索引查詢取代逐車掃描 DataFrame。
+    n_workers (選用) 以多個子行程平行掃描同行車 (資料以共用資料集提供)。
+    """
+    if copresence_index is not None and copresence_index['meta']['key_col'] != 'LocationID':
+        raise ValueError("隨行分析需要以 'LocationID' 建立的共現索引。")
+    
+    available_plates = sorted(full_data['車牌'].unique())
+    print("\n" + "="*50); print("== 目標行程導向隨行分析 =="); print("="*50)
+    for i, plate in enumerate(available_plates): print(f"  [{i+1}] {plate}")
+    
+    try:
+        choice_input = input(f"\n請選擇要作為基準的目標車牌 [1-{len(available_plates)}]: ")
+        target_plate = available_plates[int(choice_input) - 1]
+    except (ValueError, IndexError):
+        print("錯誤：無效的選擇，返回主菜單。")
+        return
+
+    print("\n--- 正在分析目標車輛的所有行程並尋找同行者... ---")
+
+    result = analyze_convoy_partners(full_data, target_plate, transition_graph=transition_graph,
+                                     trip_lsh_index=trip_lsh_index, lsh_min_similarity=lsh_min_similarity,
+                                     copresence_index=copresence_index, n_workers=n_workers)
+    if trip_lsh_index is not None and lsh_min_similarity is not None and result['target_trip_count'] > 0:
+        print(f"--- LSH 索引篩選：{len(available_plates) - 1} 輛車中有 {result['candidate_count']} 輛路線相似 ---")
+
+    print_convoy_report(full_data, result, route_matcher=route_matcher)
+    return result
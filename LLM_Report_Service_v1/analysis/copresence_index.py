@@ -0,0 +1,179 @@
+# analysis/copresence_index.py (時間分桶倒排索引：(地點, 時間桶) -> 車牌)
+
+import json
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+
+from cache.summary_cache import frame_fingerprint
+
+_ARRAY_FILES = ('keys', 'offsets', 'post_plate', 'post_time')
+
+# ==========================================
+# 1. 建立索引
+# ==========================================
+def build_copresence_index(full_data: pd.DataFrame, key_col: str = 'LocationID', bucket_seconds: int = 60) -> dict:
+    """
+    建立「(地點, 時間桶) -> 車牌」的倒排索引，回答「哪些車在時間 T 前後出現在地點 X」。
+
+    所有資料都存成扁平的 NumPy 陣列 (可存檔後以 memory map 方式開啟)：
+    - keys: 排序過的複合鍵 (地點編號 * 時間桶總數 + 時間桶)
+    - offsets: 每個鍵在 postings 中的起點 (長度 len(keys) + 1)
+    - post_plate / post_time: 依 (地點, 時間桶, 車牌編號, 時間) 排序的車牌編號與偵測時間 (ns)
+
+    Args:
+        key_col: 作為地點的欄位 ('LocationID'、'攝影機' 或 'LocationAreaID')
+        bucket_seconds: 時間桶大小 (秒)
+    """
+    df = full_data[['車牌', 'datetime', key_col]].dropna(subset=[key_col])
+    plates = np.array(sorted(df['車牌'].astype(str).unique()), dtype=object)
+    keys_list = np.array(sorted(df[key_col].astype(str).unique()), dtype=object)
+    plate_codes = np.searchsorted(plates, df['車牌'].astype(str).to_numpy(dtype=object)).astype(np.int32)
+    key_codes = np.searchsorted(keys_list, df[key_col].astype(str).to_numpy(dtype=object)).astype(np.int64)
+    times = pd.to_datetime(df['datetime']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+    bucket_ns = int(bucket_seconds * 1e9)
+    origin_ns = int(times.min() // bucket_ns * bucket_ns) if len(times) else 0
+    buckets = (times - origin_ns) // bucket_ns
+    n_buckets = int(buckets.max()) + 1 if len(buckets) else 1
+
+    order = np.lexsort((times, plate_codes, buckets, key_codes))
+    composite = key_codes[order] * n_buckets + buckets[order]
+    keys, starts = np.unique(composite, return_index=True)
+
+    return {
+        'meta': {
+            'key_col': key_col,
+            'data_fingerprint': frame_fingerprint(df, ['車牌', 'datetime', key_col]),
+            'bucket_seconds': bucket_seconds,
+            'origin_ns': origin_ns,
+            'n_buckets': n_buckets,
+            'plates': plates.tolist(),
+            'locations': keys_list.tolist(),
+        },
+        'plate_index': {plate: i for i, plate in enumerate(plates)},
+        'location_index': {loc: i for i, loc in enumerate(keys_list)},
+        'keys': keys,
+        'offsets': np.append(starts, len(composite)).astype(np.int64),
+        'post_plate': plate_codes[order],
+        'post_time': times[order],
+    }
+
+# ==========================================
+# 2. 儲存 / 以 memory map 載入
+# ==========================================
+def save_copresence_index(index: dict, directory) -> None:
+    """將索引存成資料夾 (每個陣列一個 .npy，另加 meta.json)。"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in _ARRAY_FILES:
+        np.save(directory / f"{name}.npy", np.ascontiguousarray(index[name]))
+    (directory / 'meta.json').write_text(json.dumps(index['meta'], ensure_ascii=False), encoding='utf-8')
+
+def load_copresence_index(directory, mmap: bool = True) -> dict:
+    """
+    載入索引。mmap=True 時陣列以唯讀 memory map 開啟，只有被查詢到的頁面才會讀入記憶體，
+    多個行程同時開啟也共用作業系統的頁面快取。
+    """
+    directory = Path(directory)
+    meta = json.loads((directory / 'meta.json').read_text(encoding='utf-8'))
+    index = {'meta': meta}
+    for name in _ARRAY_FILES:
+        index[name] = np.load(directory / f"{name}.npy", mmap_mode='r' if mmap else None)
+    index['plate_index'] = {plate: i for i, plate in enumerate(meta['plates'])}
+    index['location_index'] = {loc: i for i, loc in enumerate(meta['locations'])}
+    return index
+
+def check_index_matches(index: dict, full_data: pd.DataFrame):
+    """
+    確認索引是由這份資料建立的 (存檔的索引在資料或 --start / --end 範圍改變後不能沿用，否則查詢結果會與不使用索引時不同)。
+
+    Raises:
+        ValueError: 索引與資料不一致
+    """
+    key_col = index['meta']['key_col']
+    if key_col not in full_data.columns:
+        raise ValueError(f"資料中缺少共現索引的地點欄位 '{key_col}'。")
+    df = full_data[['車牌', 'datetime', key_col]].dropna(subset=[key_col])
+    if index['meta'].get('data_fingerprint') != frame_fingerprint(df, ['車牌', 'datetime', key_col]):
+        raise ValueError("共現索引與目前載入的資料不一致，請以相同的資料與日期範圍重新建立索引。")
+
+# ==========================================
+# 3. 查詢
+# ==========================================
+def _to_ns(value) -> int:
+    return value if isinstance(value, (int, np.integer)) else pd.Timestamp(value).value
+
+def query_window(index: dict, location, time_start, time_end):
+    """
+    查詢在 [time_start, time_end] 期間出現在 location 的所有偵測紀錄。
+
+    Returns:
+        (plate_codes, times_ns)：依時間桶、車牌編號排序的兩個陣列。
+    """
+    loc_code = index['location_index'].get(str(location))
+    if loc_code is None:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+
+    meta = index['meta']
+    bucket_ns = int(meta['bucket_seconds'] * 1e9)
+    t1, t2 = _to_ns(time_start), _to_ns(time_end)
+    b1 = max((t1 - meta['origin_ns']) // bucket_ns, 0)
+    b2 = min((t2 - meta['origin_ns']) // bucket_ns, meta['n_buckets'] - 1)
+    if b2 < b1:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+
+    base = loc_code * meta['n_buckets']
+    lo = np.searchsorted(index['keys'], base + b1, side='left')
+    hi = np.searchsorted(index['keys'], base + b2, side='right')
+    start, end = index['offsets'][lo], index['offsets'][hi]
+
+    plates = np.asarray(index['post_plate'][start:end])
+    times = np.asarray(index['post_time'][start:end])
+    within = (times >= t1) & (times <= t2)
+    return plates[within], times[within]
+
+def plates_in_window(index: dict, location, time_start, time_end) -> np.ndarray:
+    """回傳在時間窗內出現在 location 的車牌編號 (排序、不重複)。"""
+    plates, _ = query_window(index, location, time_start, time_end)
+    return np.unique(plates)
+
+def intersect_postings(postings: list) -> np.ndarray:
+    """多個已排序車牌編號陣列的 k 路交集 (由最短的開始，提早結束)。"""
+    if not postings:
+        return np.empty(0, dtype=np.int32)
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for other in postings[1:]:
+        if len(result) == 0:
+            break
+        result = np.intersect1d(result, other, assume_unique=True)
+    return result
+
+def copresent_plates(index: dict, queries: list) -> list:
+    """
+    回傳在所有 (location, time_start, time_end) 查詢中都出現過的車牌。
+    """
+    postings = [plates_in_window(index, loc, t1, t2) for loc, t1, t2 in queries]
+    return [index['meta']['plates'][code] for code in intersect_postings(postings)]
+
+def nearest_matches_in_window(index: dict, location, center_time, tolerance_seconds: float) -> dict:
+    """
+    對單一 (地點, 時間) 查詢 ±tolerance_seconds 內的偵測，每台車只保留時間最接近的一筆
+    (同樣接近時取較早的一筆)。
+
+    Returns:
+        dict: {車牌: 偵測時間 (pd.Timestamp)}
+    """
+    center_ns = _to_ns(center_time)
+    tolerance_ns = int(tolerance_seconds * 1e9)
+    plates, times = query_window(index, location, center_ns - tolerance_ns, center_ns + tolerance_ns)
+    if len(plates) == 0:
+        return {}
+    order = np.lexsort((times, np.abs(times - center_ns), plates))
+    plates, times = plates[order], times[order]
+    first = np.ones(len(plates), dtype=bool)
+    first[1:] = plates[1:] != plates[:-1]
+    names = index['meta']['plates']
+    return {names[p]: pd.Timestamp(t) for p, t in zip(plates[first], times[first])}
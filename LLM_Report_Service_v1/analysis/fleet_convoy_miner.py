@@ -0,0 +1,250 @@
+# analysis/fleet_convoy_miner.py (全車隊同行群組探勘：不需指定目標車)
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from .shared_dataset import shared_dataset, attach_worker_dataset, get_worker_dataset, day_ranges
+
+GROUP_COLUMNS = ['group_id', 'day', 'members', 'size', 'start_time', 'end_time',
+                 'duration_mins', 'num_locations', 'locations']
+
+# ==========================================
+# 1. 同地點同時通過的車輛 (通過群)
+# ==========================================
+def _passage_groups(locs: np.ndarray, times: np.ndarray, plates: np.ndarray,
+                    time_tolerance_seconds: float, max_span_seconds: float) -> list:
+    """
+    對每個地點依時間掃描偵測紀錄，把相鄰偵測間隔 <= time_tolerance_seconds 的車輛歸為同一個
+    「通過群」 (同一群的總跨度不超過 max_span_seconds，避免尖峰車流串成一大群)。
+
+    Returns:
+        list of (start_ns, end_ns, location, plate_codes)，只保留 >= 2 台車的通過群，依開始時間排序。
+    """
+    tolerance_ns = int(time_tolerance_seconds * 1e9)
+    max_span_ns = int(max_span_seconds * 1e9)
+    order = np.lexsort((times, locs))
+    locs, times, plates = locs[order], times[order], plates[order]
+
+    groups = []
+    n = len(times)
+    i = 0
+    while i < n:
+        j = i + 1
+        while (j < n and locs[j] == locs[i] and times[j] - times[j - 1] <= tolerance_ns
+               and times[j] - times[i] <= max_span_ns):
+            j += 1
+        if j - i >= 2:
+            members = frozenset(plates[i:j].tolist())
+            if len(members) >= 2:
+                groups.append((int(times[i]), int(times[j - 1]), locs[i], members))
+        i = j
+
+    groups.sort(key=lambda g: (g[0], g[2]))
+    return groups
+
+# ==========================================
+# 2. 掃描通過群，延伸同行候選 (Coherent Moving Cluster)
+# ==========================================
+def mine_convoys(locs: np.ndarray, times: np.ndarray, plates: np.ndarray,
+                 min_members: int = 2, min_locations: int = 3,
+                 time_tolerance_seconds: float = 60, max_gap_minutes: float = 10,
+                 max_span_seconds: float = 300) -> list:
+    """
+    找出至少 min_members 台車、一起經過至少 min_locations 個連續地點的同行群組。
+
+    依時間順序處理通過群：每個仍在有效期間 (距上次共同出現 <= max_gap_minutes) 的候選群組，
+    若與新的通過群有 >= min_members 台共同車輛，就以交集延伸一個地點；過期的候選若經過的地點數
+    達到門檻即輸出。候選以「成員集合」為鍵並依車牌建立索引，每個通過群只需比對共用車輛的候選。
+
+    Args:
+        locs / times / plates: 同一時間分區 (例如單日) 的偵測紀錄 (times 為 int64 ns，plates 為車牌編號)
+
+    Returns:
+        list of dict: {'members' (tuple 車牌編號), 'start_ns', 'end_ns', 'locations' (list)}
+    """
+    max_gap_ns = int(max_gap_minutes * 60 * 1e9)
+    active = {}          # frozenset(members) -> {'start_ns', 'last_ns', 'locations'}
+    by_plate = {}        # plate -> set(候選成員集合)
+    results = []
+
+    def _retire(key):
+        cand = active.pop(key)
+        for p in key:
+            keys = by_plate.get(p)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del by_plate[p]
+        if len(cand['locations']) >= min_locations:
+            results.append({'members': tuple(sorted(key)), 'start_ns': cand['start_ns'],
+                            'end_ns': cand['last_ns'], 'locations': cand['locations']})
+
+    def _store(key, cand):
+        existing = active.get(key)
+        if existing is not None:
+            # 同一組成員只保留經過地點較多的候選 (同樣多時保留較早開始的)
+            if (len(existing['locations']), -existing['start_ns']) >= (len(cand['locations']), -cand['start_ns']):
+                existing['last_ns'] = max(existing['last_ns'], cand['last_ns'])
+                return
+        active[key] = cand
+        for p in key:
+            by_plate.setdefault(p, set()).add(key)
+
+    for start_ns, end_ns, loc, members in _passage_groups(locs, times, plates, time_tolerance_seconds, max_span_seconds):
+        # 先讓過期的候選結案
+        expired = {key for p in members for key in by_plate.get(p, ()) if start_ns - active[key]['last_ns'] > max_gap_ns}
+        for key in sorted(expired, key=sorted):
+            _retire(key)
+
+        touched = {key for p in members for key in by_plate.get(p, ())}
+        extensions = []
+        for key in sorted(touched, key=sorted):
+            shared = key & members
+            if len(shared) < min_members:
+                continue
+            cand = active[key]
+            if cand['locations'][-1] == loc:
+                new_locations = cand['locations']
+            else:
+                new_locations = cand['locations'] + [loc]
+            extensions.append((frozenset(shared), {'start_ns': cand['start_ns'], 'last_ns': end_ns,
+                                                   'locations': new_locations}))
+            if shared == key:
+                # 成員完全延續：舊候選由延伸後的候選取代
+                active.pop(key)
+                for p in key:
+                    by_plate[p].discard(key)
+
+        for key, cand in extensions:
+            _store(key, cand)
+        if len(members) >= min_members and members not in active:
+            _store(members, {'start_ns': start_ns, 'last_ns': end_ns, 'locations': [loc]})
+
+    for key in sorted(active, key=sorted):
+        _retire(key)
+    return _drop_dominated(results)
+
+def _drop_dominated(groups: list) -> list:
+    """移除被其他群組完全涵蓋 (成員為子集且時間區間被包含) 的群組。"""
+    groups = sorted(groups, key=lambda g: (-len(g['members']), -len(g['locations']), g['start_ns'], g['members']))
+    kept = []
+    for g in groups:
+        members = set(g['members'])
+        dominated = any(members <= set(k['members']) and k['start_ns'] <= g['start_ns'] and g['end_ns'] <= k['end_ns']
+                        and len(k['locations']) >= len(g['locations']) for k in kept)
+        if not dominated:
+            kept.append(g)
+    kept.sort(key=lambda g: (g['start_ns'], g['members']))
+    return kept
+
+# ==========================================
+# 3. 依日期分區平行處理
+# ==========================================
+def _mine_day_rows(dataset: dict, day: str, start: int, end: int, params: dict) -> list:
+    """探勘單日分區：time_order[start:end] 為該日的列索引 (缺少地點的紀錄略過)。"""
+    arrays = dataset['arrays']
+    rows = arrays['time_order'][start:end]
+    locs = arrays['location_codes'][rows]
+    keep = locs >= 0
+    rows, locs = rows[keep], locs[keep]
+    groups = mine_convoys(locs, arrays['times'][rows], arrays['plate_codes'][rows], **params)
+
+    meta = dataset['spec']['meta']
+    plate_names, location_names = meta['plate_names'], meta['location_names']
+    return [{'day': day, 'members': tuple(plate_names[c] for c in g['members']), 'start_ns': g['start_ns'],
+             'end_ns': g['end_ns'], 'locations': [location_names[c] for c in g['locations']]} for g in groups]
+
+def _mine_day(task: tuple) -> list:
+    """單日分區的工作函式 (在子行程中執行，資料取自已附加的共用資料集，工作只傳遞索引範圍)。"""
+    day, start, end, params = task
+    return _mine_day_rows(get_worker_dataset(), day, start, end, params)
+
+def mine_fleet_convoys(full_data: pd.DataFrame, key_col: str = 'LocationID',
+                       min_members: int = 2, min_locations: int = 3,
+                       time_tolerance_seconds: float = 60, max_gap_minutes: float = 10,
+                       max_span_seconds: float = 300, max_workers: int = None) -> pd.DataFrame:
+    """
+    全車隊同行群組探勘：不需指定目標車，找出所有一起經過連續多個地點的車輛群組。
+
+    資料依日期分區，以行程池 (ProcessPoolExecutor) 平行處理；跨越午夜的同行會在日期邊界被切開。
+    子行程附加到同一份共用資料集 (analysis/shared_dataset.py)，記憶體用量不隨行程數增加。
+    結果依 (日期, 開始時間, 成員) 排序，與工作數量無關。
+
+    Args:
+        min_members: 群組最少車輛數
+        min_locations: 最少連續共同經過的地點數 (K)
+        time_tolerance_seconds: 同一地點視為「一起通過」的相鄰偵測間隔
+        max_gap_minutes: 群組兩次共同出現之間允許的最大間隔
+        max_workers: 行程數 (None 為 CPU 核心數；1 表示不開子行程)
+
+    Returns:
+        DataFrame: 欄位 GROUP_COLUMNS，'members' 為以逗號分隔的車牌，'locations' 為依序經過的地點列表
+    """
+    params = {'min_members': min_members, 'min_locations': min_locations,
+              'time_tolerance_seconds': time_tolerance_seconds, 'max_gap_minutes': max_gap_minutes,
+              'max_span_seconds': max_span_seconds}
+    max_workers = max_workers or os.cpu_count() or 1
+    parallel = max_workers > 1 and full_data['datetime'].dt.normalize().nunique() > 1
+    with shared_dataset(full_data, location_col=key_col, backend=None if parallel else 'local') as dataset:
+        tasks = [(day, start, end, params) for day, start, end in day_ranges(dataset)]
+        if not parallel:
+            per_day = [_mine_day_rows(dataset, *task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)), initializer=attach_worker_dataset,
+                                     initargs=(dataset['spec'],)) as pool:
+                per_day = list(pool.map(_mine_day, tasks))
+
+    rows = []
+    for groups in per_day:
+        for g in groups:
+            start, end = pd.Timestamp(g['start_ns']), pd.Timestamp(g['end_ns'])
+            rows.append({
+                'group_id': len(rows) + 1,
+                'day': g['day'],
+                'members': ', '.join(g['members']),
+                'size': len(g['members']),
+                'start_time': start,
+                'end_time': end,
+                'duration_mins': round((end - start).total_seconds() / 60, 1),
+                'num_locations': len(g['locations']),
+                'locations': g['locations'],
+            })
+    return pd.DataFrame(rows, columns=GROUP_COLUMNS)
+
+# ==========================================
+# 4. 主流程
+# ==========================================
+def run_fleet_convoy_discovery(full_data: pd.DataFrame, output_csv=None, top_n: int = 20, **kwargs) -> pd.DataFrame:
+    """
+    執行全車隊同行群組探勘並列印摘要；提供 output_csv 時將完整群組表存檔。
+    其餘參數傳給 mine_fleet_convoys。
+    """
+    if 'LocationID' not in full_data.columns and kwargs.get('key_col', 'LocationID') == 'LocationID':
+        print("錯誤：資料中缺少 'LocationID' 欄位。")
+        return pd.DataFrame(columns=GROUP_COLUMNS)
+
+    groups = mine_fleet_convoys(full_data, **kwargs)
+
+    print("\n" + "=" * 70)
+    print("## 全車隊同行群組探勘")
+    print("=" * 70)
+    if groups.empty:
+        print("  > 未發現任何同行群組。")
+        return groups
+
+    pair_counts = groups.groupby('members').size().sort_values(ascending=False)
+    print(f"  共發現 {len(groups)} 個同行片段，涉及 {len(pair_counts)} 組不同的車輛組合。")
+    print(f"\n  - 最常一起行動的組合 (前 {min(top_n, len(pair_counts))} 名):")
+    for members, count in pair_counts.head(top_n).items():
+        subset = groups[groups['members'] == members]
+        print(f"    * [{members}] 同行 {count} 次，平均經過 {subset['num_locations'].mean():.1f} 個地點")
+
+    if output_csv:
+        out = groups.copy()
+        out['locations'] = out['locations'].apply(' -> '.join)
+        out.to_csv(output_csv, index=False, encoding='utf-8-sig')
+        print(f"\n  > 完整群組表已儲存至 {output_csv}")
+    return groups
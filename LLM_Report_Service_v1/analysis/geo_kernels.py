@@ -0,0 +1,212 @@
+# analysis/geo_kernels.py (共用地理距離運算核心)
+
+import importlib.util
+
+import numpy as np
+
+# Numba 為選用套件：有安裝時使用 JIT 版本，沒有則使用 NumPy 向量化版本。
+# 這裡只檢查是否安裝，實際 import numba 與編譯延後到第一次使用 JIT 時 (numba 的載入相當耗時)。
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+
+EARTH_RADIUS_METERS = 6371000  # 地球半徑，單位為公尺
+# 點數不超過此值時 query_nearest 直接對全部點計算距離 (逐圈展開網格的額外開銷在點數少時反而較慢，
+# bench_geo_kernels 實測交叉點約在 1000~1500 點)
+NEAREST_BRUTE_FORCE_MAX_POINTS = 1000
+
+# ==========================================
+# 1. 核心距離公式 (NumPy 向量化)
+# ==========================================
+def haversine_distance(lon1, lat1, lon2, lat2):
+    """
+    計算兩個經緯度座標點之間的距離（單位：公尺）。
+    支援純量、NumPy 陣列與 pandas Series (可互相廣播)。
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(a))
+    return EARTH_RADIUS_METERS * c
+
+# ==========================================
+# 2. 選用的 JIT 版本
+# ==========================================
+def _jit_kernels():
+    """第一次需要時才載入 JIT 版本 (analysis/geo_kernels_jit.py 會 import numba)。"""
+    from analysis import geo_kernels_jit
+    return geo_kernels_jit
+
+def _resolve_jit(use_jit):
+    """use_jit=None 代表「有 Numba 就用」；明確要求 JIT 但未安裝時直接報錯。"""
+    if use_jit is None:
+        return NUMBA_AVAILABLE
+    if use_jit and not NUMBA_AVAILABLE:
+        raise ImportError("要求使用 JIT 版本，但環境中未安裝 numba。")
+    return bool(use_jit)
+
+# ==========================================
+# 3. 相鄰點距離 (軌跡)
+# ==========================================
+def consecutive_distances(lon, lat, use_jit=None) -> np.ndarray:
+    """
+    計算軌跡中相鄰兩點的距離（公尺），回傳長度為 n-1 的陣列。
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    if len(lon) < 2:
+        return np.empty(0)
+    if _resolve_jit(use_jit):
+        return _jit_kernels().consecutive_distances_jit(lon, lat)
+    return haversine_distance(lon[:-1], lat[:-1], lon[1:], lat[1:])
+
+# ==========================================
+# 4. 兩兩距離矩陣 (分塊計算，記憶體有上限)
+# ==========================================
+def pairwise_distance_chunks(lon_a, lat_a, lon_b=None, lat_b=None,
+                             max_chunk_elements: int = 2_000_000, use_jit=None):
+    """
+    分塊產生 A 與 B 兩組點之間的距離矩陣。
+
+    每個區塊最多 max_chunk_elements 個元素，因此中間運算的記憶體用量固定，
+    不會隨點數平方成長。B 省略時計算 A 對自己的距離。
+
+    Yields:
+        (row_start, row_end, block): block 為 A[row_start:row_end] 對全部 B 的距離 (公尺)。
+    """
+    lon_a = np.asarray(lon_a, dtype=float)
+    lat_a = np.asarray(lat_a, dtype=float)
+    lon_b = lon_a if lon_b is None else np.asarray(lon_b, dtype=float)
+    lat_b = lat_a if lat_b is None else np.asarray(lat_b, dtype=float)
+
+    jit = _resolve_jit(use_jit)
+    rows_per_chunk = max(1, max_chunk_elements // max(len(lon_b), 1))
+    for row_start in range(0, len(lon_a), rows_per_chunk):
+        row_end = min(row_start + rows_per_chunk, len(lon_a))
+        if jit:
+            block = _jit_kernels().pairwise_block_jit(lon_a[row_start:row_end], lat_a[row_start:row_end], lon_b, lat_b)
+        else:
+            block = haversine_distance(
+                lon_a[row_start:row_end, None], lat_a[row_start:row_end, None],
+                lon_b[None, :], lat_b[None, :]
+            )
+        yield row_start, row_end, block
+
+def pairwise_distance_matrix(lon_a, lat_a, lon_b=None, lat_b=None,
+                             max_chunk_elements: int = 2_000_000, use_jit=None) -> np.ndarray:
+    """
+    組合 pairwise_distance_chunks 的結果，回傳完整的距離矩陣 (公尺, float32 以節省記憶體)。
+    """
+    n_a = len(lon_a)
+    n_b = n_a if lon_b is None else len(lon_b)
+    matrix = np.empty((n_a, n_b), dtype=np.float32)
+    for row_start, row_end, block in pairwise_distance_chunks(lon_a, lat_a, lon_b, lat_b, max_chunk_elements, use_jit):
+        matrix[row_start:row_end] = block
+    return matrix
+
+# ==========================================
+# 5. 等距圓柱投影網格索引 (半徑查詢 / 最近鄰)
+# ==========================================
+def build_grid_index(lon, lat, cell_meters: float = 200.0) -> dict:
+    """
+    以等距圓柱投影 (equirectangular) 將座標點放入固定大小的網格，供半徑查詢使用。
+    網格只用來縮小候選範圍，最後仍以 Haversine 精確判斷距離。
+
+    Args:
+        lon, lat: 點座標陣列 (缺值的點不會被放入網格)
+        cell_meters: 網格邊長 (公尺)，建議與最常用的查詢半徑相近
+
+    Returns:
+        dict: 網格索引 (包含投影參數、每個網格的點索引)
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    ref_lat = float(np.mean(lat[valid])) if valid.any() else 0.0
+    meters_per_deg_lat = np.pi * EARTH_RADIUS_METERS / 180.0
+    meters_per_deg_lon = meters_per_deg_lat * np.cos(np.radians(ref_lat))
+
+    cell_x = np.floor(lon * meters_per_deg_lon / cell_meters)
+    cell_y = np.floor(lat * meters_per_deg_lat / cell_meters)
+
+    cells = {}
+    for idx in np.flatnonzero(valid):
+        cells.setdefault((int(cell_x[idx]), int(cell_y[idx])), []).append(idx)
+    cells = {key: np.asarray(members, dtype=np.int64) for key, members in cells.items()}
+
+    return {
+        'lon': lon,
+        'lat': lat,
+        'cell_meters': float(cell_meters),
+        'meters_per_deg_lon': meters_per_deg_lon,
+        'meters_per_deg_lat': meters_per_deg_lat,
+        'cells': cells,
+        'valid_indices': np.flatnonzero(valid),
+    }
+
+def _cell_of(grid: dict, lon: float, lat: float):
+    return (int(np.floor(lon * grid['meters_per_deg_lon'] / grid['cell_meters'])),
+            int(np.floor(lat * grid['meters_per_deg_lat'] / grid['cell_meters'])))
+
+def _candidates_in_rings(grid: dict, cx: int, cy: int, ring: int) -> np.ndarray:
+    members = [grid['cells'][(x, y)]
+               for x in range(cx - ring, cx + ring + 1)
+               for y in range(cy - ring, cy + ring + 1)
+               if (x, y) in grid['cells']]
+    return np.concatenate(members) if members else np.empty(0, dtype=np.int64)
+
+def query_radius(grid: dict, lon: float, lat: float, radius_meters: float, return_distances: bool = False):
+    """
+    找出距離 (lon, lat) 在 radius_meters 以內的所有點。
+
+    Returns:
+        依索引排序的點索引陣列；return_distances=True 時同時回傳對應距離。
+    """
+    if np.isnan(lon) or np.isnan(lat):
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, np.empty(0)) if return_distances else empty
+
+    # 投影在高緯度或大範圍時會有誤差，多查一圈網格作為安全邊界
+    ring = int(np.ceil(radius_meters / grid['cell_meters'])) + 1
+    cx, cy = _cell_of(grid, lon, lat)
+    candidates = np.sort(_candidates_in_rings(grid, cx, cy, ring))
+
+    distances = haversine_distance(lon, lat, grid['lon'][candidates], grid['lat'][candidates])
+    within = distances <= radius_meters
+    if return_distances:
+        return candidates[within], distances[within]
+    return candidates[within]
+
+def query_nearest(grid: dict, lon: float, lat: float, max_radius_meters: float = 5000.0):
+    """
+    找出距離 (lon, lat) 最近的點 (逐圈擴大搜尋範圍；點數不超過 NEAREST_BRUTE_FORCE_MAX_POINTS 時直接比對全部點)。
+
+    Returns:
+        (index, distance_meters)；在 max_radius_meters 內找不到時回傳 (None, None)。
+    """
+    if np.isnan(lon) or np.isnan(lat) or not grid['cells']:
+        return None, None
+
+    valid_indices = grid['valid_indices']
+    if len(valid_indices) <= NEAREST_BRUTE_FORCE_MAX_POINTS:
+        distances = haversine_distance(lon, lat, grid['lon'][valid_indices], grid['lat'][valid_indices])
+        best = int(np.argmin(distances))
+        if distances[best] > max_radius_meters:
+            return None, None
+        return int(valid_indices[best]), float(distances[best])
+
+    cx, cy = _cell_of(grid, lon, lat)
+    max_ring = int(np.ceil(max_radius_meters / grid['cell_meters'])) + 1
+    for ring in range(max_ring + 1):
+        candidates = _candidates_in_rings(grid, cx, cy, ring)
+        if len(candidates) == 0:
+            continue
+        distances = haversine_distance(lon, lat, grid['lon'][candidates], grid['lat'][candidates])
+        best = int(np.argmin(distances))
+        # 找到候選後再多看一圈，才能保證圈外沒有更近的點
+        if distances[best] <= ring * grid['cell_meters'] or ring == max_ring:
+            if distances[best] > max_radius_meters:
+                return None, None
+            return int(candidates[best]), float(distances[best])
+    return None, None
@@ -0,0 +1,27 @@
+# analysis/geo_kernels_jit.py (geo_kernels 的 Numba JIT 版本；只在需要時由 geo_kernels 載入)
+
+import numpy as np
+from numba import njit, prange
+
+from analysis.geo_kernels import EARTH_RADIUS_METERS
+
+@njit(cache=True)
+def haversine_scalar_jit(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = np.radians(lon1), np.radians(lat1), np.radians(lon2), np.radians(lat2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_METERS * 2 * np.arcsin(np.sqrt(a))
+
+@njit(cache=True)
+def consecutive_distances_jit(lon, lat):
+    out = np.empty(max(len(lon) - 1, 0))
+    for i in range(len(lon) - 1):
+        out[i] = haversine_scalar_jit(lon[i], lat[i], lon[i + 1], lat[i + 1])
+    return out
+
+@njit(cache=True, parallel=True)
+def pairwise_block_jit(lon_a, lat_a, lon_b, lat_b):
+    out = np.empty((len(lon_a), len(lon_b)))
+    for i in prange(len(lon_a)):
+        for j in range(len(lon_b)):
+            out[i, j] = haversine_scalar_jit(lon_a[i], lat_a[i], lon_b[j], lat_b[j])
+    return out
@@ -1,9 +1,14 @@
 # analysis/meeting_analyzer.py
 
 import pandas as pd
-from analysis.advanced_stay_detector import find_advanced_stay_points, haversine_distance
+import numpy as np
+from analysis.geo_kernels import haversine_distance
+from analysis.trajectory_kernel import build_trajectory_arrays, advanced_stay_table, ADVANCED_STAY_FIELDS
+from analysis.result_types import create_table, empty_table, encode_categories, table_records, column_values, take_rows
+from analysis.copresence_index import plates_in_window
 # 【新增匯入】需要用到分群功能來產生 LocationAreaID
 from analysis.camera_clusterer import cluster_cameras_by_distance
+from monitoring.stage_metrics import stage_span
 
 def check_time_overlap(start1, end1, start2, end2):
     """檢查兩個時間區段是否有重疊"""
@@ -11,10 +16,92 @@ def check_time_overlap(start1, end1, start2, end2):
     overlap_end = min(end1, end2)
     return overlap_start < overlap_end
 
+def count_same_camera_hits(copresence_index: dict, vehicle_df: pd.DataFrame, other_plate: str,
+                           start_time, end_time, tolerance_minutes: int = 10) -> int:
+    """
+    以共現索引檢查：在 [start_time, end_time] 期間，vehicle_df 的每一筆偵測前後 tolerance_minutes 內，
+    other_plate 是否也被同一支攝影機拍到。回傳命中的偵測筆數。
+    """
+    other_code = copresence_index['plate_index'].get(other_plate)
+    key_col = copresence_index['meta']['key_col']
+    if other_code is None or key_col not in vehicle_df.columns:
+        return 0
+
+    tolerance = pd.Timedelta(minutes=tolerance_minutes)
+    in_window = vehicle_df[(vehicle_df['datetime'] >= start_time - tolerance) & (vehicle_df['datetime'] <= end_time + tolerance)]
+    hits = 0
+    for t, loc in zip(in_window['datetime'], in_window[key_col]):
+        if other_code in plates_in_window(copresence_index, loc, t - tolerance, t + tolerance):
+            hits += 1
+    return hits
+
+MEETING_FIELDS = [
+    ('start_time', 'time'), ('end_time', 'time'), ('duration_mins', 'float'), ('distance_meters', 'float'),
+    ('location_desc', 'category'), ('type_a', 'category'), ('type_b', 'category'), ('is_cross_area', 'bool'),
+]
+
+def find_meetings(stays_a: dict, stays_b: dict, distance_threshold_meters: float = 80) -> dict:
+    """
+    比對兩台車的停留點結果表 (advanced_stay_table)，找出時間重疊且中心點距離在門檻內的組合。
+    時間重疊與距離一次對所有 (A, B) 組合以陣列計算，只有符合的組合才逐筆產生說明文字。
+
+    Returns:
+        dict: 碰面結果表 (欄位見 MEETING_FIELDS)，依重疊開始時間排序
+    """
+    if not stays_a['length'] or not stays_b['length']:
+        return empty_table('meetings', MEETING_FIELDS)
+
+    a_cols, b_cols = stays_a['columns'], stays_b['columns']
+    # [檢查 1] 時間是否有重疊 (與 check_time_overlap 相同：重疊區段長度須大於 0)
+    overlap_start = np.maximum(a_cols['start_time'][:, None], b_cols['start_time'][None, :])
+    overlap_end = np.minimum(a_cols['end_time'][:, None], b_cols['end_time'][None, :])
+    ia, ib = np.nonzero(overlap_start < overlap_end)
+
+    # [檢查 2] 物理距離是否夠近 (使用平均經緯度；無視 Area ID，只看物理距離)
+    dist_meters = haversine_distance(a_cols['center_lon'][ia], a_cols['center_lat'][ia],
+                                     b_cols['center_lon'][ib], b_cols['center_lat'][ib])
+    close = dist_meters <= distance_threshold_meters
+    ia, ib, dist_meters = ia[close], ib[close], dist_meters[close]
+    overlap_start, overlap_end = overlap_start[ia, ib], overlap_end[ia, ib]
+
+    # 判斷是否為跨區碰面 (供報告參考)；只對少數符合的組合逐筆處理
+    desc_a = column_values(stays_a, 'location_desc')[ia]
+    hint_a = column_values(stays_a, 'area_id_hint')[ia]
+    hint_b = column_values(stays_b, 'area_id_hint')[ib]
+    location_desc, is_cross_area = [], np.zeros(len(ia), dtype=bool)
+    for k, (desc, aid_a, aid_b) in enumerate(zip(desc_a, hint_a, hint_b)):
+        if aid_a and aid_b and aid_a != aid_b:
+            is_cross_area[k] = True
+            desc = f"{aid_a} 與 {aid_b} 交界"
+        location_desc.append(desc)
+
+    durations = [round(pd.Timedelta(int(d)).total_seconds() / 60, 1) for d in overlap_end - overlap_start]
+    order = np.argsort(overlap_start, kind='stable')
+    desc_codes, desc_values = encode_categories(location_desc)
+    meetings = create_table('meetings', MEETING_FIELDS, {
+        'start_time': overlap_start,
+        'end_time': overlap_end,
+        'duration_mins': np.array(durations, dtype=np.float64),
+        'distance_meters': np.round(dist_meters, 1),
+        'location_desc': desc_codes,
+        'type_a': a_cols['type'][ia],
+        'type_b': b_cols['type'][ib],
+        'is_cross_area': is_cross_area,
+    }, categories={'location_desc': desc_values, 'type_a': stays_a['categories']['type'],
+                   'type_b': stays_b['categories']['type']})
+    return take_rows(meetings, order)
+
 def run_dual_vehicle_meeting_analysis(df_a: pd.DataFrame, df_b: pd.DataFrame, 
-                                      plate_a: str, plate_b: str):
+                                      plate_a: str, plate_b: str, copresence_index: dict = None,
+                                      distance_threshold_meters: float = 80) -> list:
     """
     執行雙車碰面分析的主流程
+    copresence_index (選用) 用於確認碰面期間兩車是否曾被同一支攝影機拍到 (same_camera_hits)。
+    碰面本身仍以停留點的時間重疊與中心點距離判定 (兩車可能停在相鄰但不同的攝影機附近)，
+    索引只作為佐證，不會排除或新增碰面事件；未提供索引時 same_camera_hits 為 None。
+
+    Returns:
+        list of dict: 依開始時間排序的碰面事件
     """
     print(f"\n--- 開始分析 {plate_a} 與 {plate_b} 的碰面紀錄 ---")
 
@@ -23,82 +110,47 @@ def run_dual_vehicle_meeting_analysis(df_a: pd.DataFrame, df_b: pd.DataFrame,
     # ==============================================================================
     print("正在進行地點分群與預處理...")
     
-    # 1. 合併兩車資料以建立統一的地點分群 (避免兩車的 Area ID 定義不同)
-    combined_df = pd.concat([df_a, df_b], ignore_index=True)
-    
-    # 2. 提取不重複攝影機
-    unique_cameras = combined_df[['攝影機', '攝影機名稱', '經度', '緯度']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
-    
-    # 3. 執行分群 (產生 LocationAreaID)
-    cameras_with_area = cluster_cameras_by_distance(unique_cameras, radius_meters=200)
-    
-    # 4. 將 LocationAreaID 合併回原始資料
-    # 注意：需確保欄位名稱一致
-    df_a = pd.merge(df_a, cameras_with_area[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
-    df_b = pd.merge(df_b, cameras_with_area[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
+    pair_labels = {'plate': plate_a, 'other_plate': plate_b}
+    with stage_span('meeting.clustering', rows_in=len(df_a) + len(df_b), **pair_labels) as span:
+        # 1. 合併兩車資料以建立統一的地點分群 (避免兩車的 Area ID 定義不同)
+        combined_df = pd.concat([df_a, df_b], ignore_index=True)
+
+        # 2. 提取不重複攝影機
+        unique_cameras = combined_df[['攝影機', '攝影機名稱', '經度', '緯度']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+
+        # 3. 執行分群 (產生 LocationAreaID)
+        cameras_with_area = cluster_cameras_by_distance(unique_cameras, radius_meters=200)
+
+        # 4. 將 LocationAreaID 合併回原始資料
+        # 注意：需確保欄位名稱一致
+        df_a = pd.merge(df_a, cameras_with_area[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
+        df_b = pd.merge(df_b, cameras_with_area[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
+        span['rows_out'] = len(cameras_with_area)
     
     # ==============================================================================
     # 步驟 1: 分別計算兩台車的停留點 (使用進階混合邏輯)
     # ==============================================================================
-    print(f"正在計算 {plate_a} 的停留點 (含隱性停留)...")
-    stays_a = find_advanced_stay_points(df_a)
-    
-    print(f"正在計算 {plate_b} 的停留點 (含隱性停留)...")
-    stays_b = find_advanced_stay_points(df_b)
-    
-    print(f"-> {plate_a} 共有 {len(stays_a)} 個停留點")
-    print(f"-> {plate_b} 共有 {len(stays_b)} 個停留點")
-    
-    meetings = []
+    with stage_span('meeting.stay_detection', rows_in=len(df_a) + len(df_b), **pair_labels) as span:
+        print(f"正在計算 {plate_a} 的停留點 (含隱性停留)...")
+        stays_a = advanced_stay_table(build_trajectory_arrays(df_a)) if not df_a.empty else empty_table('advanced_stays', ADVANCED_STAY_FIELDS)
+
+        print(f"正在計算 {plate_b} 的停留點 (含隱性停留)...")
+        stays_b = advanced_stay_table(build_trajectory_arrays(df_b)) if not df_b.empty else empty_table('advanced_stays', ADVANCED_STAY_FIELDS)
+        span['rows_out'] = stays_a['length'] + stays_b['length']
     
-    # 2. 雙重迴圈比對 (Matching)
-    # 閾值設定：距離 80 公尺內視為碰面 (無視 Area ID，只看物理距離)
-    MEETING_DISTANCE_THRESHOLD = 80 
+    print(f"-> {plate_a} 共有 {stays_a['length']} 個停留點")
+    print(f"-> {plate_b} 共有 {stays_b['length']} 個停留點")
     
-    for s_a in stays_a:
-        for s_b in stays_b:
-            
-            # [檢查 1] 時間是否有重疊
-            if check_time_overlap(s_a['start_time'], s_a['end_time'],
-                                  s_b['start_time'], s_b['end_time']):
-                
-                # [檢查 2] 物理距離是否夠近 (使用平均經緯度)
-                dist_meters = haversine_distance(
-                    s_a['center_lon'], s_a['center_lat'],
-                    s_b['center_lon'], s_b['center_lat']
-                )
-                
-                if dist_meters <= MEETING_DISTANCE_THRESHOLD:
-                    # 賓果！抓到碰面
-                    
-                    # 計算重疊時間長度
-                    overlap_start = max(s_a['start_time'], s_b['start_time'])
-                    overlap_end = min(s_a['end_time'], s_b['end_time'])
-                    duration = (overlap_end - overlap_start).total_seconds() / 60
-                    
-                    # 判斷是否為跨區碰面 (供報告參考)
-                    is_cross_area = False
-                    location_hint = s_a['location_desc']
-                    
-                    # 安全存取 area_id_hint，避免有些 Gap Stay 可能沒有這個欄位
-                    aid_a = s_a.get('area_id_hint')
-                    aid_b = s_b.get('area_id_hint')
-                    
-                    if aid_a and aid_b:
-                        if aid_a != aid_b:
-                            is_cross_area = True
-                            location_hint = f"{aid_a} 與 {aid_b} 交界"
-
-                    meetings.append({
-                        'start_time': overlap_start,
-                        'end_time': overlap_end,
-                        'duration_mins': round(duration, 1),
-                        'distance_meters': round(dist_meters, 1),
-                        'location_desc': location_hint,
-                        'type_a': s_a['type'],
-                        'type_b': s_b['type'],
-                        'is_cross_area': is_cross_area
-                    })
+    # 2. 比對 (Matching)：時間重疊 + 距離 distance_threshold_meters 內視為碰面
+    with stage_span('meeting.matching', rows_in=stays_a['length'] * stays_b['length'], **pair_labels) as span:
+        meeting_table = find_meetings(stays_a, stays_b, distance_threshold_meters)
+        meetings = []
+        for m in table_records(meeting_table):
+            same_camera_hits = None
+            if copresence_index is not None:
+                same_camera_hits = count_same_camera_hits(copresence_index, df_a, plate_b, m['start_time'], m['end_time'])
+            meetings.append({'same_camera_hits': same_camera_hits, **m})
+        span['rows_out'] = len(meetings)
     
     # 3. 輸出結果報告
     if not meetings:
@@ -106,7 +158,6 @@ def run_dual_vehicle_meeting_analysis(df_a: pd.DataFrame, df_b: pd.DataFrame,
     else:
         print(f"\n[分析結果]：共發現 {len(meetings)} 次碰面事件！")
         print("="*60)
-        meetings.sort(key=lambda x: x['start_time'])
         
         for idx, m in enumerate(meetings):
             time_str = m['start_time'].strftime('%Y-%m-%d %H:%M')
@@ -115,4 +166,8 @@ def run_dual_vehicle_meeting_analysis(df_a: pd.DataFrame, df_b: pd.DataFrame,
             print(f"   - 類型：A車({m['type_a']}) + B車({m['type_b']})")
             if m['is_cross_area']:
                 print(f"   - 備註：⚠️ 這是跨區域的邊界碰面 (Area ID 不同但距離近)")
-            print("-" * 30)
\ No newline at end of file
+            if m['same_camera_hits']:
+                print(f"   - 佐證：碰面期間兩車曾 {m['same_camera_hits']} 次被同一支攝影機拍到")
+            print("-" * 30)
+
+    return meetings
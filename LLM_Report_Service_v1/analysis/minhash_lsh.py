@@ -0,0 +1,77 @@
+# analysis/minhash_lsh.py (MinHash 簽章與 LSH 分桶)
+
+import hashlib
+
+import numpy as np
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+def make_minhash_params(num_perm: int = 64, seed: int = 42) -> dict:
+    """產生 MinHash 用的隨機雜湊參數 (同一個索引必須固定使用同一組參數)。"""
+    rng = np.random.default_rng(seed)
+    return {
+        'num_perm': num_perm,
+        'seed': seed,
+        'a': rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64),
+        'b': rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64),
+    }
+
+_token_hash_cache = {}
+
+def _token_hash(token) -> int:
+    """穩定的 32 位元雜湊 (不受 Python 的 hash 隨機化影響，可跨行程、跨次執行使用)。"""
+    value = _token_hash_cache.get(token)
+    if value is None:
+        digest = hashlib.blake2b(str(token).encode('utf-8'), digest_size=4).digest()
+        value = int.from_bytes(digest, 'little')
+        _token_hash_cache[token] = value
+    return value
+
+def shingles(sequence, k: int = 1) -> set:
+    """將地點序列轉成 k-gram 集合 (k=1 即為地點集合)。"""
+    sequence = list(sequence)
+    if k <= 1:
+        return set(sequence)
+    return {tuple(sequence[i:i + k]) for i in range(len(sequence) - k + 1)}
+
+def minhash_signature(tokens, params: dict) -> np.ndarray:
+    """計算一組 token 的 MinHash 簽章 (長度 num_perm 的 uint64 陣列)。"""
+    hashes = np.fromiter((_token_hash(t) for t in tokens), dtype=np.uint64)
+    if len(hashes) == 0:
+        return np.full(params['num_perm'], _MAX_HASH, dtype=np.uint64)
+    permuted = (params['a'][:, None] * hashes[None, :] + params['b'][:, None]) % _MERSENNE_PRIME
+    return (permuted & _MAX_HASH).min(axis=1)
+
+def estimate_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """以兩個簽章相同位置的比例估計 Jaccard 相似度。"""
+    return float(np.mean(sig_a == sig_b))
+
+def band_keys(signature: np.ndarray, bands: int) -> list:
+    """將簽章切成 bands 段，每段轉成可作為 dict key 的 bytes。"""
+    rows = len(signature) // bands
+    return [signature[i * rows:(i + 1) * rows].tobytes() for i in range(bands)]
+
+def build_lsh_buckets(signatures, bands: int = 16) -> list:
+    """
+    將簽章依 band 分桶。
+
+    Returns:
+        list of dict：每個 band 一個 {band key: [項目編號, ...]}。
+    """
+    buckets = [dict() for _ in range(bands)]
+    for item_id, signature in enumerate(signatures):
+        add_to_lsh_buckets(buckets, item_id, signature)
+    return buckets
+
+def add_to_lsh_buckets(buckets: list, item_id: int, signature: np.ndarray) -> None:
+    """將一個新的項目加入既有的 LSH 分桶 (不需重建)。"""
+    for band, key in enumerate(band_keys(signature, len(buckets))):
+        buckets[band].setdefault(key, []).append(item_id)
+
+def lsh_candidates(buckets: list, signature: np.ndarray) -> set:
+    """回傳與簽章至少在一個 band 上完全相同的所有項目編號。"""
+    candidates = set()
+    for band, key in enumerate(band_keys(signature, len(buckets))):
+        candidates.update(buckets[band].get(key, ()))
+    return candidates
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from analysis.result_types import table_length, table_to_frame
+
 def get_time_slot(hour: int) -> str:
     """Gets the time slot (e.g., morning, afternoon) based on the hour."""
     if 4 <= hour < 7: return "清晨"
@@ -31,13 +33,18 @@ def get_day_type(day_of_week: int) -> str:
         return "週末"
 
 
-def find_regular_patterns_v13(trips: list, stay_points: list, all_cameras_with_area: pd.DataFrame,
+def _as_frame(results) -> pd.DataFrame:
+    """結果表 (analysis/result_types.py) 或 list of dict 轉為 DataFrame。"""
+    return table_to_frame(results) if isinstance(results, dict) else pd.DataFrame(results)
+
+def find_regular_patterns_v13(trips, stay_points, all_cameras_with_area: pd.DataFrame,
                               confirmed_threshold: int = 4,
                               secondary_base_threshold: int = 3,
                               long_stay_duration_hours: float = 4.0) -> dict:
     """
     (V13 最終優化版)
     - 為「單次停留」的點，額外記錄其開始與結束時間。
+    - trips / stay_points 可為 trip_table / area_stay_table 的結果表，或舊格式的 list of dict。
     """
     analysis_summary = {
         "base_info": { "primary": None, "secondary": [] },
@@ -51,11 +58,11 @@ def find_regular_patterns_v13(trips: list, stay_points: list, all_cameras_with_a
         index=temp_map_df['LocationAreaID']
     ).to_dict()
 
-    if not trips or not stay_points:
-        return { "summary": analysis_summary, "area_map": area_to_name_map, "trips_df": pd.DataFrame(trips) }
+    if not table_length(trips) or not table_length(stay_points):
+        return { "summary": analysis_summary, "area_map": area_to_name_map, "trips_df": _as_frame(trips) }
 
-    trips_df = pd.DataFrame(trips)
-    stay_points_df = pd.DataFrame(stay_points)
+    trips_df = _as_frame(trips)
+    stay_points_df = _as_frame(stay_points)
 
     if not stay_points_df.empty:
         stay_points_df['arrival_hour_float'] = stay_points_df['start_time'].dt.hour + stay_points_df['start_time'].dt.minute / 60
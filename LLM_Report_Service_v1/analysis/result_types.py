@@ -0,0 +1,245 @@
+# analysis/result_types.py (分析結果的欄式容器：停留點 / 行程 / 碰面 / 同行片段以陣列儲存，取代 list of dict)
+#
+# 結果表為一個 dict，每個欄位一個 NumPy 陣列 (struct-of-arrays)：
+#     'time'     : int64 (自 epoch 起的奈秒)
+#     'float'    : float64 (optional 欄位以 NaN 表示無值)
+#     'int'      : int64
+#     'bool'     : bool
+#     'category' : int32 編碼，對照值在 table['categories'][欄位] (多個欄位可共用同一份對照)
+#     'list'     : int64 offsets (長度 n + 1)，元素編碼在 table['list_codes'][欄位]，對照值同 category
+# 需要舊格式的呼叫端以 table_records() 取得與原本相同的 list of dict；
+# 批次輸出以 table_to_frame() / write_parquet() 直接由陣列轉換，不經過逐筆 dict。
+
+import importlib.util
+
+import pandas as pd
+import numpy as np
+
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+_FIELD_TYPES = ('time', 'float', 'int', 'bool', 'category', 'list')
+
+# ==========================================
+# 1. 建立
+# ==========================================
+def encode_categories(values) -> tuple:
+    """
+    將值編碼為 (int32 編碼, 對照值 object 陣列)。缺值 (None / NaN) 也保留為一個對照值，
+    解碼後與原始值相同。
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+    return codes.astype(np.int32), np.asarray(uniques, dtype=object)
+
+def create_table(kind: str, fields: list, columns: dict, categories: dict = None,
+                 list_codes: dict = None, optional: tuple = ()) -> dict:
+    """
+    建立結果表。
+
+    Args:
+        kind: 結果種類 ('area_stays'、'advanced_stays'、'trips'、'meetings'、'convoy_segment' ...)
+        fields: [(欄位名稱, 類型)]，順序即 table_records() 輸出的鍵順序
+        columns: {欄位名稱: 陣列}
+        categories: {欄位名稱: 對照值陣列} (category / list 欄位)
+        list_codes: {欄位名稱: 元素編碼陣列} (list 欄位)
+        optional: 值為 NaN (float) 或 -1 (category) 時，table_records() 省略此鍵的欄位
+
+    Raises:
+        ValueError: 欄位類型不正確或各欄長度不一致
+    """
+    categories = categories or {}
+    list_codes = list_codes or {}
+    lengths = set()
+    for name, field_type in fields:
+        if field_type not in _FIELD_TYPES:
+            raise ValueError(f"欄位 '{name}' 的類型 '{field_type}' 不正確，可用: {', '.join(_FIELD_TYPES)}")
+        column = columns[name]
+        lengths.add(len(column) - 1 if field_type == 'list' else len(column))
+        if field_type in ('category', 'list') and name not in categories:
+            raise ValueError(f"欄位 '{name}' 缺少對照值 (categories)")
+    if len(lengths) > 1:
+        raise ValueError(f"{kind} 各欄位長度不一致: {sorted(lengths)}")
+
+    return {
+        'kind': kind,
+        'length': lengths.pop() if lengths else 0,
+        'fields': list(fields),
+        'columns': columns,
+        'categories': categories,
+        'list_codes': list_codes,
+        'optional': tuple(optional),
+    }
+
+def empty_table(kind: str, fields: list) -> dict:
+    """沒有任何資料列的結果表 (欄位與類型與一般結果相同)。"""
+    columns, categories, list_codes = {}, {}, {}
+    for name, field_type in fields:
+        if field_type == 'list':
+            columns[name] = np.zeros(1, dtype=np.int64)
+            list_codes[name] = np.empty(0, dtype=np.int32)
+        else:
+            columns[name] = np.empty(0, dtype={'float': np.float64, 'bool': bool, 'category': np.int32}.get(field_type, np.int64))
+        if field_type in ('category', 'list'):
+            categories[name] = np.empty(0, dtype=object)
+    return create_table(kind, fields, columns, categories, list_codes)
+
+def table_length(table) -> int:
+    """結果表 (或舊格式的 list) 的筆數。"""
+    return table['length'] if isinstance(table, dict) else len(table)
+
+def table_nbytes(table: dict) -> int:
+    """結果表陣列所占的位元組數 (不含 object 對照值本身的字串內容)。"""
+    arrays = [*table['columns'].values(), *table['list_codes'].values()]
+    arrays += list({id(c): c for c in table['categories'].values()}.values())
+    return int(sum(a.nbytes for a in arrays))
+
+# ==========================================
+# 2. 取值與轉換
+# ==========================================
+def _field_type(table: dict, name: str) -> str:
+    for field, field_type in table['fields']:
+        if field == name:
+            return field_type
+    raise KeyError(f"{table['kind']} 沒有欄位 '{name}'")
+
+def column_values(table: dict, name: str) -> np.ndarray:
+    """
+    取出解碼後的欄位：time 為 datetime64[ns]、category 為原始值 (object)、
+    list 為每列一個 Python list 的 object 陣列，其餘為原始數值陣列。
+    """
+    field_type = _field_type(table, name)
+    column = table['columns'][name]
+    if field_type == 'time':
+        return column.view('datetime64[ns]')
+    if field_type == 'category':
+        return table['categories'][name][column]
+    if field_type == 'list':
+        values = table['categories'][name][table['list_codes'][name]]
+        lists = np.empty(table['length'], dtype=object)
+        lists[:] = [values[s:e].tolist() for s, e in zip(column[:-1], column[1:])]
+        return lists
+    return column
+
+def _python_values(table: dict, name: str) -> list:
+    field_type = _field_type(table, name)
+    if field_type == 'time':
+        return list(pd.DatetimeIndex(table['columns'][name].view('datetime64[ns]')))
+    if field_type == 'category':
+        return table['categories'][name][table['columns'][name]].tolist()
+    return column_values(table, name).tolist()
+
+def _is_missing(table: dict, name: str) -> np.ndarray:
+    field_type = _field_type(table, name)
+    column = table['columns'][name]
+    if field_type == 'float':
+        return np.isnan(column)
+    if field_type == 'category':
+        return column < 0
+    return np.zeros(table['length'], dtype=bool)
+
+def table_records(table: dict) -> list:
+    """
+    轉為 list of dict (舊版分析函式的回傳格式)：時間為 pd.Timestamp、category 為原始值、
+    list 欄位為 Python list；optional 欄位無值時省略該鍵。
+    """
+    names = [name for name, _ in table['fields']]
+    values = [_python_values(table, name) for name in names]
+    records = [dict(zip(names, row)) for row in zip(*values)]
+    for name in table['optional']:
+        for i in np.flatnonzero(_is_missing(table, name)):
+            del records[i][name]
+    return records
+
+def table_to_frame(table: dict) -> pd.DataFrame:
+    """轉為 DataFrame (欄位順序與 table_records() 的鍵相同，時間欄為 datetime64[ns])。"""
+    return pd.DataFrame({name: column_values(table, name) for name, _ in table['fields']},
+                        index=pd.RangeIndex(table['length']))
+
+def take_rows(table: dict, indices) -> dict:
+    """依索引 (或布林遮罩) 取出部分資料列，對照值沿用原表。"""
+    indices = np.asarray(indices)
+    if indices.dtype == bool:
+        indices = np.flatnonzero(indices)
+    columns, list_codes = {}, {}
+    for name, field_type in table['fields']:
+        column = table['columns'][name]
+        if field_type != 'list':
+            columns[name] = column[indices]
+            continue
+        starts, ends = column[:-1][indices], column[1:][indices]
+        lengths = ends - starts
+        columns[name] = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        positions = np.repeat(starts - columns[name][:-1], lengths) + np.arange(lengths.sum())
+        list_codes[name] = table['list_codes'][name][positions]
+    return create_table(table['kind'], table['fields'], columns, table['categories'], list_codes, table['optional'])
+
+def concat_tables(tables: list, key_field: str = None, keys: list = None) -> dict:
+    """
+    合併多個同種類的結果表 (例如批次分析中每台車一個)；對照值重新合併編碼。
+    key_field / keys 指定時加上一個 category 欄位標示每列來源 (例如 'plate')。
+    """
+    tables = list(tables)
+    if not tables:
+        raise ValueError("concat_tables 需要至少一個結果表")
+    kind, fields = tables[0]['kind'], tables[0]['fields']
+    if any(t['fields'] != fields for t in tables):
+        raise ValueError(f"{kind} 的欄位不一致，無法合併")
+
+    columns, categories, list_codes = {}, {}, {}
+    if key_field is not None:
+        key_codes, categories[key_field] = encode_categories(keys)
+        columns[key_field] = np.repeat(key_codes, [t['length'] for t in tables]).astype(np.int32)
+
+    for name, field_type in fields:
+        if field_type in ('category', 'list'):
+            source = 'list_codes' if field_type == 'list' else 'columns'
+            decoded = [t['categories'][name][t[source][name]] for t in tables]
+            codes, categories[name] = encode_categories(np.concatenate(decoded) if decoded else [])
+            if field_type == 'category':
+                columns[name] = codes
+                continue
+            list_codes[name] = codes
+            lengths = np.concatenate([np.diff(t['columns'][name]) for t in tables])
+            columns[name] = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        else:
+            columns[name] = np.concatenate([t['columns'][name] for t in tables])
+
+    out_fields = ([(key_field, 'category')] if key_field is not None else []) + list(fields)
+    return create_table(kind, out_fields, columns, categories, list_codes, tables[0]['optional'])
+
+# ==========================================
+# 3. Arrow / Parquet (選用，需要 pyarrow)
+# ==========================================
+def to_arrow(table: dict):
+    """
+    轉為 pyarrow.Table：time 為 timestamp[ns]、category 為 dictionary、list 為 list<dictionary>，
+    皆直接使用既有陣列，不經過 Python 物件。
+
+    Raises:
+        ImportError: 未安裝 pyarrow
+    """
+    if not PYARROW_AVAILABLE:
+        raise ImportError("輸出 Arrow / Parquet 需要安裝 pyarrow。")
+    import pyarrow as pa
+
+    arrays = {}
+    for name, field_type in table['fields']:
+        column = table['columns'][name]
+        if field_type == 'time':
+            arrays[name] = pa.array(column.view('datetime64[ns]'))
+        elif field_type in ('category', 'list'):
+            dictionary = pa.array([None if pd.isna(v) else str(v) for v in table['categories'][name]], type=pa.string())
+            codes = column if field_type == 'category' else table['list_codes'][name]
+            encoded = pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32()), dictionary)
+            arrays[name] = encoded if field_type == 'category' else pa.ListArray.from_arrays(pa.array(column), encoded)
+        elif field_type == 'float':
+            arrays[name] = pa.array(column, from_pandas=True)
+        else:
+            arrays[name] = pa.array(column)
+    return pa.table(arrays, metadata={'kind': table['kind']})
+
+def write_parquet(table: dict, path):
+    """將結果表寫成 Parquet 檔 (需要 pyarrow)。"""
+    arrow_table = to_arrow(table)
+    import pyarrow.parquet as pq
+
+    pq.write_table(arrow_table, str(path))
@@ -0,0 +1,197 @@
+# analysis/route_matcher.py (攝影機轉移圖上的路徑補全 / Map-Matching)
+
+import heapq
+from collections import OrderedDict
+
+import numpy as np
+
+from analysis.camera_graph import edge_position
+
+# ==========================================
+# 1. 最短路徑基礎 (CSR 上的 Dijkstra)
+# ==========================================
+def _reverse_csr(graph: dict):
+    """建立反向圖的 CSR 結構 (用於計算「到地標」的距離)。"""
+    n = len(graph['nodes'])
+    src = np.repeat(np.arange(n), np.diff(graph['indptr']))
+    order = np.argsort(graph['indices'], kind='mergesort')
+    rev_indices = src[order].astype(np.int32)
+    rev_weights = graph['median_seconds'][order]
+    rev_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(rev_indptr, graph['indices'][order] + 1, 1)
+    return np.cumsum(rev_indptr), rev_indices, rev_weights
+
+def _dijkstra_all(indptr, indices, weights, source: int) -> np.ndarray:
+    """從 source 出發到所有節點的最短旅行時間 (秒)，無法到達為 inf。"""
+    dist = np.full(len(indptr) - 1, np.inf)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for pos in range(indptr[u], indptr[u + 1]):
+            v = indices[pos]
+            nd = d + weights[pos]
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+# ==========================================
+# 2. 建立路徑比對器 (預先計算地標距離，ALT)
+# ==========================================
+def build_route_matcher(graph: dict, num_landmarks: int = 8, cache_size: int = 50000) -> dict:
+    """
+    以攝影機轉移圖 (邊權重為旅行時間中位數) 建立路徑比對器。
+
+    預先從數個地標 (以最遠優先法挑選) 計算正向與反向最短距離，
+    查詢時以 A* + 三角不等式下界 (ALT) 搜尋，並快取查詢過的攝影機對。
+
+    Args:
+        graph: camera_graph.build_camera_transition_graph 的結果
+        num_landmarks: 地標數量
+        cache_size: 路徑快取的最大筆數 (LRU)
+
+    Returns:
+        dict: 路徑比對器 (包含原圖、反向圖、地標距離與快取)
+    """
+    n = len(graph['nodes'])
+    rev_indptr, rev_indices, rev_weights = _reverse_csr(graph)
+
+    landmarks, from_landmark, to_landmark = [], [], []
+    if n > 0:
+        # 以出度最高的節點作為第一個地標，之後每次選離現有地標最遠 (可到達) 的節點
+        candidate = int(np.argmax(np.diff(graph['indptr'])))
+        min_dist = np.full(n, np.inf)
+        for _ in range(min(num_landmarks, n)):
+            landmarks.append(candidate)
+            fwd = _dijkstra_all(graph['indptr'], graph['indices'], graph['median_seconds'], candidate)
+            bwd = _dijkstra_all(rev_indptr, rev_indices, rev_weights, candidate)
+            from_landmark.append(fwd)
+            to_landmark.append(bwd)
+            reach = np.where(np.isfinite(fwd), fwd, 0.0)
+            min_dist = np.minimum(min_dist, reach)
+            min_dist[landmarks] = -1
+            candidate = int(np.argmax(min_dist))
+            if min_dist[candidate] <= 0:
+                break
+
+    return {
+        'graph': graph,
+        'landmarks': landmarks,
+        'from_landmark': np.array(from_landmark) if from_landmark else np.empty((0, n)),
+        'to_landmark': np.array(to_landmark) if to_landmark else np.empty((0, n)),
+        'cache': OrderedDict(),
+        'cache_size': cache_size,
+    }
+
+def _alt_lower_bound(matcher: dict, v: int, t: int) -> float:
+    """ALT 下界：max(d(L,t) - d(L,v), d(v,L) - d(t,L))，忽略無法到達的地標。"""
+    fl, tl = matcher['from_landmark'], matcher['to_landmark']
+    if len(fl) == 0:
+        return 0.0
+    with np.errstate(invalid='ignore'):
+        bounds = np.concatenate([fl[:, t] - fl[:, v], tl[:, v] - tl[:, t]])
+    bounds = bounds[np.isfinite(bounds)]
+    return max(float(bounds.max()), 0.0) if len(bounds) else 0.0
+
+# ==========================================
+# 3. 查詢
+# ==========================================
+def shortest_camera_path(matcher: dict, from_node, to_node):
+    """
+    查詢兩支攝影機之間最可能的路徑 (旅行時間最短)。
+
+    Returns:
+        (path, cost_seconds)：path 為含起訖點的節點 ID 列表；無法到達時回傳 (None, None)。
+    """
+    key = (str(from_node), str(to_node))
+    cache = matcher['cache']
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+
+    graph = matcher['graph']
+    s = graph['node_index'].get(key[0])
+    t = graph['node_index'].get(key[1])
+    result = (None, None)
+    if s is not None and t is not None:
+        indptr, indices, weights = graph['indptr'], graph['indices'], graph['median_seconds']
+        dist = {s: 0.0}
+        prev = {}
+        heap = [(_alt_lower_bound(matcher, s, t), s)]
+        closed = set()
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            if u == t:
+                path = [t]
+                while path[-1] != s:
+                    path.append(prev[path[-1]])
+                result = ([graph['nodes'][i] for i in reversed(path)], dist[t])
+                break
+            closed.add(u)
+            for pos in range(indptr[u], indptr[u + 1]):
+                v = int(indices[pos])
+                nd = dist[u] + weights[pos]
+                if nd < dist.get(v, np.inf):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd + _alt_lower_bound(matcher, v, t), v))
+
+    cache[key] = result
+    if len(cache) > matcher['cache_size']:
+        cache.popitem(last=False)
+    return result
+
+def fill_path_gaps(matcher: dict, path_ids: list, observed_gaps_seconds=None,
+                   min_direct_count: int = 3, time_slack: float = 2.0, max_inserted: int = 20) -> list:
+    """
+    補上相鄰兩次偵測之間「沒拍到」的攝影機。
+
+    相鄰兩支攝影機若已有足夠的直接轉移紀錄 (>= min_direct_count) 就視為直達；
+    否則以最短旅行時間路徑補全。若有提供實際時間差，只接受旅行時間不超過
+    實際時間差 * time_slack 的路徑 (避免把中途停留誤判為繞路)。
+
+    Args:
+        path_ids: 依時間排序的攝影機節點 ID 列表
+        observed_gaps_seconds: (選用) 與相鄰點對齊、長度為 len(path_ids)-1 的實際時間差
+
+    Returns:
+        補全後的節點 ID 列表 (連續重複的節點會合併)。
+    """
+    if not path_ids:
+        return []
+
+    graph = matcher['graph']
+    filled = [path_ids[0]]
+    for i in range(len(path_ids) - 1):
+        a, b = path_ids[i], path_ids[i + 1]
+        if a == b:
+            continue
+        pos = edge_position(graph, a, b)
+        if pos < 0 or graph['count'][pos] < min_direct_count:
+            path, cost = shortest_camera_path(matcher, a, b)
+            plausible = path is not None and len(path) - 2 <= max_inserted
+            if plausible and observed_gaps_seconds is not None:
+                plausible = cost <= observed_gaps_seconds[i] * time_slack
+            if plausible:
+                filled.extend(path[1:-1])
+        filled.append(b)
+
+    return [node for i, node in enumerate(filled) if i == 0 or node != filled[i - 1]]
+
+def interpolate_trip_paths(trips: list, matcher: dict, **kwargs) -> list:
+    """
+    為 segment_trips_v3 / trips_from_arrays 的每個行程加上 'matched_path_location_ids'
+    (需包含 'path_location_ids')。不修改原本的行程 dict。
+    """
+    matched = []
+    for trip in trips:
+        trip = dict(trip)
+        if trip.get('path_location_ids'):
+            trip['matched_path_location_ids'] = fill_path_gaps(matcher, trip['path_location_ids'], **kwargs)
+        matched.append(trip)
+    return matched
@@ -0,0 +1,341 @@
+# analysis/shared_dataset.py (多行程共用的唯讀資料集：欄位轉成 NumPy 陣列放在 shared memory 或 memory map 檔，子行程直接附加，不需 pickle)
+#
+# 用法 (主行程):
+#     with shared_dataset(full_data) as dataset:
+#         with ProcessPoolExecutor(n, initializer=attach_worker_dataset, initargs=(dataset['spec'],)) as pool:
+#             pool.map(job, tasks)            # tasks 只傳遞車牌編號 / 索引範圍等小資料
+# 子行程:
+#     dataset = get_worker_dataset()
+#     times = dataset['arrays']['times'][start:end]    # 唯讀的零複製視圖
+#
+# 陣列依 (車牌, 時間) 排序，每台車為連續區段 plate_offsets[code]:plate_offsets[code + 1]；
+# time_order 為依時間排序的列索引，時間區間 (例如單日) 對應 time_order 中的連續區段。
+# 後端: 'shm' (multiprocessing.shared_memory，預設)、'mmap' (暫存檔 + memory map，/dev/shm 空間不足時自動改用)、
+#       'local' (只在本行程內使用的一般陣列)。可用環境變數 SHARED_DATASET_BACKEND 指定預設值。
+#
+# 需要完整 DataFrame 的子行程 (例如 API 的分析行程) 改用 create_shared_frame / attach_shared_frame：
+# 數值與時間欄位為共用緩衝區的零複製視圖，文字欄位以代碼共用、在子行程還原。
+
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATASET_BACKENDS = ('shm', 'mmap', 'local')
+
+# (陣列名稱, dtype)；長度為列數，plate_offsets 為車牌數 + 1
+_ARRAY_DTYPES = {
+    'times': np.int64,             # 偵測時間 (ns)
+    'plate_codes': np.int32,       # 車牌編號 (依車牌字串排序)
+    'location_codes': np.int32,    # 地點編號 (location_col 依字串排序；缺值為 -1)
+    'camera_codes': np.int32,      # 攝影機編號
+    'lon': np.float64,
+    'lat': np.float64,
+    'time_order': np.int64,        # 依時間排序的列索引 (時間相同時依原本順序)
+    'plate_offsets': np.int64,
+}
+_ALIGNMENT = 64
+
+# ==========================================
+# 1. 建立資料集
+# ==========================================
+def _build_arrays(full_data: pd.DataFrame, location_col: str) -> tuple:
+    """將需要的欄位編碼成數值陣列，回傳 (arrays, meta)。"""
+    plate_names = np.array(sorted(full_data['車牌'].astype(str).unique()), dtype=object)
+    plate_codes = np.searchsorted(plate_names, full_data['車牌'].astype(str).to_numpy(dtype=object)).astype(np.int32)
+
+    loc_values = full_data[location_col]
+    loc_valid = loc_values.notna().to_numpy()
+    loc_str = loc_values[loc_valid].astype(str).to_numpy(dtype=object)
+    location_names = np.array(sorted(set(loc_str)), dtype=object)
+    location_codes = np.full(len(full_data), -1, dtype=np.int32)
+    location_codes[loc_valid] = np.searchsorted(location_names, loc_str)
+
+    camera_codes, camera_values = pd.factorize(full_data['攝影機'], sort=True)
+    camera_names = (full_data[['攝影機', '攝影機名稱']].drop_duplicates(subset=['攝影機']).set_index('攝影機')['攝影機名稱']
+                    .reindex(camera_values).tolist() if '攝影機名稱' in full_data.columns else [None] * len(camera_values))
+
+    datetimes = pd.to_datetime(full_data['datetime'])
+    times = datetimes.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    order = np.lexsort((times, plate_codes))
+    sorted_times = times[order]
+    arrays = {
+        'times': sorted_times,
+        'plate_codes': plate_codes[order],
+        'location_codes': location_codes[order],
+        'camera_codes': camera_codes[order].astype(np.int32),
+        'lon': pd.to_numeric(full_data['經度'], errors='coerce').to_numpy(dtype=np.float64)[order],
+        'lat': pd.to_numeric(full_data['緯度'], errors='coerce').to_numpy(dtype=np.float64)[order],
+        'time_order': np.argsort(sorted_times, kind='stable').astype(np.int64),
+        'plate_offsets': np.searchsorted(plate_codes[order], np.arange(len(plate_names) + 1)).astype(np.int64),
+    }
+    meta = {
+        'n_rows': len(full_data),
+        'location_col': location_col,
+        'datetime_unit': np.datetime_data(datetimes.dtype)[0] if datetimes.dtype.kind == 'M' else 'ns',
+        'plate_names': plate_names.tolist(),
+        'location_names': location_names.tolist(),
+        'camera_values': camera_values.tolist(),
+        'camera_names': camera_names,
+    }
+    return arrays, meta
+
+def _layout(arrays: dict, dtypes: dict) -> tuple:
+    """各陣列在共用緩衝區中的位置 ({名稱: (offset, 長度, dtype)}) 與總大小。"""
+    layout, offset = {}, 0
+    for name, dtype in dtypes.items():
+        dtype = np.dtype(dtype)
+        layout[name] = (offset, len(arrays[name]), dtype.str)
+        offset += -(-len(arrays[name]) * dtype.itemsize // _ALIGNMENT) * _ALIGNMENT
+    return layout, max(offset, 1)
+
+def _views(buffer, layout: dict, readonly: bool) -> dict:
+    views = {}
+    for name, (offset, length, dtype) in layout.items():
+        view = np.ndarray((length,), dtype=dtype, buffer=buffer, offset=offset)
+        if readonly:
+            view.flags.writeable = False
+        views[name] = view
+    return views
+
+def _allocate(size: int, backend: str, directory=None) -> tuple:
+    """
+    配置共用緩衝區，回傳 (buffer, 實際使用的後端, location, 需要釋放的資源)。
+    shm 建立失敗 (例如容器的 /dev/shm 太小) 時自動改用 mmap。
+    """
+    if backend == 'shm':
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            return shm.buf, 'shm', shm.name, [('shm_owner', shm)]
+        except OSError as e:
+            print(f"- 無法建立 shared memory ({e})，改用 memory map 檔案。")
+    tmp_dir = tempfile.mkdtemp(prefix='shared_dataset_', dir=directory)
+    location = str(Path(tmp_dir) / 'dataset.bin')
+    with open(location, 'w+b') as f:
+        f.truncate(size)
+        mapped = mmap.mmap(f.fileno(), size)
+    return mapped, 'mmap', location, [('mmap', mapped), ('dir', tmp_dir)]
+
+def _fill(arrays: dict, dtypes: dict, backend: str, directory=None) -> tuple:
+    """將陣列複製到新的共用緩衝區，回傳 (spec, 唯讀視圖, 資源)。"""
+    layout, size = _layout(arrays, dtypes)
+    buffer, backend, location, resources = _allocate(size, backend, directory)
+    views = _views(buffer, layout, readonly=False)
+    for name, view in views.items():
+        view[:] = arrays[name]
+        view.flags.writeable = False
+    return {'backend': backend, 'location': location, 'size': size, 'layout': layout}, views, resources
+
+def _attach(spec: dict) -> tuple:
+    """依 spec 開啟既有的共用緩衝區，回傳 (唯讀視圖, 資源)。"""
+    if spec['backend'] == 'local':
+        raise ValueError("'local' 資料集只能在建立它的行程中使用。")
+    if spec['backend'] == 'shm':
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=spec['location'], track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=spec['location'])
+        buffer, resources = shm.buf, [('shm', shm)]
+    else:
+        with open(spec['location'], 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), spec['size'], access=mmap.ACCESS_READ)
+        buffer, resources = mapped, [('mmap', mapped)]
+    return _views(buffer, spec['layout'], readonly=True), resources
+
+def _with_indexes(dataset: dict) -> dict:
+    meta = dataset['spec']['meta']
+    dataset['plate_index'] = {p: i for i, p in enumerate(meta['plate_names'])}
+    dataset['location_index'] = {loc: i for i, loc in enumerate(meta['location_names'])}
+    return dataset
+
+def create_shared_dataset(full_data: pd.DataFrame, location_col: str = 'LocationID', backend: str = None,
+                          directory=None) -> dict:
+    """
+    建立共用資料集。
+
+    Args:
+        location_col: 編碼為 location_codes 的地點欄位 ('LocationID' 或 '攝影機' 等)
+        backend: 'shm' / 'mmap' / 'local'；None 時取 SHARED_DATASET_BACKEND 環境變數 (預設 'shm')。
+                 shm 建立失敗 (例如容器的 /dev/shm 太小) 時自動改用 mmap
+        directory: mmap 檔案所在的資料夾 (預設為系統暫存資料夾)
+
+    Returns:
+        dict: {'spec' (可 pickle 的描述，傳給子行程的 attach_shared_dataset), 'arrays', 'plate_index',
+               'location_index'}；用完以 release_shared_dataset 釋放
+    """
+    backend = backend or os.environ.get('SHARED_DATASET_BACKEND', 'shm')
+    if backend not in DATASET_BACKENDS:
+        raise ValueError(f"未知的資料集後端 '{backend}'，可用: {', '.join(DATASET_BACKENDS)}")
+
+    arrays, meta = _build_arrays(full_data, location_col)
+    if backend == 'local':
+        return _with_indexes({'spec': {'backend': 'local', 'meta': meta}, 'arrays': arrays, '_resources': []})
+
+    spec, views, resources = _fill(arrays, _ARRAY_DTYPES, backend, directory)
+    spec['meta'] = meta
+    return _with_indexes({'spec': spec, 'arrays': views, '_resources': resources})
+
+def attach_shared_dataset(spec: dict) -> dict:
+    """依 spec 附加到既有的共用資料集 (唯讀，不複製資料)。"""
+    views, resources = _attach(spec)
+    return _with_indexes({'spec': spec, 'arrays': views, '_resources': resources})
+
+def release_shared_dataset(dataset: dict):
+    """
+    釋放資料集 (create_shared_frame / attach_shared_frame 的結果亦同)：建立者會刪除 shared memory / 暫存檔，
+    附加者只關閉對應。仍有陣列視圖被引用時無法立即關閉對應，交由垃圾回收處理 (shared memory 名稱仍會被刪除)。
+    """
+    dataset['arrays'] = {}
+    dataset.pop('frame', None)
+    for kind, resource in dataset.pop('_resources', []):
+        if kind == 'dir':
+            shutil.rmtree(resource, ignore_errors=True)
+            continue
+        try:
+            resource.close()
+        except BufferError:
+            pass
+        if kind == 'shm_owner':
+            resource.unlink()
+
+@contextmanager
+def shared_dataset(full_data: pd.DataFrame, **kwargs):
+    """create_shared_dataset 的 context manager 版本，離開時自動釋放。"""
+    dataset = create_shared_dataset(full_data, **kwargs)
+    try:
+        yield dataset
+    finally:
+        release_shared_dataset(dataset)
+
+# ==========================================
+# 2. 子行程
+# ==========================================
+_worker_dataset = None
+
+def attach_worker_dataset(spec: dict):
+    """行程池的 initializer：子行程啟動時附加一次，之後的工作以 get_worker_dataset() 取用。"""
+    global _worker_dataset
+    _worker_dataset = attach_shared_dataset(spec)
+
+def get_worker_dataset() -> dict:
+    if _worker_dataset is None:
+        raise RuntimeError("此行程尚未附加共用資料集 (請以 attach_worker_dataset 作為行程池的 initializer)。")
+    return _worker_dataset
+
+# ==========================================
+# 3. 給既有分析函式的輕量視圖
+# ==========================================
+def plate_range(dataset: dict, plate: str) -> tuple:
+    """車牌在陣列中的區段 (start, end)；找不到時為 (0, 0)。"""
+    code = dataset['plate_index'].get(plate)
+    if code is None:
+        return 0, 0
+    offsets = dataset['arrays']['plate_offsets']
+    return int(offsets[code]), int(offsets[code + 1])
+
+def plate_arrays(dataset: dict, plate: str) -> dict:
+    """單一車輛依時間排序的陣列視圖 (不複製)：times / location_codes / camera_codes / lon / lat。"""
+    start, end = plate_range(dataset, plate)
+    return {name: dataset['arrays'][name][start:end] for name in ('times', 'location_codes', 'camera_codes', 'lon', 'lat')}
+
+def plate_frame(dataset: dict, plate: str) -> pd.DataFrame:
+    """
+    由共用陣列組出單一車輛的 DataFrame (欄位: 車牌, datetime, 攝影機, 攝影機名稱, 地點欄位, 經度, 緯度)，
+    可直接交給 build_trajectory_arrays 等既有分析函式；只複製這台車的資料。
+    各列依時間排序 (時間相同時維持原本順序)，datetime 維持原資料的時間單位，欄位值與直接篩選原 DataFrame 相同。
+    """
+    meta = dataset['spec']['meta']
+    view = plate_arrays(dataset, plate)
+    camera_codes = np.asarray(view['camera_codes'])
+    location_names = np.array(meta['location_names'] + [np.nan], dtype=object)
+    return pd.DataFrame({
+        '車牌': plate,
+        'datetime': pd.to_datetime(np.asarray(view['times'])).astype(f"datetime64[{meta.get('datetime_unit', 'ns')}]"),
+        '攝影機': pd.Index(meta['camera_values'])[camera_codes],
+        '攝影機名稱': np.array(meta['camera_names'], dtype=object)[camera_codes],
+        meta['location_col']: location_names[np.asarray(view['location_codes'])],
+        '經度': np.asarray(view['lon']),
+        '緯度': np.asarray(view['lat']),
+    })
+
+def day_ranges(dataset: dict) -> list:
+    """依日期切分 time_order，回傳 [(日期字串, start, end)]：time_order[start:end] 為該日的列索引。"""
+    arrays = dataset['arrays']
+    days = arrays['times'][arrays['time_order']].astype('datetime64[ns]').astype('datetime64[D]')
+    if len(days) == 0:
+        return []
+    unique_days, starts = np.unique(days, return_index=True)
+    ends = np.append(starts[1:], len(days))
+    return [(str(day), int(s), int(e)) for day, s, e in zip(unique_days, starts, ends)]
+
+# ==========================================
+# 4. 整份 DataFrame
+# ==========================================
+def _frame_arrays(full_data: pd.DataFrame) -> tuple:
+    """
+    將 DataFrame 拆成可放入共用緩衝區的陣列，回傳 (arrays, meta)。
+    數值 / 時間欄位直接使用原本的陣列；其他欄位 (文字等) 轉成 int32 代碼，唯一值表放在 meta 中。
+    """
+    arrays, columns = {}, []
+    for i, (name, series) in enumerate(full_data.items()):
+        key = f'col{i}'
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufmM':
+            arrays[key] = series.to_numpy()
+            columns.append({'name': name, 'key': key})
+        else:
+            codes, uniques = pd.factorize(series)
+            arrays[key] = codes.astype(np.int32)
+            columns.append({'name': name, 'key': key, 'dtype': str(series.dtype), 'values': list(uniques)})
+
+    index = full_data.index
+    if isinstance(index, pd.RangeIndex):
+        index_meta = {'range': (index.start, index.stop, index.step)}
+    else:
+        arrays['index'] = index.to_numpy()
+        index_meta = {'key': 'index'}
+    return arrays, {'columns': columns, 'index': index_meta}
+
+def _frame_from_views(views: dict, meta: dict) -> pd.DataFrame:
+    data = {}
+    for column in meta['columns']:
+        view = views[column['key']]
+        if 'values' in column:
+            values = np.array(column['values'] + [None], dtype=object)
+            data[column['name']] = pd.array(values[view], dtype=column['dtype'])
+        else:
+            data[column['name']] = view
+    index_meta = meta['index']
+    index = pd.RangeIndex(*index_meta['range']) if 'range' in index_meta else pd.Index(views[index_meta['key']])
+    return pd.DataFrame(data, index=index, copy=False)
+
+def create_shared_frame(full_data: pd.DataFrame, backend: str = None, directory=None) -> dict:
+    """
+    將整份 DataFrame 放到共用緩衝區，供需要完整資料的子行程附加 (例如 API 的分析行程)。
+
+    數值與時間欄位在各行程中都是同一塊記憶體的唯讀視圖；文字欄位只共用代碼，附加時以唯一值表還原
+    (每個行程只多一份指標陣列)。還原後的 DataFrame 與原本的欄位、dtype、索引與內容相同。
+
+    Returns:
+        dict: {'spec' (傳給子行程的 attach_shared_frame), 'frame' (本行程使用的 DataFrame)}；
+              用完以 release_shared_dataset 釋放
+    """
+    backend = backend or os.environ.get('SHARED_DATASET_BACKEND', 'shm')
+    if backend not in DATASET_BACKENDS or backend == 'local':
+        raise ValueError(f"共用 DataFrame 需要 'shm' 或 'mmap' 後端 (收到 '{backend}')")
+
+    arrays, meta = _frame_arrays(full_data)
+    spec, views, resources = _fill(arrays, {name: array.dtype for name, array in arrays.items()}, backend, directory)
+    spec['meta'] = meta
+    return {'spec': spec, 'arrays': views, 'frame': _frame_from_views(views, meta), '_resources': resources}
+
+def attach_shared_frame(spec: dict) -> dict:
+    """依 spec 附加到 create_shared_frame 建立的 DataFrame (數值欄位不複製)。"""
+    views, resources = _attach(spec)
+    return {'spec': spec, 'arrays': views, 'frame': _frame_from_views(views, spec['meta']), '_resources': resources}
@@ -4,6 +4,10 @@ import pandas as pd
 from collections import Counter, defaultdict
 import numpy as np
 
+from analysis.route_matcher import fill_path_gaps
+from analysis.trip_lsh_index import rank_candidate_plates
+from analysis.copresence_index import query_window
+
 # --- 核心資料處理函式 (與前版相同) ---
 def find_all_co_occurrence_events(df1: pd.DataFrame, df2: pd.DataFrame, time_tolerance_minutes: int = 15) -> pd.DataFrame:
     df1['time_key'] = df1['datetime'].dt.round(f'{time_tolerance_minutes}min')
@@ -12,6 +16,31 @@ def find_all_co_occurrence_events(df1: pd.DataFrame, df2: pd.DataFrame, time_tol
     time_diff = (merged_df['datetime_x'] - merged_df['datetime_y']).abs()
     return merged_df[time_diff <= pd.Timedelta(minutes=time_tolerance_minutes)].copy()
 
+def find_co_occurrence_events_from_index(copresence_index: dict, target_df: pd.DataFrame,
+                                         time_tolerance_minutes: int = 15) -> pd.DataFrame:
+    """
+    以共現索引一次找出所有車輛與目標車的共現事件，每個目標地點只需一次索引查詢。
+    比對規則與 find_all_co_occurrence_events 相同：同地點、時間取整到 time_tolerance_minutes 後相同，
+    且時間差在容許範圍內 (先以索引查詢 ±容許範圍，再套用相同的取整條件)。
+
+    Returns:
+        DataFrame: 'partner', 'datetime_x' (目標車), 'datetime_y' (同行車), 'LocationID'
+    """
+    tolerance = pd.Timedelta(minutes=time_tolerance_minutes)
+    plate_names = copresence_index['meta']['plates']
+    rows = []
+    for target_time, target_loc in zip(target_df['datetime'], target_df['LocationID']):
+        plates, times = query_window(copresence_index, target_loc, target_time - tolerance, target_time + tolerance)
+        for plate_code, matched_ns in zip(plates, times):
+            rows.append({'partner': plate_names[plate_code], 'datetime_x': target_time,
+                         'datetime_y': pd.Timestamp(matched_ns), 'LocationID': target_loc})
+    events = pd.DataFrame(rows, columns=['partner', 'datetime_x', 'datetime_y', 'LocationID'])
+    if events.empty:
+        return events
+    freq = f'{time_tolerance_minutes}min'
+    same_key = events['datetime_x'].dt.round(freq) == events['datetime_y'].dt.round(freq)
+    return events[same_key].reset_index(drop=True)
+
 def stitch_events_into_routes(events_df: pd.DataFrame, max_gap_minutes: int = 20) -> list:
     if events_df.empty: return []
     events_df = events_df.sort_values(by='datetime_x').reset_index(drop=True)
@@ -59,8 +88,127 @@ def analyze_route_summary(instances: list, target_plate: str) -> dict:
         'time_period_summary': time_period_summary
     }
 
-def run_event_driven_analysis(full_data: pd.DataFrame, min_route_len: int = 2,  time_tolerance_minutes: int = 5):
-    """主流程函式：產生詳細的分析報告。"""
+def _route_tuple(route: list, route_matcher: dict = None) -> tuple:
+    """
+    同行路徑的比對鍵。提供 route_matcher 時先補上沒拍到的攝影機，
+    讓走同一條路、但被拍到的攝影機不同的路徑能歸為同一類。
+    """
+    loc_ids = [item['LocationID'] for item in route]
+    if route_matcher is None:
+        return tuple(loc_ids)
+    gaps = [(route[i + 1]['datetime_x'] - route[i]['datetime_x']).total_seconds() for i in range(len(route) - 1)]
+    return tuple(fill_path_gaps(route_matcher, loc_ids, observed_gaps_seconds=gaps))
+
+def find_common_routes(full_data: pd.DataFrame, target_plate: str, min_route_len: int = 2,
+                       time_tolerance_minutes: int = 5, route_matcher: dict = None,
+                       trip_lsh_index: dict = None, lsh_min_similarity: float = None,
+                       copresence_index: dict = None, top_n: int = 3) -> list:
+    """
+    找出與目標車最頻繁的同行路徑 (只計算，不列印)。參數意義同 run_event_driven_analysis。
+
+    Returns:
+        list of dict: {'route_tuple', 'count', 'summary', 'instances'}，依發生次數排序，最多 top_n 筆
+    """
+    target_df = full_data[full_data['車牌'] == target_plate].copy()
+
+    all_common_routes = []
+    # 候選同行車：只有指定 lsh_min_similarity 時才以 LSH 索引篩選；掃描順序固定依車牌排序，
+    # 同樣次數的路徑排名才不會因索引而改變
+    candidate_plates = sorted(p for p in full_data['車牌'].unique() if p != target_plate)
+    if trip_lsh_index is not None and lsh_min_similarity is not None:
+        candidate_plates = sorted(rank_candidate_plates(trip_lsh_index, target_plate, candidate_plates,
+                                                        min_similarity=lsh_min_similarity))
+    if copresence_index is not None:
+        indexed_events = find_co_occurrence_events_from_index(copresence_index, target_df, time_tolerance_minutes)
+        partner_groups = dict(tuple(indexed_events.groupby('partner')))
+    else:
+        partner_groups = dict(tuple(full_data[full_data['車牌'].isin(set(candidate_plates))].groupby('車牌')))
+    for partner_plate in candidate_plates:
+        partner_df = partner_groups.get(partner_plate)
+        if partner_df is None: continue
+        if copresence_index is not None:
+            co_events = partner_df
+        else:
+            co_events = find_all_co_occurrence_events(target_df, partner_df, time_tolerance_minutes)
+        if not co_events.empty:
+            routes = stitch_events_into_routes(co_events)
+            for route in routes:
+                if len(route) >= min_route_len:
+                    all_common_routes.append({
+                        'partner': partner_plate,
+                        'route_tuple': _route_tuple(route, route_matcher),
+                        'details': route
+                    })
+
+    route_counter = Counter(item['route_tuple'] for item in all_common_routes)
+    results = []
+    for route_tuple, count in route_counter.most_common(top_n):
+        instances = [item for item in all_common_routes if item['route_tuple'] == route_tuple]
+        results.append({
+            'route_tuple': route_tuple,
+            'count': count,
+            'summary': analyze_route_summary(instances, target_plate),
+            'instances': instances,
+        })
+    return results
+
+def print_common_routes_report(full_data: pd.DataFrame, target_plate: str, common_routes: list):
+    """列印 find_common_routes 的結果。"""
+    cam_name_map = full_data.groupby('LocationID')['攝影機名稱'].unique().apply(list).to_dict()
+    
+    print(f"\n--- 與 {target_plate} 的最頻繁同行路徑 Top {len(common_routes)} 分析報告 ---")
+    
+    for i, route in enumerate(common_routes):
+        route_tuple, count = route['route_tuple'], route['count']
+        path_str = " -> ".join(route_tuple)
+        instances = route['instances']
+        
+        # 印出摘要
+        summary = route['summary']
+        start_loc_id, end_loc_id = route_tuple[0], route_tuple[-1]
+        start_cam_names = cam_name_map.get(start_loc_id, ["未知"])
+        end_cam_names = cam_name_map.get(end_loc_id, ["未知"])
+
+        print("\n" + "="*70)
+        print(f"## 報告 {i+1}: 最頻繁同行路徑")
+        print("="*70)
+        print(f"  - 路線 ({len(route_tuple)}個地點): {path_str}")
+        print(f"  - 總計發生: {count} 次")
+        print(f"  - 起點名稱: {start_cam_names[0]}")
+        print(f"  - 終點名稱: {end_cam_names[0]}")
+        print("\n  【路線摘要】")
+        print(f"  - 同行時段分析: {summary['time_period_summary']}")
+        print(f"  - 平均旅行時間: {target_plate} 約 {summary['avg_target_time_min']:.1f} 分鐘 | 夥伴車輛約 {summary['avg_partner_time_min']:.1f} 分鐘")
+        
+        # 印出詳細案例
+        print("\n  【詳細案例列表】")
+        for j, instance in enumerate(instances):
+            partner = instance['partner']
+            details = instance['details']
+            
+            target_start_time = details[0]['datetime_x']
+            target_end_time = details[-1]['datetime_x']
+            partner_start_time = details[0]['datetime_y']
+            partner_end_time = details[-1]['datetime_y']
+
+            time_diff_seconds = (partner_start_time - target_start_time).total_seconds()
+            time_diff_min = time_diff_seconds / 60
+            time_corr_str = f"晚 {abs(time_diff_min):.1f} 分鐘" if time_diff_min > 0 else f"早 {abs(time_diff_min):.1f} 分鐘"
+            
+            print(f"    - [案例 #{j+1}] 與 {partner} 在 {target_start_time.strftime('%Y-%m-%d')}")
+            print(f"      - {target_plate.ljust(9)}: {target_start_time.strftime('%H:%M:%S')} -> {target_end_time.strftime('%H:%M:%S')}")
+            print(f"      - {partner.ljust(9)}: {partner_start_time.strftime('%H:%M:%S')} -> {partner_end_time.strftime('%H:%M:%S')} (在起點比目標{time_corr_str})")
+
+def run_event_driven_analysis(full_data: pd.DataFrame, min_route_len: int = 2,  time_tolerance_minutes: int = 5,
+                              route_matcher: dict = None, trip_lsh_index: dict = None,
+                              lsh_min_similarity: float = None, copresence_index: dict = None):
+    """
+    主流程函式：產生詳細的分析報告。
+    route_matcher (選用，route_matcher.build_route_matcher 的結果) 用於補全路徑後再比較同行路線。
+    trip_lsh_index (選用，trip_lsh_index 的索引) 搭配 lsh_min_similarity 時只掃描路線相似度
+    >= lsh_min_similarity 的車輛 (較快，但可能漏掉只同行一小段的車輛)；未指定門檻時結果不受索引影響。
+    copresence_index (選用，以 'LocationID' 建立的共現索引) 以索引查詢取代逐車 merge。
+    """
     if 'LocationID' not in full_data.columns:
         print("錯誤：資料中缺少 'LocationID' 欄位。"); return
         
@@ -73,72 +221,20 @@ def run_event_driven_analysis(full_data: pd.DataFrame, min_route_len: int = 2,
     try:
         choice_input = input(f"\n請選擇要作為基準的目標車牌 [1-{len(available_plates)}]: ")
         target_plate = available_plates[int(choice_input) - 1]
-        target_df = full_data[full_data['車牌'] == target_plate].copy()
         
         print("\n--- 正在掃描所有同行事件並組合路徑... ---")
-        all_common_routes = []
-        for partner_plate, partner_df in full_data.groupby('車牌'):
-            if partner_plate == target_plate: continue
-            co_events = find_all_co_occurrence_events(target_df, partner_df, time_tolerance_minutes)
-            if not co_events.empty:
-                routes = stitch_events_into_routes(co_events)
-                for route in routes:
-                    if len(route) >= min_route_len:
-                        all_common_routes.append({
-                            'partner': partner_plate,
-                            'route_tuple': tuple(item['LocationID'] for item in route),
-                            'details': route
-                        })
-
-        if not all_common_routes:
+        common_routes = find_common_routes(full_data, target_plate, min_route_len=min_route_len,
+                                           time_tolerance_minutes=time_tolerance_minutes,
+                                           route_matcher=route_matcher, trip_lsh_index=trip_lsh_index,
+                                           lsh_min_similarity=lsh_min_similarity, copresence_index=copresence_index)
+
+        if not common_routes:
             print(f"\n分析完成：未找到與 {target_plate} 任何長度超過 {min_route_len} 的同行路徑。"); return
 
-        route_counter = Counter(item['route_tuple'] for item in all_common_routes)
-        cam_name_map = full_data.groupby('LocationID')['攝影機名稱'].unique().apply(list).to_dict()
-        
-        print(f"\n--- 與 {target_plate} 的最頻繁同行路徑 Top 3 分析報告 ---")
-        
-        for i, (route_tuple, count) in enumerate(route_counter.most_common(3)):
-            path_str = " -> ".join(route_tuple)
-            instances = [item for item in all_common_routes if item['route_tuple'] == route_tuple]
-            
-            # 產生並印出摘要
-            summary = analyze_route_summary(instances, target_plate)
-            start_loc_id, end_loc_id = route_tuple[0], route_tuple[-1]
-            start_cam_names = cam_name_map.get(start_loc_id, ["未知"])
-            end_cam_names = cam_name_map.get(end_loc_id, ["未知"])
-
-            print("\n" + "="*70)
-            print(f"## 報告 {i+1}: 最頻繁同行路徑")
-            print("="*70)
-            print(f"  - 路線 ({len(route_tuple)}個地點): {path_str}")
-            print(f"  - 總計發生: {count} 次")
-            print(f"  - 起點名稱: {start_cam_names[0]}")
-            print(f"  - 終點名稱: {end_cam_names[0]}")
-            print("\n  【路線摘要】")
-            print(f"  - 同行時段分析: {summary['time_period_summary']}")
-            print(f"  - 平均旅行時間: {target_plate} 約 {summary['avg_target_time_min']:.1f} 分鐘 | 夥伴車輛約 {summary['avg_partner_time_min']:.1f} 分鐘")
-            
-            # 印出詳細案例
-            print("\n  【詳細案例列表】")
-            for j, instance in enumerate(instances):
-                partner = instance['partner']
-                details = instance['details']
-                
-                target_start_time = details[0]['datetime_x']
-                target_end_time = details[-1]['datetime_x']
-                partner_start_time = details[0]['datetime_y']
-                partner_end_time = details[-1]['datetime_y']
-
-                time_diff_seconds = (partner_start_time - target_start_time).total_seconds()
-                time_diff_min = time_diff_seconds / 60
-                time_corr_str = f"晚 {abs(time_diff_min):.1f} 分鐘" if time_diff_min > 0 else f"早 {abs(time_diff_min):.1f} 分鐘"
-                
-                print(f"    - [案例 #{j+1}] 與 {partner} 在 {target_start_time.strftime('%Y-%m-%d')}")
-                print(f"      - {target_plate.ljust(9)}: {target_start_time.strftime('%H:%M:%S')} -> {target_end_time.strftime('%H:%M:%S')}")
-                print(f"      - {partner.ljust(9)}: {partner_start_time.strftime('%H:%M:%S')} -> {partner_end_time.strftime('%H:%M:%S')} (在起點比目標{time_corr_str})")
+        print_common_routes_report(full_data, target_plate, common_routes)
+        return common_routes
 
     except (ValueError, IndexError):
         print("錯誤：無效的選擇，返回主菜單。")
     except Exception as e:
-        print(f"分析過程中發生未預期的錯誤: {e}, {e.__traceback__.tb_lineno}")
\ No newline at end of file
+        print(f"分析過程中發生未預期的錯誤: {e}, {e.__traceback__.tb_lineno}")
@@ -0,0 +1,372 @@
+# analysis/trajectory_kernel.py (單次掃描軌跡切分核心)
+
+import pandas as pd
+import numpy as np
+
+from analysis.geo_kernels import consecutive_distances
+from analysis.camera_graph import transition_gap_thresholds
+from analysis.result_types import create_table, empty_table, encode_categories, table_records
+
+# ==========================================
+# 1. 共用陣列建構 (每台車只排序、掃描一次)
+# ==========================================
+def graph_node_col(transition_graph: dict = None) -> str:
+    """build_trajectory_arrays 應使用的節點欄位：有轉移圖時為圖的節點欄位，否則為預設的 'LocationID'。"""
+    return transition_graph['node_col'] if transition_graph is not None else 'LocationID'
+
+def build_trajectory_arrays(vehicle_df: pd.DataFrame, node_col: str = 'LocationID') -> dict:
+    """
+    將單一車輛的軌跡 DataFrame 轉換成一組共用的 NumPy 陣列。
+    停留點 (區域型 / 進階型) 與行程切分都從這組陣列計算，不再各自排序與逐列掃描。
+
+    Args:
+        vehicle_df: 單一車輛的軌跡 DataFrame (需包含 'datetime', '經度', '緯度', '攝影機名稱'，
+                    'LocationAreaID' 可選)
+        node_col: 攝影機節點欄位 (供轉移圖查詢與行程路徑使用，資料中沒有時略過)；
+                  搭配轉移圖切分行程時須與圖的節點欄位相同 (見 graph_node_col)
+
+    Returns:
+        dict: 包含時間、座標、區域、相鄰點時間差/距離/速度與區域切換邊界的陣列。
+    """
+    df = vehicle_df.copy()
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    # 穩定排序：時間相同的偵測維持原本順序；舊版逐一掃描的函式 (find_advanced_stay_points) 也以 kind='stable' 排序，
+    # 兩者才會在時間相同的偵測上取到同一筆
+    df = df.sort_values('datetime', kind='stable').reset_index(drop=True)
+
+    node_ids = df[node_col].astype(str).to_numpy(dtype=object) if node_col in df.columns else None
+    arrays = trajectory_arrays_from_columns(
+        df['datetime'].to_numpy(dtype='datetime64[ns]').astype(np.int64),
+        pd.to_numeric(df['經度'], errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(df['緯度'], errors='coerce').to_numpy(dtype=float),
+        df['攝影機名稱'].to_numpy(dtype=object),
+        areas=df['LocationAreaID'].to_numpy(dtype=object) if 'LocationAreaID' in df.columns else None,
+        node_ids=node_ids,
+    )
+    arrays['node_col'] = node_col if node_ids is not None else None
+    return arrays
+
+def trajectory_arrays_from_columns(times: np.ndarray, lon: np.ndarray, lat: np.ndarray, camera_names: np.ndarray,
+                                   areas: np.ndarray = None, node_ids: np.ndarray = None) -> dict:
+    """
+    由已依時間排序的欄位陣列建立共用陣列 (格式同 build_trajectory_arrays)，
+    供已經持有陣列的呼叫端 (例如 analysis/colocation_query.py) 使用，不必先組成 DataFrame。
+
+    Args:
+        times: 偵測時間 (int64 ns，已排序)
+        areas: 每筆紀錄的區域 ID (object 陣列，None 表示資料沒有區域)
+        node_ids: 每筆紀錄的攝影機節點 ID (None 表示沒有)
+    """
+    n = len(times)
+    has_area = areas is not None
+    if has_area:
+        area_codes, _ = pd.factorize(areas, use_na_sentinel=True)
+    else:
+        areas = np.full(n, None, dtype=object)
+        area_codes = np.full(n, -1, dtype=np.int64)
+
+    # 相鄰兩點的時間差 (分鐘)、距離 (公尺) 與換算時速
+    gap_minutes = np.diff(times) / 6e10
+    gap_meters = consecutive_distances(lon, lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap_speed_kph = (gap_meters / 1000.0) / (gap_minutes / 60.0)
+
+    # 區域切換邊界：與 find_stay_points_v2 的 (x != x.shift()).cumsum() 相同語意
+    # (缺值的區域與任何值都不相等，因此每一筆缺值紀錄都會自成一段)
+    area_run_start = np.ones(n, dtype=bool)
+    if n > 1:
+        area_run_start[1:] = (area_codes[1:] != area_codes[:-1]) | (area_codes[1:] == -1)
+
+    return {
+        'n': n,
+        'times': times,
+        'lon': lon,
+        'lat': lat,
+        'coord_valid': ~(np.isnan(lon) | np.isnan(lat)),
+        'areas': areas,
+        'has_area': has_area,
+        'camera_names': camera_names,
+        'node_ids': node_ids,
+        # 結果表 (analysis/result_types.py) 使用的編碼：區域 (缺值保留)、攝影機名稱、攝影機節點
+        'area_encoding': encode_categories(areas),
+        'camera_encoding': encode_categories(camera_names),
+        'node_encoding': encode_categories(node_ids) if node_ids is not None else None,
+        'gap_minutes': gap_minutes,
+        'gap_meters': gap_meters,
+        'gap_speed_kph': gap_speed_kph,
+        'area_run_start': area_run_start,
+    }
+
+def _subset_arrays(arrays: dict, mask: np.ndarray) -> dict:
+    """取出部分紀錄並重新計算相鄰點的差值陣列 (只在有無效座標時使用)。"""
+    lon = arrays['lon'][mask]
+    lat = arrays['lat'][mask]
+    times = arrays['times'][mask]
+    gap_minutes = np.diff(times) / 6e10
+    gap_meters = consecutive_distances(lon, lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap_speed_kph = (gap_meters / 1000.0) / (gap_minutes / 60.0)
+    return {
+        **arrays,
+        'n': len(times),
+        'times': times,
+        'lon': lon,
+        'lat': lat,
+        'coord_valid': np.ones(len(times), dtype=bool),
+        'areas': arrays['areas'][mask],
+        'camera_names': arrays['camera_names'][mask],
+        'node_ids': arrays['node_ids'][mask] if arrays['node_ids'] is not None else None,
+        'area_encoding': _subset_encoding(arrays['area_encoding'], mask),
+        'camera_encoding': _subset_encoding(arrays['camera_encoding'], mask),
+        'node_encoding': _subset_encoding(arrays['node_encoding'], mask),
+        'gap_minutes': gap_minutes,
+        'gap_meters': gap_meters,
+        'gap_speed_kph': gap_speed_kph,
+    }
+
+def _subset_encoding(encoding, mask):
+    return (encoding[0][mask], encoding[1]) if encoding is not None else None
+
+def _run_bounds(starts: np.ndarray, n: int):
+    """將「區段起點」布林陣列轉成 (start, end) 索引 (end 為包含)。"""
+    start_idx = np.flatnonzero(starts)
+    end_idx = np.append(start_idx[1:] - 1, n - 1)
+    return start_idx, end_idx
+
+# ==========================================
+# 2. 三種結果 (皆由共用陣列計算，回傳 analysis/result_types.py 的結果表)
+# ==========================================
+AREA_STAY_FIELDS = [
+    ('location_area_id', 'category'), ('representative_name', 'category'),
+    ('start_time', 'time'), ('end_time', 'time'), ('duration_minutes', 'float'),
+]
+ADVANCED_STAY_FIELDS = [
+    ('type', 'category'), ('start_time', 'time'), ('end_time', 'time'), ('duration_minutes', 'float'),
+    ('location_desc', 'category'), ('center_lat', 'float'), ('center_lon', 'float'),
+    ('area_id_hint', 'category'), ('avg_speed_kph', 'float'),
+]
+_STAY_TYPES = np.array(['Explicit Stay (顯性連續)', 'Gap Stay (隱性區間)'], dtype=object)
+
+def _round_minutes(values) -> np.ndarray:
+    # 與舊版逐筆 round(float(x), 2) 相同 (np.round 的結果在少數值上會差一個進位)
+    return np.array([round(float(v), 2) for v in values], dtype=np.float64)
+
+def area_stay_table(arrays: dict, time_threshold_minutes: int = 20) -> dict:
+    """
+    與 find_stay_points_v2 相同的區域型停留點，以結果表回傳 (欄位見 AREA_STAY_FIELDS)。
+    """
+    if arrays['n'] == 0 or not arrays['has_area']:
+        print("錯誤：輸入的 DataFrame 缺少 'LocationAreaID' 欄位。")
+        return empty_table('area_stays', AREA_STAY_FIELDS)
+
+    times = arrays['times']
+    start_idx, end_idx = _run_bounds(arrays['area_run_start'], arrays['n'])
+    durations = (times[end_idx] - times[start_idx]) / 6e10
+    keep = durations >= time_threshold_minutes
+    start_idx, end_idx = start_idx[keep], end_idx[keep]
+
+    area_codes, area_values = arrays['area_encoding']
+    camera_codes, camera_values = arrays['camera_encoding']
+    return create_table('area_stays', AREA_STAY_FIELDS, {
+        'location_area_id': area_codes[start_idx],
+        'representative_name': camera_codes[start_idx],
+        'start_time': times[start_idx],
+        'end_time': times[end_idx],
+        'duration_minutes': _round_minutes(durations[keep]),
+    }, categories={'location_area_id': area_values, 'representative_name': camera_values})
+
+def advanced_stay_table(arrays: dict,
+                        time_threshold_mins: int = 20,
+                        gap_speed_threshold_kph: float = 10.0) -> dict:
+    """
+    與 find_advanced_stay_points 相同的「顯性連續停留」與「隱性區間停留」，以結果表回傳
+    (欄位見 ADVANCED_STAY_FIELDS；avg_speed_kph 只有隱性停留有值，顯性停留為 NaN)。
+    只在時間斷層處迴圈，不再逐列 iloc 掃描。
+    """
+    if not arrays['coord_valid'].all():
+        arrays = _subset_arrays(arrays, arrays['coord_valid'])
+
+    n = arrays['n']
+    if n < 2:
+        return empty_table('advanced_stays', ADVANCED_STAY_FIELDS)
+
+    times = arrays['times']
+    areas = arrays['areas']
+    gap_minutes = arrays['gap_minutes']
+    rows = {name: [] for name, _ in ADVANCED_STAY_FIELDS}
+
+    def add_stay(stay_type, s, e, duration, location_desc, center_lat, center_lon, area_id_hint, speed):
+        for name, value in zip(rows, (stay_type, times[s], times[e], duration, location_desc, center_lat,
+                                      center_lon, area_id_hint, speed)):
+            rows[name].append(value)
+
+    def explicit_stay(s, e):
+        if e <= s:
+            return
+        seg_duration = (times[e] - times[s]) / 6e10
+        if seg_duration < time_threshold_mins:
+            return
+        add_stay(0, s, e, round(float(seg_duration), 2), f"{areas[s]} (連續活動)",
+                 np.mean(arrays['lat'][s:e + 1]), np.mean(arrays['lon'][s:e + 1]), areas[s], np.nan)
+
+    seg_start = 0
+    for i in np.flatnonzero(gap_minutes >= time_threshold_mins):
+        # [1] 結算斷層前的區段 (顯性停留)
+        explicit_stay(seg_start, i)
+
+        # [2] 斷層本身是否為隱性停留 (時間久 + 距離短)
+        implied_speed = arrays['gap_speed_kph'][i]
+        if implied_speed < gap_speed_threshold_kph:
+            start_area = areas[i] if pd.notna(areas[i]) else "未知"
+            end_area = areas[i + 1] if pd.notna(areas[i + 1]) else "未知"
+            if start_area == end_area:
+                loc_desc = f"{start_area} (長時間靜止)"
+            else:
+                loc_desc = f"{start_area} -> {end_area} (區間停留)"
+
+            add_stay(1, i, i + 1, round(float(gap_minutes[i]), 2), loc_desc,
+                     (arrays['lat'][i] + arrays['lat'][i + 1]) / 2, (arrays['lon'][i] + arrays['lon'][i + 1]) / 2,
+                     start_area, round(float(implied_speed), 2))
+
+        # [3] 下一個區段從斷層後開始
+        seg_start = i + 1
+
+    explicit_stay(seg_start, n - 1)
+
+    if not rows['type']:
+        return empty_table('advanced_stays', ADVANCED_STAY_FIELDS)
+    desc_codes, desc_values = encode_categories(rows['location_desc'])
+    hint_codes, hint_values = encode_categories(rows['area_id_hint'])
+    return create_table('advanced_stays', ADVANCED_STAY_FIELDS, {
+        'type': np.array(rows['type'], dtype=np.int32),
+        'start_time': np.array(rows['start_time'], dtype=np.int64),
+        'end_time': np.array(rows['end_time'], dtype=np.int64),
+        'duration_minutes': np.array(rows['duration_minutes'], dtype=np.float64),
+        'location_desc': desc_codes,
+        'center_lat': np.array(rows['center_lat'], dtype=np.float64),
+        'center_lon': np.array(rows['center_lon'], dtype=np.float64),
+        'area_id_hint': hint_codes,
+        'avg_speed_kph': np.array(rows['avg_speed_kph'], dtype=np.float64),
+    }, categories={'type': _STAY_TYPES, 'location_desc': desc_values, 'area_id_hint': hint_values},
+        optional=('avg_speed_kph',))
+
+def _path_column(encoding, keep_rows, lengths):
+    """行程路徑 (list 欄位)：各行程的點在陣列中是連續區段，只需保留有效行程的點並累加 offsets。"""
+    codes, values = encoding
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    return offsets, codes[keep_rows], values
+
+def trip_table(arrays: dict, gap_threshold_minutes: int = 20, transition_graph: dict = None) -> dict:
+    """
+    與 segment_trips_v3 相同的行程切分，以結果表回傳。
+    路徑欄位 (path_camera_names / path_location_ids / path_area_ids) 為 list 欄位，
+    資料中沒有攝影機節點或區域時省略對應欄位。
+    提供 transition_graph 時，每個時間間隔改用兩支攝影機之間的學習旅行時間作為門檻
+    (沒有歷史轉移的攝影機對仍使用 gap_threshold_minutes)；陣列須以圖的節點欄位建立 (見 graph_node_col)。
+
+    Raises:
+        ValueError: 提供 transition_graph 但陣列沒有對應的節點 ID
+    """
+    if transition_graph is not None:
+        node_col = arrays.get('node_col')
+        if arrays['node_ids'] is None or (node_col is not None and node_col != transition_graph['node_col']):
+            raise ValueError(f"軌跡資料缺少轉移圖的節點欄位 '{transition_graph['node_col']}' "
+                             f"(請以 build_trajectory_arrays(..., node_col=graph_node_col(transition_graph)) 建立)。")
+    fields = [('start_time', 'time'), ('end_time', 'time'), ('duration_minutes', 'float'),
+              ('start_area_id', 'category'), ('end_area_id', 'category'),
+              ('start_location_name', 'category'), ('end_location_name', 'category'),
+              ('point_count', 'int'), ('path_camera_names', 'list')]
+    if arrays['node_ids'] is not None:
+        fields.append(('path_location_ids', 'list'))
+    if arrays['has_area']:
+        fields.append(('path_area_ids', 'list'))
+
+    n = arrays['n']
+    if n == 0:
+        return empty_table('trips', fields)
+
+    times = arrays['times']
+    starts = np.zeros(n, dtype=bool)
+    starts[0] = True
+    if transition_graph is not None and arrays['node_ids'] is not None:
+        node_ids = arrays['node_ids']
+        thresholds = transition_gap_thresholds(transition_graph, node_ids[:-1], node_ids[1:],
+                                               default_minutes=gap_threshold_minutes)
+    else:
+        thresholds = gap_threshold_minutes
+    starts[1:] = arrays['gap_minutes'] > thresholds
+    start_idx, end_idx = _run_bounds(starts, n)
+
+    # 一個有效的行程至少需要 2 個點（起點和終點）
+    lengths = end_idx - start_idx + 1
+    keep = lengths > 1
+    keep_rows = np.repeat(keep, lengths)
+    start_idx, end_idx, lengths = start_idx[keep], end_idx[keep], lengths[keep]
+
+    if arrays['has_area']:
+        area_codes, area_values = arrays['area_encoding']
+        start_area, end_area = area_codes[start_idx], area_codes[end_idx]
+    else:
+        area_values = np.array(['Unknown'], dtype=object)
+        start_area = end_area = np.zeros(len(start_idx), dtype=np.int32)
+    camera_codes, camera_values = arrays['camera_encoding']
+
+    columns = {
+        'start_time': times[start_idx],
+        'end_time': times[end_idx],
+        'duration_minutes': _round_minutes((times[end_idx] - times[start_idx]) / 6e10),
+        'start_area_id': start_area,
+        'end_area_id': end_area,
+        'start_location_name': camera_codes[start_idx],
+        'end_location_name': camera_codes[end_idx],
+        'point_count': lengths.astype(np.int64),
+    }
+    categories = {'start_area_id': area_values, 'end_area_id': area_values,
+                  'start_location_name': camera_values, 'end_location_name': camera_values}
+    list_codes = {}
+    path_sources = {'path_camera_names': 'camera_encoding', 'path_location_ids': 'node_encoding',
+                    'path_area_ids': 'area_encoding'}
+    for name, field_type in fields:
+        if field_type == 'list':
+            columns[name], list_codes[name], categories[name] = _path_column(arrays[path_sources[name]], keep_rows, lengths)
+    return create_table('trips', fields, columns, categories, list_codes)
+
+def area_stays_from_arrays(arrays: dict, time_threshold_minutes: int = 20) -> list:
+    """與 find_stay_points_v2 相同格式的 list of dict (area_stay_table 的逐筆形式)。"""
+    return table_records(area_stay_table(arrays, time_threshold_minutes))
+
+def advanced_stays_from_arrays(arrays: dict,
+                               time_threshold_mins: int = 20,
+                               gap_speed_threshold_kph: float = 10.0) -> list:
+    """與 find_advanced_stay_points 相同格式的 list of dict (advanced_stay_table 的逐筆形式)。"""
+    return table_records(advanced_stay_table(arrays, time_threshold_mins, gap_speed_threshold_kph))
+
+def trips_from_arrays(arrays: dict, gap_threshold_minutes: int = 20, transition_graph: dict = None) -> list:
+    """與 segment_trips_v3 相同格式的 list of dict (trip_table 的逐筆形式)。"""
+    return table_records(trip_table(arrays, gap_threshold_minutes, transition_graph))
+
+# ==========================================
+# 3. 主入口
+# ==========================================
+def analyze_vehicle_trajectory(vehicle_df: pd.DataFrame,
+                               stay_threshold_minutes: int = 20,
+                               advanced_time_threshold_mins: int = 20,
+                               gap_speed_threshold_kph: float = 10.0,
+                               trip_gap_threshold_minutes: int = 20,
+                               transition_graph: dict = None) -> dict:
+    """
+    單次掃描同時產生區域型停留點、進階停留點與行程。
+
+    Returns:
+        dict: {'area_stays': [...], 'advanced_stays': [...], 'trips': [...]}，
+              格式分別與 find_stay_points_v2、find_advanced_stay_points、segment_trips_v3 相同。
+    """
+    if vehicle_df.empty:
+        return {'area_stays': [], 'advanced_stays': [], 'trips': []}
+
+    arrays = build_trajectory_arrays(vehicle_df, node_col=graph_node_col(transition_graph))
+    return {
+        'area_stays': area_stays_from_arrays(arrays, stay_threshold_minutes),
+        'advanced_stays': advanced_stays_from_arrays(arrays, advanced_time_threshold_mins, gap_speed_threshold_kph),
+        'trips': trips_from_arrays(arrays, trip_gap_threshold_minutes, transition_graph),
+    }
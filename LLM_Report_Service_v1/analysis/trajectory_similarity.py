@@ -0,0 +1,266 @@
+# analysis/trajectory_similarity.py (行程軌跡相似度搜尋：LCSS / DTW + 候選剪枝)
+
+import pandas as pd
+import numpy as np
+
+from analysis.minhash_lsh import make_minhash_params, shingles, minhash_signature, build_lsh_buckets, lsh_candidates
+from analysis.route_matcher import fill_path_gaps
+
+# ==========================================
+# 1. 全車隊行程序列
+# ==========================================
+def _fill_sequence(route_matcher: dict, locs: np.ndarray, times: np.ndarray):
+    """以 route_matcher 補上未拍到的攝影機，補上的點時間以前後兩點線性內插。"""
+    out_locs, out_times = [locs[0]], [times[0]]
+    for i in range(len(locs) - 1):
+        gap_seconds = (times[i + 1] - times[i]) / 1e9
+        filled = fill_path_gaps(route_matcher, [locs[i], locs[i + 1]], observed_gaps_seconds=[gap_seconds])
+        inner = filled[1:-1]
+        if inner:
+            out_locs.extend(inner)
+            out_times.extend(np.linspace(times[i], times[i + 1], len(inner) + 2)[1:-1].astype(np.int64))
+        out_locs.append(locs[i + 1])
+        out_times.append(times[i + 1])
+    return np.asarray(out_locs, dtype=object), np.asarray(out_times, dtype=np.int64)
+
+def build_fleet_trip_sequences(full_data: pd.DataFrame, node_col: str = 'LocationID',
+                               gap_threshold_minutes: int = 20, route_matcher: dict = None) -> list:
+    """
+    將全部車輛切成行程 (與 segment_trips_v3 相同的時間間隔規則)，每個行程保留地點序列與時間序列。
+
+    Returns:
+        list of dict: {'trip_id', 'plate', 'start_time', 'end_time', 'locations', 'times' (int64 ns)}
+    """
+    df = full_data[['車牌', 'datetime', node_col]].dropna(subset=[node_col])
+    df = df.sort_values(['車牌', 'datetime'], kind='mergesort')
+
+    plates = df['車牌'].to_numpy(dtype=object)
+    times = pd.to_datetime(df['datetime']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    locs = df[node_col].astype(str).to_numpy(dtype=object)
+
+    n = len(df)
+    if n == 0:
+        return []
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (plates[1:] != plates[:-1]) | (np.diff(times) > gap_threshold_minutes * 60 * 1e9)
+    start_idx = np.flatnonzero(starts)
+    end_idx = np.append(start_idx[1:], n)
+
+    trips = []
+    for s, e in zip(start_idx, end_idx):
+        if e - s < 2:
+            continue
+        trip_locs, trip_times = locs[s:e], times[s:e]
+        if route_matcher is not None:
+            trip_locs, trip_times = _fill_sequence(route_matcher, trip_locs, trip_times)
+        trips.append({
+            'trip_id': len(trips),
+            'plate': plates[s],
+            'start_time': pd.Timestamp(times[s]),
+            'end_time': pd.Timestamp(times[e - 1]),
+            'locations': trip_locs,
+            'times': trip_times,
+        })
+    return trips
+
+# ==========================================
+# 2. 相似度 (動態規劃)
+# ==========================================
+def lcss_similarity(locs_a, times_a, locs_b, times_b,
+                    time_tolerance_seconds: float = 300, relative_time: bool = False) -> float:
+    """
+    最長共同子序列 (LCSS) 相似度：同一地點且時間差在容許範圍內才算匹配，
+    以較短序列的長度正規化到 [0, 1]。
+
+    relative_time=True 時以各自行程起點為時間零點 (比較「路線」而非「同時出現」)。
+    """
+    n, m = len(locs_a), len(locs_b)
+    if n == 0 or m == 0:
+        return 0.0
+    times_a = np.asarray(times_a, dtype=np.int64)
+    times_b = np.asarray(times_b, dtype=np.int64)
+    if relative_time:
+        times_a = times_a - times_a[0]
+        times_b = times_b - times_b[0]
+    tolerance_ns = time_tolerance_seconds * 1e9
+
+    prev = [0] * (m + 1)
+    for i in range(1, n + 1):
+        cur = [0] * (m + 1)
+        loc_i, time_i = locs_a[i - 1], times_a[i - 1]
+        for j in range(1, m + 1):
+            if loc_i == locs_b[j - 1] and abs(time_i - times_b[j - 1]) <= tolerance_ns:
+                cur[j] = prev[j - 1] + 1
+            else:
+                cur[j] = prev[j] if prev[j] >= cur[j - 1] else cur[j - 1]
+        prev = cur
+    return prev[m] / min(n, m)
+
+def dtw_similarity(locs_a, locs_b, window: int = None) -> float:
+    """
+    地點序列的 DTW 相似度 (相同地點成本 0，不同地點成本 1)，
+    window 為 Sakoe-Chiba 帶寬 (None 表示不限制)。回傳 1 - 正規化距離。
+    """
+    n, m = len(locs_a), len(locs_b)
+    if n == 0 or m == 0:
+        return 0.0
+    window = max(window if window is not None else max(n, m), abs(n - m))
+
+    inf = float('inf')
+    prev = [inf] * (m + 1)
+    prev[0] = 0.0
+    for i in range(1, n + 1):
+        cur = [inf] * (m + 1)
+        for j in range(max(1, i - window), min(m, i + window) + 1):
+            cost = 0.0 if locs_a[i - 1] == locs_b[j - 1] else 1.0
+            cur[j] = cost + min(prev[j], cur[j - 1], prev[j - 1])
+        prev = cur
+    return 1.0 - prev[m] / max(n, m)
+
+# ==========================================
+# 3. 候選剪枝索引 (倒排索引 + MinHash/LSH)
+# ==========================================
+def build_similarity_index(trips: list, num_perm: int = 64, bands: int = 16, seed: int = 42) -> dict:
+    """
+    建立行程相似度搜尋用的索引：
+    - 倒排索引：LocationID -> 經過該地點的行程編號
+    - MinHash 簽章與 LSH 分桶：快速排除地點集合差異很大的行程
+    """
+    inverted = {}
+    for trip in trips:
+        for loc in set(trip['locations']):
+            inverted.setdefault(loc, []).append(trip['trip_id'])
+    inverted = {loc: np.asarray(ids, dtype=np.int64) for loc, ids in inverted.items()}
+
+    params = make_minhash_params(num_perm, seed)
+    signatures = np.array([minhash_signature(shingles(t['locations']), params) for t in trips]) \
+        if trips else np.empty((0, num_perm), dtype=np.uint64)
+
+    return {
+        'trips': trips,
+        'inverted': inverted,
+        'params': params,
+        'signatures': signatures,
+        'buckets': build_lsh_buckets(signatures, bands),
+    }
+
+def search_similar_trips(index: dict, target_trip: dict, top_k: int = 10,
+                         metric: str = 'lcss',
+                         time_tolerance_minutes: float = 5,
+                         relative_time: bool = False,
+                         min_shared_locations: int = 2,
+                         use_lsh: bool = True,
+                         max_candidates: int = 500) -> dict:
+    """
+    以目標行程搜尋其他車輛最相似的行程。
+
+    剪枝流程：
+    1. 倒排索引：只保留與目標行程至少共用 min_shared_locations 個地點的行程。
+    2. LSH：只保留與目標簽章至少落在同一個 band 的行程 (use_lsh=False 時略過)。
+    3. 依 MinHash 估計的 Jaccard 排序，最多取 max_candidates 筆進行 LCSS / DTW 計算。
+
+    Returns:
+        dict: {'results': 依分數排序的結果列表, 'stats': 各階段候選數}
+    """
+    trips = index['trips']
+    target_locs = set(target_trip['locations'])
+    postings = [index['inverted'][loc] for loc in target_locs if loc in index['inverted']]
+    shared = np.bincount(np.concatenate(postings), minlength=len(trips)) if postings else np.zeros(len(trips), dtype=np.int64)
+
+    candidates = np.flatnonzero(shared >= min_shared_locations)
+    candidates = np.array([c for c in candidates
+                           if trips[c]['plate'] != target_trip['plate']], dtype=np.int64)
+    stats = {'total_trips': len(trips), 'after_inverted_index': len(candidates)}
+
+    target_signature = minhash_signature(shingles(target_trip['locations']), index['params'])
+    if use_lsh and len(candidates):
+        lsh_hits = lsh_candidates(index['buckets'], target_signature)
+        candidates = np.array([c for c in candidates if c in lsh_hits], dtype=np.int64)
+    stats['after_lsh'] = len(candidates)
+
+    estimated = (index['signatures'][candidates] == target_signature).mean(axis=1) if len(candidates) else np.empty(0)
+    order = np.argsort(-estimated, kind='mergesort')[:max_candidates]
+    candidates, estimated = candidates[order], estimated[order]
+    stats['scored'] = len(candidates)
+
+    results = []
+    for trip_id, jaccard in zip(candidates, estimated):
+        other = trips[trip_id]
+        if metric == 'dtw':
+            score = dtw_similarity(target_trip['locations'], other['locations'])
+        else:
+            score = lcss_similarity(target_trip['locations'], target_trip['times'],
+                                    other['locations'], other['times'],
+                                    time_tolerance_seconds=time_tolerance_minutes * 60,
+                                    relative_time=relative_time)
+        if score > 0:
+            results.append({
+                'trip_id': int(trip_id),
+                'plate': other['plate'],
+                'start_time': other['start_time'],
+                'end_time': other['end_time'],
+                'score': round(float(score), 4),
+                'shared_locations': int(shared[trip_id]),
+                'estimated_jaccard': round(float(jaccard), 4),
+            })
+
+    results.sort(key=lambda r: (-r['score'], r['trip_id']))
+    return {'results': results[:top_k], 'stats': stats}
+
+# ==========================================
+# 4. 主流程
+# ==========================================
+def run_trajectory_similarity_search(full_data: pd.DataFrame, target_plate: str,
+                                     trip_index: int = None, top_k: int = 10,
+                                     metric: str = 'lcss',
+                                     time_tolerance_minutes: float = 5,
+                                     relative_time: bool = False,
+                                     route_matcher: dict = None,
+                                     similarity_index: dict = None) -> list:
+    """
+    搜尋與目標車輛行程最相似的其他車輛行程，並列印報告。
+
+    Args:
+        target_plate: 目標車牌
+        trip_index: 只分析目標車的第幾個行程 (None 表示全部行程)
+        metric: 'lcss' (含時間限制) 或 'dtw' (只比較地點序列)
+        relative_time: LCSS 以行程起點為時間零點 (找「走相同路線」而非「同時同行」的車)
+        route_matcher: (選用) 先補全路徑再比較
+        similarity_index: (選用) 預先建立好的 build_similarity_index 結果
+
+    Returns:
+        list of dict: 每個目標行程的搜尋結果
+    """
+    if similarity_index is None:
+        trips = build_fleet_trip_sequences(full_data, route_matcher=route_matcher)
+        similarity_index = build_similarity_index(trips)
+
+    target_trips = [t for t in similarity_index['trips'] if t['plate'] == target_plate]
+    if not target_trips:
+        print(f"錯誤：無法為車輛 {target_plate} 切分出任何有效行程。")
+        return []
+    if trip_index is not None:
+        target_trips = target_trips[trip_index:trip_index + 1]
+
+    all_results = []
+    print("\n" + "=" * 70)
+    print(f"## {target_plate} 行程相似度搜尋 ({metric.upper()})")
+    print("=" * 70)
+    for trip in target_trips:
+        found = search_similar_trips(similarity_index, trip, top_k=top_k, metric=metric,
+                                     time_tolerance_minutes=time_tolerance_minutes,
+                                     relative_time=relative_time)
+        all_results.append({'target_trip_id': trip['trip_id'], **found})
+        if not found['results']:
+            continue
+
+        stats = found['stats']
+        print(f"\n  - 目標行程 #{trip['trip_id']}: {trip['start_time'].strftime('%Y-%m-%d %H:%M')} -> "
+              f"{trip['end_time'].strftime('%H:%M')} (共 {len(trip['locations'])} 個地點)")
+        print(f"    候選剪枝: 全部 {stats['total_trips']} -> 倒排索引 {stats['after_inverted_index']} "
+              f"-> LSH {stats['after_lsh']} -> 計算 {stats['scored']}")
+        for r in found['results']:
+            print(f"    * {r['plate']:<12} {r['start_time'].strftime('%Y-%m-%d %H:%M')} "
+                  f"相似度 {r['score']:.2f} (共用 {r['shared_locations']} 個地點)")
+
+    return all_results
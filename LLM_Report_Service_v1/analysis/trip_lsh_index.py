@@ -0,0 +1,212 @@
+# analysis/trip_lsh_index.py (行程 MinHash-LSH 索引：「誰的路線跟這台車很像」)
+
+import json
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+
+from analysis.minhash_lsh import (make_minhash_params, shingles, minhash_signature, band_keys, add_to_lsh_buckets,
+                                  lsh_candidates)
+from analysis.trajectory_kernel import build_trajectory_arrays, trips_from_arrays
+
+# ==========================================
+# 1. 建立 / 追加
+# ==========================================
+def create_trip_lsh_index(num_perm: int = 128, bands: int = 32, seed: int = 42, shingle_k: int = 1) -> dict:
+    """
+    建立一個空的行程 LSH 索引。
+
+    Args:
+        num_perm: MinHash 簽章長度 (必須能被 bands 整除)
+        bands: LSH band 數量；band 越多越容易成為候選 (門檻約為 (1/bands)^(bands/num_perm))
+        shingle_k: 地點序列的 k-gram 長度 (1 = 只看經過哪些區域；2 = 同時考慮行經順序)
+    """
+    if num_perm % bands != 0:
+        raise ValueError("num_perm 必須能被 bands 整除。")
+    return {
+        'params': make_minhash_params(num_perm, seed),
+        'bands': bands,
+        'shingle_k': shingle_k,
+        'plates': [],
+        'plate_index': {},
+        'trip_plate': [],
+        'trip_start': [],
+        'trip_end': [],
+        'signatures': [],
+        'buckets': [dict() for _ in range(bands)],
+        'plate_trips': {},
+    }
+
+def _remove_trip(index: dict, trip_id: int) -> None:
+    """從分桶與車牌行程列表移除一個行程；編號保留不重用 (trip_plate 設為 -1)，儲存時才壓縮。"""
+    for band, key in enumerate(band_keys(index['signatures'][trip_id], index['bands'])):
+        index['buckets'][band][key].remove(trip_id)
+    index['plate_trips'][index['trip_plate'][trip_id]].remove(trip_id)
+    index['trip_plate'][trip_id] = -1
+
+def add_trips_to_index(index: dict, plate: str, trips: list) -> int:
+    """
+    將某台車的行程 (segment_trips_v3 / trips_from_arrays 的結果，需包含 'path_area_ids') 追加到索引。
+    已經索引過的行程 (同車牌、同起訖時間) 會略過；與既有行程時間重疊的行程 (例如新資料延長了
+    原本最後一個行程) 會取代舊的行程，因此可以用累積的資料重複追加而不需重建。
+
+    Returns:
+        實際新增或取代的行程數。
+    """
+    plate_code = index['plate_index'].get(plate)
+    if plate_code is None:
+        plate_code = len(index['plates'])
+        index['plates'].append(plate)
+        index['plate_index'][plate] = plate_code
+        index['plate_trips'][plate_code] = []
+
+    added = 0
+    for trip in trips:
+        start_ns = pd.Timestamp(trip['start_time']).value
+        end_ns = pd.Timestamp(trip['end_time']).value
+        path = [a for a in trip.get('path_area_ids', []) if pd.notna(a)]
+        if not path:
+            continue
+        overlapping = [t for t in index['plate_trips'][plate_code]
+                       if index['trip_start'][t] <= end_ns and index['trip_end'][t] >= start_ns]
+        if any(index['trip_start'][t] == start_ns and index['trip_end'][t] == end_ns for t in overlapping):
+            continue
+        for old_trip_id in overlapping:
+            _remove_trip(index, old_trip_id)
+
+        signature = minhash_signature(shingles(path, index['shingle_k']), index['params'])
+        trip_id = len(index['signatures'])
+        index['signatures'].append(signature)
+        index['trip_plate'].append(plate_code)
+        index['trip_start'].append(start_ns)
+        index['trip_end'].append(end_ns)
+        index['plate_trips'][plate_code].append(trip_id)
+        add_to_lsh_buckets(index['buckets'], trip_id, signature)
+        added += 1
+    return added
+
+def build_trip_lsh_index(full_data: pd.DataFrame, cameras_with_area: pd.DataFrame,
+                         gap_threshold_minutes: int = 20, index: dict = None, **index_kwargs) -> dict:
+    """
+    對全部車輛切分行程並建立 (或追加到既有的) LSH 索引。
+
+    Args:
+        cameras_with_area: 含 'LocationAreaID' 的攝影機表 (cluster_cameras_by_distance 或 area_table_for_level 的結果)
+        index: 既有索引；提供時只追加新行程
+    """
+    index = index or create_trip_lsh_index(**index_kwargs)
+    data = pd.merge(full_data, cameras_with_area[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
+    for plate, vehicle_df in data.groupby('車牌', sort=True):
+        trips = trips_from_arrays(build_trajectory_arrays(vehicle_df), gap_threshold_minutes)
+        add_trips_to_index(index, plate, trips)
+    return index
+
+# ==========================================
+# 2. 查詢
+# ==========================================
+def query_similar_plates(index: dict, plate: str, top_k: int = 10, min_similarity: float = 0.5) -> list:
+    """
+    找出行程與指定車輛最相似的其他車輛。
+
+    對目標車的每個行程，只比對 LSH 候選行程 (不掃描全部車輛)，以 MinHash 估計的 Jaccard
+    相似度 >= min_similarity 視為「路線相似」，再依車牌彙總。
+
+    Returns:
+        list of dict: {'plate', 'matched_trips', 'target_trips_matched', 'avg_similarity', 'max_similarity'}，
+                      依 target_trips_matched、avg_similarity 排序；top_k=None 時回傳全部。
+    """
+    plate_code = index['plate_index'].get(plate)
+    if plate_code is None:
+        return []
+
+    signatures = index['signatures']
+    trip_plate = index['trip_plate']
+    per_partner = {}
+    for trip_id in index['plate_trips'][plate_code]:
+        signature = signatures[trip_id]
+        matched_partners = set()
+        for cand in lsh_candidates(index['buckets'], signature):
+            partner_code = trip_plate[cand]
+            if partner_code == plate_code:
+                continue
+            similarity = float(np.mean(signatures[cand] == signature))
+            if similarity < min_similarity:
+                continue
+            stats = per_partner.setdefault(partner_code, {'matched_trips': 0, 'target_trips': set(), 'similarities': []})
+            stats['matched_trips'] += 1
+            stats['similarities'].append(similarity)
+            matched_partners.add(partner_code)
+        for partner_code in matched_partners:
+            per_partner[partner_code]['target_trips'].add(trip_id)
+
+    results = [{
+        'plate': index['plates'][code],
+        'matched_trips': stats['matched_trips'],
+        'target_trips_matched': len(stats['target_trips']),
+        'avg_similarity': round(float(np.mean(stats['similarities'])), 4),
+        'max_similarity': round(float(np.max(stats['similarities'])), 4),
+    } for code, stats in per_partner.items()]
+    results.sort(key=lambda r: (-r['target_trips_matched'], -r['avg_similarity'], r['plate']))
+    return results if top_k is None else results[:top_k]
+
+def rank_candidate_plates(index: dict, plate: str, plates: list, min_similarity: float = None) -> list:
+    """
+    依路線相似度排列候選同行車：LSH 查到的相似車輛在前 (依 query_similar_plates 的順序)，
+    其餘車輛依原順序排在後面，不會漏掉任何車輛。
+
+    min_similarity 指定時才篩選，只保留相似度 >= min_similarity 的車輛；路線不同但實際同行
+    (例如只同行一小段) 的車輛會被排除，只適合在明確要求加速時使用。
+    """
+    similar = [r['plate'] for r in query_similar_plates(index, plate, top_k=None, min_similarity=min_similarity or 0.0)]
+    allowed = set(plates)
+    ranked = [p for p in similar if p in allowed]
+    if min_similarity is not None:
+        return ranked
+    ranked_set = set(ranked)
+    return ranked + [p for p in plates if p not in ranked_set]
+
+# ==========================================
+# 3. 儲存 / 載入
+# ==========================================
+def save_trip_lsh_index(index: dict, directory) -> None:
+    """
+    將索引存到資料夾 (簽章為 .npy，其餘為 JSON)。LSH 分桶在載入時由簽章重建，不需另外儲存；
+    已被取代的行程不會寫入。
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    live = np.flatnonzero(np.asarray(index['trip_plate'], dtype=np.int64) >= 0)
+    signatures = np.array(index['signatures'], dtype=np.uint64).reshape(-1, index['params']['num_perm'])[live]
+    trips = np.array([index['trip_plate'], index['trip_start'], index['trip_end']], dtype=np.int64).reshape(3, -1)[:, live]
+    np.save(directory / 'signatures.npy', signatures)
+    np.save(directory / 'trips.npy', trips)
+    meta = {
+        'num_perm': index['params']['num_perm'],
+        'seed': index['params']['seed'],
+        'bands': index['bands'],
+        'shingle_k': index['shingle_k'],
+        'plates': index['plates'],
+    }
+    (directory / 'meta.json').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+
+def load_trip_lsh_index(directory) -> dict:
+    """載入 save_trip_lsh_index 儲存的索引 (可繼續以 add_trips_to_index 追加)。"""
+    directory = Path(directory)
+    meta = json.loads((directory / 'meta.json').read_text(encoding='utf-8'))
+    index = create_trip_lsh_index(meta['num_perm'], meta['bands'], meta['seed'], meta['shingle_k'])
+    index['plates'] = meta['plates']
+    index['plate_index'] = {plate: i for i, plate in enumerate(meta['plates'])}
+    index['plate_trips'] = {i: [] for i in range(len(meta['plates']))}
+
+    signatures = np.load(directory / 'signatures.npy')
+    trip_plate, trip_start, trip_end = np.load(directory / 'trips.npy')
+    for trip_id, signature in enumerate(signatures):
+        plate_code = int(trip_plate[trip_id])
+        index['signatures'].append(signature)
+        index['trip_plate'].append(plate_code)
+        index['trip_start'].append(int(trip_start[trip_id]))
+        index['trip_end'].append(int(trip_end[trip_id]))
+        index['plate_trips'][plate_code].append(trip_id)
+        add_to_lsh_buckets(index['buckets'], trip_id, signature)
+    return index
@@ -2,7 +2,10 @@
 
 import pandas as pd
 
-def segment_trips_v3(vehicle_df: pd.DataFrame, gap_threshold_minutes: int = 20) -> list:
+from analysis.camera_graph import transition_gap_thresholds
+
+def segment_trips_v3(vehicle_df: pd.DataFrame, gap_threshold_minutes: int = 20,
+                     transition_graph: dict = None) -> list:
     """
     (V3) 根據軌跡點之間的時間間隔，將車輛的軌跡切割成一段段的「行程」。
     這個版本不再依賴於預先計算好的「長時停留點」，因此更加穩健。
@@ -10,6 +13,8 @@ def segment_trips_v3(vehicle_df: pd.DataFrame, gap_threshold_minutes: int = 20)
     Args:
         vehicle_df: 預處理過的、單一車輛的 DataFrame (已按時間排序)。
         gap_threshold_minutes: 定義一次移動結束所需的時間間隔（分鐘）。
+        transition_graph: (選用) camera_graph 建立的轉移圖；提供時改用兩支攝影機之間的
+                          學習旅行時間作為門檻，沒有歷史轉移時仍使用 gap_threshold_minutes。
 
     Returns:
         一個包含行程資訊的 list of dictionaries。
@@ -25,7 +30,13 @@ def segment_trips_v3(vehicle_df: pd.DataFrame, gap_threshold_minutes: int = 20)
 
     # 2. 找出所有時間差超過閾值的點，這些點是「行程的斷點」
     #    .shift(-1) 是為了將斷點標記在上一筆紀錄，代表「此處為終點」
-    trip_breakpoints = time_gaps > pd.Timedelta(minutes=gap_threshold_minutes)
+    if transition_graph is not None and transition_graph['node_col'] in vehicle_df.columns:
+        nodes = vehicle_df[transition_graph['node_col']].astype(str)
+        thresholds = transition_gap_thresholds(transition_graph, nodes.shift(1).tolist(), nodes.tolist(),
+                                               default_minutes=gap_threshold_minutes)
+        trip_breakpoints = time_gaps > pd.to_timedelta(thresholds, unit='min')
+    else:
+        trip_breakpoints = time_gaps > pd.Timedelta(minutes=gap_threshold_minutes)
     
     # 3. 使用 .cumsum() 技巧，為每一次連續的移動（即一次行程）分配一個唯一的 ID
     trip_ids = trip_breakpoints.cumsum()
@@ -48,7 +59,7 @@ def segment_trips_v3(vehicle_df: pd.DataFrame, gap_threshold_minutes: int = 20)
             start_area_id = start_point['LocationAreaID'] if 'LocationAreaID' in start_point else 'Unknown'
             end_area_id = end_point['LocationAreaID'] if 'LocationAreaID' in end_point else 'Unknown'
 
-            trips.append({
+            trip = {
                 'start_time': trip_start_time,
                 'end_time': trip_end_time,
                 'duration_minutes': round(duration.total_seconds() / 60, 2),
@@ -58,6 +69,12 @@ def segment_trips_v3(vehicle_df: pd.DataFrame, gap_threshold_minutes: int = 20)
                 'end_location_name': end_point['攝影機名稱'],
                 'point_count': len(group),
                 'path_camera_names': group['攝影機名稱'].tolist()
-            })
+            }
+            # 路徑上的地點 ID 序列 (供轉移圖、路徑補全與 LSH 索引使用)
+            if 'LocationID' in group.columns:
+                trip['path_location_ids'] = group['LocationID'].astype(str).tolist()
+            if 'LocationAreaID' in group.columns:
+                trip['path_area_ids'] = group['LocationAreaID'].tolist()
+            trips.append(trip)
             
     return trips
\ No newline at end of file
@@ -0,0 +1,250 @@
+# api/endpoints.py (HTTP API 服務：資料集與索引於啟動時載入一次，分析在行程池中執行)
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     uvicorn api.endpoints:app --host 0.0.0.0 --port 8000
+#
+# 環境變數:
+#     VEHICLE_DATA_PATH  資料 CSV 路徑 (預設 data/realistic_vehicle_dataset1.csv)
+#     API_WORKERS        分析行程數 (預設 CPU 核心數)
+#     SUMMARY_CACHE_DIR  摘要快取資料夾 (各子行程共用；未設定時只使用各行程的記憶體快取)
+#     COPRESENCE_INDEX_PATH  以 `cli.py build-index copresence` 建立的共現索引 (未設定時啟動時建立並存到暫存資料夾)；
+#                        子行程都以 memory map 開啟同一份檔案
+#     SHARED_DATASET_BACKEND 主行程共用資料的方式 (shm / mmap，見 analysis/shared_dataset.py)
+#
+# 資料檔只由主行程讀取一次並放到共用記憶體，分析子行程啟動時直接附加 (數值欄位不複製)，只各自建立分析索引。
+#     TRANSITION_GRAPH_PATH  以 `cli.py build-index transition-graph` 建立的攝影機轉移圖 (.npz)；
+#                        設定時 /report 與 /convoy 的行程切分改用學習旅行時間門檻，
+#                        /convoy 與 /similarity 另以此圖建立路徑比對器補全未拍到的攝影機
+#                        (/similarity?metric=lcss|dtw 的全車隊行程相似度索引於子行程啟動時建立一次)
+#     TRIP_LSH_INDEX_PATH  以 `cli.py build-index trip-lsh` 建立的行程 LSH 索引；/convoy 依路線相似度排列候選同行車，
+#                        請求指定 lsh_min_similarity 時 /convoy 與 /similarity 只比對路線相似的車輛
+
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import FastAPI, HTTPException, Query
+
+from data_loader import load_vehicle_data, DEFAULT_DATA_PATH
+from cli import open_copresence_index, open_transition_graph, open_trip_lsh_index, report_records, convoy_records, meeting_records, similarity_records, colocation_records, to_jsonable
+from cli import SIMILARITY_METRICS, check_similarity_options, build_trip_similarity_index
+
+# ==========================================
+# 1. 熱資料 (主行程讀取一次並放到共用記憶體，子行程附加後只建立各自的索引)
+# ==========================================
+_warm = {}
+
+def _load_warm_state(data_path: str, full_data, dataset: dict = None, copresence_path: str = None) -> dict:
+    """
+    由已載入的資料建立攝影機區域階層、共現索引與反向查詢索引，放在行程內的全域狀態中重複使用。
+    dataset 為依 (車牌, 時間) 排序的共用資料集 (反向查詢索引直接使用，不另建一份；報告與隨行分析由此切出各車資料)；
+    copresence_path 指定時以 memory map 開啟存檔的共現索引，否則在記憶體中建立；
+    TRANSITION_GRAPH_PATH 有設定時載入攝影機轉移圖，並以此建立路徑比對器；TRIP_LSH_INDEX_PATH 有設定時載入行程 LSH 索引。
+    行程相似度索引 (/similarity 的 lcss / dtw) 在此以同一個路徑比對器建立一次。
+    """
+    from analysis.area_hierarchy import build_area_hierarchy
+    from analysis.colocation_query import build_colocation_index
+    from analysis.copresence_index import build_copresence_index
+    from cache.summary_cache import create_summary_cache
+    from reporting_service import REPORT_AREA_RADIUS_METERS
+    from analysis.route_matcher import build_route_matcher
+
+    unique_cameras = full_data[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+    area_hierarchy = build_area_hierarchy(unique_cameras, radii=(50, REPORT_AREA_RADIUS_METERS))
+    transition_graph = (open_transition_graph(os.environ['TRANSITION_GRAPH_PATH'], full_data)
+                        if os.environ.get('TRANSITION_GRAPH_PATH') else None)
+    route_matcher = build_route_matcher(transition_graph) if transition_graph is not None else None
+    has_location_id = 'LocationID' in full_data.columns
+    _warm.update({
+        'data_path': str(data_path),
+        'full_data': full_data,
+        'dataset': dataset,
+        'plates': set(full_data['車牌'].unique()),
+        'area_hierarchy': area_hierarchy,
+        'copresence_index': (open_copresence_index(copresence_path, full_data) if copresence_path
+                             else build_copresence_index(full_data) if has_location_id else None),
+        'colocation_index': build_colocation_index(full_data, area_hierarchy, dataset=dataset),
+        'transition_graph': transition_graph,
+        'route_matcher': route_matcher,
+        'similarity_index': (build_trip_similarity_index(full_data, route_matcher=route_matcher)
+                             if has_location_id else None),
+        'trip_lsh_index': (open_trip_lsh_index(os.environ['TRIP_LSH_INDEX_PATH'])
+                           if os.environ.get('TRIP_LSH_INDEX_PATH') else None),
+        'summary_cache': create_summary_cache(os.environ.get('SUMMARY_CACHE_DIR')),
+    })
+    return _warm
+
+def _share_warm_data(data_path: str, copresence_path: str = None) -> dict:
+    """
+    主行程：讀取一次資料並放到共用記憶體 (整份 DataFrame 與依 (車牌, 時間) 排序的陣列)，
+    共現索引未指定存檔時建立一次並存到暫存資料夾，子行程都以 memory map 開啟同一份檔案。
+    主行程只保留健康檢查與車牌檢查需要的資料，不建立分析用的索引。
+
+    Returns:
+        dict: {'initargs' (傳給 _init_worker), 'shared' (結束時釋放), 'tmp_dir' (結束時刪除，可能為 None)}
+    """
+    from analysis.copresence_index import build_copresence_index, save_copresence_index
+    from analysis.shared_dataset import create_shared_frame, create_shared_dataset
+
+    full_data = load_vehicle_data(data_path, verbose=False)
+    # 指定的索引檔先在主行程開啟一次：路徑或內容有誤時服務直接啟動失敗，而不是每個請求都失敗
+    if copresence_path:
+        open_copresence_index(copresence_path, full_data)
+    if os.environ.get('TRANSITION_GRAPH_PATH'):
+        open_transition_graph(os.environ['TRANSITION_GRAPH_PATH'], full_data)
+    if os.environ.get('TRIP_LSH_INDEX_PATH'):
+        open_trip_lsh_index(os.environ['TRIP_LSH_INDEX_PATH'])
+
+    frame = create_shared_frame(full_data)
+    full_data = frame['frame']
+    dataset = create_shared_dataset(full_data, location_col='LocationID')
+    tmp_dir = None
+    if not copresence_path and 'LocationID' in full_data.columns:
+        tmp_dir = copresence_path = tempfile.mkdtemp(prefix='copresence_index_')
+        save_copresence_index(build_copresence_index(full_data), tmp_dir)
+
+    _warm.update({'data_path': str(data_path), 'full_data': full_data, 'plates': set(full_data['車牌'].unique())})
+    return {'initargs': (str(data_path), frame['spec'], dataset['spec'], copresence_path),
+            'shared': [frame, dataset], 'tmp_dir': tmp_dir}
+
+def _init_worker(data_path: str, frame_spec: dict, dataset_spec: dict, copresence_path: str = None):
+    """行程池初始化：附加主行程共用的資料 (不重新讀取資料檔，數值欄位不複製)，再建立此行程的分析索引。"""
+    from analysis.shared_dataset import attach_shared_frame, attach_shared_dataset
+
+    frame = attach_shared_frame(frame_spec)
+    dataset = attach_shared_dataset(dataset_spec)
+    _warm['shared'] = [frame, dataset]
+    _load_warm_state(data_path, frame['frame'], dataset, copresence_path)
+
+def _run_quietly(func, *args, **kwargs):
+    """在子行程中執行分析，分析過程的列印訊息不輸出到服務日誌。"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return to_jsonable(func(_warm['full_data'], *args, **kwargs))
+
+def _report_job(plate: str, use_llm: bool, prompt_token_budget: int = None) -> list:
+    return _run_quietly(report_records, [plate], use_llm=use_llm, area_hierarchy=_warm['area_hierarchy'],
+                        summary_cache=_warm['summary_cache'], transition_graph=_warm['transition_graph'],
+                        prompt_token_budget=prompt_token_budget, dataset=_warm['dataset'])
+
+def _convoy_job(plate: str, min_segment_length: int, lsh_min_similarity: float = None) -> list:
+    return _run_quietly(convoy_records, [plate], min_segment_length=min_segment_length,
+                        copresence_index=_warm['copresence_index'], transition_graph=_warm['transition_graph'],
+                        route_matcher=_warm['route_matcher'], trip_lsh_index=_warm['trip_lsh_index'],
+                        lsh_min_similarity=lsh_min_similarity, dataset=_warm['dataset'])
+
+def _meeting_job(plate_a: str, plate_b: str, distance: float) -> list:
+    return _run_quietly(meeting_records, [(plate_a, plate_b)], distance_threshold_meters=distance,
+                        copresence_index=_warm['copresence_index'])
+
+def _similarity_job(plate: str, min_route_len: int, time_tolerance: int, top_n: int,
+                    lsh_min_similarity: float = None, metric: str = 'routes', relative_time: bool = False) -> list:
+    return _run_quietly(similarity_records, [plate], min_route_len=min_route_len, time_tolerance_minutes=time_tolerance,
+                        top_n=top_n, copresence_index=_warm['copresence_index'], route_matcher=_warm['route_matcher'],
+                        trip_lsh_index=_warm['trip_lsh_index'], lsh_min_similarity=lsh_min_similarity,
+                        metric=metric, relative_time=relative_time, similarity_index=_warm['similarity_index'])
+
+def _colocation_job(query: dict) -> list:
+    return _run_quietly(colocation_records, colocation_index=_warm['colocation_index'], **query)
+
+# ==========================================
+# 2. 服務生命週期
+# ==========================================
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    from analysis.shared_dataset import release_shared_dataset
+
+    data_path = os.environ.get('VEHICLE_DATA_PATH', str(DEFAULT_DATA_PATH))
+    workers = int(os.environ.get('API_WORKERS', os.cpu_count() or 1))
+    shared = _share_warm_data(data_path, os.environ.get('COPRESENCE_INDEX_PATH'))
+    app.state.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=shared['initargs'])
+    app.state.workers = workers
+    try:
+        yield
+    finally:
+        app.state.pool.shutdown(wait=False, cancel_futures=True)
+        for resource in shared['shared']:
+            release_shared_dataset(resource)
+        if shared['tmp_dir']:
+            shutil.rmtree(shared['tmp_dir'], ignore_errors=True)
+
+app = FastAPI(title="車輛軌跡智慧分析 API", lifespan=lifespan)
+
+async def _submit(job, *args):
+    """將 CPU 密集的分析交給行程池，不阻塞事件迴圈。"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(app.state.pool, job, *args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _check_plate(plate: str):
+    if plate not in _warm['plates']:
+        raise HTTPException(status_code=404, detail=f"找不到車牌 {plate}")
+
+def _check_lsh_min_similarity(lsh_min_similarity: float):
+    if lsh_min_similarity is not None and not os.environ.get('TRIP_LSH_INDEX_PATH'):
+        raise HTTPException(status_code=400, detail="lsh_min_similarity 需要設定 TRIP_LSH_INDEX_PATH")
+
+_LSH_MIN_SIMILARITY = Query(None, ge=0, le=1, description="只比對路線相似度 >= 此值的車輛 (需要行程 LSH 索引；預設不篩選)")
+
+# ==========================================
+# 3. 端點
+# ==========================================
+@app.get("/health")
+async def health():
+    return {'status': 'ok', 'data_path': _warm['data_path'], 'rows': len(_warm['full_data']),
+            'plates': len(_warm['plates']), 'workers': app.state.workers}
+
+@app.get("/plates")
+async def plates():
+    return sorted(_warm['plates'])
+
+@app.get("/report/{plate}")
+async def report(plate: str, use_llm: bool = Query(False, description="是否呼叫 LLM 產生智慧摘要"),
+                 prompt_token_budget: int = Query(None, ge=1, description="提示詞的 token 上限 (預設不限制)")):
+    _check_plate(plate)
+    records = await _submit(_report_job, plate, use_llm, prompt_token_budget)
+    return records[0]
+
+@app.get("/convoy/{plate}")
+async def convoy(plate: str, min_segment_length: int = Query(20, ge=1), lsh_min_similarity: float = _LSH_MIN_SIMILARITY):
+    _check_plate(plate)
+    _check_lsh_min_similarity(lsh_min_similarity)
+    return await _submit(_convoy_job, plate, min_segment_length, lsh_min_similarity)
+
+@app.get("/meeting")
+async def meeting(plate_a: str, plate_b: str, distance: float = Query(80, gt=0)):
+    _check_plate(plate_a)
+    _check_plate(plate_b)
+    return await _submit(_meeting_job, plate_a, plate_b, distance)
+
+@app.get("/similarity/{plate}")
+async def similarity(plate: str, min_route_len: int = Query(2, ge=2), time_tolerance: int = Query(5, ge=0),
+                     top_n: int = Query(3, ge=1), lsh_min_similarity: float = _LSH_MIN_SIMILARITY,
+                     metric: str = Query('routes', pattern=f"^({'|'.join(SIMILARITY_METRICS)})$",
+                                         description="routes: 事件驅動同行路徑；lcss / dtw: 行程軌跡相似度"),
+                     relative_time: bool = Query(False, description="lcss 以行程起點為時間零點")):
+    _check_plate(plate)
+    _check_lsh_min_similarity(lsh_min_similarity)
+    try:
+        check_similarity_options(metric, relative_time, lsh_min_similarity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await _submit(_similarity_job, plate, min_route_len, time_tolerance, top_n, lsh_min_similarity,
+                         metric, relative_time)
+
+@app.get("/colocation")
+async def colocation(area_id: str = Query(None, description="區域 ID (level 層級；camera 層級為攝影機編號)"),
+                     level: str = Query('200m'), lon: float = Query(None), lat: float = Query(None),
+                     radius: float = Query(100, gt=0), start: str = Query(None, description="YYYY-MM-DD 或完整時間"),
+                     end: str = Query(None, description="只有日期時包含當天整天"), min_dwell: float = Query(0, ge=0),
+                     top_n: int = Query(None, ge=1)):
+    if (area_id is None) == (lon is None or lat is None):
+        raise HTTPException(status_code=400, detail="需要 area_id 或 lon + lat (擇一)")
+    query = {'start': start, 'end': end, 'area_id': area_id, 'level': level, 'lon': lon, 'lat': lat,
+             'radius_meters': radius, 'min_dwell_minutes': min_dwell, 'top_n': top_n}
+    return await _submit(_colocation_job, query)
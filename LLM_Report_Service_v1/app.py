@@ -1,74 +1,45 @@
 # app.py (V12 - 完整穩定版)
 
-import pandas as pd
-from pathlib import Path
-import sys
+from data_loader import load_vehicle_data, DEFAULT_DATA_PATH
 
 # ==========================================
-# 匯入各個分析模組
+# 各個分析模組在選到對應功能時才匯入 (啟動時不載入用不到的分析器與 LLM 客戶端)
 # ==========================================
-# 1. 單一車輛 LLM 報告服務
-from reporting_service import run_llm_reporting_flow
+# 1. 單一車輛 LLM 報告服務: reporting_service.run_llm_reporting_flow
+# 2. 隨行車輛/跟隨分析: analysis.convoy_analyzer.run_trip_oriented_convoy_analysis
+# 3. 雙車碰面分析: analysis.meeting_analyzer.run_dual_vehicle_meeting_analysis
+# 4. 全車隊同行群組探勘: analysis.fleet_convoy_miner.run_fleet_convoy_discovery
 
-# 2. 隨行車輛/跟隨分析 (保留原有功能)
-from analysis.convoy_analyzer import run_trip_oriented_convoy_analysis
-
-# 3. 雙車碰面分析 (新功能)
-# 請確保 analysis/meeting_analyzer.py 檔案存在且已更新
-from analysis.meeting_analyzer import run_dual_vehicle_meeting_analysis
-
-def main_console():
+def main_console(transition_graph_path: str = None):
     """
     應用主控台：負責資料載入與主選單邏輯
+    transition_graph_path (選用) 為 `cli.py build-index transition-graph` 建立的攝影機轉移圖，
+    報告與隨行分析的行程切分改用學習旅行時間門檻，隨行分析報告另列出補全後的推估完整路徑。
     """
     # ==============================================================================
     # 步驟 1: 載入並預處理資料
     # ==============================================================================
     full_data = None
     try:
-        current_file_path = Path(__file__)
-        project_root_path = current_file_path.parent
-        
-        # 設定資料路徑 (請確認檔名是否正確)
-        DATA_FILE_PATH = project_root_path / 'data' / 'realistic_vehicle_dataset1.csv'
-        
-        print(f"正在讀取資料: {DATA_FILE_PATH} ...")
-        
-        if not DATA_FILE_PATH.exists():
-            print(f"錯誤：找不到檔案 {DATA_FILE_PATH}")
-            print("請確認檔案是否已放入 data 資料夾中。")
-            input("按 Enter 鍵離開...")
-            return
-
-        full_data = pd.read_csv(DATA_FILE_PATH)
-        
-        # --- 資料清洗與格式化 ---
-        # 1. 時間格式轉換
-        full_data['datetime'] = pd.to_datetime(full_data['日期'] + ' ' + full_data['時間'])
-        full_data = full_data.sort_values(by='datetime').reset_index(drop=True)
+        print(f"正在讀取資料: {DEFAULT_DATA_PATH} ...")
+        full_data = load_vehicle_data(DEFAULT_DATA_PATH)
         
-        # 2. 確保 LocationID 為字串
-        if 'LocationID' in full_data.columns:
-            full_data['LocationID'] = full_data['LocationID'].astype(str)
-        else:
-            print("警告：資料中缺少 'LocationID' 欄位，可能會影響部分分析功能。")
-        
-        # 3. 【關鍵修正】強制轉換經緯度為浮點數
-        # 這是為了確保後續計算距離 (Haversine) 時不會因為資料含有字串而失敗
-        if '經度' in full_data.columns and '緯度' in full_data.columns:
-            full_data['經度'] = pd.to_numeric(full_data['經度'], errors='coerce')
-            full_data['緯度'] = pd.to_numeric(full_data['緯度'], errors='coerce')
-            
-            # 移除座標無效 (NaN) 的資料，避免髒資料導致程式崩潰
-            before_len = len(full_data)
-            full_data = full_data.dropna(subset=['經度', '緯度'])
-            after_len = len(full_data)
-            if before_len != after_len:
-                print(f"已移除 {before_len - after_len} 筆經緯度無效的資料。")
-            
         print("--- 成功讀取並預處理軌跡資料 ---")
         print(f"有效資料筆數: {len(full_data)}")
 
+        transition_graph = route_matcher = None
+        if transition_graph_path:
+            from cli import open_transition_graph
+            from analysis.route_matcher import build_route_matcher
+            transition_graph = open_transition_graph(transition_graph_path, full_data)
+            route_matcher = build_route_matcher(transition_graph)
+            print(f"--- 已載入攝影機轉移圖: {transition_graph_path} ({len(transition_graph['indices'])} 條邊) ---")
+
+    except FileNotFoundError as e:
+        print(f"錯誤：{e}")
+        print("請確認檔案是否已放入 data 資料夾中。")
+        input("按 Enter 鍵離開...")
+        return
     except Exception as e:
         print(f"\n[嚴重錯誤] 讀取資料時發生例外狀況: {e}")
         input("按 Enter 鍵離開...")
@@ -85,21 +56,29 @@ def main_console():
             print("  [1] 單一車輛軌跡分析 (LLM 報告)")
             print("  [2] 分析目標行程的隨行車輛 (行程導向)")
             print("  [3] 雙車碰面分析 (Dual-Vehicle Meeting)")
+            print("  [4] 全車隊同行群組探勘 (不需指定目標車)")
             print("  [q] 結束程式")
             
             choice = input("請輸入您的選擇: ").strip()
             
             # --- 選項 1: 單一車輛分析 ---
             if choice == '1':
-                run_single_vehicle_analysis(full_data)
+                run_single_vehicle_analysis(full_data, transition_graph)
             
             # --- 選項 2: 隨行車輛分析 (保留原功能) ---
             elif choice == '2':
-                run_trip_oriented_convoy_analysis(full_data)
+                from analysis.convoy_analyzer import run_trip_oriented_convoy_analysis
+                run_trip_oriented_convoy_analysis(full_data, transition_graph=transition_graph,
+                                                  route_matcher=route_matcher)
                 
             # --- 選項 3: 雙車碰面分析 (新功能) ---
             elif choice == '3':
                 run_dual_vehicle_analysis_flow(full_data)
+
+            # --- 選項 4: 全車隊同行群組探勘 ---
+            elif choice == '4':
+                from analysis.fleet_convoy_miner import run_fleet_convoy_discovery
+                run_fleet_convoy_discovery(full_data)
                 
             # --- 離開 ---
             elif choice.lower() == 'q':
@@ -107,7 +86,7 @@ def main_console():
                 break
             else:
                 print("無效的選擇，請重新輸入。")
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\n程式已強制中斷。")
             break
         except Exception as e:
@@ -115,7 +94,7 @@ def main_console():
             print("請檢查您的資料或程式碼設定。")
             # 不中斷迴圈，讓使用者可以重試別的功能
 
-def run_single_vehicle_analysis(full_data):
+def run_single_vehicle_analysis(full_data, transition_graph=None):
     """處理「單一車輛報告生成」的使用者互動與呼叫"""
     available_plates = sorted(full_data['車牌'].unique())
     print("\n--- 生成單一車輛深度分析報告 ---")
@@ -139,7 +118,8 @@ def run_single_vehicle_analysis(full_data):
             debug_mode = True if debug_choice == 'y' else False
             
             # 呼叫報告服務
-            run_llm_reporting_flow(full_data, target_plate, debug_mode=debug_mode)
+            from reporting_service import run_llm_reporting_flow
+            run_llm_reporting_flow(full_data, target_plate, debug_mode=debug_mode, transition_graph=transition_graph)
         else:
             print("錯誤：輸入的編號超出範圍。")
             
@@ -216,7 +196,16 @@ def run_dual_vehicle_analysis_flow(full_data):
 
     # 呼叫後端分析邏輯
     # (注意：這裡的 run_dual_vehicle_meeting_analysis 會自動處理 LocationAreaID)
+    from analysis.meeting_analyzer import run_dual_vehicle_meeting_analysis
     run_dual_vehicle_meeting_analysis(df_a, df_b, plate_a, plate_b)
 
 if __name__ == '__main__':
-    main_console()
\ No newline at end of file
+    import argparse
+    from monitoring.profiler import add_profile_arguments, profile_from_args
+
+    parser = argparse.ArgumentParser(description="車輛軌跡智慧分析系統 (互動式主控台)")
+    parser.add_argument('--transition-graph', help="攝影機轉移圖 (.npz，cli.py build-index transition-graph 建立)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    with profile_from_args(args, run_name='app'):
+        main_console(args.transition_graph)
\ No newline at end of file
@@ -0,0 +1,68 @@
+# benchmarks/bench_colocation.py (反向查詢「誰來過這裡」：查詢耗時，並與 find_advanced_stay_points 的停留歸屬比對)
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     python -m benchmarks.bench_colocation [--data data/realistic_vehicle_dataset1.csv] [--areas 20]
+#
+# 比對方式：不限時間區間查詢各區域，每台車的停留時間應等於該車 find_advanced_stay_points 結果中
+# area_id_hint 為該區域的停留時間總和 (停留只歸屬於起點位置)。
+
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from data_loader import load_vehicle_data, DEFAULT_DATA_PATH
+from analysis.advanced_stay_detector import find_advanced_stay_points
+from analysis.area_hierarchy import build_area_hierarchy, area_table_for_level, DEFAULT_RADII
+from analysis.colocation_query import build_colocation_index, who_was_here, DEFAULT_LEVEL
+from analysis.result_types import table_records
+
+def _reference_dwell(full_data: pd.DataFrame, cameras_with_area_id: pd.DataFrame, plates: list, area_id) -> dict:
+    """find_advanced_stay_points 的歸屬：{車牌: area_id_hint 為 area_id 的停留時間總和 (分鐘)}。"""
+    dwell = {}
+    for plate in plates:
+        vehicle = pd.merge(full_data[full_data['車牌'] == plate], cameras_with_area_id[['攝影機', 'LocationAreaID']],
+                           on='攝影機', how='left')
+        stays = find_advanced_stay_points(vehicle)
+        dwell[plate] = sum(s['duration_minutes'] for s in stays if str(s['area_id_hint']) == str(area_id))
+    return dwell
+
+def main():
+    parser = argparse.ArgumentParser(description="反向查詢基準測試與停留歸屬比對")
+    parser.add_argument('--data', type=Path, default=DEFAULT_DATA_PATH, help="資料 CSV 路徑或分區資料夾")
+    parser.add_argument('--areas', type=int, default=20, help="比對的區域數 (偵測筆數最多的區域)")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="允許的停留時間差 (分鐘，停留時間逐筆四捨五入)")
+    args = parser.parse_args()
+
+    full_data = load_vehicle_data(args.data, verbose=False)
+    unique_cameras = full_data[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+    hierarchy = build_area_hierarchy(unique_cameras, radii=DEFAULT_RADII)
+    start = time.perf_counter()
+    index = build_colocation_index(full_data, hierarchy)
+    print(f"資料: {len(full_data)} 筆 | 索引建立 {time.perf_counter() - start:.2f}s")
+
+    level = DEFAULT_LEVEL
+    cameras_with_area_id = area_table_for_level(hierarchy, level)
+    area_ids = cameras_with_area_id.merge(full_data[['攝影機']], on='攝影機')['LocationAreaID'].value_counts().index[:args.areas]
+
+    print(f"\n  {'區域':<12} {'車輛':>5} {'查詢':>10}  停留時間一致")
+    mismatches = 0
+    for area_id in area_ids:
+        start = time.perf_counter()
+        records = table_records(who_was_here(index, area_id=area_id, level=level))
+        elapsed = time.perf_counter() - start
+
+        reference = _reference_dwell(full_data, cameras_with_area_id, [r['plate'] for r in records], area_id)
+        bad = [(r['plate'], r['dwell_minutes'], round(reference[r['plate']], 2)) for r in records
+               if abs(r['dwell_minutes'] - reference[r['plate']]) > args.tolerance]
+        mismatches += len(bad)
+        print(f"  {str(area_id):<12} {len(records):>5} {elapsed * 1000:8.1f}ms  {'是' if not bad else '否'}")
+        for plate, dwell, expected in bad[:5]:
+            print(f"      {plate}: 反向查詢 {dwell} 分鐘 / find_advanced_stay_points {expected} 分鐘")
+
+    if mismatches:
+        raise SystemExit(f"\n共 {mismatches} 台車的停留時間不一致。")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/bench_convoy_parallel.py (隨行分析平行掃描：加速比 vs 核心數)
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     python -m benchmarks.bench_convoy_parallel [--data data/vehicle_behavior_dataset_2months_final.csv] [--plate ABC-1234]
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from analysis.convoy_analyzer import analyze_convoy_partners
+
+DEFAULT_DATA = Path(__file__).resolve().parent.parent / 'data' / 'vehicle_behavior_dataset_2months_final.csv'
+
+def _load(path: Path) -> pd.DataFrame:
+    """讀取資料並做與 app.py 相同的前處理；缺少 'LocationID' 時以 '攝影機' 代替。"""
+    df = pd.read_csv(path)
+    df['datetime'] = pd.to_datetime(df['日期'] + ' ' + df['時間'])
+    df = df.sort_values(by='datetime').reset_index(drop=True)
+    if 'LocationID' not in df.columns:
+        df['LocationID'] = df['攝影機']
+    df['LocationID'] = df['LocationID'].astype(str)
+    return df
+
+def _timed(full_data: pd.DataFrame, plate: str, n_workers):
+    start = time.perf_counter()
+    result = analyze_convoy_partners(full_data, plate, n_workers=n_workers)
+    return time.perf_counter() - start, result
+
+def _signature(result: dict) -> list:
+    """比較用：每個行程的 (同行車, 片段長度, 起訖時間)。"""
+    return [[(p['plate'], p['segment_length'], p['start_time'], p['end_time']) for p in trip['convoy_partners']]
+            for trip in result['analyzed_trips']]
+
+def main():
+    parser = argparse.ArgumentParser(description="隨行分析平行掃描基準測試")
+    parser.add_argument('--data', type=Path, default=DEFAULT_DATA, help="資料 CSV 路徑")
+    parser.add_argument('--plate', help="目標車牌 (預設為資料筆數最多的車)")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help="測試到的最大行程數")
+    args = parser.parse_args()
+
+    full_data = _load(args.data)
+    plate = args.plate or full_data['車牌'].value_counts().idxmax()
+    print(f"資料: {args.data.name} ({len(full_data)} 筆, {full_data['車牌'].nunique()} 輛車)")
+    print(f"目標車牌: {plate} | CPU 核心數: {os.cpu_count()}")
+
+    serial_time, serial_result = _timed(full_data, plate, None)
+    print(f"\n  {'模式':<22} {'耗時':>10} {'加速':>8}  結果一致")
+    print(f"  {'逐車 DataFrame 掃描':<22} {serial_time:9.2f}s {1.0:7.1f}x")
+
+    workers = 1
+    while workers <= args.max_workers:
+        elapsed, result = _timed(full_data, plate, workers)
+        same = _signature(result) == _signature(serial_result)
+        print(f"  {f'平行掃描 x{workers}':<22} {elapsed:9.2f}s {serial_time / elapsed:7.1f}x  {'是' if same else '否'}")
+        workers *= 2
+
+if __name__ == '__main__':
+    main()
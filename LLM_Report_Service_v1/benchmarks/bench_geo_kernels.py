@@ -0,0 +1,74 @@
+# benchmarks/bench_geo_kernels.py (geo_kernels 微基準測試)
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     python -m benchmarks.bench_geo_kernels [--points 20000] [--cameras 3000]
+
+import argparse
+import time
+
+import numpy as np
+
+from analysis.geo_kernels import (
+    NUMBA_AVAILABLE, haversine_distance, consecutive_distances,
+    pairwise_distance_matrix, build_grid_index, query_radius, query_nearest
+)
+
+def _best_of(func, repeat: int = 3) -> float:
+    """執行數次並回傳最短耗時 (秒)。"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _random_points(n: int, seed: int = 0):
+    """在桃園市附近產生隨機座標 (與資料集的範圍相近)。"""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(121.05, 121.45, n)
+    lat = rng.uniform(24.80, 25.10, n)
+    return lon, lat
+
+def _report(name: str, baseline: float, optimized: float):
+    print(f"  {name:<36} 舊做法 {baseline * 1000:9.2f} ms | 新做法 {optimized * 1000:9.2f} ms | 加速 {baseline / optimized:7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="geo_kernels 微基準測試")
+    parser.add_argument('--points', type=int, default=20000, help="軌跡點數 (相鄰點距離)")
+    parser.add_argument('--cameras', type=int, default=3000, help="攝影機數 (兩兩距離 / 半徑查詢)")
+    parser.add_argument('--radius', type=float, default=200.0, help="半徑查詢的距離 (公尺)")
+    args = parser.parse_args()
+
+    print(f"Numba JIT: {'可用' if NUMBA_AVAILABLE else '未安裝 (使用 NumPy 版本)'}")
+
+    # --- 1. 相鄰點距離：逐對純量呼叫 vs 向量化 ---
+    lon, lat = _random_points(args.points)
+    scalar = _best_of(lambda: [haversine_distance(lon[i], lat[i], lon[i + 1], lat[i + 1]) for i in range(len(lon) - 1)], repeat=1)
+    vectorized = _best_of(lambda: consecutive_distances(lon, lat, use_jit=False))
+    _report(f"相鄰點距離 ({args.points} 點)", scalar, vectorized)
+    if NUMBA_AVAILABLE:
+        consecutive_distances(lon, lat, use_jit=True)  # 先觸發編譯
+        _report("相鄰點距離 (JIT)", scalar, _best_of(lambda: consecutive_distances(lon, lat, use_jit=True)))
+
+    # --- 2. 兩兩距離矩陣：逐列呼叫 vs 分塊矩陣 ---
+    cam_lon, cam_lat = _random_points(args.cameras, seed=1)
+    row_by_row = _best_of(lambda: [haversine_distance(cam_lon[i], cam_lat[i], cam_lon, cam_lat) for i in range(len(cam_lon))], repeat=1)
+    chunked = _best_of(lambda: pairwise_distance_matrix(cam_lon, cam_lat, use_jit=False))
+    _report(f"兩兩距離矩陣 ({args.cameras}x{args.cameras})", row_by_row, chunked)
+
+    # --- 3. 半徑查詢：每次對全部點計算距離 vs 網格索引 ---
+    grid = build_grid_index(cam_lon, cam_lat, cell_meters=args.radius)
+    brute = _best_of(lambda: [np.flatnonzero(haversine_distance(cam_lon[i], cam_lat[i], cam_lon, cam_lat) <= args.radius)
+                              for i in range(len(cam_lon))])
+    gridded = _best_of(lambda: [query_radius(grid, cam_lon[i], cam_lat[i], args.radius) for i in range(len(cam_lon))])
+    _report(f"半徑 {args.radius:.0f}m 查詢 ({args.cameras} 次)", brute, gridded)
+
+    # --- 4. 最近鄰查詢 ---
+    query_lon, query_lat = _random_points(1000, seed=2)
+    brute_nn = _best_of(lambda: [int(np.argmin(haversine_distance(query_lon[i], query_lat[i], cam_lon, cam_lat)))
+                                 for i in range(len(query_lon))])
+    grid_nn = _best_of(lambda: [query_nearest(grid, query_lon[i], query_lat[i]) for i in range(len(query_lon))])
+    _report("最近鄰查詢 (1000 次)", brute_nn, grid_nn)
+
+if __name__ == '__main__':
+    main()
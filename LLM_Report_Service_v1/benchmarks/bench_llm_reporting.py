@@ -0,0 +1,93 @@
+# benchmarks/bench_llm_reporting.py (報告流程吞吐量：以模擬 LLM 後端離線測試併發上限與重試行為)
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     python -m benchmarks.bench_llm_reporting --latency-ms 800 --failure-rate 0.1 --concurrency 1 4 16 --max-concurrency 4
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from data_loader import load_vehicle_data, DEFAULT_DATA_PATH
+from analysis.area_hierarchy import build_area_hierarchy
+from cache.summary_cache import create_summary_cache
+from llm_clients.backends import create_backend, backend_stats
+from reporting_service import run_llm_reporting_flow, REPORT_AREA_RADIUS_METERS
+
+def _timed_report(full_data, plate: str, area_hierarchy: dict, summary_cache: dict, backend: dict):
+    start = time.perf_counter()
+    result = run_llm_reporting_flow(full_data, plate, area_hierarchy=area_hierarchy,
+                                    summary_cache=summary_cache, llm_backend=backend)
+    return time.perf_counter() - start, result is not None and result['llm_report'] is not None
+
+def run_level(full_data, plates: list, concurrency: int, area_hierarchy: dict, summary_cache: dict,
+              backend_kwargs: dict) -> dict:
+    backend = create_backend('mock', **backend_kwargs)
+    start = time.perf_counter()
+    # redirect_stdout 作用於整個行程，因此在執行緒池外層統一關閉報告流程的列印
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda p: _timed_report(full_data, p, area_hierarchy, summary_cache, backend), plates))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([lat for lat, _ in results])
+    stats = backend_stats(backend)
+    return {
+        'concurrency': concurrency,
+        'reports': len(plates),
+        'failed': sum(1 for _, ok in results if not ok),
+        'retries': stats['retries'],
+        'throughput_rps': round(len(plates) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 1),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="報告流程吞吐量基準測試 (模擬 LLM 後端)")
+    parser.add_argument('--data', default=str(DEFAULT_DATA_PATH), help="資料 CSV 路徑")
+    parser.add_argument('--plates', type=int, default=20, help="要產生報告的車輛數")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help="同時處理的報告數")
+    parser.add_argument('--max-concurrency', type=int, default=4, help="後端同時進行中的請求上限")
+    parser.add_argument('--latency-ms', type=float, default=500.0, help="模擬的 LLM 回應延遲")
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help="模擬延遲的隨機增量上限")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="每次呼叫的注入失敗機率")
+    parser.add_argument('--max-retries', type=int, default=None, help="重試次數 (預設依 LLM_MAX_RETRIES)")
+    parser.add_argument('--json', help="另存結果為 JSON 檔")
+    args = parser.parse_args()
+
+    if args.max_retries is not None:
+        os.environ['LLM_MAX_RETRIES'] = str(args.max_retries)
+
+    full_data = load_vehicle_data(args.data, verbose=False)
+    plates = full_data['車牌'].value_counts().index[:args.plates].tolist()
+    unique_cameras = full_data[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+    area_hierarchy = build_area_hierarchy(unique_cameras, radii=(50, REPORT_AREA_RADIUS_METERS))
+
+    # 先把本地分析結果放進快取，讓測量只反映 LLM 呼叫與併發行為 (資料不足、不會呼叫 LLM 的車輛排除)
+    summary_cache = create_summary_cache()
+    warm_backend = create_backend('mock', latency_ms=0, jitter_ms=0, failure_rate=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        plates = [p for p in plates if _timed_report(full_data, p, area_hierarchy, summary_cache, warm_backend)[1]]
+
+    backend_kwargs = {'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms, 'failure_rate': args.failure_rate,
+                      'max_concurrency': args.max_concurrency, 'seed': 0}
+    print(f"車輛數: {len(plates)} | 模擬延遲: {args.latency_ms}±{args.jitter_ms} ms | "
+          f"失敗率: {args.failure_rate} | 後端併發上限: {args.max_concurrency}")
+    print(f"  {'並行數':>6} {'吞吐量 (rep/s)':>16} {'p50 (ms)':>10} {'p99 (ms)':>10} {'重試':>6} {'失敗':>6}")
+    levels = []
+    for concurrency in args.concurrency:
+        level = run_level(full_data, plates, concurrency, area_hierarchy, summary_cache, backend_kwargs)
+        levels.append(level)
+        print(f"  {concurrency:>6} {level['throughput_rps']:>16} {level['p50_ms']:>10} {level['p99_ms']:>10} "
+              f"{level['retries']:>6} {level['failed']:>6}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'backend': backend_kwargs, 'levels': levels}, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/load_test_api.py (API 壓力測試：各並行數下的 p50 / p99 延遲與吞吐量)
+#
+# 先啟動服務 (於 LLM_Report_Service_v1 目錄下):
+#     uvicorn api.endpoints:app --port 8000
+# 再執行:
+#     python -m benchmarks.load_test_api --url http://127.0.0.1:8000 --concurrency 1 4 16 --requests 200
+
+import argparse
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+def _get(url: str, timeout: float):
+    """送出一個 GET 請求，回傳 (延遲秒數, 是否成功)。"""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except (urllib.error.URLError, TimeoutError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+def _build_urls(base: str, endpoint: str, plates: list, total: int) -> list:
+    """依端點類型輪流使用資料集中的車牌組成請求 URL。"""
+    urls = []
+    for i in range(total):
+        plate = urllib.parse.quote(plates[i % len(plates)])
+        if endpoint == 'meeting':
+            other = urllib.parse.quote(plates[(i + 1) % len(plates)])
+            urls.append(f"{base}/meeting?plate_a={plate}&plate_b={other}")
+        else:
+            urls.append(f"{base}/{endpoint}/{plate}")
+    return urls
+
+def run_level(urls: list, concurrency: int, timeout: float) -> dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda u: _get(u, timeout), urls))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([lat for lat, ok in results if ok])
+    return {
+        'concurrency': concurrency,
+        'requests': len(urls),
+        'errors': sum(1 for _, ok in results if not ok),
+        'throughput_rps': round(len(urls) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 1) if len(latencies) else None,
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 1) if len(latencies) else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="API 壓力測試")
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="服務位址")
+    parser.add_argument('--endpoint', choices=['report', 'convoy', 'meeting', 'similarity'], default='convoy')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help="要測試的並行數")
+    parser.add_argument('--requests', type=int, default=100, help="每個並行數送出的請求數")
+    parser.add_argument('--timeout', type=float, default=120.0, help="單一請求逾時 (秒)")
+    parser.add_argument('--json', help="另存結果為 JSON 檔")
+    args = parser.parse_args()
+
+    base = args.url.rstrip('/')
+    with urllib.request.urlopen(f"{base}/plates", timeout=args.timeout) as resp:
+        plates = json.loads(resp.read())
+    urls = _build_urls(base, args.endpoint, plates, args.requests)
+
+    # 先暖機 (讓每個子行程完成初始化)
+    run_level(urls[:max(args.concurrency)], max(args.concurrency), args.timeout)
+
+    print(f"端點: /{args.endpoint} | 每級請求數: {args.requests}")
+    print(f"  {'並行數':>6} {'吞吐量 (req/s)':>16} {'p50 (ms)':>10} {'p99 (ms)':>10} {'錯誤':>6}")
+    levels = []
+    for concurrency in args.concurrency:
+        level = run_level(urls, concurrency, args.timeout)
+        levels.append(level)
+        print(f"  {concurrency:>6} {level['throughput_rps']:>16} {level['p50_ms']!s:>10} {level['p99_ms']!s:>10} {level['errors']:>6}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'endpoint': args.endpoint, 'levels': levels}, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+# benchmarks/run_benchmarks.py (各分析階段的基準測試：合成資料 10x / 100x / 1000x，與基準線比較以抓出效能退化)
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     python -m benchmarks.run_benchmarks --scales 10 100 --save-baseline     # 建立 / 更新基準線
+#     python -m benchmarks.run_benchmarks --scales 10 100 --check              # 與基準線比較，有退化時結束代碼為 1，
+#                                                                              # 找不到基準線時結束代碼為 2
+#
+# 合成資料會快取在 benchmarks/.synthetic_cache/ (相同規模與 seed 只產生一次)；
+# 基準線依機器分開存放在 benchmarks/baselines/<主機名稱>/scale_<倍數>.json，不同機器的數字不可互相比較。
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import scale_params, write_synthetic_dataset
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_CACHE_DIR = BENCH_DIR / '.synthetic_cache'
+DEFAULT_BASELINE_DIR = BENCH_DIR / 'baselines' / platform.node()
+
+STAGES = ['ingest', 'clustering', 'stay_detection', 'trip_segmentation', 'pattern_mining', 'anomaly',
+          'convoy', 'meeting', 'similarity']
+
+# ==========================================
+# 1. 資料準備
+# ==========================================
+def synthetic_dataset_path(scale: float, seed: int, cache_dir: Path = DEFAULT_CACHE_DIR) -> Path:
+    """回傳指定規模的合成資料 CSV，不存在時才產生。"""
+    path = Path(cache_dir) / f"synthetic_x{scale:g}_seed{seed}.csv"
+    if not path.exists():
+        print(f"  產生合成資料 (x{scale:g}) -> {path} ...", flush=True)
+        write_synthetic_dataset(path, seed=seed, **scale_params(scale))
+    return path
+
+def _pick_targets(full_data: pd.DataFrame, sample_plates: int) -> dict:
+    """挑選各階段使用的車輛：一般車取資料量中位附近的車、車隊取領頭車、碰面取同一組的兩台車。"""
+    counts = full_data['車牌'].value_counts()
+    normal = [p for p in counts.index if p.startswith('NOR-')]
+    mid = len(normal) // 2
+    sample = normal[max(0, mid - sample_plates // 2):][:sample_plates]
+    leaders = full_data.loc[full_data['ConvoyID'].notna(), '車牌'].value_counts()
+    meeting = sorted(p for p in counts.index if p.startswith('MEE-'))[:2]
+    return {
+        'sample': sample,
+        'convoy': leaders.index[0] if len(leaders) else counts.index[0],
+        'meeting': meeting if len(meeting) == 2 else list(counts.index[:2]),
+        'similarity': sample[0] if sample else counts.index[0],
+    }
+
+# ==========================================
+# 2. 各階段
+# ==========================================
+def build_stages(csv_path: Path, sample_plates: int) -> dict:
+    """
+    載入資料一次並準備各階段的輸入，回傳 {階段名稱: 無參數函式}。
+    每個函式只包含該階段本身的計算 (前一階段的結果事先算好)，計時才不會互相混在一起；
+    停留點偵測與行程切分各自計入由車輛資料建立軌跡陣列的時間 (與正式流程相同的工作量)。
+    """
+    from data_loader import load_vehicle_data
+    from analysis.area_hierarchy import build_area_hierarchy, area_table_for_level, level_name
+    from analysis.trajectory_kernel import build_trajectory_arrays, area_stay_table, advanced_stay_table, trip_table
+    from analysis.pattern_clusterer import find_regular_patterns_v13
+    from analysis.anomaly_detector import find_anomalies_v3
+    from analysis.convoy_analyzer import analyze_convoy_partners
+    from analysis.meeting_analyzer import run_dual_vehicle_meeting_analysis
+    from analysis.similarity_analyzer_bin import find_common_routes
+    from reporting_service import REPORT_AREA_RADIUS_METERS, SUMMARY_PARAMS
+
+    full_data = load_vehicle_data(csv_path, verbose=False)
+    targets = _pick_targets(full_data, sample_plates)
+    unique_cameras = full_data[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+    radii = (50, REPORT_AREA_RADIUS_METERS)
+
+    hierarchy = build_area_hierarchy(unique_cameras, radii=radii)
+    report_level = level_name(REPORT_AREA_RADIUS_METERS)
+    cameras_with_area_id = area_table_for_level(hierarchy, report_level)
+
+    # 抽樣車輛的逐車輸入 (與 reporting_service._compute_vehicle_summary 相同的前處理)
+    per_plate = []
+    for plate in targets['sample']:
+        vehicle = full_data[full_data['車牌'] == plate]
+        merged = pd.merge(vehicle, cameras_with_area_id[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
+        arrays = build_trajectory_arrays(merged)
+        stays = area_stay_table(arrays, time_threshold_minutes=SUMMARY_PARAMS['stay_threshold_minutes'])
+        trips = trip_table(arrays, gap_threshold_minutes=SUMMARY_PARAMS['trip_gap_minutes'])
+        patterns = find_regular_patterns_v13(trips, stays, cameras_with_area_id)
+        per_plate.append({'merged': merged, 'stays': stays, 'trips': trips, 'patterns': patterns})
+
+    plate_a, plate_b = targets['meeting']
+    df_a = full_data[full_data['車牌'] == plate_a]
+    df_b = full_data[full_data['車牌'] == plate_b]
+
+    def detect_stays(merged: pd.DataFrame):
+        arrays = build_trajectory_arrays(merged)
+        return (area_stay_table(arrays, time_threshold_minutes=SUMMARY_PARAMS['stay_threshold_minutes']),
+                advanced_stay_table(arrays))
+
+    stages = {
+        'ingest': lambda: load_vehicle_data(csv_path, verbose=False),
+        'clustering': lambda: build_area_hierarchy(unique_cameras, radii=radii),
+        'stay_detection': lambda: [detect_stays(p['merged']) for p in per_plate],
+        'trip_segmentation': lambda: [trip_table(build_trajectory_arrays(p['merged']),
+                                                 gap_threshold_minutes=SUMMARY_PARAMS['trip_gap_minutes'])
+                                      for p in per_plate],
+        'pattern_mining': lambda: [find_regular_patterns_v13(p['trips'], p['stays'], cameras_with_area_id)
+                                   for p in per_plate],
+        'anomaly': lambda: [find_anomalies_v3(p['patterns']['trips_df'], p['patterns']['summary']['regular_patterns'])
+                            for p in per_plate],
+        'convoy': lambda: analyze_convoy_partners(full_data, targets['convoy']),
+        'meeting': lambda: run_dual_vehicle_meeting_analysis(df_a, df_b, plate_a, plate_b),
+        'similarity': lambda: find_common_routes(full_data, targets['similarity']),
+    }
+    info = {'rows': len(full_data), 'plates': int(full_data['車牌'].nunique()),
+            'cameras': int(full_data['攝影機'].nunique()), 'targets': targets}
+    return stages, info
+
+def time_stage(func, repeat: int) -> dict:
+    """執行 repeat 次 (分析過程的列印訊息不輸出)，回傳最短與中位數耗時 (秒)。"""
+    samples = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+    return {'best': min(samples), 'median': statistics.median(samples), 'repeat': repeat}
+
+# ==========================================
+# 3. 基準線
+# ==========================================
+def _environment() -> dict:
+    return {'host': platform.node(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'cpu_count': os.cpu_count()}
+
+def baseline_path(baseline_dir: Path, scale: float) -> Path:
+    return Path(baseline_dir) / f"scale_{scale:g}.json"
+
+def compare_to_baseline(result: dict, baseline: dict, tolerance: float, min_delta_seconds: float = 0.005) -> list:
+    """
+    比較最短耗時；比基準線慢超過 tolerance (比例) 且差距超過 min_delta_seconds 的階段視為退化。
+    回傳 [(階段, 基準線秒數, 本次秒數)]。
+    """
+    regressions = []
+    for stage, timing in result['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            continue
+        if timing['best'] > base['best'] * (1 + tolerance) and timing['best'] - base['best'] > min_delta_seconds:
+            regressions.append((stage, base['best'], timing['best']))
+    return regressions
+
+def run_scale(scale: float, args) -> dict:
+    csv_path = synthetic_dataset_path(scale, args.seed, args.cache_dir)
+    stages, info = build_stages(csv_path, args.sample_plates)
+    print(f"\n=== x{scale:g}: {info['rows']:,} 筆 / {info['plates']:,} 台車 / {info['cameras']:,} 支攝影機 ===")
+    result = {'scale': scale, 'seed': args.seed, 'sample_plates': args.sample_plates, **info,
+              'environment': _environment(), 'stages': {}}
+    for name in args.stages:
+        result['stages'][name] = time_stage(stages[name], args.repeat)
+        timing = result['stages'][name]
+        print(f"  {name:<18} best {timing['best'] * 1000:10.1f} ms | median {timing['median'] * 1000:10.1f} ms", flush=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="分析流程基準測試 (合成資料)")
+    parser.add_argument('--scales', type=float, nargs='+', default=[10], help="相對內附資料集的倍數 (例如 10 100 1000)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="要測試的階段")
+    parser.add_argument('--repeat', type=int, default=3, help="每個階段重複次數 (取最短耗時)")
+    parser.add_argument('--sample-plates', type=int, default=10, help="逐車階段 (停留點 / 行程 / 模式 / 異常) 的抽樣車輛數")
+    parser.add_argument('--seed', type=int, default=0, help="合成資料的亂數種子")
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR, help="合成資料快取資料夾")
+    parser.add_argument('--baseline-dir', type=Path, default=DEFAULT_BASELINE_DIR, help="基準線資料夾")
+    parser.add_argument('--save-baseline', action='store_true', help="將本次結果存為基準線")
+    parser.add_argument('--check', action='store_true', help="與基準線比較，有退化時結束代碼為 1 (找不到基準線時為 2)")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="允許的變慢比例 (預設 25%%)")
+    parser.add_argument('--json', type=Path, help="另存本次結果為 JSON 檔")
+    args = parser.parse_args()
+
+    # --check 找不到基準線時無法判斷是否退化，直接失敗 (同時 --save-baseline 則視為建立第一份基準線)
+    missing = [str(baseline_path(args.baseline_dir, scale)) for scale in args.scales
+               if not baseline_path(args.baseline_dir, scale).exists()]
+    if args.check and missing and not args.save_baseline:
+        print(f"找不到基準線，無法比較: {', '.join(missing)}\n請先以 --save-baseline 建立基準線。", file=sys.stderr)
+        sys.exit(2)
+
+    results, regressions = [], []
+    for scale in args.scales:
+        result = run_scale(scale, args)
+        results.append(result)
+
+        path = baseline_path(args.baseline_dir, scale)
+        if args.check:
+            if not path.exists():
+                print(f"  (找不到基準線 {path}，本次結果將存為第一份基準線)")
+            else:
+                baseline = json.loads(path.read_text(encoding='utf-8'))
+                for stage, base, now in compare_to_baseline(result, baseline, args.tolerance):
+                    regressions.append((scale, stage, base, now))
+                    print(f"  !! 退化: {stage} {base * 1000:.1f} ms -> {now * 1000:.1f} ms ({now / base:.2f}x)")
+        if args.save_baseline:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+            print(f"  基準線已儲存: {path}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if regressions:
+        print(f"\n共 {len(regressions)} 個階段效能退化 (容許 {args.tolerance:.0%})。")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
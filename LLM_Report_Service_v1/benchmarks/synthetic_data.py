@@ -0,0 +1,347 @@
+# benchmarks/synthetic_data.py (可重現的合成車辨資料：任意規模的攝影機網路、車隊與天數)
+#
+# 產生的 CSV 欄位與 data/realistic_vehicle_dataset1.csv 相同，可直接交給 data_loader.load_vehicle_data 讀取。
+# 相同參數與 seed 一定產生完全相同的資料。
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     python -m benchmarks.synthetic_data --scale 10 --output data/synthetic_x10.csv
+#     python -m benchmarks.synthetic_data --cameras 2000 --plates 500 --days 56 --seed 7 --output out.csv
+
+import argparse
+import math
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from analysis.geo_kernels import consecutive_distances
+
+# 內附資料集 (realistic_vehicle_dataset1.csv) 的規模：scale=1 時產生相近的資料量
+BASE_CAMERAS = 572
+BASE_PLATES = 9
+BASE_DAYS = 28
+
+# 桃園市附近 (與內附資料的經緯度範圍相近)
+DEFAULT_BBOX = (121.07, 24.84, 121.37, 25.07)
+DEFAULT_START_DATE = '2025-08-01'
+
+OUTPUT_COLUMNS = ['攝影機名稱', '車牌', '單位', '日期', '時間', '攝影機', 'LocationID', '經度', '緯度', 'ConvoyID', 'FollowingID']
+
+ROAD_NAMES = ['中正路', '中山路', '民生街', '民族路', '泰圳路', '廣福路', '文三一街', '中興路', '大觀路', '天祥街',
+              '和平路', '復興路', '成功路', '忠孝路', '仁愛路', '信義路', '大興路', '上興路', '合圳北路', '環南路']
+DIRECTIONS = ['往北', '往南', '往東', '往西']
+
+def scale_params(scale: float) -> dict:
+    """
+    依內附資料的倍數換算產生參數：車輛數與倍數成正比，攝影機數隨倍數的平方根成長 (涵蓋範圍變大、但不會無限加密)。
+    """
+    return {
+        'n_cameras': int(round(BASE_CAMERAS * math.sqrt(scale))),
+        'n_plates': max(2, int(round(BASE_PLATES * scale))),
+        'n_days': BASE_DAYS,
+    }
+
+# ==========================================
+# 1. 攝影機網路
+# ==========================================
+def generate_camera_network(n_cameras: int, seed: int = 0, bbox: tuple = DEFAULT_BBOX) -> dict:
+    """
+    產生攝影機網路：路口排成略帶擾動的棋盤格，每個路口有 1~5 支不同方向的攝影機 (彼此相距數十公尺)，
+    轄區 (單位) 依路口所在的區塊劃分。
+
+    Returns:
+        dict: {'cameras': DataFrame (攝影機, 攝影機名稱, 單位, LocationID, 經度, 緯度),
+               'rows', 'cols', 'node_lon', 'node_lat', 'node_cameras': 各路口的攝影機列索引}
+    """
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = bbox
+
+    # 每個路口平均 3 支攝影機
+    cams_per_node = []
+    while sum(cams_per_node) < n_cameras:
+        cams_per_node.append(int(rng.integers(1, 6)))
+    cams_per_node[-1] -= sum(cams_per_node) - n_cameras
+    n_nodes = len(cams_per_node)
+
+    aspect = (max_lon - min_lon) / (max_lat - min_lat)
+    cols = max(1, int(math.ceil(math.sqrt(n_nodes * aspect))))
+    rows = int(math.ceil(n_nodes / cols))
+    node_row, node_col = np.divmod(np.arange(n_nodes), cols)
+    step_lon = (max_lon - min_lon) / cols
+    step_lat = (max_lat - min_lat) / rows
+    node_lon = min_lon + (node_col + 0.5 + rng.uniform(-0.25, 0.25, n_nodes)) * step_lon
+    node_lat = min_lat + (node_row + 0.5 + rng.uniform(-0.25, 0.25, n_nodes)) * step_lat
+
+    # 轄區：每個單位負責約 6x6 個路口
+    block = 6
+    station_of_node = (node_row // block) * int(math.ceil(cols / block)) + node_col // block
+
+    records = []
+    node_cameras = []
+    for node, count in enumerate(cams_per_node):
+        road_a = ROAD_NAMES[node_row[node] % len(ROAD_NAMES)]
+        road_b = ROAD_NAMES[(node_col[node] + 7) % len(ROAD_NAMES)]
+        indices = []
+        for k in range(count):
+            indices.append(len(records))
+            # 同一路口的攝影機相距約 10~40 公尺
+            offset = rng.uniform(-0.0003, 0.0003, 2)
+            records.append({
+                '攝影機': str(2000000000 + node * 10 + k + 1),
+                '攝影機名稱': f"(合成){road_a}、{road_b}-{k + 1}.{DIRECTIONS[k % 4]}(車)",
+                '單位': f"第{station_of_node[node] + 1:02d}派出所",
+                'LocationID': f"LOC_{node * 10 + k + 1}",
+                '經度': round(float(node_lon[node] + offset[0]), 6),
+                '緯度': round(float(node_lat[node] + offset[1]), 6),
+            })
+        node_cameras.append(np.array(indices, dtype=np.int64))
+
+    return {
+        'cameras': pd.DataFrame(records),
+        'rows': rows,
+        'cols': cols,
+        'node_lon': node_lon,
+        'node_lat': node_lat,
+        'node_cameras': node_cameras,
+    }
+
+# ==========================================
+# 2. 行駛與偵測
+# ==========================================
+def _route(world: dict, origin: int, dest: int) -> np.ndarray:
+    """棋盤格上的 L 形路線 (同一組起訖點永遠走同一條路，形成可被辨識的規律路徑)。"""
+    cols = world['cols']
+    n_nodes = len(world['node_cameras'])
+    r1, c1 = divmod(origin, cols)
+    r2, c2 = divmod(dest, cols)
+    col_steps = np.arange(c1, c2 + (1 if c2 >= c1 else -1), 1 if c2 >= c1 else -1)
+    row_steps = np.arange(r1, r2 + (1 if r2 >= r1 else -1), 1 if r2 >= r1 else -1)
+    if (origin + dest) % 2 == 0:
+        path = np.concatenate([r1 * cols + col_steps, row_steps[1:] * cols + c2])
+    else:
+        path = np.concatenate([row_steps * cols + c1, r2 * cols + col_steps[1:]])
+    # 棋盤最後一列可能不完整，超出範圍的路口直接略過
+    return path[path < n_nodes]
+
+def _drive(world: dict, rng: np.random.Generator, route: np.ndarray, depart: float, speed_kmh: float,
+           cameras: list = None):
+    """
+    沿路線行駛並產生偵測。每經過一個路口觸發 1~3 支攝影機 (間隔數秒)。
+
+    Args:
+        depart: 出發時間 (自起始日 00:00 起算的秒數)
+        cameras: 指定每個路口觸發的攝影機 (跟車時沿用前車的選擇)；None 表示隨機挑選
+
+    Returns:
+        (攝影機列索引, 偵測時間秒數, 各路口觸發的攝影機, 抵達時間)
+    """
+    legs = consecutive_distances(world['node_lon'][route], world['node_lat'][route]) if len(route) > 1 else np.zeros(0)
+    # 路口間的行駛時間 (市區道路折減 1.3 倍距離)，再加上每個路口 0~40 秒的停等
+    leg_seconds = legs * 1.3 / (speed_kmh / 3.6) + rng.uniform(0, 40, len(legs))
+    arrive = depart + np.concatenate([[0.0], np.cumsum(leg_seconds)])
+
+    if cameras is None:
+        cameras = []
+        for node in route:
+            options = world['node_cameras'][node]
+            count = int(rng.integers(1, min(3, len(options)) + 1))
+            cameras.append(rng.choice(options, size=count, replace=False))
+    cam_idx = np.concatenate(cameras) if cameras else np.zeros(0, dtype=np.int64)
+    times = np.concatenate([t + np.sort(rng.uniform(0, 12, len(c))) for t, c in zip(arrive, cameras)]) \
+        if cameras else np.zeros(0)
+    return cam_idx, times, cameras, float(arrive[-1]) if len(arrive) else depart
+
+# ==========================================
+# 3. 車隊行為
+# ==========================================
+def _new_plan(rng: np.random.Generator, n_nodes: int) -> dict:
+    """每台車固定的住家、工作地點、週末常去地點與行駛習慣。"""
+    home, work = rng.choice(n_nodes, size=2, replace=False)
+    return {
+        'home': int(home),
+        'work': int(work),
+        'leisure': [int(x) for x in rng.choice(n_nodes, size=2)],
+        'leave_hour': float(rng.uniform(7.3, 8.7)),
+        'return_hour': float(rng.uniform(17.2, 19.3)),
+        'speed_kmh': float(rng.uniform(28, 45)),
+    }
+
+def generate_synthetic_dataset(n_cameras: int = BASE_CAMERAS, n_plates: int = BASE_PLATES, n_days: int = BASE_DAYS,
+                               seed: int = 0, convoy_fraction: float = 0.2, meeting_fraction: float = 0.2,
+                               start_date: str = DEFAULT_START_DATE, bbox: tuple = DEFAULT_BBOX) -> pd.DataFrame:
+    """
+    產生合成車辨資料。
+
+    車輛行為:
+        - 通勤 (所有車輛)：工作日上午住家 → 工作地點、傍晚返家；偶爾塞車 (時間異常) 或下班後繞去其他地點 (少見路徑)；
+          週末到固定的休閒地點停留數小時。
+        - 車隊 (convoy_fraction 的車輛，2~3 台一組)：部分夜晚由領頭車前往隨機地點，其餘成員以數十秒的時間差
+          經過相同的攝影機 (領頭車標記 ConvoyID，跟隨車標記 FollowingID)。
+        - 碰面 (meeting_fraction 的車輛，兩兩一組)：部分工作日晚上兩車先後抵達同一路口並停留 30~90 分鐘。
+
+    Returns:
+        DataFrame: 欄位同內附資料集 (OUTPUT_COLUMNS)，依時間排序
+    """
+    rng = np.random.default_rng(seed)
+    world = generate_camera_network(n_cameras, seed=seed, bbox=bbox)
+    n_nodes = len(world['node_cameras'])
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+
+    width = max(4, len(str(n_plates)))
+    # 比例大於 0 時至少湊出一組 (小規模資料也包含車隊與碰面行為)
+    n_convoy = max(2, int(n_plates * convoy_fraction)) if convoy_fraction > 0 else 0
+    n_meeting = max(2, int(n_plates * meeting_fraction)) if meeting_fraction > 0 else 0
+    if n_convoy + n_meeting > n_plates:
+        raise ValueError(f"車輛數 {n_plates} 不足以分配車隊 ({n_convoy}) 與碰面 ({n_meeting}) 角色")
+    plates = ([f"DEL-{i:0{width}d}" for i in range(n_convoy)] +
+              [f"MEE-{i:0{width}d}" for i in range(n_meeting)] +
+              [f"NOR-{i:0{width}d}" for i in range(n_plates - n_convoy - n_meeting)])
+    plans = {plate: _new_plan(rng, n_nodes) for plate in plates}
+
+    # 分組：車隊 2~3 台一組 (第一台為領頭車)、碰面兩兩一組
+    convoy_groups, i = [], 0
+    while i + 1 < n_convoy:
+        size = min(int(rng.integers(2, 4)), n_convoy - i)
+        convoy_groups.append(plates[i:i + size])
+        i += size
+    meeting_pairs = [plates[n_convoy + j:n_convoy + j + 2] for j in range(0, n_meeting - 1, 2)]
+
+    chunks = []  # (攝影機列索引, 時間秒數, 車牌編號, 標記種類, 標記 ID)
+    plate_code = {plate: k for k, plate in enumerate(plates)}
+
+    def emit(plate, cam_idx, times, tag_kind=0, tag=''):
+        chunks.append((cam_idx, times, np.full(len(cam_idx), plate_code[plate]), tag_kind, tag))
+
+    for day in range(n_days):
+        day_start = day * 86400.0
+        date = start + timedelta(days=day)
+        weekday = date.weekday() < 5
+
+        # --- 通勤 / 週末 ---
+        for plate in plates:
+            plan = plans[plate]
+            if weekday:
+                leave = day_start + (plan['leave_hour'] + rng.normal(0, 0.15)) * 3600
+                # 約 5% 的行程遇到塞車 (時間明顯變長)
+                slow = 0.55 if rng.random() < 0.05 else 1.0
+                cam, t, _, _ = _drive(world, rng, _route(world, plan['home'], plan['work']), leave, plan['speed_kmh'] * slow)
+                emit(plate, cam, t)
+
+                back = day_start + (plan['return_hour'] + rng.normal(0, 0.2)) * 3600
+                if rng.random() < 0.1:
+                    # 下班後繞去其他地點停留一下再回家
+                    detour = int(rng.integers(n_nodes))
+                    cam, t, _, arrive = _drive(world, rng, _route(world, plan['work'], detour), back, plan['speed_kmh'])
+                    emit(plate, cam, t)
+                    cam, t, _, _ = _drive(world, rng, _route(world, detour, plan['home']),
+                                          arrive + rng.uniform(1800, 5400), plan['speed_kmh'])
+                else:
+                    slow = 0.55 if rng.random() < 0.05 else 1.0
+                    cam, t, _, _ = _drive(world, rng, _route(world, plan['work'], plan['home']), back, plan['speed_kmh'] * slow)
+                emit(plate, cam, t)
+            elif rng.random() < 0.6:
+                place = plan['leisure'][int(rng.integers(2))]
+                leave = day_start + rng.uniform(9.5, 14.0) * 3600
+                cam, t, _, arrive = _drive(world, rng, _route(world, plan['home'], place), leave, plan['speed_kmh'])
+                emit(plate, cam, t)
+                cam, t, _, _ = _drive(world, rng, _route(world, place, plan['home']),
+                                      arrive + rng.uniform(3600, 3 * 3600), plan['speed_kmh'])
+                emit(plate, cam, t)
+
+        # --- 碰面：兩車先後抵達同一路口並停留 ---
+        if weekday:
+            for pair in meeting_pairs:
+                if rng.random() >= 0.15:
+                    continue
+                spot = int(rng.integers(n_nodes))
+                meet_at = day_start + rng.uniform(19.75, 20.25) * 3600
+                stay = rng.uniform(1800, 5400)
+                for plate in pair:
+                    plan = plans[plate]
+                    route = _route(world, plan['home'], spot)
+                    # 估計行駛時間後回推出發時間，讓兩車在 ±5 分鐘內抵達
+                    _, _, _, arrive = _drive(world, np.random.default_rng(0), route, 0.0, plan['speed_kmh'])
+                    depart = meet_at - arrive + rng.uniform(-300, 300)
+                    cam, t, _, arrive = _drive(world, rng, route, depart, plan['speed_kmh'])
+                    emit(plate, cam, t)
+                    cam, t, _, _ = _drive(world, rng, _route(world, spot, plan['home']),
+                                          arrive + stay + rng.uniform(-120, 120), plan['speed_kmh'])
+                    emit(plate, cam, t)
+
+        # --- 車隊：領頭車夜間出發，跟隨車以固定時間差經過相同攝影機 ---
+        for group in convoy_groups:
+            if rng.random() >= 0.15:
+                continue
+            leader = group[0]
+            plan = plans[leader]
+            target = int(rng.integers(n_nodes))
+            for leg, (origin, dest) in enumerate([(plan['home'], target), (target, plan['home'])]):
+                convoy_id = f"CONVOY-{date:%Y%m%d}-{'OUT' if leg == 0 else 'RETURN'}-{int(rng.integers(1000, 10000))}"
+                depart = day_start + (rng.uniform(21.5, 23.0) if leg == 0 else rng.uniform(25.0, 26.5)) * 3600
+                route = _route(world, origin, dest)
+                cam, t, chosen, _ = _drive(world, rng, route, depart, plan['speed_kmh'])
+                emit(leader, cam, t, 1, convoy_id)
+                for rank, follower in enumerate(group[1:], start=1):
+                    lag = rank * rng.uniform(10, 40)
+                    f_cam, f_t, _, _ = _drive(world, rng, route, depart + lag, plan['speed_kmh'], cameras=chosen)
+                    emit(follower, f_cam, f_t, 2, convoy_id)
+
+    # --- 組成 DataFrame ---
+    cam_idx = np.concatenate([c[0] for c in chunks]).astype(np.int64)
+    seconds = np.concatenate([c[1] for c in chunks])
+    plate_idx = np.concatenate([c[2] for c in chunks])
+    sizes = [len(c[0]) for c in chunks]
+    tag_kind = np.repeat([c[3] for c in chunks], sizes)
+    tag = np.repeat(np.array([c[4] for c in chunks], dtype=object), sizes)
+
+    order = np.lexsort((plate_idx, seconds))
+    cameras = world['cameras'].iloc[cam_idx[order]].reset_index(drop=True)
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(np.round(seconds[order]), unit='s')
+    tag_kind, tag = tag_kind[order], tag[order]
+
+    df = pd.DataFrame({
+        '攝影機名稱': cameras['攝影機名稱'],
+        '車牌': np.array(plates, dtype=object)[plate_idx[order]],
+        '單位': cameras['單位'],
+        '日期': timestamps.strftime('%Y-%m-%d'),
+        '時間': timestamps.strftime('%H:%M:%S'),
+        '攝影機': cameras['攝影機'],
+        'LocationID': cameras['LocationID'],
+        '經度': cameras['經度'],
+        '緯度': cameras['緯度'],
+        'ConvoyID': np.where(tag_kind == 1, tag, None),
+        'FollowingID': np.where(tag_kind == 2, tag, None),
+    })
+    return df[OUTPUT_COLUMNS]
+
+def write_synthetic_dataset(output, **kwargs) -> Path:
+    """產生資料並寫成 CSV (UTF-8)。"""
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    generate_synthetic_dataset(**kwargs).to_csv(output, index=False)
+    return output
+
+def main():
+    parser = argparse.ArgumentParser(description="產生可重現的合成車辨資料")
+    parser.add_argument('--scale', type=float, default=None, help="相對內附資料集的倍數 (指定時忽略 --cameras/--plates/--days)")
+    parser.add_argument('--cameras', type=int, default=BASE_CAMERAS, help="攝影機數")
+    parser.add_argument('--plates', type=int, default=BASE_PLATES, help="車輛數")
+    parser.add_argument('--days', type=int, default=BASE_DAYS, help="天數")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    parser.add_argument('--convoy-fraction', type=float, default=0.2, help="車隊成員的比例")
+    parser.add_argument('--meeting-fraction', type=float, default=0.2, help="碰面車輛的比例")
+    parser.add_argument('--start-date', default=DEFAULT_START_DATE, help="起始日期 (YYYY-MM-DD)")
+    parser.add_argument('--output', '-o', required=True, help="輸出 CSV 路徑")
+    args = parser.parse_args()
+
+    if args.scale is not None:
+        params = scale_params(args.scale)
+    else:
+        params = {'n_cameras': args.cameras, 'n_plates': args.plates, 'n_days': args.days}
+    path = write_synthetic_dataset(args.output, seed=args.seed, convoy_fraction=args.convoy_fraction,
+                                   meeting_fraction=args.meeting_fraction, start_date=args.start_date, **params)
+    print(f"已產生 {path} ({params['n_cameras']} 支攝影機, {params['n_plates']} 台車, {params['n_days']} 天)")
+
+if __name__ == '__main__':
+    main()
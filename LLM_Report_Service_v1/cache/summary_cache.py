@@ -0,0 +1,172 @@
+# cache/summary_cache.py (單一車輛分析摘要快取：記憶體 LRU + 磁碟 LRU，依資料指紋自動失效)
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+
+FINGERPRINT_COLUMNS = ['datetime', '攝影機', '經度', '緯度']
+
+# ==========================================
+# 1. 指紋 (資料版本) 與參數雜湊
+# ==========================================
+def _digest(data: bytes, size: int = 16) -> str:
+    return hashlib.blake2b(data, digest_size=size).hexdigest()
+
+def frame_fingerprint(df: pd.DataFrame, columns: list = None) -> str:
+    """
+    DataFrame 內容的指紋 (與列的順序無關)：新增、刪除或修改任何一筆偵測紀錄都會改變指紋。
+    """
+    columns = [c for c in (columns or df.columns) if c in df.columns]
+    if df.empty:
+        return _digest(json.dumps(columns).encode('utf-8'))
+    row_hashes = np.sort(pd.util.hash_pandas_object(df[columns], index=False).to_numpy())
+    return _digest(row_hashes.tobytes() + json.dumps(columns, ensure_ascii=False).encode('utf-8'))
+
+def plate_fingerprint(vehicle_df: pd.DataFrame) -> str:
+    """單一車輛偵測紀錄的指紋；該車有新的偵測進來時指紋就會改變，舊快取自然失效。"""
+    return frame_fingerprint(vehicle_df, FINGERPRINT_COLUMNS)
+
+def params_hash(params: dict) -> str:
+    """分析參數的雜湊 (鍵的順序不影響結果)。"""
+    return _digest(json.dumps(params, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'), size=8)
+
+def cache_key(plate: str, fingerprint: str, params: dict) -> tuple:
+    return (plate, fingerprint, params_hash(params))
+
+# ==========================================
+# 2. 建立快取
+# ==========================================
+def create_summary_cache(directory=None, max_memory_items: int = 256, max_disk_items: int = 5000) -> dict:
+    """
+    建立摘要快取。
+
+    Args:
+        directory: 磁碟快取資料夾 (None 表示只使用記憶體)；多個行程可共用同一個資料夾
+        max_memory_items: 記憶體中最多保留的筆數 (LRU)
+        max_disk_items: 磁碟上最多保留的筆數 (依最後存取時間淘汰)
+    """
+    if directory is not None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+    return {
+        'directory': directory,
+        'memory': OrderedDict(),
+        'max_memory_items': max_memory_items,
+        'max_disk_items': max_disk_items,
+        'lock': threading.Lock(),
+        'key_locks': {},
+        'stats': {'memory_hits': 0, 'disk_hits': 0, 'misses': 0},
+    }
+
+def _plate_prefix(plate: str, params_digest: str) -> str:
+    return f"{_digest(plate.encode('utf-8'), size=8)}_{params_digest}_"
+
+def _disk_path(cache: dict, key: tuple) -> Path:
+    plate, fingerprint, params_digest = key
+    return cache['directory'] / f"{_plate_prefix(plate, params_digest)}{fingerprint}.pkl"
+
+# ==========================================
+# 3. 讀取 / 寫入
+# ==========================================
+def get_cached_summary(cache: dict, key: tuple, count_miss: bool = True):
+    """查詢快取 (先記憶體、再磁碟)；沒有命中時回傳 None。"""
+    with cache['lock']:
+        if key in cache['memory']:
+            cache['memory'].move_to_end(key)
+            cache['stats']['memory_hits'] += 1
+            return cache['memory'][key]
+
+    if cache['directory'] is not None:
+        path = _disk_path(cache, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # 更新存取時間，供 LRU 淘汰使用
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            value = None
+        if value is not None:
+            with cache['lock']:
+                cache['stats']['disk_hits'] += 1
+            _remember(cache, key, value)
+            return value
+
+    if count_miss:
+        with cache['lock']:
+            cache['stats']['misses'] += 1
+    return None
+
+def _remember(cache: dict, key: tuple, value):
+    """放入記憶體 LRU；同一台車、同一組參數的舊版本 (指紋不同) 直接移除。"""
+    plate, fingerprint, params_digest = key
+    with cache['lock']:
+        stale = [k for k in cache['memory'] if k[0] == plate and k[2] == params_digest and k[1] != fingerprint]
+        for k in stale:
+            del cache['memory'][k]
+        cache['memory'][key] = value
+        cache['memory'].move_to_end(key)
+        while len(cache['memory']) > cache['max_memory_items']:
+            cache['memory'].popitem(last=False)
+
+def put_cached_summary(cache: dict, key: tuple, value):
+    """寫入快取。磁碟寫入先寫暫存檔再原子性地改名，多個行程同時寫入也不會讀到半個檔案。"""
+    _remember(cache, key, value)
+    directory = cache['directory']
+    if directory is None:
+        return
+
+    plate, fingerprint, params_digest = key
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, _disk_path(cache, key))
+
+    # 同一台車、同一組參數的舊版本已經失效
+    for old in directory.glob(f"{_plate_prefix(plate, params_digest)}*.pkl"):
+        if old.name != _disk_path(cache, key).name:
+            old.unlink(missing_ok=True)
+    _evict_disk(cache)
+
+def _evict_disk(cache: dict):
+    """磁碟筆數超過上限時，刪除最久沒有存取的檔案。"""
+    files = list(cache['directory'].glob('*.pkl'))
+    excess = len(files) - cache['max_disk_items']
+    if excess <= 0:
+        return
+    def _mtime(path):
+        try:
+            return path.stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+    for path in sorted(files, key=_mtime)[:excess]:
+        path.unlink(missing_ok=True)
+
+def get_or_compute(cache: dict, key: tuple, compute):
+    """
+    有快取就直接回傳，否則呼叫 compute() 計算並寫入。
+    同一個鍵同時有多個請求時只會計算一次，其餘請求等待並共用結果。
+    compute() 回傳 None (例如資料不足) 時不寫入快取。
+    """
+    value = get_cached_summary(cache, key)
+    if value is not None:
+        return value
+
+    with cache['lock']:
+        key_lock = cache['key_locks'].setdefault(key, threading.Lock())
+    with key_lock:
+        # 等待期間可能已由其他請求算好
+        value = get_cached_summary(cache, key, count_miss=False)
+        if value is None:
+            value = compute()
+            if value is not None:
+                put_cached_summary(cache, key, value)
+    with cache['lock']:
+        cache['key_locks'].pop(key, None)
+    return value
@@ -0,0 +1,611 @@
+# cli.py (非互動式命令列介面：批次執行各項分析並輸出 JSON / CSV)
+#
+# 執行方式 (於 LLM_Report_Service_v1 目錄下):
+#     python cli.py --data data/realistic_vehicle_dataset1.csv --output out.json report --plates ABC-1234 --no-llm
+#     python cli.py --format csv --output convoy.csv convoy --plates-file plates.txt --workers 4
+#     python cli.py meeting --pair ABC-1234 XYZ-5678 --distance 80
+#     python cli.py similarity --plates ABC-1234 --min-route-len 3
+#     python cli.py similarity --plates ABC-1234 --metric lcss --relative-time   (行程軌跡相似度：路線大致相同、允許小幅偏離)
+#     python cli.py fleet --min-locations 5
+#     python cli.py --profile --profile-output convoy.json convoy --plates ABC-1234   (speedscope 剖析檔；未指定路徑時寫到 profiles/)
+#     python cli.py --metrics-log stages.jsonl --metrics-prom stages.prom --stage-timing report --plates ABC-1234 --no-llm
+#     python cli.py --data data/store --start 2025-08-01 --end 2025-08-07 convoy --plates ABC-1234  (分區資料夾只讀取該週)
+#     python cli.py build-index copresence --path data/indexes/copresence       (建立一次，之後以 --copresence-index 開啟)
+#     python cli.py --copresence-index data/indexes/copresence similarity --plates ABC-1234
+#     python cli.py build-index transition-graph --path data/indexes/transition_graph.npz
+#     python cli.py --transition-graph data/indexes/transition_graph.npz convoy --plates ABC-1234
+#     python cli.py build-index trip-lsh --path data/indexes/trip_lsh        (資料夾已存在時只追加 / 更新行程)
+#     python cli.py --trip-lsh-index data/indexes/trip_lsh --lsh-min-similarity 0.3 convoy --plates ABC-1234
+#     python cli.py --start 2025-08-01 --end 2025-08-07 colocation --area Area-012 --level 200m --min-dwell 30
+#     python cli.py --start 2025-08-01 --end 2025-08-01 colocation --point 121.11 24.90 --radius 150 --top-n 20
+
+import argparse
+import contextlib
+import json
+import sys
+from pathlib import Path
+
+from data_loader import load_vehicle_data, DEFAULT_DATA_PATH
+from monitoring.profiler import add_profile_arguments, profile_from_args
+
+# pandas / numpy 與各分析器都在實際執行子命令時才載入，--help 與參數錯誤可以立即回應
+
+# ==========================================
+# 1. 參數與輸入
+# ==========================================
+def _read_plates(args, full_data: 'pd.DataFrame') -> list:
+    """合併 --plates 與 --plates-file (一行一個車牌，# 開頭為註解)，未指定時回傳全部車牌。"""
+    plates = list(args.plates or [])
+    if args.plates_file:
+        for line in Path(args.plates_file).read_text(encoding='utf-8').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                plates.append(line)
+    if not plates:
+        return sorted(full_data['車牌'].unique())
+
+    known = set(full_data['車牌'].unique())
+    missing = [p for p in plates if p not in known]
+    if missing:
+        print(f"警告：資料中找不到以下車牌，將略過：{', '.join(missing)}", file=sys.stderr)
+    return [p for p in dict.fromkeys(plates) if p in known]
+
+def _read_pairs(args) -> list:
+    """合併 --pair 與 --pairs-file (一行一組 '車牌A,車牌B')。"""
+    pairs = [tuple(p) for p in (args.pair or [])]
+    if args.pairs_file:
+        for line in Path(args.pairs_file).read_text(encoding='utf-8').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                plate_a, plate_b = [x.strip() for x in line.split(',')[:2]]
+                pairs.append((plate_a, plate_b))
+    return pairs
+
+def _pushdown_plates(args):
+    """
+    讀取資料時可以只載入的車牌 (None 為全部)。
+    只有 meeting 只用到配對中的車牌；report / convoy 等分析需要全部車輛 (攝影機分群、候選隨行車)。
+    指定 --copresence-index 時需載入全部資料，才能確認索引與資料一致。
+    """
+    if args.command != 'meeting' or args.copresence_index:
+        return None
+    return sorted({plate for pair in _read_pairs(args) for plate in pair})
+
+def _load_range(args) -> tuple:
+    """
+    讀取資料的日期範圍。colocation 的 --start / --end 是查詢區間，停留時間需要區間前後的軌跡，
+    因此讀取範圍前後各多讀 DEFAULT_CONTEXT_HOURS 小時。
+    """
+    if args.command != 'colocation' or (args.start is None and args.end is None):
+        return args.start, args.end
+    import pandas as pd
+    from data_loader import parse_date_range
+    from analysis.colocation_query import DEFAULT_CONTEXT_HOURS
+
+    start_ts, end_ts = parse_date_range(args.start, args.end)
+    context = pd.Timedelta(hours=DEFAULT_CONTEXT_HOURS)
+    return (start_ts - context if start_ts is not None else None,
+            end_ts + context if end_ts is not None else None)
+
+def _require_location_id(full_data: 'pd.DataFrame'):
+    if 'LocationID' not in full_data.columns:
+        raise ValueError("資料中缺少 'LocationID' 欄位，無法執行此分析。")
+
+def open_copresence_index(path, full_data: 'pd.DataFrame') -> dict:
+    """以 memory map 開啟 build-index 建立的共現索引，並確認索引與載入的資料一致 (API 亦共用)。"""
+    from analysis.copresence_index import load_copresence_index, check_index_matches
+
+    index = load_copresence_index(path, mmap=True)
+    check_index_matches(index, full_data)
+    return index
+
+def open_transition_graph(path, full_data: 'pd.DataFrame') -> dict:
+    """載入 build-index 建立的攝影機轉移圖 (API 亦共用)。"""
+    from analysis.camera_graph import load_transition_graph
+
+    graph = load_transition_graph(path)
+    if graph['node_col'] not in full_data.columns:
+        raise ValueError(f"資料中缺少轉移圖的節點欄位 '{graph['node_col']}'。")
+    return graph
+
+def open_trip_lsh_index(path) -> dict:
+    """載入 build-index 建立的行程 LSH 索引 (API 亦共用)。"""
+    from analysis.trip_lsh_index import load_trip_lsh_index
+
+    if not (Path(path) / 'meta.json').exists():
+        raise FileNotFoundError(f"找不到行程 LSH 索引: {path}")
+    return load_trip_lsh_index(path)
+
+# ==========================================
+# 2. 各項分析 (重用既有分析函式，回傳可序列化的紀錄；api/endpoints.py 亦共用)
+# ==========================================
+def report_records(full_data: 'pd.DataFrame', plates: list, use_llm: bool = True, area_hierarchy: dict = None,
+                   summary_cache: dict = None, llm_backend: dict = None, batch_size: int = 1,
+                   transition_graph: dict = None, prompt_token_budget: int = None, dataset: dict = None) -> list:
+    """
+    dataset (選用，analysis/shared_dataset.py) 提供時各車資料直接由共用陣列切出；
+    未提供且有多台車時以 'local' 後端建立一份，省去每台車都篩選整份資料。
+    """
+    from analysis.area_hierarchy import build_area_hierarchy
+    from analysis.shared_dataset import create_shared_dataset
+    from prompts.report_prompt import REPORT_SECTIONS
+    from monitoring.stage_metrics import stage_span
+    from reporting_service import run_llm_reporting_flow, run_batch_reporting_flow, REPORT_AREA_RADIUS_METERS
+
+    if area_hierarchy is None:
+        unique_cameras = full_data[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+        with stage_span('report.clustering', rows_in=len(unique_cameras)):
+            area_hierarchy = build_area_hierarchy(unique_cameras, radii=(50, REPORT_AREA_RADIUS_METERS))
+    if dataset is None and len(plates) > 1:
+        dataset = create_shared_dataset(full_data, location_col='LocationID', backend='local')
+
+    if use_llm and batch_size > 1:
+        results = run_batch_reporting_flow(full_data, plates, area_hierarchy=area_hierarchy, summary_cache=summary_cache,
+                                           llm_backend=llm_backend, batch_size=batch_size,
+                                           transition_graph=transition_graph, prompt_token_budget=prompt_token_budget,
+                                           dataset=dataset)
+    else:
+        results = [run_llm_reporting_flow(full_data, plate, area_hierarchy=area_hierarchy, use_llm=use_llm,
+                                          summary_cache=summary_cache, llm_backend=llm_backend,
+                                          transition_graph=transition_graph, prompt_token_budget=prompt_token_budget,
+                                          dataset=dataset)
+                   for plate in plates]
+
+    records = []
+    for plate, result in zip(plates, results):
+        if result is None:
+            records.append({'plate': plate, 'status': 'insufficient_data'})
+            continue
+        # 結構化報告的各段落攤平成獨立欄位，CSV 輸出時每個段落一欄
+        structured = result['llm_report_structured'] or {}
+        records.append({'plate': plate, 'status': 'ok', 'llm_report': result['llm_report'],
+                        **{f'report_{field}': structured.get(field) for field, _ in REPORT_SECTIONS},
+                        'referenced_area_ids': structured.get('referenced_area_ids'),
+                        'deanonymized_report': result['deanonymized_report'],
+                        'summary': result['summary'], 'area_map': result['area_map']})
+    return records
+
+def convoy_records(full_data: 'pd.DataFrame', plates: list, min_segment_length: int = 20,
+                   n_workers: int = None, copresence_index: dict = None, transition_graph: dict = None,
+                   route_matcher: dict = None, trip_lsh_index: dict = None, lsh_min_similarity: float = None,
+                   dataset: dict = None) -> list:
+    """
+    route_matcher (選用) 提供時每筆紀錄加上目標車行程的推估完整路徑 'matched_trip_path'。
+    trip_lsh_index / lsh_min_similarity 見 analyze_convoy_partners (未指定門檻時只影響比對順序)。
+    dataset (選用) 為共用資料集；未使用共現索引且未提供時建立一份 (平行掃描時放在共用記憶體，否則為 'local')。
+    """
+    import numpy as np
+    from analysis.convoy_analyzer import analyze_convoy_partners, matched_trip_path
+
+    _require_location_id(full_data)
+    records = []
+    with contextlib.ExitStack() as stack:
+        # 所有目標車共用同一份資料集 (平行掃描時子行程直接附加)，不必每台車重建或篩選整份資料
+        if dataset is None and copresence_index is None:
+            from analysis.shared_dataset import shared_dataset
+            dataset = stack.enter_context(shared_dataset(full_data, location_col='LocationID',
+                                                         backend=None if n_workers else 'local'))
+        results = [analyze_convoy_partners(full_data, plate, n_workers=n_workers, copresence_index=copresence_index,
+                                           transition_graph=transition_graph, min_segment_length=min_segment_length,
+                                           trip_lsh_index=trip_lsh_index, lsh_min_similarity=lsh_min_similarity,
+                                           dataset=dataset) for plate in plates]
+
+    for plate, result in zip(plates, results):
+        for trip in result['analyzed_trips']:
+            trip_info = trip['trip_info']
+            matched = {}
+            if route_matcher is not None and trip['convoy_partners']:
+                matched['matched_trip_path'] = ' -> '.join(matched_trip_path(route_matcher, trip['target_trip_df']))
+            for partner in trip['convoy_partners']:
+                records.append({
+                    'target_plate': plate,
+                    'trip_start': trip_info['start_time'],
+                    'trip_end': trip_info['end_time'],
+                    'trip_locations': len(trip['target_trip_df']),
+                    **matched,
+                    'partner_plate': partner['plate'],
+                    'segment_length': partner['segment_length'],
+                    'start_time': partner['start_time'],
+                    'end_time': partner['end_time'],
+                    'start_loc_id': partner['start_loc_id'],
+                    'end_loc_id': partner['end_loc_id'],
+                    'avg_lag_seconds': round(float(np.mean(partner['time_lags'])), 1),
+                })
+    return records
+
+def meeting_records(full_data: 'pd.DataFrame', pairs: list, distance_threshold_meters: float = 80,
+                    copresence_index: dict = None) -> list:
+    """copresence_index (選用) 提供時每筆碰面加上 same_camera_hits (兩車被同一支攝影機拍到的次數)。"""
+    from analysis.meeting_analyzer import run_dual_vehicle_meeting_analysis
+
+    records = []
+    for plate_a, plate_b in pairs:
+        df_a = full_data[full_data['車牌'] == plate_a].copy()
+        df_b = full_data[full_data['車牌'] == plate_b].copy()
+        meetings = run_dual_vehicle_meeting_analysis(df_a, df_b, plate_a, plate_b, copresence_index=copresence_index,
+                                                     distance_threshold_meters=distance_threshold_meters)
+        records.extend({'plate_a': plate_a, 'plate_b': plate_b, **m} for m in meetings)
+    return records
+
+SIMILARITY_METRICS = ('routes', 'lcss', 'dtw')
+
+def check_similarity_options(metric: str, relative_time: bool = False, lsh_min_similarity: float = None):
+    """檢查 similarity 的參數組合 (CLI 與 API 共用)。"""
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"未知的相似度方法 '{metric}' (可用: {', '.join(SIMILARITY_METRICS)})。")
+    if relative_time and metric != 'lcss':
+        raise ValueError("relative_time 只適用於 lcss。")
+    if lsh_min_similarity is not None and metric != 'routes':
+        raise ValueError("lsh_min_similarity 只適用於 routes (事件驅動同行路徑)。")
+
+def build_trip_similarity_index(full_data: 'pd.DataFrame', route_matcher: dict = None) -> dict:
+    """
+    全車隊行程序列的相似度搜尋索引 (見 analysis/trajectory_similarity.py；API 亦共用)。
+    提供 route_matcher 時行程以其轉移圖的節點欄位切分，補上的攝影機才能與原序列比對。
+    """
+    from analysis.trajectory_kernel import graph_node_col
+    from analysis.trajectory_similarity import build_fleet_trip_sequences, build_similarity_index
+
+    node_col = graph_node_col(route_matcher['graph'] if route_matcher is not None else None)
+    return build_similarity_index(build_fleet_trip_sequences(full_data, node_col=node_col, route_matcher=route_matcher))
+
+def trip_similarity_records(full_data: 'pd.DataFrame', plates: list, metric: str = 'lcss', top_n: int = 3,
+                            time_tolerance_minutes: int = 5, relative_time: bool = False,
+                            route_matcher: dict = None, similarity_index: dict = None) -> list:
+    """
+    目標車每個行程最相似的其他車輛行程 (LCSS / DTW，路線大致相同但允許小幅偏離)；
+    每個目標行程輸出前 top_n 筆。similarity_index 未提供時以 build_trip_similarity_index 建立一次。
+    """
+    from analysis.trajectory_similarity import run_trajectory_similarity_search
+
+    if similarity_index is None:
+        similarity_index = build_trip_similarity_index(full_data, route_matcher=route_matcher)
+    trips = similarity_index['trips']
+    records = []
+    for plate in plates:
+        searches = run_trajectory_similarity_search(full_data, plate, top_k=top_n, metric=metric,
+                                                    time_tolerance_minutes=time_tolerance_minutes,
+                                                    relative_time=relative_time, similarity_index=similarity_index)
+        for search in searches:
+            target = trips[search['target_trip_id']]
+            for rank, result in enumerate(search['results'], start=1):
+                records.append({
+                    'target_plate': plate,
+                    'metric': metric,
+                    'target_trip_id': search['target_trip_id'],
+                    'target_start': target['start_time'],
+                    'target_end': target['end_time'],
+                    'rank': rank,
+                    'partner_plate': result['plate'],
+                    'partner_trip_id': result['trip_id'],
+                    'start_time': result['start_time'],
+                    'end_time': result['end_time'],
+                    'score': result['score'],
+                    'shared_locations': result['shared_locations'],
+                    'estimated_jaccard': result['estimated_jaccard'],
+                })
+    return records
+
+def similarity_records(full_data: 'pd.DataFrame', plates: list, min_route_len: int = 2,
+                       time_tolerance_minutes: int = 5, top_n: int = 3, copresence_index: dict = None,
+                       route_matcher: dict = None, trip_lsh_index: dict = None, lsh_min_similarity: float = None,
+                       metric: str = 'routes', relative_time: bool = False, similarity_index: dict = None) -> list:
+    """
+    metric='routes' (預設) 為事件驅動同行路徑 (find_common_routes)：
+    route_matcher (選用) 提供時同行路徑先補上未拍到的攝影機再歸類；
+    trip_lsh_index / lsh_min_similarity 同 convoy_records (見 find_common_routes)。
+    metric='lcss' / 'dtw' 改為行程軌跡相似度搜尋 (見 trip_similarity_records；relative_time 只用於 lcss)。
+    """
+    from analysis.similarity_analyzer_bin import find_common_routes
+
+    check_similarity_options(metric, relative_time, lsh_min_similarity)
+    _require_location_id(full_data)
+    if metric != 'routes':
+        return trip_similarity_records(full_data, plates, metric=metric, top_n=top_n,
+                                       time_tolerance_minutes=time_tolerance_minutes, relative_time=relative_time,
+                                       route_matcher=route_matcher, similarity_index=similarity_index)
+    records = []
+    for plate in plates:
+        routes = find_common_routes(full_data, plate, min_route_len=min_route_len,
+                                    time_tolerance_minutes=time_tolerance_minutes, top_n=top_n,
+                                    copresence_index=copresence_index, route_matcher=route_matcher,
+                                    trip_lsh_index=trip_lsh_index, lsh_min_similarity=lsh_min_similarity)
+        for rank, route in enumerate(routes, start=1):
+            records.append({
+                'target_plate': plate,
+                'rank': rank,
+                'route': ' -> '.join(route['route_tuple']),
+                'count': route['count'],
+                'partners': ', '.join(sorted({inst['partner'] for inst in route['instances']})),
+                'avg_target_time_min': round(float(route['summary']['avg_target_time_min']), 1),
+                'avg_partner_time_min': round(float(route['summary']['avg_partner_time_min']), 1),
+                'time_period_summary': route['summary']['time_period_summary'],
+            })
+    return records
+
+def fleet_records(full_data: 'pd.DataFrame', min_members: int = 2, min_locations: int = 3, max_workers: int = None) -> list:
+    from analysis.fleet_convoy_miner import mine_fleet_convoys
+
+    key_col = 'LocationID' if 'LocationID' in full_data.columns else '攝影機'
+    groups = mine_fleet_convoys(full_data, key_col=key_col, min_members=min_members,
+                                min_locations=min_locations, max_workers=max_workers)
+    groups['locations'] = groups['locations'].apply(' -> '.join)
+    return groups.to_dict('records')
+
+def colocation_records(full_data: 'pd.DataFrame', start=None, end=None, area_id=None, level: str = '200m',
+                       lon: float = None, lat: float = None, radius_meters: float = 100, min_dwell_minutes: float = 0,
+                       top_n: int = None, colocation_index: dict = None, area_hierarchy: dict = None) -> list:
+    from analysis.colocation_query import build_colocation_index, who_was_here
+    from analysis.result_types import table_records
+
+    if colocation_index is None:
+        colocation_index = build_colocation_index(full_data, area_hierarchy)
+    table = who_was_here(colocation_index, start=start, end=end, area_id=area_id, level=level, lon=lon, lat=lat,
+                         radius_meters=radius_meters, min_dwell_minutes=min_dwell_minutes, top_n=top_n)
+    return table_records(table)
+
+def build_index_records(full_data: 'pd.DataFrame', kind: str, path) -> list:
+    """建立索引並存檔，回傳一筆摘要紀錄 (索引種類、路徑、項目數)。"""
+    if kind == 'copresence':
+        from analysis.copresence_index import build_copresence_index, save_copresence_index
+
+        _require_location_id(full_data)
+        index = build_copresence_index(full_data)
+        save_copresence_index(index, path)
+        return [{'kind': kind, 'path': str(path), 'entries': int(len(index['post_plate'])),
+                 'data_fingerprint': index['meta']['data_fingerprint']}]
+    if kind == 'transition-graph':
+        from analysis.camera_graph import build_camera_transition_graph, save_transition_graph
+
+        node_col = 'LocationID' if 'LocationID' in full_data.columns else '攝影機'
+        graph = build_camera_transition_graph(full_data, node_col=node_col)
+        path = Path(path) if str(path).endswith('.npz') else Path(f"{path}.npz")   # np.savez 會自動補上副檔名
+        save_transition_graph(graph, path)
+        return [{'kind': kind, 'path': str(path), 'entries': int(len(graph['indices'])), 'node_col': node_col}]
+    if kind == 'trip-lsh':
+        from analysis.area_hierarchy import build_area_hierarchy, area_table_for_level, level_name
+        from analysis.trip_lsh_index import build_trip_lsh_index, save_trip_lsh_index
+        from reporting_service import REPORT_AREA_RADIUS_METERS
+
+        # 既有索引只追加新行程；被新資料延長的行程會取代舊的部分行程
+        index = open_trip_lsh_index(path) if (Path(path) / 'meta.json').exists() else None
+        unique_cameras = full_data[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機'])
+        hierarchy = build_area_hierarchy(unique_cameras.reset_index(drop=True), radii=(REPORT_AREA_RADIUS_METERS,))
+        index = build_trip_lsh_index(full_data, area_table_for_level(hierarchy, level_name(REPORT_AREA_RADIUS_METERS)),
+                                     index=index)
+        save_trip_lsh_index(index, path)
+        return [{'kind': kind, 'path': str(path), 'entries': sum(len(t) for t in index['plate_trips'].values()),
+                 'plates': len(index['plates'])}]
+    raise ValueError(f"未知的索引種類 '{kind}'")
+
+def cmd_report(args, full_data):
+    summary_cache = None
+    if args.cache_dir:
+        from cache.summary_cache import create_summary_cache
+        summary_cache = create_summary_cache(args.cache_dir)
+    llm_backend = None
+    if args.llm_backend and not args.no_llm:
+        from llm_clients.backends import create_backend
+        llm_backend = create_backend(args.llm_backend)
+    return report_records(full_data, _read_plates(args, full_data), use_llm=not args.no_llm,
+                          summary_cache=summary_cache, llm_backend=llm_backend, batch_size=args.batch_size,
+                          transition_graph=_transition_graph(args, full_data),
+                          prompt_token_budget=args.prompt_token_budget)
+
+def _copresence_index(args, full_data):
+    return open_copresence_index(args.copresence_index, full_data) if args.copresence_index else None
+
+def _transition_graph(args, full_data):
+    return open_transition_graph(args.transition_graph, full_data) if args.transition_graph else None
+
+def _trip_lsh_index(args):
+    return open_trip_lsh_index(args.trip_lsh_index) if args.trip_lsh_index else None
+
+def _route_matcher(transition_graph):
+    if transition_graph is None:
+        return None
+    from analysis.route_matcher import build_route_matcher
+    return build_route_matcher(transition_graph)
+
+def cmd_convoy(args, full_data):
+    transition_graph = _transition_graph(args, full_data)
+    return convoy_records(full_data, _read_plates(args, full_data), min_segment_length=args.min_segment_length,
+                          n_workers=args.workers, copresence_index=_copresence_index(args, full_data),
+                          transition_graph=transition_graph, route_matcher=_route_matcher(transition_graph),
+                          trip_lsh_index=_trip_lsh_index(args), lsh_min_similarity=args.lsh_min_similarity)
+
+def cmd_meeting(args, full_data):
+    return meeting_records(full_data, _read_pairs(args), distance_threshold_meters=args.distance,
+                           copresence_index=_copresence_index(args, full_data))
+
+def cmd_similarity(args, full_data):
+    return similarity_records(full_data, _read_plates(args, full_data), min_route_len=args.min_route_len,
+                              time_tolerance_minutes=args.time_tolerance, top_n=args.top_n,
+                              copresence_index=_copresence_index(args, full_data),
+                              route_matcher=_route_matcher(_transition_graph(args, full_data)),
+                              trip_lsh_index=_trip_lsh_index(args), lsh_min_similarity=args.lsh_min_similarity,
+                              metric=args.metric, relative_time=args.relative_time)
+
+def cmd_fleet(args, full_data):
+    return fleet_records(full_data, min_members=args.min_members, min_locations=args.min_locations,
+                         max_workers=args.workers)
+
+def cmd_build_index(args, full_data):
+    return build_index_records(full_data, args.kind, args.path)
+
+def cmd_colocation(args, full_data):
+    lon, lat = args.point if args.point else (None, None)
+    return colocation_records(full_data, start=args.start, end=args.end, area_id=args.area, level=args.level,
+                              lon=lon, lat=lat, radius_meters=args.radius, min_dwell_minutes=args.min_dwell,
+                              top_n=args.top_n)
+
+# ==========================================
+# 3. 輸出
+# ==========================================
+def _json_default(value):
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return str(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, (np.ndarray, set, tuple)):
+        return list(value)
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict('records')
+    return str(value)
+
+def to_jsonable(records: list) -> list:
+    """將紀錄轉成只含 JSON 基本型別的結構 (時間轉字串、NumPy 數值轉 Python 數值)。"""
+    return json.loads(json.dumps(records, ensure_ascii=False, default=_json_default))
+
+def write_records(records: list, output, fmt: str):
+    """將紀錄寫成 JSON (預設) 或 CSV；output 為 None 時寫到標準輸出。"""
+    if fmt == 'csv':
+        import pandas as pd
+
+        frame = pd.DataFrame(records)
+        for col in frame.columns:
+            if frame[col].map(lambda v: isinstance(v, (dict, list))).any():
+                frame[col] = frame[col].map(lambda v: json.dumps(v, ensure_ascii=False, default=_json_default))
+        text = frame.to_csv(index=False)
+    else:
+        text = json.dumps(records, ensure_ascii=False, indent=2, default=_json_default) + '\n'
+
+    if output:
+        Path(output).write_text(text, encoding='utf-8-sig' if fmt == 'csv' else 'utf-8')
+        print(f"已輸出 {len(records)} 筆結果至 {output}", file=sys.stderr)
+    else:
+        sys.stdout.write(text)
+
+# ==========================================
+# 4. 主程式
+# ==========================================
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="車輛軌跡智慧分析系統 (非互動式命令列)",
+                                     allow_abbrev=False)  # 子命令的 --metric 不可被當成 --metrics-* 的縮寫
+    parser.add_argument('--data', default=str(DEFAULT_DATA_PATH),
+                        help="資料 CSV 路徑，或以 partitioned_store.py 建立的分區資料夾")
+    parser.add_argument('--start', help="只分析此日期 (含) 之後的資料，格式 YYYY-MM-DD")
+    parser.add_argument('--end', help="只分析到此日期 (含當天) 為止的資料，格式 YYYY-MM-DD")
+    parser.add_argument('--output', '-o', help="輸出檔案路徑 (預設輸出到標準輸出)")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help="輸出格式")
+    parser.add_argument('--metrics-log', help="將各分析階段的耗時 / 記憶體 / 筆數紀錄以 JSON Lines 附加到此檔案")
+    parser.add_argument('--metrics-prom', help="結束時將各階段累計值寫成 Prometheus 文字格式檔案")
+    parser.add_argument('--stage-timing', action='store_true', help="結束時在 stderr 列出各階段累計耗時")
+    parser.add_argument('--copresence-index', help="以 memory map 開啟的共現索引資料夾 (build-index copresence 建立；"
+                                                   "convoy / similarity / meeting 使用，需與 --data / --start / --end 相同)")
+    parser.add_argument('--transition-graph', help="build-index transition-graph 建立的攝影機轉移圖 (.npz)；"
+                                                   "report / convoy 的行程切分改用學習旅行時間門檻，"
+                                                   "convoy / similarity 另以此圖補全未拍到的攝影機")
+    parser.add_argument('--trip-lsh-index', help="build-index trip-lsh 建立的行程 LSH 索引資料夾；"
+                                                 "convoy 依路線相似度排列候選同行車；搭配 --lsh-min-similarity 時"
+                                                 "convoy / similarity 只比對路線相似的車輛")
+    parser.add_argument('--lsh-min-similarity', type=float, default=None,
+                        help="搭配 --trip-lsh-index：只比對路線相似度 >= 此值的車輛 (較快，但可能漏掉只同行一小段的車輛；"
+                             "預設不篩選)")
+    add_profile_arguments(parser)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_plate_args(p):
+        p.add_argument('--plates', nargs='+', help="目標車牌 (可多個)")
+        p.add_argument('--plates-file', help="車牌清單檔 (一行一個車牌)；未指定車牌時分析全部車輛")
+
+    p = sub.add_parser('report', help="單一車輛軌跡分析報告")
+    add_plate_args(p)
+    p.add_argument('--no-llm', action='store_true', help="不呼叫 LLM，只輸出本地分析結果")
+    p.add_argument('--cache-dir', help="摘要快取資料夾 (資料未變更的車輛直接使用上次的分析結果)")
+    p.add_argument('--llm-backend', choices=['openai', 'local', 'mock'],
+                   help="LLM 後端 (預設依 LLM_BACKEND 環境變數，未設定時為 openai)")
+    p.add_argument('--batch-size', type=int, default=1,
+                   help="每次 LLM 請求合併的車輛數 (大於 1 時使用批次提示詞，最多 26)")
+    p.add_argument('--prompt-token-budget', type=int, default=None,
+                   help="每台車提示詞的 token 上限 (超過時依重要性截斷長尾內容；預設不限制)")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser('convoy', help="目標行程導向隨行分析")
+    add_plate_args(p)
+    p.add_argument('--min-segment-length', type=int, default=20, help="同行片段最少地點數")
+    p.add_argument('--workers', type=int, default=None, help="平行掃描的行程數 (預設不平行)")
+    p.set_defaults(func=cmd_convoy)
+
+    p = sub.add_parser('meeting', help="雙車碰面分析")
+    p.add_argument('--pair', nargs=2, action='append', metavar=('PLATE_A', 'PLATE_B'), help="要比對的兩台車 (可重複)")
+    p.add_argument('--pairs-file', help="車牌配對檔 (一行一組 '車牌A,車牌B')")
+    p.add_argument('--distance', type=float, default=80, help="視為碰面的最大距離 (公尺)")
+    p.set_defaults(func=cmd_meeting)
+
+    p = sub.add_parser('similarity', help="事件驅動同行路徑分析 / 行程軌跡相似度搜尋")
+    add_plate_args(p)
+    p.add_argument('--metric', choices=SIMILARITY_METRICS, default='routes',
+                   help="routes: 事件驅動同行路徑 (預設)；lcss / dtw: 行程軌跡相似度 (路線大致相同、允許小幅偏離)")
+    p.add_argument('--relative-time', action='store_true',
+                   help="lcss 以行程起點為時間零點 (找走相同路線、但不一定同時出現的車)")
+    p.add_argument('--min-route-len', type=int, default=2, help="同行路徑最少地點數 (routes)")
+    p.add_argument('--time-tolerance', type=int, default=5, help="同地點時間容忍度 (分鐘；routes / lcss)")
+    p.add_argument('--top-n', type=int, default=3, help="每台車輸出的最頻繁路徑數 (lcss / dtw 為每個行程的最相似行程數)")
+    p.set_defaults(func=cmd_similarity)
+
+    p = sub.add_parser('fleet', help="全車隊同行群組探勘")
+    p.add_argument('--min-members', type=int, default=2, help="群組最少車輛數")
+    p.add_argument('--min-locations', type=int, default=3, help="最少連續共同經過的地點數")
+    p.add_argument('--workers', type=int, default=None, help="行程數 (預設為 CPU 核心數)")
+    p.set_defaults(func=cmd_fleet)
+
+    p = sub.add_parser('colocation', help="反向查詢：時間區間內 (--start / --end) 出現在指定區域或座標半徑內的車輛")
+    p.add_argument('--area', help="區域 ID (--level 層級的 LocationAreaID；camera 層級為攝影機編號)")
+    p.add_argument('--level', default='200m', help="區域層級 (camera / 50m / 200m / district，預設 200m)")
+    p.add_argument('--point', nargs=2, type=float, metavar=('LON', 'LAT'), help="以座標為中心查詢 (與 --area 擇一)")
+    p.add_argument('--radius', type=float, default=100, help="--point 的查詢半徑 (公尺)")
+    p.add_argument('--min-dwell', type=float, default=0, help="最短停留時間 (分鐘)")
+    p.add_argument('--top-n', type=int, default=None, help="只輸出停留時間最長的前 N 台車")
+    p.set_defaults(func=cmd_colocation)
+
+    p = sub.add_parser('build-index', help="依 --data / --start / --end 的資料建立索引並存檔")
+    p.add_argument('kind', choices=['copresence', 'transition-graph', 'trip-lsh'], help="索引種類")
+    p.add_argument('--path', required=True,
+                   help="索引存放位置 (copresence / trip-lsh 為資料夾，transition-graph 為 .npz 檔)")
+    p.set_defaults(func=cmd_build_index)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'meeting' and not (args.pair or args.pairs_file):
+        raise SystemExit("錯誤：meeting 需要 --pair 或 --pairs-file。")
+    if args.command == 'colocation' and (args.area is None) == (args.point is None):
+        raise SystemExit("錯誤：colocation 需要 --area 或 --point (擇一)。")
+    if args.lsh_min_similarity is not None and not args.trip_lsh_index:
+        raise SystemExit("錯誤：--lsh-min-similarity 需要搭配 --trip-lsh-index。")
+    if args.command == 'similarity':
+        try:
+            check_similarity_options(args.metric, args.relative_time, args.lsh_min_similarity)
+        except ValueError as e:
+            raise SystemExit(f"錯誤：{e}")
+
+    if args.metrics_log:
+        from monitoring.stage_metrics import set_log_path
+        set_log_path(args.metrics_log)
+
+    # 分析過程的文字訊息一律寫到 stderr，stdout 只保留機器可讀的結果
+    with contextlib.redirect_stdout(sys.stderr):
+        with profile_from_args(args, run_name=f"cli_{args.command}"):
+            try:
+                start, end = _load_range(args)
+                full_data = load_vehicle_data(args.data, start=start, end=end, plates=_pushdown_plates(args))
+                records = args.func(args, full_data)
+            except (ValueError, FileNotFoundError) as e:
+                raise SystemExit(f"錯誤：{e}")
+    write_records(records, args.output, args.format)
+
+    if args.metrics_prom or args.stage_timing:
+        from monitoring.stage_metrics import write_prometheus_textfile, format_stage_table
+        if args.metrics_prom:
+            write_prometheus_textfile(args.metrics_prom)
+        if args.stage_timing:
+            print(format_stage_table(), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# data_loader.py (軌跡資料讀取與預處理，供 app.py 與 cli.py 共用)
+
+from pathlib import Path
+
+DEFAULT_DATA_PATH = Path(__file__).resolve().parent / 'data' / 'realistic_vehicle_dataset1.csv'
+# 前處理後的資料列順序：依時間排序，同一時間再依車牌 (穩定排序，同車同時間保留原順序)；
+# partitioned_store 讀回的資料以相同的鍵排序，與直接讀 CSV 的順序一致
+SORT_KEYS = ['datetime', '車牌']
+
+def load_vehicle_data(data_path=DEFAULT_DATA_PATH, verbose: bool = True, start=None, end=None,
+                      plates=None) -> 'pd.DataFrame':
+    """
+    讀取車辨資料並完成共同的前處理：
+    1. 由 '日期' + '時間' 產生 datetime 並依 SORT_KEYS 排序
+    2. LocationID 轉為字串
+    3. 經緯度轉為浮點數，移除座標無效的資料
+
+    data_path 可以是 CSV 檔，或以 partitioned_store.py 建立的依日期分區資料夾；
+    分區資料夾只會讀取與 start / end / plates 條件相符的分區與區塊，CSV 則在讀入後篩選。
+
+    Args:
+        start / end: 日期範圍 ('YYYY-MM-DD' 或完整時間)；end 只有日期時包含當天整天
+        plates: 只保留這些車牌 (None 為全部)
+
+    Raises:
+        FileNotFoundError: 找不到資料檔
+    """
+    import pandas as pd  # 延遲載入：只看 --help 或選單時不需要付出 pandas 的匯入時間
+
+    data_path = Path(data_path)
+    if not data_path.exists():
+        raise FileNotFoundError(f"找不到檔案 {data_path}")
+
+    if data_path.is_dir():
+        from partitioned_store import read_partitioned_store
+        full_data = read_partitioned_store(data_path, start=start, end=end, plates=plates)
+        return preprocess_vehicle_data(full_data, verbose=verbose)
+
+    full_data = preprocess_vehicle_data(pd.read_csv(data_path), verbose=verbose)
+    return filter_vehicle_data(full_data, start=start, end=end, plates=plates)
+
+def preprocess_vehicle_data(full_data: 'pd.DataFrame', verbose: bool = True) -> 'pd.DataFrame':
+    """load_vehicle_data 的前處理步驟 (已有 datetime 欄位時不重新組合日期與時間)。"""
+    import pandas as pd
+
+    # 1. 時間格式轉換
+    if 'datetime' in full_data.columns:
+        full_data['datetime'] = pd.to_datetime(full_data['datetime'])
+    else:
+        full_data['datetime'] = pd.to_datetime(full_data['日期'] + ' ' + full_data['時間'])
+    full_data = full_data.sort_values(by=SORT_KEYS, kind='mergesort').reset_index(drop=True)
+
+    # 2. 確保 LocationID 為字串
+    if 'LocationID' in full_data.columns:
+        full_data['LocationID'] = full_data['LocationID'].astype(str)
+    elif verbose:
+        print("警告：資料中缺少 'LocationID' 欄位，可能會影響部分分析功能。")
+
+    # 3. 強制轉換經緯度為浮點數 (確保 Haversine 距離計算不會因字串而失敗)
+    if '經度' in full_data.columns and '緯度' in full_data.columns:
+        full_data['經度'] = pd.to_numeric(full_data['經度'], errors='coerce')
+        full_data['緯度'] = pd.to_numeric(full_data['緯度'], errors='coerce')
+
+        # 移除座標無效 (NaN) 的資料，避免髒資料導致程式崩潰
+        before_len = len(full_data)
+        full_data = full_data.dropna(subset=['經度', '緯度'])
+        if verbose and before_len != len(full_data):
+            print(f"已移除 {before_len - len(full_data)} 筆經緯度無效的資料。")
+
+    return full_data
+
+def parse_date_range(start=None, end=None) -> tuple:
+    """
+    將日期範圍轉為 [start, end) 的 Timestamp (未指定的一端為 None)。
+    end 只有日期 (時間為 00:00) 時視為包含當天，回傳隔天 00:00。
+    """
+    import pandas as pd
+
+    start_ts = pd.Timestamp(start) if start is not None else None
+    end_ts = pd.Timestamp(end) if end is not None else None
+    if end_ts is not None and end_ts == end_ts.normalize():
+        end_ts += pd.Timedelta(days=1)
+    if start_ts is not None and end_ts is not None and start_ts >= end_ts:
+        raise ValueError(f"日期範圍無效：開始 {start} 不早於結束 {end}。")
+    return start_ts, end_ts
+
+def filter_vehicle_data(full_data: 'pd.DataFrame', start=None, end=None, plates=None) -> 'pd.DataFrame':
+    """依日期範圍與車牌篩選已前處理的資料 (條件皆未指定時原樣回傳)。"""
+    if start is None and end is None and plates is None:
+        return full_data
+    start_ts, end_ts = parse_date_range(start, end)
+    mask = full_data['datetime'].notna()
+    if start_ts is not None:
+        mask &= full_data['datetime'] >= start_ts
+    if end_ts is not None:
+        mask &= full_data['datetime'] < end_ts
+    if plates is not None:
+        mask &= full_data['車牌'].isin(set(plates))
+    return full_data[mask].reset_index(drop=True)
@@ -0,0 +1,272 @@
+# llm_clients/backends.py (可替換的 LLM 後端：OpenAI / 本地 OpenAI 相容服務 / 離線模擬)
+#
+# 以環境變數 LLM_BACKEND 選擇後端 (預設 openai):
+#     openai  OpenAI 官方 API (OPENAI_API_KEY, LLM_MODEL 預設 gpt-4o)
+#     local   OpenAI 相容的本地 HTTP 服務，例如 vLLM / llama.cpp / Ollama
+#             (LLM_LOCAL_URL 預設 http://127.0.0.1:8080/v1, LLM_LOCAL_MODEL, LLM_LOCAL_API_KEY)
+#     mock    離線的確定性模擬後端，供壓力測試與無網路環境使用
+#             (LLM_MOCK_LATENCY_MS, LLM_MOCK_JITTER_MS, LLM_MOCK_FAILURE_RATE, LLM_MOCK_FIXTURES, LLM_MOCK_SEED)
+#
+# 共用設定:
+#     LLM_MAX_CONCURRENCY  同時進行中的請求上限 (預設 4)
+#     LLM_MAX_RETRIES      連線失敗 / 逾時 / 速率限制 (本地服務另含 HTTP 5xx) 的重試次數 (預設 2)；
+#                          驗證失敗、400 / schema 不符等其他錯誤不重試
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from prompts.report_prompt import REPORT_SECTIONS
+from monitoring.stage_metrics import record_llm_usage
+
+BACKEND_NAMES = ('openai', 'local', 'mock')
+
+# ==========================================
+# 1. 建立後端
+# ==========================================
+def _new_backend(name: str, complete, max_concurrency: int = None) -> dict:
+    """
+    後端以 dict 表示：complete(system_prompt, user_prompt, response_schema=None) -> str，
+    暫時性失敗 (連線、逾時、速率限制、伺服器錯誤) 丟出 ConnectionError / TimeoutError，會被重試；
+    重試也不會成功的錯誤 (驗證失敗、請求或 schema 被拒) 丟出 RuntimeError，不重試。
+    成功時以 record_llm_usage 回報 token 用量 (記入進行中的階段)。
+    response_schema ({'name', 'schema'}，見 prompts/report_prompt.py) 指定時要求模型輸出符合該 JSON Schema 的物件。
+    """
+    if max_concurrency is None:
+        max_concurrency = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+    return {
+        'name': name,
+        'complete': complete,
+        'semaphore': threading.BoundedSemaphore(max(1, max_concurrency)),
+        'lock': threading.Lock(),
+        'stats': {'requests': 0, 'attempts': 0, 'retries': 0, 'failures': 0, 'busy_seconds': 0.0},
+    }
+
+def _response_format(response_schema: dict) -> dict:
+    """OpenAI 相容 API 的 response_format 參數 (strict JSON Schema)。"""
+    return {'type': 'json_schema',
+            'json_schema': {'name': response_schema['name'], 'schema': response_schema['schema'], 'strict': True}}
+
+def create_openai_backend(model: str = None, temperature: float = 0.2, max_tokens: int = 2048,
+                          max_concurrency: int = None) -> dict:
+    """OpenAI 官方 API；客戶端沿用 cloud_client 的延遲初始化。"""
+    from llm_clients.cloud_client import get_client, get_client_error
+
+    model = model or os.environ.get('LLM_MODEL', 'gpt-4o')
+
+    def complete(system_prompt: str, user_prompt: str, response_schema: dict = None) -> str:
+        client = get_client()
+        if not client:
+            raise RuntimeError(f"LLM API client 未成功初始化: {get_client_error()}")
+        import openai  # 客戶端已建立表示 openai 可匯入
+
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **({'response_format': _response_format(response_schema)} if response_schema else {})
+            )
+        except (openai.APIConnectionError, openai.RateLimitError) as e:
+            # 連線失敗 / 逾時 (APITimeoutError 為 APIConnectionError 的子類別) 與速率限制轉換後交給重試機制處理
+            raise ConnectionError(f"呼叫 OpenAI API 時發生暫時性錯誤: {e}") from e
+        except openai.OpenAIError as e:
+            # 驗證失敗、400、schema 被拒等，重試也不會成功
+            raise RuntimeError(f"OpenAI API 拒絕請求: {e}") from e
+        if response.usage is not None:
+            record_llm_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content
+
+    return _new_backend('openai', complete, max_concurrency)
+
+def create_local_backend(base_url: str = None, model: str = None, api_key: str = None, timeout: float = 120.0,
+                         temperature: float = 0.2, max_tokens: int = 2048, max_concurrency: int = None) -> dict:
+    """OpenAI 相容的本地 HTTP 服務 (POST {base_url}/chat/completions)，只使用標準函式庫。"""
+    base_url = (base_url or os.environ.get('LLM_LOCAL_URL', 'http://127.0.0.1:8080/v1')).rstrip('/')
+    model = model or os.environ.get('LLM_LOCAL_MODEL', 'local-model')
+    api_key = api_key or os.environ.get('LLM_LOCAL_API_KEY')
+
+    def complete(system_prompt: str, user_prompt: str, response_schema: dict = None) -> str:
+        body = {
+            'model': model,
+            'messages': [
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': user_prompt},
+            ],
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+        }
+        if response_schema:
+            body['response_format'] = _response_format(response_schema)
+        body = json.dumps(body).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if api_key:
+            headers['Authorization'] = f"Bearer {api_key}"
+        request = urllib.request.Request(f"{base_url}/chat/completions", data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as resp:
+                payload = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429 or e.code >= 500:
+                raise ConnectionError(f"本地 LLM 服務回應 HTTP {e.code}") from e
+            raise RuntimeError(f"本地 LLM 服務拒絕請求 (HTTP {e.code})") from e
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"無法連線到本地 LLM 服務 {base_url}: {e.reason}") from e
+        usage = payload.get('usage') or {}
+        record_llm_usage(usage.get('prompt_tokens'), usage.get('completion_tokens'))
+        return payload['choices'][0]['message']['content']
+
+    return _new_backend('local', complete, max_concurrency)
+
+def _prompt_digest(system_prompt: str, user_prompt: str) -> str:
+    return hashlib.blake2b((system_prompt + '\0' + user_prompt).encode('utf-8'), digest_size=8).hexdigest()
+
+def _template_sections(user_prompt: str) -> dict:
+    """依提示詞內容組出固定的四段式摘要欄位 (只引用提示詞中出現的 Area-ID)。"""
+    areas = list(dict.fromkeys(re.findall(r'Area-\d+', user_prompt)))
+    primary = areas[:2]
+    return {
+        'pattern_label': f"這輛車主要在 {'、'.join(primary) if primary else '數個地點'} 之間活動。",
+        'movement_pattern': f"常見行程以 {areas[0] if areas else '主要停留點'} 為起點。",
+        'key_anomalies': "(模擬後端) 未評估異常事件。",
+        'conclusion': f"(模擬後端) 本摘要由離線模擬產生，提示詞共 {len(user_prompt)} 字。",
+        'referenced_area_ids': primary,
+    }
+
+def _template_report(user_prompt: str, response_schema: dict = None) -> str:
+    """
+    未指定 response_schema 時回傳純文字四段式摘要；
+    指定時回傳符合 schema 的 JSON (批次 schema 依「### 目標車輛X」區塊逐車產生)。
+    """
+    if response_schema is None:
+        sections = _template_sections(user_prompt)
+        return "\n\n".join(f"【{title}】{sections[field]}" for field, title in REPORT_SECTIONS)
+    if 'reports' in response_schema['schema']['properties']:
+        blocks = re.split(r'^### (目標車輛[A-Z]+)\s*$', user_prompt, flags=re.MULTILINE)
+        reports = [{'vehicle': alias, **_template_sections(text)} for alias, text in zip(blocks[1::2], blocks[2::2])]
+        return json.dumps({'reports': reports}, ensure_ascii=False)
+    return json.dumps(_template_sections(user_prompt), ensure_ascii=False)
+
+def create_mock_backend(latency_ms: float = None, jitter_ms: float = None, failure_rate: float = None,
+                        fixtures_dir=None, seed: int = None, max_concurrency: int = None) -> dict:
+    """
+    離線的確定性模擬後端。
+
+    Args:
+        latency_ms: 每次呼叫的固定延遲 (毫秒)
+        jitter_ms: 額外的隨機延遲上限 (毫秒)
+        failure_rate: 每次呼叫丟出 ConnectionError 的機率 (0~1)，用於測試重試行為
+        fixtures_dir: 回放資料夾；存在 <提示詞雜湊>.txt 時直接回傳其內容，否則依提示詞套用範本
+        seed: 延遲與失敗注入的亂數種子 (相同種子、相同呼叫順序得到相同結果)
+    """
+    from security.anonymizer import estimate_tokens
+
+    env = os.environ
+    latency_ms = float(env.get('LLM_MOCK_LATENCY_MS', 0) if latency_ms is None else latency_ms)
+    jitter_ms = float(env.get('LLM_MOCK_JITTER_MS', 0) if jitter_ms is None else jitter_ms)
+    failure_rate = float(env.get('LLM_MOCK_FAILURE_RATE', 0) if failure_rate is None else failure_rate)
+    fixtures_dir = fixtures_dir if fixtures_dir is not None else env.get('LLM_MOCK_FIXTURES')
+    fixtures_dir = Path(fixtures_dir) if fixtures_dir else None
+    rng = random.Random(int(env.get('LLM_MOCK_SEED', 0) if seed is None else seed))
+    rng_lock = threading.Lock()
+
+    def complete(system_prompt: str, user_prompt: str, response_schema: dict = None) -> str:
+        with rng_lock:
+            delay = (latency_ms + rng.uniform(0, jitter_ms)) / 1000.0
+            fail = rng.random() < failure_rate
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError("模擬後端注入的連線失敗")
+
+        fixture = fixtures_dir / f"{_prompt_digest(system_prompt, user_prompt)}.txt" if fixtures_dir is not None else None
+        if fixture is not None and fixture.exists():
+            text = fixture.read_text(encoding='utf-8')
+        else:
+            text = _template_report(user_prompt, response_schema)
+        # 模擬後端沒有真正的 tokenizer，以本地估算值回報用量
+        record_llm_usage(estimate_tokens(system_prompt) + estimate_tokens(user_prompt), estimate_tokens(text))
+        return text
+
+    return _new_backend('mock', complete, max_concurrency)
+
+_BACKEND_FACTORIES = {
+    'openai': create_openai_backend,
+    'local': create_local_backend,
+    'mock': create_mock_backend,
+}
+
+def create_backend(name: str = None, **kwargs) -> dict:
+    """依名稱建立後端；未指定時使用環境變數 LLM_BACKEND (預設 openai)。"""
+    name = (name or os.environ.get('LLM_BACKEND', 'openai')).lower()
+    if name not in _BACKEND_FACTORIES:
+        raise ValueError(f"未知的 LLM 後端 '{name}'，可用: {', '.join(BACKEND_NAMES)}")
+    return _BACKEND_FACTORIES[name](**kwargs)
+
+_default_backend = None
+_default_lock = threading.Lock()
+
+def get_default_backend() -> dict:
+    """行程內共用的預設後端 (第一次呼叫時依環境變數建立)。"""
+    global _default_backend
+    with _default_lock:
+        if _default_backend is None:
+            _default_backend = create_backend()
+        return _default_backend
+
+# ==========================================
+# 2. 呼叫 (併發上限 + 重試)
+# ==========================================
+def complete_with_retry(backend: dict, system_prompt: str, user_prompt: str, max_retries: int = None,
+                        backoff_seconds: float = 0.5, response_schema: dict = None) -> str:
+    """
+    透過後端產生回覆。暫時性失敗 (ConnectionError / TimeoutError) 時以指數退避重試，
+    同時進行中的請求數受後端的併發上限限制。重試用盡或遇到不可重試的錯誤 (RuntimeError) 時回傳 None。
+    """
+    if max_retries is None:
+        max_retries = int(os.environ.get('LLM_MAX_RETRIES', 2))
+    with backend['lock']:
+        backend['stats']['requests'] += 1
+
+    retryable = True
+    for attempt in range(max_retries + 1):
+        if attempt:
+            with backend['lock']:
+                backend['stats']['retries'] += 1
+            time.sleep(backoff_seconds * (2 ** (attempt - 1)))
+        with backend['semaphore']:
+            start = time.perf_counter()
+            try:
+                return backend['complete'](system_prompt, user_prompt, response_schema=response_schema)
+            except (ConnectionError, TimeoutError) as e:
+                last_error = e
+            except RuntimeError as e:
+                last_error, retryable = e, False
+            finally:
+                with backend['lock']:
+                    backend['stats']['attempts'] += 1
+                    backend['stats']['busy_seconds'] += time.perf_counter() - start
+        if not retryable:
+            break
+
+    with backend['lock']:
+        backend['stats']['failures'] += 1
+    if retryable:
+        print(f"LLM 後端 '{backend['name']}' 重試 {max_retries} 次後仍失敗: {last_error}")
+    else:
+        print(f"LLM 後端 '{backend['name']}' 的請求被拒絕 (不重試): {last_error}")
+    return None
+
+def backend_stats(backend: dict) -> dict:
+    with backend['lock']:
+        return dict(backend['stats'], name=backend['name'])
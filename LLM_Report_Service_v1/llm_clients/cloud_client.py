@@ -1,54 +1,108 @@
-# llm_clients/cloud_client.py (OpenAI 專用版 - 回傳 Token 用量)
+# llm_clients/cloud_client.py (LLM 呼叫入口：OpenAI 客戶端初始化；實際後端見 llm_clients/backends.py)
 
+import json
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# 從 prompts 模組匯入 SYSTEM_PROMPT (維持不變)
-from prompts.report_prompt import SYSTEM_PROMPT
+# 從 prompts 模組匯入系統提示詞與結構化輸出的 JSON Schema
+from prompts.report_prompt import (REPORT_SYSTEM_PROMPT, BATCH_SYSTEM_PROMPT, REPORT_SECTIONS,
+                                   REPORT_JSON_SCHEMA, BATCH_REPORT_JSON_SCHEMA)
 
-# --- 1. API 金鑰管理 (簡化版) ---
-load_dotenv()
-API_KEY = os.environ.get("OPENAI_API_KEY")
+# --- 1. 延遲初始化 ---
+# 匯入本模組不會載入 openai / dotenv，也不會建立連線；
+# 第一次真的要呼叫 LLM 時才讀取 API 金鑰並建立客戶端 (離線執行其他分析不受影響)。
+_client = None
+_client_error = None
 
-# --- 2. 初始化 OpenAI 客戶端 (簡化版) ---
-try:
-    if not API_KEY:
-        raise ValueError("在 .env 檔案中找不到 OPENAI_API_KEY。")
-    
-    client = OpenAI(api_key=API_KEY)
-    print("--- LLM Client: Initialized with OpenAI ---")
+def get_client():
+    """
+    取得 OpenAI 客戶端 (第一次呼叫時才初始化，之後重複使用)。
+    初始化失敗時回傳 None，失敗原因保留在 get_client_error()。
+    """
+    global _client, _client_error
+    if _client is not None or _client_error is not None:
+        return _client
+
+    try:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+
+        # --- API 金鑰管理 (簡化版) ---
+        load_dotenv()
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("在 .env 檔案中找不到 OPENAI_API_KEY。")
+
+        _client = OpenAI(api_key=api_key)
+        print("--- LLM Client: Initialized with OpenAI ---")
+
+    except Exception as e:
+        print(f"初始化 OpenAI client 失敗: {e}")
+        _client_error = e
+    return _client
+
+def get_client_error():
+    """回傳客戶端初始化失敗的例外 (尚未初始化或成功時為 None)。"""
+    return _client_error
 
-except Exception as e:
-    print(f"初始化 OpenAI client 失敗: {e}")
-    client = None
+# --- 2. 結構化回覆的解析 ---
+def load_json_object(response_text: str):
+    """解析模型回覆中的 JSON 物件 (容許外包 ```json 區塊)；無法解析時回傳 None。"""
+    if not response_text:
+        return None
+    start, end = response_text.find('{'), response_text.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        payload = json.loads(response_text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return payload if isinstance(payload, dict) else None
 
-# --- 3. 修改函式以回傳完整的 response 物件 ---
-def generate_report_from_summary(anonymized_summary_text: str):
+def validate_report_fields(payload) -> dict:
     """
-    將摘要發送給 OpenAI，並獲取包含 usage 的完整回覆。
+    檢查單份報告的欄位 (四個段落 + referenced_area_ids)，回傳整理後的 dict；
+    段落缺漏或全部為空時回傳 None。
     """
-    if not client:
-        raise ConnectionError("LLM API client 未成功初始化。")
+    if not isinstance(payload, dict):
+        return None
+    report = {}
+    for field, _ in REPORT_SECTIONS:
+        value = payload.get(field)
+        report[field] = value.strip() if isinstance(value, str) else ""
+    if not any(report.values()):
+        return None
+    area_ids = payload.get('referenced_area_ids')
+    report['referenced_area_ids'] = list(dict.fromkeys(a for a in area_ids if isinstance(a, str))) \
+        if isinstance(area_ids, list) else []
+    return report
 
-    # 指定要使用的 OpenAI 模型
-    model_to_use = "gpt-4o"
+# --- 3. 產生摘要 (依 LLM_BACKEND 選擇後端) ---
+def generate_report_from_summary(anonymized_summary_text: str, backend: dict = None):
+    """
+    將去識別化的摘要發送給 LLM 後端，要求依 REPORT_JSON_SCHEMA 回覆。
+    回傳 {段落欄位..., 'referenced_area_ids'}；重試用盡、請求被拒絕或回覆不符合格式時回傳 None。
+    """
+    from llm_clients.backends import get_default_backend, complete_with_retry
 
-    try:
-        print(f"--- Calling OpenAI model: {model_to_use} ---")
-        response = client.chat.completions.create(
-            model=model_to_use,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": anonymized_summary_text}
-            ],
-            temperature=0.2,
-            max_tokens=2048
-        )
-        # 【【【 核心修改處：回傳完整的 response 物件 】】】
-        return response.choices[0].message.content
-    
-    
-    except Exception as e:
-        print(f"呼叫 OpenAI API 時發生錯誤: {e}")
-        return None # 發生錯誤時回傳 None
\ No newline at end of file
+    backend = backend or get_default_backend()
+    print(f"--- Calling LLM backend: {backend['name']} ---")
+    response_text = complete_with_retry(backend, REPORT_SYSTEM_PROMPT, anonymized_summary_text,
+                                        response_schema=REPORT_JSON_SCHEMA)
+    if response_text is None:
+        return None
+    report = validate_report_fields(load_json_object(response_text))
+    if report is None:
+        print("LLM 回覆不符合結構化報告格式，已忽略。")
+    return report
+
+def generate_batch_report(batch_prompt_text: str, backend: dict = None):
+    """
+    批次模式：一次送出多台車的去識別化摘要，要求依 BATCH_REPORT_JSON_SCHEMA 逐車回覆。
+    回傳模型的原始 JSON 文字 (依代號拆分由呼叫端負責)；重試用盡或請求被拒絕時回傳 None。
+    """
+    from llm_clients.backends import get_default_backend, complete_with_retry
+
+    backend = backend or get_default_backend()
+    print(f"--- Calling LLM backend (batch): {backend['name']} ---")
+    return complete_with_retry(backend, BATCH_SYSTEM_PROMPT, batch_prompt_text,
+                               response_schema=BATCH_REPORT_JSON_SCHEMA)
@@ -0,0 +1,276 @@
+# monitoring/profiler.py (取樣式效能剖析：找出實際資料上的熱點函式，輸出 collapsed stack / speedscope 檔)
+#
+# 用法:
+#     python cli.py --profile report --plates ABC-1234 --no-llm            # 自動命名 profiles/cli_report_<時間>.collapsed
+#     python cli.py --profile --profile-output convoy.speedscope.json convoy --plates ABC-1234
+#     python -m monitoring.profiler -o run.collapsed cli.py convoy --plates ABC-1234   # 剖析任意腳本，不需修改程式
+#
+# collapsed 檔可交給 flamegraph.pl / inferno / speedscope 產生火焰圖；.json 為 speedscope 格式 (https://www.speedscope.app)。
+# 取樣器以背景執行緒定期讀取各執行緒的呼叫堆疊，只能看到本行程 (ProcessPoolExecutor 子行程的工作不在其中)；
+# 直譯器不支援 sys._current_frames 或指定 mode='cprofile' 時改用 cProfile，輸出 pstats 檔。
+
+import argparse
+import cProfile
+import json
+import pstats
+import runpy
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PROFILE_DIR = PROJECT_ROOT / 'profiles'
+DEFAULT_INTERVAL_MS = 5.0
+PROFILE_MODES = ('sampling', 'cprofile')
+SAMPLING_AVAILABLE = hasattr(sys, '_current_frames')
+
+# ==========================================
+# 1. 取樣
+# ==========================================
+# code 物件 -> (名稱, 是否為專案內的函式)；取樣時每個堆疊框都要查，避免重複解析路徑
+_label_cache = {}
+# 取樣到的專案函式名稱 (熱點統計只看這些函式)
+_project_labels = set()
+
+def _frame_label(code) -> tuple:
+    """
+    堆疊框的名稱「函式 (檔案:行號)」：專案內的檔案以相對路徑表示，
+    其餘 (pandas / numpy 等) 只保留路徑的最後兩層。
+    """
+    cached = _label_cache.get(code)
+    if cached is None:
+        path = Path(code.co_filename)
+        try:
+            if code.co_filename.startswith('<'):  # <frozen importlib._bootstrap>、<string> 等沒有實體檔案的程式碼
+                raise ValueError(code.co_filename)
+            shown, in_project = path.resolve().relative_to(PROJECT_ROOT).as_posix(), True
+        except (ValueError, OSError):
+            shown, in_project = '/'.join(path.parts[-2:]), False
+        # 剖析器本身與模組層級的程式碼不算分析函式
+        in_project = in_project and not shown.startswith('monitoring/') and code.co_name != '<module>'
+        cached = _label_cache[code] = (f"{code.co_name} ({shown}:{code.co_firstlineno})", in_project)
+    return cached
+
+def _stack_of(frame) -> tuple:
+    """由最外層到最內層的堆疊框名稱。"""
+    labels = []
+    while frame is not None:
+        label, in_project = _frame_label(frame.f_code)
+        labels.append(label)
+        if in_project:
+            _project_labels.add(label)
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+def create_sampler(interval_ms: float = DEFAULT_INTERVAL_MS, all_threads: bool = True) -> dict:
+    """
+    建立取樣器：背景執行緒每 interval_ms 讀取一次呼叫堆疊，依 (執行緒名稱, 堆疊) 累計取樣經過的時間。
+    all_threads=False 時只取樣呼叫 start_sampler 的執行緒。
+    """
+    return {
+        'interval': interval_ms / 1000.0,
+        'all_threads': all_threads,
+        'samples': Counter(),        # (執行緒名稱, 堆疊) -> 取樣次數
+        'weights': Counter(),        # (執行緒名稱, 堆疊) -> 累計秒數
+        'stop': threading.Event(),
+        'thread': None,
+        'target_ident': None,
+        'started_at': None,
+        'elapsed': 0.0,
+    }
+
+def _sample_loop(sampler: dict):
+    own_ident = threading.get_ident()
+    last = time.perf_counter()
+    while not sampler['stop'].wait(sampler['interval']):
+        now = time.perf_counter()
+        weight, last = now - last, now
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if not sampler['all_threads'] and ident != sampler['target_ident']:
+                continue
+            key = (names.get(ident, str(ident)), _stack_of(frame))
+            sampler['samples'][key] += 1
+            sampler['weights'][key] += weight
+
+def start_sampler(sampler: dict):
+    sampler['target_ident'] = threading.get_ident()
+    sampler['started_at'] = time.perf_counter()
+    sampler['thread'] = threading.Thread(target=_sample_loop, args=(sampler,), name='stack-sampler', daemon=True)
+    sampler['thread'].start()
+
+def stop_sampler(sampler: dict):
+    sampler['stop'].set()
+    sampler['thread'].join()
+    sampler['elapsed'] = time.perf_counter() - sampler['started_at']
+
+# ==========================================
+# 2. 輸出格式
+# ==========================================
+def format_collapsed(sampler: dict) -> str:
+    """Brendan Gregg 的 collapsed stack 格式：每行「執行緒;外層;...;內層 取樣次數」。"""
+    lines = []
+    for (thread_name, stack), count in sorted(sampler['samples'].items(), key=lambda item: -item[1]):
+        lines.append(';'.join((thread_name,) + stack) + f" {count}")
+    return "\n".join(lines) + "\n"
+
+def speedscope_document(sampler: dict, name: str) -> dict:
+    """speedscope 的 sampled profile 格式，每個執行緒一份 profile，權重單位為秒。"""
+    frame_index = {}
+    frames = []
+    profiles = {}
+    for (thread_name, stack), weight in sampler['weights'].items():
+        indices = []
+        for label in stack:
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                func, _, location = label.partition(' (')
+                file, _, line = location.rstrip(')').rpartition(':')
+                frames.append({'name': func, 'file': file, 'line': int(line) if line.isdigit() else None})
+            indices.append(frame_index[label])
+        profile = profiles.setdefault(thread_name, {'samples': [], 'weights': []})
+        profile['samples'].append(indices)
+        profile['weights'].append(round(weight, 6))
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'monitoring.profiler',
+        'activeProfileIndex': 0,
+        'shared': {'frames': frames},
+        'profiles': [
+            {'type': 'sampled', 'name': thread_name, 'unit': 'seconds', 'startValue': 0,
+             'endValue': round(sum(p['weights']), 6), 'samples': p['samples'], 'weights': p['weights']}
+            for thread_name, p in profiles.items()
+        ],
+    }
+
+def hot_functions(sampler: dict, top_n: int = 20, project_only: bool = True) -> list:
+    """
+    依取樣時間統計各函式的自身時間 (位於堆疊最內層) 與總時間 (出現在堆疊中，遞迴只算一次)。
+    project_only=True 時自身時間歸給堆疊中最內層的專案函式，方便直接看出是哪個分析函式慢。
+    回傳 [(函式, 自身秒數, 總秒數)]，依總秒數排序。
+    """
+    self_time, total_time = Counter(), Counter()
+    for (_, stack), weight in sampler['weights'].items():
+        frames = [label for label in stack if label in _project_labels] if project_only else list(stack)
+        if not frames:
+            continue
+        self_time[frames[-1]] += weight
+        for label in set(frames):
+            total_time[label] += weight
+    ranked = sorted(total_time, key=lambda label: -total_time[label])[:top_n]
+    return [(label, self_time[label], total_time[label]) for label in ranked]
+
+def format_hot_functions(sampler: dict, top_n: int = 20) -> str:
+    lines = [f"--- 取樣 {sum(sampler['samples'].values())} 次，共 {sampler['elapsed']:.2f} 秒；專案函式耗時前 {top_n} 名 ---",
+             f"{'總時間 (s)':>10} {'自身 (s)':>10}  函式"]
+    for label, own, total in hot_functions(sampler, top_n):
+        lines.append(f"{total:>10.3f} {own:>10.3f}  {label}")
+    return "\n".join(lines)
+
+def write_profile(sampler: dict, path, name: str = 'profile'):
+    """依副檔名輸出：.json 為 speedscope 格式，其餘為 collapsed stack。"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.json':
+        path.write_text(json.dumps(speedscope_document(sampler, name), ensure_ascii=False), encoding='utf-8')
+    else:
+        path.write_text(format_collapsed(sampler), encoding='utf-8')
+
+# ==========================================
+# 3. 包住一次執行
+# ==========================================
+def default_profile_path(run_name: str, mode: str = 'sampling') -> Path:
+    suffix = '.prof' if mode == 'cprofile' else '.collapsed'
+    return DEFAULT_PROFILE_DIR / f"{run_name}_{time.strftime('%Y%m%d_%H%M%S')}{suffix}"
+
+@contextmanager
+def profile_run(output_path=None, run_name: str = 'profile', mode: str = 'sampling',
+                interval_ms: float = DEFAULT_INTERVAL_MS, report_top: int = 20, report_file=None):
+    """
+    剖析 with 區塊內的執行，結束時寫出剖析檔並把熱點函式表印到 report_file (預設 stderr)。
+
+    Args:
+        output_path: 輸出檔；None 時寫到 profiles/<run_name>_<時間>.collapsed (cprofile 模式為 .prof)
+        mode: 'sampling' (預設) 或 'cprofile'；不支援取樣的直譯器自動改用 cprofile
+        interval_ms: 取樣間隔 (毫秒)
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"未知的剖析模式 '{mode}'，可用: {', '.join(PROFILE_MODES)}")
+    if mode == 'sampling' and not SAMPLING_AVAILABLE:
+        mode = 'cprofile'
+    if output_path is None:
+        output_path = default_profile_path(run_name, mode)
+    report_file = report_file if report_file is not None else sys.stderr
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(str(output_path))
+            stats = pstats.Stats(profiler, stream=report_file)
+            stats.sort_stats('cumulative').print_stats(str(PROJECT_ROOT.name), report_top)
+            print(f"--- cProfile 結果已寫入 {output_path} (可用 python -m pstats 或 snakeviz 檢視) ---", file=report_file)
+        return
+
+    sampler = create_sampler(interval_ms)
+    start_sampler(sampler)
+    try:
+        yield
+    finally:
+        stop_sampler(sampler)
+        write_profile(sampler, output_path, name=run_name)
+        print(format_hot_functions(sampler, report_top), file=report_file)
+        print(f"--- 剖析結果已寫入 {output_path} ---", file=report_file)
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """加入 --profile / --profile-output / --profile-mode / --profile-interval-ms 參數 (cli.py 與 app.py 共用)。"""
+    parser.add_argument('--profile', action='store_true', help="剖析這次執行並寫出剖析檔 (預設寫到 profiles/)")
+    parser.add_argument('--profile-output', metavar='PATH',
+                        help="剖析檔路徑 (.json 為 speedscope，其餘為 collapsed stack；指定時即啟用 --profile)")
+    parser.add_argument('--profile-mode', choices=PROFILE_MODES, default='sampling', help="剖析方式 (預設 sampling)")
+    parser.add_argument('--profile-interval-ms', type=float, default=DEFAULT_INTERVAL_MS, help="取樣間隔 (毫秒)")
+
+def profile_from_args(args, run_name: str):
+    """依 add_profile_arguments 的參數回傳 profile_run；未指定 --profile / --profile-output 時回傳不做事的 context manager。"""
+    if not (args.profile or args.profile_output):
+        return _no_profile()
+    return profile_run(args.profile_output, run_name=run_name, mode=args.profile_mode,
+                       interval_ms=args.profile_interval_ms)
+
+@contextmanager
+def _no_profile():
+    yield
+
+# ==========================================
+# 4. 剖析任意腳本
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以取樣式剖析執行任意腳本 (類似 python -m cProfile)")
+    parser.add_argument('-o', '--output', help="剖析檔路徑 (.json 為 speedscope，其餘為 collapsed stack)")
+    parser.add_argument('--mode', choices=PROFILE_MODES, default='sampling')
+    parser.add_argument('--interval-ms', type=float, default=DEFAULT_INTERVAL_MS)
+    parser.add_argument('script', help="要執行的 Python 腳本")
+    parser.add_argument('script_args', nargs=argparse.REMAINDER, help="傳給腳本的參數")
+    args = parser.parse_args(argv)
+
+    sys.argv = [args.script] + args.script_args
+    sys.path.insert(0, str(Path(args.script).resolve().parent))
+    with profile_run(args.output, run_name=Path(args.script).stem, mode=args.mode, interval_ms=args.interval_ms):
+        try:
+            runpy.run_path(args.script, run_name='__main__')
+        except SystemExit:
+            pass
+
+if __name__ == '__main__':
+    main()
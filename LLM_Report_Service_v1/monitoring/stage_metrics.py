@@ -0,0 +1,212 @@
+# monitoring/stage_metrics.py (各分析階段的計時 / 記憶體 / 筆數 / LLM token 紀錄，輸出為 JSON Lines 或 Prometheus 文字格式)
+#
+# 用法:
+#     with stage_span('report.pattern_mining', rows_in=len(trips), plate=plate) as span:
+#         result = find_regular_patterns_v13(...)
+#         span['rows_out'] = len(result['summary']['regular_patterns'])
+#
+# 環境變數 STAGE_METRICS_LOG 指定時，預設紀錄器會把每個結束的階段以一行 JSON 附加到該檔案；
+# Prometheus 文字格式以 write_prometheus_textfile() 輸出 (可交給 node_exporter 的 textfile collector 收集)。
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows 沒有 resource 模組，改為不記錄 RSS
+    RESOURCE_AVAILABLE = False
+
+# 目前執行環境 (執行緒 / asyncio 任務) 中尚未結束的階段，由外到內
+_active_spans = contextvars.ContextVar('active_stage_spans', default=())
+
+# ==========================================
+# 1. 紀錄器
+# ==========================================
+def create_metrics_registry(max_recent: int = 1000, log_path=None) -> dict:
+    """
+    建立紀錄器：'stages' 為各階段的累計值，'recent' 保留最近 max_recent 筆階段紀錄。
+    log_path 指定時每個結束的階段以一行 JSON 附加到該檔案。
+    """
+    return {
+        'lock': threading.Lock(),
+        'stages': {},
+        'recent': deque(maxlen=max_recent),
+        'log_path': str(log_path) if log_path else None,
+    }
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+def get_default_registry() -> dict:
+    """行程內共用的預設紀錄器 (第一次呼叫時建立，log_path 取自環境變數 STAGE_METRICS_LOG)。"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = create_metrics_registry(log_path=os.environ.get('STAGE_METRICS_LOG'))
+        return _default_registry
+
+def set_log_path(path, registry: dict = None):
+    """變更 (或以 None 關閉) 紀錄器的 JSON Lines 輸出檔。"""
+    registry = registry if registry is not None else get_default_registry()
+    with registry['lock']:
+        registry['log_path'] = str(path) if path else None
+
+def _peak_rss_bytes():
+    """行程目前為止的最高 RSS (bytes)；Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes。"""
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# ==========================================
+# 2. 階段紀錄
+# ==========================================
+@contextmanager
+def stage_span(stage: str, rows_in: int = None, registry: dict = None, **labels):
+    """
+    記錄一個階段的牆鐘時間、CPU 時間、最高 RSS 增量、輸入 / 輸出筆數與 LLM token 用量。
+
+    區塊內可設定 span['rows_out']，或在 span['attributes'] 加入其他要寫進 JSON 紀錄的數值。
+    CPU 時間只計算目前執行緒 (子行程的工作不計入)；RSS 增量為行程最高 RSS 在此階段內上升的量，
+    階段用量未超過先前的最高點時為 0。區塊內丟出例外時照樣記錄，並在 'error' 填入例外類別名稱。
+    """
+    registry = registry if registry is not None else get_default_registry()
+    active = _active_spans.get()
+    span = {
+        'stage': stage,
+        'parent': active[-1]['stage'] if active else None,
+        'labels': labels,
+        'rows_in': rows_in,
+        'rows_out': None,
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'attributes': {},
+        'error': None,
+    }
+    token = _active_spans.set(active + (span,))
+    rss_before = _peak_rss_bytes()
+    cpu_start = time.thread_time()
+    wall_start = time.perf_counter()
+    span['started_at'] = time.time()
+    try:
+        yield span
+    except BaseException as e:
+        span['error'] = type(e).__name__
+        raise
+    finally:
+        span['wall_seconds'] = time.perf_counter() - wall_start
+        span['cpu_seconds'] = time.thread_time() - cpu_start
+        rss_after = _peak_rss_bytes()
+        span['rss_peak_delta_bytes'] = rss_after - rss_before if rss_before is not None else None
+        _active_spans.reset(token)
+        _finish_span(registry, span)
+
+def record_llm_usage(prompt_tokens: int, completion_tokens: int):
+    """將一次 LLM 呼叫的 token 用量加到目前所有尚未結束的階段 (外層階段的合計也包含在內)。"""
+    for span in _active_spans.get():
+        span['prompt_tokens'] += prompt_tokens or 0
+        span['completion_tokens'] += completion_tokens or 0
+
+def _finish_span(registry: dict, span: dict):
+    with registry['lock']:
+        totals = registry['stages'].setdefault(span['stage'], {
+            'calls': 0, 'errors': 0, 'wall_seconds': 0.0, 'wall_seconds_max': 0.0, 'cpu_seconds': 0.0,
+            'rows_in': 0, 'rows_out': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'rss_peak_delta_bytes_max': 0,
+        })
+        totals['calls'] += 1
+        totals['errors'] += span['error'] is not None
+        totals['wall_seconds'] += span['wall_seconds']
+        totals['wall_seconds_max'] = max(totals['wall_seconds_max'], span['wall_seconds'])
+        totals['cpu_seconds'] += span['cpu_seconds']
+        totals['rows_in'] += span['rows_in'] or 0
+        totals['rows_out'] += span['rows_out'] or 0
+        totals['prompt_tokens'] += span['prompt_tokens']
+        totals['completion_tokens'] += span['completion_tokens']
+        totals['rss_peak_delta_bytes_max'] = max(totals['rss_peak_delta_bytes_max'], span['rss_peak_delta_bytes'] or 0)
+        registry['recent'].append(span)
+
+        if registry['log_path']:
+            with open(registry['log_path'], 'a', encoding='utf-8') as f:
+                f.write(json.dumps(span_record(span), ensure_ascii=False, default=str) + '\n')
+
+def span_record(span: dict) -> dict:
+    """階段紀錄的 JSON 形式 (時間四捨五入到微秒)。"""
+    record = {key: value for key, value in span.items() if key not in ('attributes', 'labels')}
+    for key in ('wall_seconds', 'cpu_seconds', 'started_at'):
+        record[key] = round(span[key], 6)
+    record.update(span['labels'])
+    record.update(span['attributes'])
+    return record
+
+def stage_totals(registry: dict = None) -> dict:
+    """各階段累計值的複本 ({階段: {...}})。"""
+    registry = registry if registry is not None else get_default_registry()
+    with registry['lock']:
+        return {stage: dict(totals) for stage, totals in registry['stages'].items()}
+
+def reset_metrics(registry: dict = None):
+    registry = registry if registry is not None else get_default_registry()
+    with registry['lock']:
+        registry['stages'].clear()
+        registry['recent'].clear()
+
+# ==========================================
+# 3. Prometheus 文字格式
+# ==========================================
+# (指標名稱, 類型, 說明, 累計值欄位)；標籤只有 stage (車牌等高基數標籤只寫入 JSON 紀錄)
+_PROMETHEUS_METRICS = [
+    ('report_stage_calls_total', 'counter', "階段執行次數", 'calls'),
+    ('report_stage_errors_total', 'counter', "階段丟出例外的次數", 'errors'),
+    ('report_stage_wall_seconds_total', 'counter', "階段累計牆鐘時間 (秒)", 'wall_seconds'),
+    ('report_stage_wall_seconds_max', 'gauge', "階段單次最長牆鐘時間 (秒)", 'wall_seconds_max'),
+    ('report_stage_cpu_seconds_total', 'counter', "階段累計 CPU 時間 (秒，僅計算執行該階段的執行緒)", 'cpu_seconds'),
+    ('report_stage_rows_in_total', 'counter', "階段累計輸入筆數", 'rows_in'),
+    ('report_stage_rows_out_total', 'counter', "階段累計輸出筆數", 'rows_out'),
+    ('report_stage_rss_peak_delta_bytes_max', 'gauge', "階段單次造成的最高 RSS 增量 (bytes)", 'rss_peak_delta_bytes_max'),
+]
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_prometheus(registry: dict = None) -> str:
+    """將各階段累計值轉為 Prometheus text exposition format。"""
+    totals = stage_totals(registry)
+    lines = []
+    for name, metric_type, help_text, field in _PROMETHEUS_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for stage in sorted(totals):
+            lines.append(f'{name}{{stage="{_escape_label(stage)}"}} {totals[stage][field]:g}')
+
+    lines.append("# HELP report_llm_tokens_total 階段內 LLM 呼叫的累計 token 數")
+    lines.append("# TYPE report_llm_tokens_total counter")
+    for stage in sorted(totals):
+        for kind in ('prompt', 'completion'):
+            value = totals[stage][f'{kind}_tokens']
+            if value:
+                lines.append(f'report_llm_tokens_total{{stage="{_escape_label(stage)}",kind="{kind}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus_textfile(path, registry: dict = None):
+    """寫出 Prometheus 文字格式檔案 (先寫暫存檔再改名，收集器不會讀到寫到一半的內容)。"""
+    path = str(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(format_prometheus(registry))
+    os.replace(tmp_path, path)
+
+def format_stage_table(registry: dict = None) -> str:
+    """各階段累計值的文字表格 (依累計牆鐘時間排序)，供命令列輸出。"""
+    totals = stage_totals(registry)
+    lines = [f"{'階段':<28} {'次數':>6} {'牆鐘 (s)':>10} {'CPU (s)':>10} {'輸入筆數':>10} {'輸出筆數':>10} {'tokens':>8}"]
+    for stage, t in sorted(totals.items(), key=lambda item: -item[1]['wall_seconds']):
+        lines.append(f"{stage:<28} {t['calls']:>6} {t['wall_seconds']:>10.3f} {t['cpu_seconds']:>10.3f} "
+                     f"{t['rows_in']:>10} {t['rows_out']:>10} {t['prompt_tokens'] + t['completion_tokens']:>8}")
+    return "\n".join(lines)
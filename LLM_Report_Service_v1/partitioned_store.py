@@ -0,0 +1,216 @@
+# partitioned_store.py (依日期分區的軌跡資料庫：manifest 記錄各分區 / 區塊的車牌與時間範圍，查詢時只讀取相符的部分)
+#
+# 建立 (於 LLM_Report_Service_v1 目錄下):
+#     python partitioned_store.py --data data/realistic_vehicle_dataset1.csv --output data/store
+# 使用:
+#     python cli.py --data data/store --start 2025-08-01 --end 2025-08-07 convoy --plates ABC-1234
+#
+# 目錄結構:
+#     manifest.json
+#     day=YYYY-MM-DD/part.parquet            (有安裝 pyarrow 時；每個 row group 為一個區塊)
+#     day=YYYY-MM-DD/part-0000.csv.gz ...    (沒有 pyarrow 時；每個檔案為一個區塊)
+# 分區內依 (車牌, 時間) 排序，每個區塊涵蓋一段連續的車牌，因此車牌條件可以跳過大部分區塊。
+
+import argparse
+import gzip
+import importlib.util
+import json
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+DEFAULT_ROW_GROUP_SIZE = 50_000
+
+# ==========================================
+# 1. 建立
+# ==========================================
+def _row_group_stats(group: pd.DataFrame) -> dict:
+    return {
+        'rows': len(group),
+        'plate_min': str(group['車牌'].iloc[0]),
+        'plate_max': str(group['車牌'].iloc[-1]),
+        'time_min': group['datetime'].min().isoformat(),
+        'time_max': group['datetime'].max().isoformat(),
+    }
+
+def _write_partition(day_df: pd.DataFrame, part_dir: Path, fmt: str, row_group_size: int) -> list:
+    """寫出單日分區，回傳各區塊的統計 (含檔名與 row group 編號)。"""
+    part_dir.mkdir(parents=True, exist_ok=True)
+    day_df = day_df.sort_values(['車牌', 'datetime'], kind='mergesort').reset_index(drop=True)
+    groups = [day_df.iloc[i:i + row_group_size] for i in range(0, len(day_df), row_group_size)]
+
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.Table.from_pandas(day_df, preserve_index=False), part_dir / 'part.parquet',
+                       row_group_size=row_group_size)
+        return [{'file': 'part.parquet', 'row_group': i, **_row_group_stats(g)} for i, g in enumerate(groups)]
+
+    stats = []
+    for i, group in enumerate(groups):
+        name = f"part-{i:04d}.csv.gz"
+        # mtime=0：相同資料產生相同的檔案內容
+        with gzip.GzipFile(part_dir / name, 'wb', mtime=0) as f:
+            f.write(group.to_csv(index=False).encode('utf-8'))
+        stats.append({'file': name, 'row_group': None, **_row_group_stats(group)})
+    return stats
+
+def write_partitioned_store(full_data: pd.DataFrame, store_dir, fmt: str = None,
+                            row_group_size: int = DEFAULT_ROW_GROUP_SIZE, overwrite: bool = False) -> dict:
+    """
+    將已前處理的軌跡資料 (需有 datetime 欄位) 依日期寫成分區資料夾並產生 manifest。
+
+    Args:
+        fmt: 'parquet' 或 'csv.gz'；None 時有 pyarrow 用 parquet，否則用 csv.gz
+        row_group_size: 每個區塊的最大筆數
+        overwrite: 資料夾已存在時是否先刪除
+
+    Returns:
+        dict: manifest 內容
+    """
+    fmt = fmt or ('parquet' if PYARROW_AVAILABLE else 'csv.gz')
+    if fmt not in ('parquet', 'csv.gz'):
+        raise ValueError(f"不支援的格式 '{fmt}'，可用: parquet, csv.gz")
+    if fmt == 'parquet' and not PYARROW_AVAILABLE:
+        raise ValueError("寫出 parquet 需要安裝 pyarrow。")
+
+    store_dir = Path(store_dir)
+    if store_dir.exists():
+        if not overwrite:
+            raise FileExistsError(f"{store_dir} 已存在 (使用 overwrite=True 覆寫)")
+        shutil.rmtree(store_dir)
+    store_dir.mkdir(parents=True)
+
+    partitions = []
+    days = full_data['datetime'].dt.strftime('%Y-%m-%d')
+    for day, day_df in full_data.groupby(days, sort=True):
+        part_dir = store_dir / f"day={day}"
+        row_groups = _write_partition(day_df, part_dir, fmt, row_group_size)
+        partitions.append({
+            'day': day,
+            'path': part_dir.name,
+            'rows': len(day_df),
+            'plates': int(day_df['車牌'].nunique()),
+            'time_min': min(g['time_min'] for g in row_groups),
+            'time_max': max(g['time_max'] for g in row_groups),
+            'row_groups': row_groups,
+        })
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'format': fmt,
+        'columns': list(full_data.columns),
+        # csv.gz 讀回時依此指定欄位型別 (逐區塊推斷可能與整份 CSV 不同，例如攝影機編號變成整數)
+        'dtypes': {col: str(dtype) for col, dtype in full_data.dtypes.items() if col != 'datetime'},
+        'rows': int(sum(p['rows'] for p in partitions)),
+        'partitions': partitions,
+    }
+    (store_dir / MANIFEST_NAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding='utf-8')
+    return manifest
+
+# ==========================================
+# 2. 讀取 (依 manifest 的統計值跳過不相符的分區與區塊)
+# ==========================================
+def load_manifest(store_dir) -> dict:
+    path = Path(store_dir) / MANIFEST_NAME
+    if not path.exists():
+        raise FileNotFoundError(f"{store_dir} 不是分區資料夾 (找不到 {MANIFEST_NAME})")
+    manifest = json.loads(path.read_text(encoding='utf-8'))
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"不支援的 manifest 版本 {manifest.get('version')}，請重新建立分區資料夾。")
+    return manifest
+
+def _overlaps(stats: dict, start_ts, end_ts, plates: list) -> bool:
+    """區塊 (或分區) 的時間 / 車牌範圍是否可能含有符合條件的資料。"""
+    if start_ts is not None and pd.Timestamp(stats['time_max']) < start_ts:
+        return False
+    if end_ts is not None and pd.Timestamp(stats['time_min']) >= end_ts:
+        return False
+    if plates is not None and 'plate_min' in stats:
+        return any(stats['plate_min'] <= p <= stats['plate_max'] for p in plates)
+    return True
+
+def plan_store_read(manifest: dict, start=None, end=None, plates=None) -> list:
+    """
+    依條件選出要讀取的區塊，回傳 [(分區資料夾, 檔名, row group 編號)]。
+    只比對 manifest 的統計值，不開啟任何資料檔。
+    """
+    from data_loader import parse_date_range
+
+    start_ts, end_ts = parse_date_range(start, end)
+    plates = sorted(set(map(str, plates))) if plates is not None else None
+    selected = []
+    for partition in manifest['partitions']:
+        if not _overlaps(partition, start_ts, end_ts, None):
+            continue
+        for group in partition['row_groups']:
+            if _overlaps(group, start_ts, end_ts, plates):
+                selected.append((partition['path'], group['file'], group['row_group']))
+    return selected
+
+def _read_blocks(store_dir: Path, manifest: dict, blocks: list) -> list:
+    frames = []
+    if manifest['format'] == 'parquet':
+        import pyarrow.parquet as pq
+
+        by_file = {}
+        for part_path, name, row_group in blocks:
+            by_file.setdefault((part_path, name), []).append(row_group)
+        for (part_path, name), row_groups in by_file.items():
+            frames.append(pq.ParquetFile(store_dir / part_path / name).read_row_groups(row_groups).to_pandas())
+    else:
+        # round_trip：讀回與寫出前完全相同的浮點數 (經緯度不差 1 ulp，plate_fingerprint 才與讀 CSV 時相同)
+        for part_path, name, _ in blocks:
+            frames.append(pd.read_csv(store_dir / part_path / name, dtype=manifest.get('dtypes'),
+                                      float_precision='round_trip'))
+    return frames
+
+def read_partitioned_store(store_dir, start=None, end=None, plates=None) -> pd.DataFrame:
+    """
+    讀取分區資料夾中符合日期範圍與車牌的資料 (只讀取相符的分區與區塊，再逐筆精確篩選)。
+    回傳的欄位與建立時相同，尚未經過 data_loader 的前處理 (由 load_vehicle_data 負責)；
+    資料列依 data_loader.SORT_KEYS 排回與直接讀 CSV 相同的順序 (分區內原本依車牌排列)。
+    """
+    from data_loader import SORT_KEYS, filter_vehicle_data
+
+    store_dir = Path(store_dir)
+    manifest = load_manifest(store_dir)
+    blocks = plan_store_read(manifest, start=start, end=end, plates=plates)
+    frames = _read_blocks(store_dir, manifest, blocks)
+    if not frames:
+        return pd.DataFrame(columns=manifest['columns']).astype({'datetime': 'datetime64[ns]'})
+
+    data = pd.concat(frames, ignore_index=True)
+    data['datetime'] = pd.to_datetime(data['datetime'])
+    data = data.sort_values(SORT_KEYS, kind='mergesort').reset_index(drop=True)
+    return filter_vehicle_data(data, start=start, end=end, plates=plates)
+
+# ==========================================
+# 3. 命令列
+# ==========================================
+def main(argv=None):
+    from data_loader import load_vehicle_data
+
+    parser = argparse.ArgumentParser(description="將軌跡 CSV 轉換為依日期分區的資料夾")
+    parser.add_argument('--data', required=True, help="來源 CSV 路徑")
+    parser.add_argument('--output', required=True, help="輸出資料夾")
+    parser.add_argument('--format', choices=['parquet', 'csv.gz'], default=None,
+                        help="分區檔案格式 (預設: 有 pyarrow 時為 parquet，否則為 csv.gz)")
+    parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE, help="每個區塊的最大筆數")
+    parser.add_argument('--overwrite', action='store_true', help="輸出資料夾已存在時覆寫")
+    args = parser.parse_args(argv)
+
+    full_data = load_vehicle_data(args.data)
+    manifest = write_partitioned_store(full_data, args.output, fmt=args.format, row_group_size=args.row_group_size,
+                                       overwrite=args.overwrite)
+    blocks = sum(len(p['row_groups']) for p in manifest['partitions'])
+    print(f"已寫入 {manifest['rows']:,} 筆資料：{len(manifest['partitions'])} 個日期分區、{blocks} 個區塊 "
+          f"({manifest['format']}) -> {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -27,4 +27,68 @@ SYSTEM_PROMPT = """
 # **禁忌**
 - **禁止**輸出除了摘要以外的任何標題、前言或結語。
 - **禁止**逐條列出所有原始數據。
-"""
\ No newline at end of file
+"""
+# ==========================================
+# 結構化輸出：模型以 JSON 回覆四個段落與引用的 Area-ID，報告直接由欄位組成
+# ==========================================
+# (欄位名稱, 段落標題)，順序即報告中的段落順序
+REPORT_SECTIONS = [
+    ('pattern_label', '模式標籤'),
+    ('movement_pattern', '通勤與移動模式'),
+    ('key_anomalies', '關鍵異常事件'),
+    ('conclusion', '總結'),
+]
+
+_REPORT_PROPERTIES = {
+    **{field: {'type': 'string', 'description': title} for field, title in REPORT_SECTIONS},
+    'referenced_area_ids': {
+        'type': 'array',
+        'items': {'type': 'string'},
+        'description': '摘要中提到的所有 Area-ID (例如 Area-001)',
+    },
+}
+
+REPORT_JSON_SCHEMA = {
+    'name': 'vehicle_report',
+    'schema': {
+        'type': 'object',
+        'properties': _REPORT_PROPERTIES,
+        'required': list(_REPORT_PROPERTIES),
+        'additionalProperties': False,
+    },
+}
+
+BATCH_REPORT_JSON_SCHEMA = {
+    'name': 'vehicle_report_batch',
+    'schema': {
+        'type': 'object',
+        'properties': {
+            'reports': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {'vehicle': {'type': 'string'}, **_REPORT_PROPERTIES},
+                    'required': ['vehicle', *_REPORT_PROPERTIES],
+                    'additionalProperties': False,
+                },
+            },
+        },
+        'required': ['reports'],
+        'additionalProperties': False,
+    },
+}
+
+_STRUCTURED_OUTPUT_RULES = """
+# **輸出格式 (覆蓋上方「只能包含摘要內容」的規定)**
+- 只能輸出一個 JSON 物件，不得包含其他文字。四個段落分別放在 pattern_label (模式標籤)、movement_pattern (通勤與移動模式)、key_anomalies (關鍵異常事件)、conclusion (總結) 欄位，段落內容不需要再加【】標題。
+- referenced_area_ids 必須列出四個段落中提到的每一個 Area-ID，不可遺漏，也不可列出未提到的 Area-ID。
+"""
+
+REPORT_SYSTEM_PROMPT = SYSTEM_PROMPT + _STRUCTURED_OUTPUT_RULES
+
+# 批次模式：一次請求包含多台車的摘要，每台車以「### 目標車輛X」區塊分隔，要求以 JSON 逐車回覆
+BATCH_SYSTEM_PROMPT = REPORT_SYSTEM_PROMPT + """
+# **批次模式 (本次請求包含多台車輛)**
+- 使用者訊息中每台車的資料以「### 目標車輛A」、「### 目標車輛B」... 分隔，請**分別**為每台車撰寫一份上述四段式摘要，不要混用不同車輛的數據。
+- 輸出格式為 {"reports": [...]}，每台車對應一筆 report，除了上述欄位外，vehicle 欄位必須與區塊標題的代號完全相同。
+"""
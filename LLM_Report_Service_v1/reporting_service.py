@@ -1,18 +1,22 @@
 # reporting_service.py (修正版 - 正確處理 OpenAI 回應物件)
 
 import pandas as pd
-import json
-import re
 
 # (上方的 import 和 format_details_to_string 函式維持不變)
-from analysis.camera_clusterer import cluster_cameras_by_distance
-from analysis.stay_point_detector import find_stay_points_v2
-from analysis.trip_segmenter import segment_trips_v3
+from analysis.area_hierarchy import build_area_hierarchy, area_table_for_level, level_name
+from analysis.trajectory_kernel import build_trajectory_arrays, area_stay_table, trip_table, graph_node_col
+from analysis.result_types import table_length
 from analysis.pattern_clusterer import find_regular_patterns_v13
 from analysis.anomaly_detector import find_anomalies_v3
+from analysis.camera_graph import transition_graph_fingerprint
+from analysis.shared_dataset import plate_frame
+from cache.summary_cache import frame_fingerprint, plate_fingerprint, cache_key, get_or_compute
 from security.anonymizer import anonymize_data
 from security.deanonymizer import deanonymize_report
-from llm_clients.cloud_client import generate_report_from_summary
+from llm_clients.cloud_client import (generate_report_from_summary, generate_batch_report, load_json_object,
+                                      validate_report_fields)
+from prompts.report_prompt import REPORT_SECTIONS
+from monitoring.stage_metrics import stage_span
 
 def format_details_to_string(summary_data: dict, area_map: dict) -> str:
     """
@@ -99,85 +103,146 @@ def format_details_to_string(summary_data: dict, area_map: dict) -> str:
 
     return "\n".join(output)
 
-def run_llm_reporting_flow(full_df: pd.DataFrame, target_plate: str, debug_mode: bool = False):
+# 報告流程使用的地點分群半徑 (公尺)，對應多層級區域索引中的其中一層
+REPORT_AREA_RADIUS_METERS = 200
+
+# 影響摘要結果的分析參數 (快取鍵的一部分；演算法變更時請調高 version 讓舊快取失效)
+SUMMARY_PARAMS = {
+    'version': 1,
+    'area_radius_meters': REPORT_AREA_RADIUS_METERS,
+    'stay_threshold_minutes': 20,
+    'trip_gap_minutes': 20,
+}
+
+def _vehicle_rows(full_df: pd.DataFrame, target_plate: str, dataset: dict = None) -> pd.DataFrame:
+    """單一車輛的偵測紀錄；提供共用資料集時直接切出該車的區段，不必篩選整份 DataFrame。"""
+    if dataset is not None:
+        return plate_frame(dataset, target_plate)
+    return full_df[full_df['車牌'] == target_plate].copy()
+
+def compute_vehicle_summary(full_df: pd.DataFrame, target_plate: str, area_hierarchy: dict = None,
+                            summary_cache: dict = None, transition_graph: dict = None, dataset: dict = None) -> dict:
+    """
+    執行本地數據分析引擎 (停留點、行程、規律模式、異常)，不呼叫 LLM。
+    area_hierarchy 可傳入預先計算好的多層級區域索引，省去每次重新分群。
+    transition_graph (選用，analysis/camera_graph.py) 提供時行程切分改用攝影機間的學習旅行時間門檻。
+    summary_cache (選用，cache.summary_cache 的快取) 以 (車牌, 該車資料指紋, 參數) 為鍵重複使用結果；
+    該車有新的偵測紀錄或攝影機表改變時會自動重新計算。
+    dataset (選用，analysis/shared_dataset.py) 提供時以 plate_frame 取出該車資料 (多台車連續分析時較快)。
+
+    Returns:
+        dict: {'final_summary', 'area_map', 'trips_df'}；資料不足時回傳 None
+    """
+    vehicle_data = _vehicle_rows(full_df, target_plate, dataset)
+    if summary_cache is None:
+        return _compute_vehicle_summary(full_df, target_plate, area_hierarchy, transition_graph, vehicle_data)
 
-    
-    # ==============================================================================
-    # 步驟 1: 執行本地數據分析引擎 (此區塊不變)
-    # ==============================================================================
-    print("\n--- 正在執行本地數據分析引擎... ---")
-    
-    unique_cameras = full_df[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
-    cameras_with_area_id = cluster_cameras_by_distance(unique_cameras, radius_meters=200)
-    
-    vehicle_data = full_df[full_df['車牌'] == target_plate].copy()
     if vehicle_data.empty:
         print(f"錯誤：在資料集中找不到車牌 {target_plate} 的任何紀錄。")
-        return
+        return None
+    cameras = area_hierarchy['camera_table'] if area_hierarchy is not None else full_df.drop_duplicates(subset=['攝影機'])
+    params = {**SUMMARY_PARAMS, 'cameras': frame_fingerprint(cameras, ['攝影機', '經度', '緯度', '單位'])}
+    if transition_graph is not None:
+        params['transition_graph'] = transition_graph_fingerprint(transition_graph)
+    key = cache_key(target_plate, plate_fingerprint(vehicle_data), params)
+    return get_or_compute(summary_cache, key,
+                          lambda: _compute_vehicle_summary(full_df, target_plate, area_hierarchy, transition_graph,
+                                                           vehicle_data))
 
-    vehicle_data_with_area = pd.merge(vehicle_data, cameras_with_area_id[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
+def _compute_vehicle_summary(full_df: pd.DataFrame, target_plate: str, area_hierarchy: dict = None,
+                             transition_graph: dict = None, vehicle_data: pd.DataFrame = None) -> dict:
+    if area_hierarchy is None:
+        unique_cameras = full_df[['攝影機', '攝影機名稱', '經度', '緯度', '單位']].drop_duplicates(subset=['攝影機']).reset_index(drop=True)
+        with stage_span('report.clustering', rows_in=len(unique_cameras)):
+            area_hierarchy = build_area_hierarchy(unique_cameras, radii=(50, REPORT_AREA_RADIUS_METERS))
+    report_level = level_name(REPORT_AREA_RADIUS_METERS)
+    cameras_with_area_id = area_table_for_level(area_hierarchy, report_level)
     
-    stay_points_result = find_stay_points_v2(vehicle_data_with_area, time_threshold_minutes=20)
-    if not stay_points_result:
+    if vehicle_data is None:
+        vehicle_data = _vehicle_rows(full_df, target_plate)
+    if vehicle_data.empty:
+        print(f"錯誤：在資料集中找不到車牌 {target_plate} 的任何紀錄。")
+        return None
+
+    with stage_span('report.trajectory_arrays', rows_in=len(vehicle_data), plate=target_plate) as span:
+        vehicle_data_with_area = pd.merge(vehicle_data, cameras_with_area_id[['攝影機', 'LocationAreaID']], on='攝影機', how='left')
+
+        # 單次掃描：停留點與行程共用同一組排序後的陣列
+        trajectory_arrays = build_trajectory_arrays(vehicle_data_with_area, node_col=graph_node_col(transition_graph))
+        span['rows_out'] = len(trajectory_arrays['times'])
+
+    with stage_span('report.stay_detection', rows_in=len(vehicle_data), plate=target_plate) as span:
+        stay_points_result = area_stay_table(trajectory_arrays, time_threshold_minutes=SUMMARY_PARAMS['stay_threshold_minutes'])
+        span['rows_out'] = table_length(stay_points_result)
+    if not table_length(stay_points_result):
         print(f"- 未找到 {target_plate} 的任何停留點，分析中止。")
-        return
+        return None
     
-    trips_result = segment_trips_v3(vehicle_data_with_area)
-    if not trips_result:
+    with stage_span('report.trip_segmentation', rows_in=len(vehicle_data), plate=target_plate) as span:
+        trips_result = trip_table(trajectory_arrays, gap_threshold_minutes=SUMMARY_PARAMS['trip_gap_minutes'],
+                                  transition_graph=transition_graph)
+        span['rows_out'] = table_length(trips_result)
+    if not table_length(trips_result):
         print(f"- 未切割出 {target_plate} 的任何行程，分析中止。")
-        return
+        return None
     
-    pattern_result = find_regular_patterns_v13(trips_result, stay_points_result, cameras_with_area_id)
+    with stage_span('report.pattern_mining', rows_in=table_length(trips_result), plate=target_plate) as span:
+        pattern_result = find_regular_patterns_v13(trips_result, stay_points_result, cameras_with_area_id)
+        span['rows_out'] = len(pattern_result["summary"].get("regular_patterns", []))
     regular_summary = pattern_result["summary"]
     area_map = pattern_result["area_map"]
     trips_df = pattern_result["trips_df"]
     
-    anomalies = find_anomalies_v3(trips_df, regular_summary["regular_patterns"])
+    with stage_span('report.anomaly', rows_in=len(trips_df), plate=target_plate) as span:
+        anomalies = find_anomalies_v3(trips_df, regular_summary["regular_patterns"])
+        span['rows_out'] = sum(len(v) for v in anomalies.values() if isinstance(v, list))
     
-    final_summary = {**regular_summary, **anomalies}
-    print("--- 本地數據分析完成 ---")
-    # ... (debug 模式程式碼不變) ...
+    return {'final_summary': {**regular_summary, **anomalies}, 'area_map': area_map, 'trips_df': trips_df}
 
-    # ==============================================================================
-    # 步驟 2: 去識別化並呼叫 LLM (此區塊不變)
-    # ==============================================================================
-    anonymized_prompt, reversal_map = anonymize_data(final_summary, area_map, target_plate)
-    
-    print("\n--- 正在呼叫雲端 LLM 生成智慧摘要... ---")
-    summary_from_llm = generate_report_from_summary(anonymized_prompt)
-    
-    # ==============================================================================
-    # 步驟 3: 組合並輸出最終報告
-    # ==============================================================================
-    
-    # 【【【【 核心修正處：將 details_str 的定義加回這裡 】】】】
-    details_str = format_details_to_string(final_summary, area_map)
-    
+def _anonymize_for_llm(final_summary: dict, area_map: dict, target_plate: str, vehicle_alias: str = "目標車輛A",
+                       token_budget: int = None):
+    """去識別化並記錄提示詞各區段的 token 數 (token_budget 見 anonymize_data，None 為不限制)。"""
+    prompt_stats = {}
+    with stage_span('report.anonymization', rows_in=len(area_map), plate=target_plate) as span:
+        anonymized_prompt, reversal_map = anonymize_data(final_summary, area_map, target_plate, token_budget=token_budget,
+                                                         prompt_stats=prompt_stats, vehicle_alias=vehicle_alias)
+        span['rows_out'] = len(reversal_map)
+        span['attributes']['prompt_tokens_estimated'] = prompt_stats['total_tokens']
+    section_tokens = ", ".join(f"{name} {info['tokens']}" + (f" (省略 {info['omitted']})" if info['omitted'] else "")
+                               for name, info in prompt_stats['sections'].items())
+    budget = prompt_stats['token_budget'] if prompt_stats['token_budget'] is not None else "不限"
+    print(f"--- Prompt 約 {prompt_stats['total_tokens']} tokens (預算 {budget})：{section_tokens} ---")
+    return anonymized_prompt, reversal_map
+
+def assemble_report_text(report: dict) -> str:
+    """由結構化報告的段落欄位組出四段式摘要文字。"""
+    return "\n\n".join(f"【{title}】{report[field]}" for field, title in REPORT_SECTIONS if report.get(field))
+
+def _deanonymized_report_text(report: dict, reversal_map: dict, vehicle_alias: str = "目標車輛A") -> str:
+    """只以報告實際引用的 Area-ID 與車輛代號還原，不需要掃過整份 reversal_map。"""
+    referenced = {code: reversal_map[code] for code in [*report['referenced_area_ids'], vehicle_alias]
+                  if code in reversal_map}
+    return deanonymize_report(assemble_report_text(report), referenced)
+
+def _print_final_report(report: dict, reversal_map: dict, final_summary: dict, area_map: dict,
+                        title: str = "## 最終分析報告"):
+    """輸出最終報告：智慧摘要、摘要中提及地點的說明 (取自 referenced_area_ids)、詳細數據。"""
     print("\n\n" + "#"*70)
-    print("## 最終分析報告")
+    print(title)
     print("#"*70)
 
     print("\n【 智慧摘要 】\n")
-    print(summary_from_llm)
+    print(assemble_report_text(report) if report else "(LLM 未回傳摘要，以下僅列出本地分析數據)")
 
     print("\n" + "-"*35)
     print("  地點說明:")
-    
-    mentioned_areas = sorted(list(set(re.findall(r'Area-\d+', summary_from_llm))))
-            
-    if mentioned_areas:
-        main_points = []
-        other_points = []
-        
-        for area_id in mentioned_areas:
-            if area_id in reversal_map:
-                info = reversal_map[area_id]
-                if info.get("label"):
-                    main_points.append((area_id, info))
-                else:
-                    other_points.append((area_id, info))
-        
-        main_points.sort(key=lambda item: int(item[1]['label'].replace("主要活動/停留點", "")))
+
+    referenced = [(area_id, reversal_map[area_id]) for area_id in (report['referenced_area_ids'] if report else [])
+                  if area_id in reversal_map]
+    if referenced:
+        # 主要停留點依名次排列，其餘地點依 Area-ID 排列
+        main_points = sorted((item for item in referenced if item[1].get("rank")), key=lambda item: item[1]["rank"])
+        other_points = sorted(item for item in referenced if not item[1].get("rank"))
 
         for area_id, info in main_points:
             print(f'  * {area_id} ({info["label"]}): {info["name"]}')
@@ -186,17 +251,170 @@ def run_llm_reporting_flow(full_df: pd.DataFrame, target_plate: str, debug_mode:
             print(f'  * {area_id}: {info["name"]}')
     else:
         print("  - 摘要中未提及具體地點。")
-        
+
     print("-" * 35)
-    
+
     print("\n" + "="*70 + "\n")
     print("【 詳細數據 】\n")
+    # 詳細數據中的地點直接以 Area-ID 呈現 (與摘要一致)
+    print(format_details_to_string(final_summary, {area_id: area_id for area_id in area_map}))
+
+def _report_result(plate: str, final_summary: dict, area_map: dict, report: dict, reversal_map: dict,
+                   vehicle_alias: str = "目標車輛A") -> dict:
+    return {
+        'plate': plate, 'summary': final_summary, 'area_map': area_map,
+        'llm_report': assemble_report_text(report) if report else None,
+        'llm_report_structured': report,
+        'deanonymized_report': _deanonymized_report_text(report, reversal_map, vehicle_alias) if report else None,
+    }
+
+def run_llm_reporting_flow(full_df: pd.DataFrame, target_plate: str, debug_mode: bool = False,
+                           area_hierarchy: dict = None, use_llm: bool = True, summary_cache: dict = None,
+                           llm_backend: dict = None, transition_graph: dict = None, prompt_token_budget: int = None,
+                           dataset: dict = None):
+    """
+    單一車輛報告主流程。area_hierarchy 可傳入預先計算好的多層級區域索引，省去每次重新分群。
+    summary_cache (選用) 用於重複使用相同資料版本的本地分析結果。
+    transition_graph (選用) 用於行程切分的學習旅行時間門檻 (見 compute_vehicle_summary)。
+    use_llm=False 時只輸出本地分析的詳細數據 (不呼叫雲端 LLM)。
+    llm_backend (選用) 指定 LLM 後端 (見 llm_clients/backends.py)，未指定時依 LLM_BACKEND 環境變數決定。
+    prompt_token_budget (選用) 限制提示詞的 token 數 (見 anonymize_data)，未指定時不截斷。
+    dataset (選用) 為共用資料集，見 compute_vehicle_summary。
+
+    Returns:
+        dict: {'plate', 'summary', 'area_map', 'llm_report', 'llm_report_structured', 'deanonymized_report'}；
+              llm_report 為組好的四段式摘要 (Area-ID 形式)，llm_report_structured 為模型回覆的段落欄位；
+              分析中止時回傳 None
+    """
+    # ==============================================================================
+    # 步驟 1: 執行本地數據分析引擎 (此區塊不變)
+    # ==============================================================================
+    print("\n--- 正在執行本地數據分析引擎... ---")
+
+    computed = compute_vehicle_summary(full_df, target_plate, area_hierarchy=area_hierarchy,
+                                       summary_cache=summary_cache, transition_graph=transition_graph, dataset=dataset)
+    if computed is None:
+        return None
+    final_summary = computed['final_summary']
+    area_map = computed['area_map']
+    print("--- 本地數據分析完成 ---")
+    # ... (debug 模式程式碼不變) ...
+
+    if not use_llm:
+        print("\n" + "="*70 + "\n")
+        print("【 詳細數據 】\n")
+        print(format_details_to_string(final_summary, area_map))
+        return _report_result(target_plate, final_summary, area_map, None, None)
+
+    # ==============================================================================
+    # 步驟 2: 去識別化並呼叫 LLM (此區塊不變)
+    # ==============================================================================
+    anonymized_prompt, reversal_map = _anonymize_for_llm(final_summary, area_map, target_plate,
+                                                         token_budget=prompt_token_budget)
     
-    final_details_str = details_str
-    sorted_real_names = sorted(area_map.values(), key=len, reverse=True)
-    for name in sorted_real_names:
-        area_id = next((aid for aid, n in area_map.items() if n == name), None)
-        if area_id:
-            final_details_str = final_details_str.replace(name, area_id)
-            
-    print(final_details_str)
\ No newline at end of file
+    print("\n--- 正在呼叫雲端 LLM 生成智慧摘要... ---")
+    with stage_span('report.llm_call', plate=target_plate) as span:
+        report = generate_report_from_summary(anonymized_prompt, backend=llm_backend)
+        span['rows_out'] = int(report is not None)
+    
+    # ==============================================================================
+    # 步驟 3: 組合並輸出最終報告
+    # ==============================================================================
+    _print_final_report(report, reversal_map, final_summary, area_map)
+
+    return _report_result(target_plate, final_summary, area_map, report, reversal_map)
+
+# ==============================================================================
+# 多車批次報告：一次 LLM 請求涵蓋多台車，節省重複的系統提示詞與往返延遲
+# ==============================================================================
+# 代號 目標車輛A ~ 目標車輛Z，單一批次最多 26 台
+BATCH_MAX_VEHICLES = 26
+DEFAULT_BATCH_SIZE = 4
+
+def vehicle_alias(index: int) -> str:
+    return f"目標車輛{chr(65 + index)}"
+
+def build_batch_prompt(anonymized_prompts: dict) -> str:
+    """將多台車的去識別化摘要 ({代號: 摘要文字}) 組成一份批次提示詞，每台車以「### 代號」區塊分隔。"""
+    parts = [f"以下共 {len(anonymized_prompts)} 台車輛的活動分析摘要，請依批次模式逐車回覆 JSON。\n"]
+    for alias, prompt_text in anonymized_prompts.items():
+        parts.append(f"### {alias}\n{prompt_text}")
+    return "\n".join(parts)
+
+def parse_batch_response(response_text: str, aliases: list) -> dict:
+    """
+    解析批次回覆，回傳 {代號: 結構化報告}。
+    格式錯誤、代號不符或段落全空的項目直接略過 (由呼叫端改為單車呼叫)。
+    """
+    payload = load_json_object(response_text)
+    reports = payload.get('reports') if payload else None
+    if not isinstance(reports, list):
+        return {}
+
+    parsed = {}
+    for item in reports:
+        report = validate_report_fields(item)
+        alias = item.get('vehicle') if isinstance(item, dict) else None
+        if report is not None and alias in aliases:
+            parsed.setdefault(alias, report)
+    return parsed
+
+def run_batch_reporting_flow(full_df: pd.DataFrame, target_plates: list, area_hierarchy: dict = None,
+                             summary_cache: dict = None, llm_backend: dict = None,
+                             batch_size: int = DEFAULT_BATCH_SIZE, transition_graph: dict = None,
+                             prompt_token_budget: int = None, dataset: dict = None) -> list:
+    """
+    多車報告主流程：每 batch_size 台車合併成一次 LLM 請求 (各自使用 目標車輛A/B/C... 代號)，
+    回覆依代號拆回各車，並以各車自己的 reversal_map 還原。
+    批次回覆無法解析或缺少某台車時，該車改用單車請求補齊。prompt_token_budget 為每台車提示詞的 token 上限。
+    dataset (選用) 為共用資料集，各車資料直接由共用陣列切出 (見 compute_vehicle_summary)。
+
+    Returns:
+        list: 與 target_plates 對應的結果 (格式同 run_llm_reporting_flow)；資料不足的車輛為 None
+    """
+    batch_size = max(1, min(batch_size, BATCH_MAX_VEHICLES))
+    results = {}
+
+    print(f"\n--- 正在執行本地數據分析引擎 ({len(target_plates)} 台車)... ---")
+    prepared = []
+    for plate in target_plates:
+        computed = compute_vehicle_summary(full_df, plate, area_hierarchy=area_hierarchy, summary_cache=summary_cache,
+                                           transition_graph=transition_graph, dataset=dataset)
+        if computed is None:
+            results[plate] = None
+            continue
+        prepared.append((plate, computed['final_summary'], computed['area_map']))
+    print("--- 本地數據分析完成 ---")
+
+    for batch_start in range(0, len(prepared), batch_size):
+        batch = prepared[batch_start:batch_start + batch_size]
+        anonymized = {}
+        for i, (plate, final_summary, area_map) in enumerate(batch):
+            anonymized[vehicle_alias(i)] = _anonymize_for_llm(final_summary, area_map, plate, vehicle_alias(i),
+                                                              token_budget=prompt_token_budget)
+
+        print(f"\n--- 正在呼叫雲端 LLM 生成智慧摘要 (批次 {batch_start // batch_size + 1}，{len(batch)} 台車)... ---")
+        with stage_span('report.llm_batch_call', rows_in=len(batch)) as span:
+            response_text = generate_batch_report(build_batch_prompt({a: p for a, (p, _) in anonymized.items()}),
+                                                  backend=llm_backend)
+            parsed = parse_batch_response(response_text, list(anonymized))
+            span['rows_out'] = len(parsed)
+
+        missing = [alias for alias in anonymized if alias not in parsed]
+        if missing:
+            print(f"--- 批次回覆缺少 {len(missing)} 台車的摘要，改為逐車呼叫 ---")
+        for alias, (plate, _, _) in zip(anonymized, batch):
+            if alias in parsed:
+                continue
+            with stage_span('report.llm_call', plate=plate) as span:
+                parsed[alias] = generate_report_from_summary(anonymized[alias][0], backend=llm_backend)
+                span['rows_out'] = int(parsed[alias] is not None)
+
+        for i, (plate, final_summary, area_map) in enumerate(batch):
+            alias = vehicle_alias(i)
+            reversal_map = anonymized[alias][1]
+            _print_final_report(parsed[alias], reversal_map, final_summary, area_map,
+                                title=f"## 最終分析報告：{plate} ({alias})")
+            results[plate] = _report_result(plate, final_summary, area_map, parsed[alias], reversal_map, alias)
+
+    return [results[plate] for plate in target_plates]
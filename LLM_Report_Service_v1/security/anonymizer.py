@@ -1,77 +1,255 @@
 # security/anonymizer.py (修正後)
+import importlib.util
+import math
+import re
+
 import pandas as pd
 
-def format_summary_for_prompt(summary: dict, area_map: dict) -> str:
+# ==========================================
+# 1. Token 估算
+# ==========================================
+TIKTOKEN_AVAILABLE = importlib.util.find_spec('tiktoken') is not None
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_encoder = None
+
+def estimate_tokens(text: str) -> int:
     """
-    將結構化的 summary 轉換為一個對 LLM 更友善、資訊更豐富的純文字格式。
+    在本地估算文字的 token 數。有安裝 tiktoken 時使用 o200k_base 編碼 (gpt-4o)，
+    否則以「每個中日韓字元約 1 個 token、其餘約 4 個字元 1 個 token」估算。
+    """
+    global _encoder
+    if TIKTOKEN_AVAILABLE:
+        if _encoder is None:
+            import tiktoken
+            _encoder = tiktoken.get_encoding('o200k_base')
+        return len(_encoder.encode(text))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+# ==========================================
+# 2. 各區段內容 (每一行為一個項目，附重要性排序)
+# ==========================================
+SECTION_ORDER = ['stay_points', 'regular_patterns', 'duration_anomalies', 'infrequent_patterns']
+SECTION_TITLES = {
+    'stay_points': "[主要活動/停留點分析]",
+    'regular_patterns': "[已確認的規律模式]",
+    'infrequent_patterns': "[路徑異常事件 (次數較少的行程)]",
+    'duration_anomalies': "[時間異常事件]",
+}
+# 每個區段至少優先保留的項目數 (在補齊其他區段的長尾之前)
+CORE_ITEMS_PER_SECTION = 3
+
+def _item(text: str, rank: int, tier: int, group: int = None, **extra) -> dict:
+    return {'text': text, 'rank': rank, 'tier': tier, 'group': group, 'tokens': estimate_tokens(text), **extra}
+
+def _stay_point_items(summary: dict) -> list:
+    items = []
+    # all_stay_points_stats 已依總停留時間排序，順序即重要性
+    for i, sp in enumerate(summary['all_stay_points_stats']):
+        line = f"- {sp['name']} ({sp['area_id']}): " # (這裡的 sp['name'] 會被後續步驟替換掉)
+        line += f"來訪 {sp['visit_count']} 次, 總計 {sp['total_duration_hours']} 小時"
+        if sp.get('stay_pattern_type') == '長期駐留':
+            line += f", 模式：長期駐留 (平均每次停留約 {sp['avg_duration_days']} 天)"
+        elif sp.get('avg_arrival_time'):
+            line += f", 通常時段 {sp['avg_arrival_time']} ~ {sp['avg_departure_time']}"
+        items.append(_item(line + "\n", rank=i, tier=0 if i < CORE_ITEMS_PER_SECTION else 1,
+                           visits=sp['visit_count'], hours=sp['total_duration_hours']))
+    return items
+
+def _regular_pattern_items(summary: dict, id_to_name: dict) -> list:
+    patterns = summary['regular_patterns']
+    # 模式代號 (A, B, C...) 依原始順序編排，時間異常事件會引用同一個代號；重要性則依發生次數
+    by_count = sorted(range(len(patterns)), key=lambda i: -patterns[i]['occurrence_count'])
+    rank_of = {idx: r for r, idx in enumerate(by_count)}
+    items = []
+    for i, p in enumerate(patterns):
+        start_name = id_to_name.get(p['start_area_id'], "未知")
+        end_name = id_to_name.get(p['end_area_id'], "未知")
+        line = (f"- 模式 {chr(65+i)} (從 {start_name} 到 {end_name}, {p['day_type']}-{p['time_slot']}): "
+                f"發生 {p['occurrence_count']} 次, 平均時段 {p['avg_start_time']}~{p['avg_end_time']}, "
+                f"平均耗時 {p['avg_duration_minutes']:.2f} 分鐘\n")
+        items.append(_item(line, rank=rank_of[i], tier=0 if rank_of[i] < CORE_ITEMS_PER_SECTION else 1,
+                           count=p['occurrence_count']))
+    return items
+
+def _infrequent_pattern_items(summary: dict, id_to_name: dict) -> list:
+    """每種少見路徑一行統計 (tier 0/1)，底下逐次的時間明細屬於長尾 (tier 2)。"""
+    if not summary['infrequent_patterns']:
+        return []
+    infrequent_df = pd.DataFrame(summary['infrequent_patterns'])
+    groups = list(infrequent_df.groupby('signature'))
+    # 次數多的路徑較重要
+    by_count = sorted(range(len(groups)), key=lambda i: -len(groups[i][1]))
+    rank_of = {idx: r for r, idx in enumerate(by_count)}
+    items = []
+    for g, (signature, group) in enumerate(groups):
+        start_name = id_to_name.get(group['start_area_id'].iloc[0], "未知")
+        end_name = id_to_name.get(group['end_area_id'].iloc[0], "未知")
+        count = len(group)
+        avg_duration = group['duration_minutes'].mean()
+        line = f"- 模式「從 {start_name} 到 {end_name}」 (共 {count} 次, 平均耗時 {avg_duration:.1f} 分鐘):\n"
+        items.append(_item(line, rank=rank_of[g], tier=0 if rank_of[g] < CORE_ITEMS_PER_SECTION else 1,
+                           group=g, count=count, header=True))
+        for j, (_, row) in enumerate(group.iterrows()):
+            detail = f"  - {row['start_time'].strftime('%Y-%m-%d %H:%M')} 到 {row['end_time'].strftime('%Y-%m-%d %H:%M')}\n"
+            # 各路徑的明細輪流納入：先放每條路徑的第 1 筆，再放第 2 筆...
+            items.append(_item(detail, rank=j * len(groups) + rank_of[g], tier=2, group=g, header=False))
+    return items
+
+def _duration_anomaly_items(summary: dict, id_to_name: dict) -> list:
+    anomalies = summary['duration_anomalies']
+    exceeded = [round(a['actual_duration_minutes'] - a['median_duration_for_pattern'], 2) for a in anomalies]
+    # 超出中位數越多越重要
+    by_excess = sorted(range(len(anomalies)), key=lambda i: -exceeded[i])
+    rank_of = {idx: r for r, idx in enumerate(by_excess)}
+    items = []
+    for i, a in enumerate(anomalies):
+        pattern_index = next((k for k, p in enumerate(summary['regular_patterns']) if p['signature'] == a['pattern_signature']), -1)
+        pattern_label = f"模式 {chr(65+pattern_index)}" if pattern_index != -1 else "一個規律模式"
+
+        p_info = next((p for p in summary['regular_patterns'] if p['signature'] == a['pattern_signature']), None)
+        start_name = id_to_name.get(p_info['start_area_id'], "未知") if p_info else "未知"
+        end_name = id_to_name.get(p_info['end_area_id'], "未知") if p_info else "未知"
+
+        line = (f"- {a['start_time'].strftime('%Y-%m-%d %H:%M')} 到 {a['end_time'].strftime('%Y-%m-%d %H:%M')}, "
+                f"在「{pattern_label} (從 {start_name} 到 {end_name})」路徑上, "
+                f"耗時 {a['actual_duration_minutes']} 分鐘, 超出中位數時間 {exceeded[i]} 分鐘 "
+                f"(中位數: {a['median_duration_for_pattern']} 分鐘)。\n")
+        items.append(_item(line, rank=rank_of[i], tier=0 if rank_of[i] < CORE_ITEMS_PER_SECTION else 1,
+                           exceeded=exceeded[i]))
+    return items
+
+def _omitted_note(section: str, omitted: list) -> str:
+    """被省略的項目改以一行統計代替，讓 LLM 仍知道長尾的規模。"""
+    if section == 'stay_points':
+        visits = sum(it['visits'] for it in omitted)
+        hours = round(sum(it['hours'] for it in omitted), 1)
+        return f"- (另有 {len(omitted)} 個停留點未列出，合計來訪 {visits} 次、{hours} 小時)\n"
+    if section == 'regular_patterns':
+        return f"- (另有 {len(omitted)} 個規律模式未列出，合計發生 {sum(it['count'] for it in omitted)} 次)\n"
+    if section == 'infrequent_patterns':
+        return f"- (另有 {len(omitted)} 種少見路徑未列出，合計 {sum(it['count'] for it in omitted)} 次)\n"
+    excess = [it['exceeded'] for it in omitted]
+    return f"- (另有 {len(omitted)} 筆時間異常未列出，超出中位數 {min(excess)} ~ {max(excess)} 分鐘)\n"
+
+# ==========================================
+# 3. 在 token 預算內組出提示詞
+# ==========================================
+PROMPT_HEADER = "請根據以下車輛活動分析摘要，生成一份專業的情報分析報告。\n\n--- 分析摘要 ---\n"
+PROMPT_FOOTER = "\n--- 摘要結束 ---\n"
+EMPTY_LINES = {
+    'stay_points': "- 未發現明顯的長時間停留點。\n",
+    'regular_patterns': "- 無\n",
+    'infrequent_patterns': "- 無\n",
+    'duration_anomalies': "- 無\n",
+}
+# 每個被截斷的區段預留給省略說明的 token 數
+OMITTED_NOTE_RESERVE = 30
+
+def build_budgeted_prompt(summary: dict, area_map: dict, token_budget: int = None, rewrite=None) -> dict:
+    """
+    依重要性在 token 預算內組出提示詞 (token_budget 為 None 時不限制，列出全部內容)。
+    納入順序：各區段的前幾名 (主要停留點、主要規律模式、超時最多的異常、最常見的少見路徑)
+    → 各區段其餘項目 → 少見路徑的逐次時間明細。同一區段只要有一項放不下，排名較後的項目也不再納入，
+    被省略的部分以一行統計代替。rewrite (選用) 會先套用到每一行 (例如去識別化)，token 數以套用後的文字估算。
+
+    Returns:
+        dict: {'text', 'total_tokens', 'token_budget',
+               'sections': {區段: {'tokens', 'items', 'omitted'}}}
     """
     id_to_name = area_map
-    prompt_text = "請根據以下車輛活動分析摘要，生成一份專業的情報分析報告。\n\n"
-    prompt_text += "--- 分析摘要 ---\n"
-
-    # --- 主要據點資訊 ---
-    prompt_text += "\n[主要活動/停留點分析]\n"
-# 【簡化】不再需要區分 primary/secondary，因為標籤1, 2, 3已經隱含了重要性
-    if not summary['all_stay_points_stats']:
-        prompt_text += "- 未發現明顯的長時間停留點。\n"
-    else:
-        for sp in summary['all_stay_points_stats']:
-            prompt_text += f"- {sp['name']} ({sp['area_id']}): " # (這裡的 sp['name'] 會被後續步驟替換掉)
-            prompt_text += f"來訪 {sp['visit_count']} 次, 總計 {sp['total_duration_hours']} 小時"
-            
-            if sp.get('stay_pattern_type') == '長期駐留':
-                prompt_text += f", 模式：長期駐留 (平均每次停留約 {sp['avg_duration_days']} 天)\n"
-            elif sp.get('avg_arrival_time'):
-                 prompt_text += f", 通常時段 {sp['avg_arrival_time']} ~ {sp['avg_departure_time']}\n"
-            else:
-                 prompt_text += "\n"
-    
+    section_items = {
+        'stay_points': _stay_point_items(summary),
+        'regular_patterns': _regular_pattern_items(summary, id_to_name),
+        'infrequent_patterns': _infrequent_pattern_items(summary, id_to_name),
+        'duration_anomalies': _duration_anomaly_items(summary, id_to_name),
+    }
+    if rewrite is not None:
+        for items in section_items.values():
+            for it in items:
+                it['text'] = rewrite(it['text'])
+                it['tokens'] = estimate_tokens(it['text'])
 
-    # --- 後續的程式碼 (規律模式、異常事件) 維持不變 ---
-    # (此處省略後續未變動的程式碼，你的版本是正確的)
-    # ...
-    prompt_text += "\n[已確認的規律模式]\n"
-    if summary['regular_patterns']:
-        for i, p in enumerate(summary['regular_patterns']):
-            start_name = id_to_name.get(p['start_area_id'], "未知")
-            end_name = id_to_name.get(p['end_area_id'], "未知")
-            prompt_text += f"- 模式 {chr(65+i)} (從 {start_name} 到 {end_name}, {p['day_type']}-{p['time_slot']}): 發生 {p['occurrence_count']} 次, 平均時段 {p['avg_start_time']}~{p['avg_end_time']}, 平均耗時 {p['avg_duration_minutes']:.2f} 分鐘\n"
-    else:
-        prompt_text += "- 無\n"
-
-
-    prompt_text += "\n[路徑異常事件 (次數較少的行程)]\n"
-    if summary['infrequent_patterns']:
-        infrequent_df = pd.DataFrame(summary['infrequent_patterns'])
-        for signature, group in infrequent_df.groupby('signature'):
-            start_name = id_to_name.get(group['start_area_id'].iloc[0], "未知")
-            end_name = id_to_name.get(group['end_area_id'].iloc[0], "未知")
-            count = len(group)
-            avg_duration = group['duration_minutes'].mean()
-            prompt_text += f"- 模式「從 {start_name} 到 {end_name}」 (共 {count} 次, 平均耗時 {avg_duration:.1f} 分鐘):\n"
-            for _, row in group.iterrows():
-                prompt_text += f"  - {row['start_time'].strftime('%Y-%m-%d %H:%M')} 到 {row['end_time'].strftime('%Y-%m-%d %H:%M')}\n"
-    else:
-        prompt_text += "- 無\n"
-        
-    prompt_text += "\n[時間異常事件]\n"
-    if summary['duration_anomalies']:
-        for a in summary['duration_anomalies']:
-            pattern_index = next((i for i, p in enumerate(summary['regular_patterns']) if p['signature'] == a['pattern_signature']), -1)
-            pattern_label = f"模式 {chr(65+pattern_index)}" if pattern_index != -1 else "一個規律模式"
-            
-            p_info = next((p for p in summary['regular_patterns'] if p['signature'] == a['pattern_signature']), None)
-            start_name = id_to_name.get(p_info['start_area_id'], "未知") if p_info else "未知"
-            end_name = id_to_name.get(p_info['end_area_id'], "未知") if p_info else "未知"
-
-            exceeded_time = round(a['actual_duration_minutes'] - a['median_duration_for_pattern'], 2)
-            prompt_text += f"- {a['start_time'].strftime('%Y-%m-%d %H:%M')} 到 {a['end_time'].strftime('%Y-%m-%d %H:%M')}, 在「{pattern_label} (從 {start_name} 到 {end_name})」路徑上, "
-            prompt_text += f"耗時 {a['actual_duration_minutes']} 分鐘, 超出中位數時間 {exceeded_time} 分鐘 (中位數: {a['median_duration_for_pattern']} 分鐘)。\n"
+    # 固定內容 (標題、空區段) 一定納入
+    fixed_tokens = estimate_tokens(PROMPT_HEADER) + estimate_tokens(PROMPT_FOOTER)
+    for section in SECTION_ORDER:
+        fixed_tokens += estimate_tokens("\n" + SECTION_TITLES[section] + "\n")
+        if not section_items[section]:
+            fixed_tokens += estimate_tokens(EMPTY_LINES[section])
+
+    if token_budget is None:
+        selected = {id(it) for items in section_items.values() for it in items}
     else:
-        prompt_text += "- 無\n"
-        
-    prompt_text += "\n--- 摘要結束 ---\n"
-    return prompt_text
+        remaining = token_budget - fixed_tokens - OMITTED_NOTE_RESERVE * sum(1 for v in section_items.values() if v)
+        candidates = sorted(
+            ((it['tier'], SECTION_ORDER.index(section), it['rank'], section, it)
+             for section, items in section_items.items() for it in items),
+            key=lambda c: c[:3])
+        selected, blocked = set(), set()
+        included_groups = set()
+        for tier, _, _, section, it in candidates:
+            # 明細只在其路徑統計行已納入時才考慮，並依各路徑分別判斷是否已截斷
+            block_key = (section, it['group']) if tier == 2 else (section, None)
+            if block_key in blocked or (tier == 2 and it['group'] not in included_groups):
+                continue
+            # 路徑統計行另外預留「其餘 N 次略」一行的空間
+            cost = it['tokens'] + (estimate_tokens("  - (其餘 999 次略)\n") if it.get('header') else 0)
+            if cost > remaining:
+                blocked.add(block_key)
+                continue
+            remaining -= cost
+            selected.add(id(it))
+            if it.get('header'):
+                included_groups.add(it['group'])
+
+    # 依原本的順序輸出已納入的項目
+    prompt_text = PROMPT_HEADER
+    sections = {}
+    for section in ['stay_points', 'regular_patterns', 'infrequent_patterns', 'duration_anomalies']:
+        items = section_items[section]
+        body = ""
+        if not items:
+            body = EMPTY_LINES[section]
+        elif section == 'infrequent_patterns':
+            groups = {}
+            for it in items:
+                groups.setdefault(it['group'], []).append(it)
+            omitted_headers = []
+            for g in sorted(groups):
+                header, details = groups[g][0], groups[g][1:]
+                if id(header) not in selected:
+                    omitted_headers.append(header)
+                    continue
+                body += header['text'] + "".join(d['text'] for d in details if id(d) in selected)
+                dropped = sum(1 for d in details if id(d) not in selected)
+                if dropped:
+                    body += f"  - (其餘 {dropped} 次略)\n"
+            if omitted_headers:
+                body += _omitted_note(section, omitted_headers)
+        else:
+            body = "".join(it['text'] for it in items if id(it) in selected)
+            omitted = [it for it in items if id(it) not in selected]
+            if omitted:
+                body += _omitted_note(section, omitted)
+
+        section_text = "\n" + SECTION_TITLES[section] + "\n" + body
+        prompt_text += section_text
+        sections[section] = {
+            'tokens': estimate_tokens(section_text),
+            'items': sum(1 for it in items if id(it) in selected),
+            'omitted': sum(1 for it in items if id(it) not in selected),
+        }
+    prompt_text += PROMPT_FOOTER
+
+    return {'text': prompt_text, 'total_tokens': estimate_tokens(prompt_text), 'token_budget': token_budget,
+            'sections': sections}
+
+def format_summary_for_prompt(summary: dict, area_map: dict, token_budget: int = None) -> str:
+    """
+    將結構化的 summary 轉換為一個對 LLM 更友善、資訊更豐富的純文字格式。
+    token_budget 為 None 時列出全部內容；指定時依重要性截斷長尾 (見 build_budgeted_prompt)。
+    """
+    return build_budgeted_prompt(summary, area_map, token_budget)['text']
 
 # security/anonymizer.py
 
@@ -84,17 +262,23 @@ import pandas as pd
 # (此處省略該函式，請保留您檔案中原有的版本)
 # ...
 
-def anonymize_data(summary: dict, area_map: dict, plate_number: str):
+def anonymize_data(summary: dict, area_map: dict, plate_number: str,
+                   token_budget: int = None, prompt_stats: dict = None,
+                   vehicle_alias: str = "目標車輛A"):
     """
     (新架構版) 將分析摘要去識別化。
-    - reversal_map 現在儲存更豐富的資訊：{"Area-ID": {"name": "...", "label": "..."}}
+    - reversal_map 現在儲存更豐富的資訊：{"Area-ID": {"name": "...", "label": "...", "rank": 1}}
+      (rank 為主要停留點的名次，非主要停留點為 None)
     - Prompt 中的地點名稱會被統一替換成 Area-ID。
+    - 指定 token_budget 時提示詞長度受其限制，超過時依重要性保留內容、長尾部分改以統計摘要代替
+      (預設 None 不限制)；傳入 prompt_stats (dict) 時會填入各區段的 token 統計。
+    - vehicle_alias 為車牌的代號；批次模式中每台車使用不同代號 (目標車輛A、B、C...)。
     """
     reversal_map = {}
     
     # 步驟 1: 建立基礎的 reversal_map，包含所有地點的名稱和預設空標籤
     for area_id, name in area_map.items():
-        reversal_map[area_id] = {"name": name, "label": None}
+        reversal_map[area_id] = {"name": name, "label": None, "rank": None}
         
     # 步驟 2: 遍歷排序後的主要停留點，為它們在 map 中“貼上”標籤
     label_counter = 1
@@ -103,24 +287,34 @@ def anonymize_data(summary: dict, area_map: dict, plate_number: str):
             area_id = sp['area_id']
             if area_id in reversal_map:
                 reversal_map[area_id]["label"] = f"主要活動/停留點{label_counter}"
+                reversal_map[area_id]["rank"] = label_counter
                 label_counter += 1
 
     # 處理車牌
-    reversal_map["目標車輛A"] = {"name": plate_number, "label": "目標車輛"}
+    reversal_map[vehicle_alias] = {"name": plate_number, "label": "目標車輛", "rank": None}
 
     # 步驟 3: 準備發送給 LLM 的文本，將所有地點全名替換成 Area-ID
-    full_prompt_text = format_summary_for_prompt(summary, area_map)
-    anonymized_prompt_text = full_prompt_text
-
     # 優先替換較長的攝影機名稱，避免部分匹配錯誤
     sorted_names = sorted(area_map.values(), key=len, reverse=True)
+    name_to_id = {}
     for name in sorted_names:
         # 找到這個名稱對應的 Area-ID
         area_id = next((aid for aid, n in area_map.items() if n == name), None)
         if area_id:
-            anonymized_prompt_text = anonymized_prompt_text.replace(name, area_id)
+            name_to_id[name] = area_id
+
+    def _anonymize_text(text: str) -> str:
+        for name, area_id in name_to_id.items():
+            text = text.replace(name, area_id)
+        # 替換車牌
+        return text.replace(plate_number, vehicle_alias)
+
+    # 逐行先去識別化再估算 token，預算對應的是實際送出的文字
+    built = build_budgeted_prompt(summary, area_map, token_budget, rewrite=_anonymize_text)
+    anonymized_prompt_text = _anonymize_text(built['text'])
+
+    if prompt_stats is not None:
+        prompt_stats.update({'sections': built['sections'], 'token_budget': token_budget,
+                             'total_tokens': estimate_tokens(anonymized_prompt_text)})
 
-    # 替換車牌
-    anonymized_prompt_text = anonymized_prompt_text.replace(plate_number, "目標車輛A")
-        
     return anonymized_prompt_text, reversal_map
\ No newline at end of file